@@ -0,0 +1,203 @@
+"""
+Batch mode: run many prompts through the reflection loop concurrently.
+
+Usage:
+    python batch.py prompts.jsonl -o results.jsonl --concurrency 16 --steps 3
+
+Each input line is either a JSON object with a "prompt" key (and optional
+"id", "n_steps", "optimize_prompt", "revision_mode", "n_drafts" and "timeout" overrides)
+or a bare JSON string. A record without a prompt string fails on its own, like a failed run.
+Results are written as JSON lines in completion order.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from engine import ReflectionAgent
+from prompts import CRITIC_SYSTEM_PROMPTS, TEMPLATE_PROMPTS
+from utils.convergence import ConvergenceConfig
+from utils.metrics import MetricsRecorder
+from utils.ratelimit import RateLimit, get_rate_limiter
+from utils.routing import ModelRouting
+from utils.transport import TransportConfig, get_transport
+
+
+def load_prompts(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Parse JSONL prompt records, skipping blank lines.
+
+    Args:
+        lines (Iterable[str]): Lines of a JSONL file
+
+    Returns:
+        List[Dict[str, Any]]: One record per line, each with an "id"; anything but an object is taken as
+            the prompt
+    """
+    records = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            record = {"prompt": record}
+        record.setdefault("id", len(records))
+        records.append(record)
+    return records
+
+
+async def _run_one(agent: ReflectionAgent, record: Dict[str, Any], semaphore: asyncio.Semaphore,
+                   batch_start: float, n_steps: int, optimize_prompt: bool,
+                   revision_mode: str = "rewrite", n_drafts: int = 1,
+                   draft_selection: str = "heuristic", timeout: Optional[float] = None) -> Dict[str, Any]:
+    async with semaphore:
+        started = time.perf_counter()
+        result = {"id": record["id"], "prompt": record.get("prompt")}
+        try:
+            if not isinstance(result["prompt"], str):
+                raise ValueError('the record has no "prompt" string')
+            final_output, steps_data = await agent.arun(
+                user_msg=record["prompt"],
+                n_steps=record.get("n_steps", n_steps),
+                optimize_prompt=record.get("optimize_prompt", optimize_prompt),
+                revision_mode=record.get("revision_mode", revision_mode),
+                n_drafts=record.get("n_drafts", n_drafts),
+                draft_selection=draft_selection,
+                timeout=record.get("timeout", timeout),
+            )
+            result.update({"final_output": final_output, "steps_data": steps_data, "error": None})
+        except Exception as e:
+            result.update({"final_output": None, "steps_data": [], "error": str(e)})
+        finished = time.perf_counter()
+        result["timings"] = {
+            "queue_wait": started - batch_start,
+            "elapsed": finished - started,
+            "finished_at": finished - batch_start,
+        }
+        return result
+
+
+async def arun_batch(agent: ReflectionAgent, records: Iterable[Dict[str, Any]], concurrency: int = 8,
+                     n_steps: int = 3, optimize_prompt: bool = False,
+                     revision_mode: str = "rewrite", n_drafts: int = 1, draft_selection: str = "heuristic",
+                     timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run every prompt through the reflection loop with at most `concurrency` loops in flight.
+
+    Args:
+        agent (ReflectionAgent): The agent shared by all runs
+        records (Iterable[Dict[str, Any]]): Prompt records as returned by `load_prompts`
+        concurrency (int): Maximum number of reflection loops running at once
+        n_steps (int): Default number of reflection steps per prompt
+        optimize_prompt (bool): Default for optimizing each prompt first
+        revision_mode (str): Default revision mode, "rewrite" or "patch" (see ReflectionAgent.arun)
+        n_drafts (int): Default number of first drafts per prompt
+        draft_selection (str): How the best first draft is picked, "heuristic" or "rank"
+        timeout (Optional[float]): Default wall-clock limit per prompt in seconds, counted once its loop
+            starts; a loop past it returns the steps it finished
+
+    Yields:
+        Dict[str, Any]: One result per prompt, in completion order
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    batch_start = time.perf_counter()
+    tasks = [
+        asyncio.create_task(_run_one(agent, record, semaphore, batch_start, n_steps, optimize_prompt,
+                                     revision_mode, n_drafts, draft_selection, timeout))
+        for record in records
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _amain(args: argparse.Namespace) -> int:
+    if args.templates:
+        records = [{"id": name, "prompt": prompt} for name, prompt in TEMPLATE_PROMPTS.items()]
+    else:
+        with open(args.input, encoding="utf-8") if args.input != "-" else sys.stdin as f:
+            records = load_prompts(f)
+
+    # Keep enough pooled connections for every loop in flight
+    get_transport(TransportConfig(pool_size=max(args.concurrency, 10)))
+    metrics = MetricsRecorder(jsonl_path=args.metrics_jsonl)
+    routing = ModelRouting(reflection=args.reflection_model, optimization=args.optimization_model,
+                           escalation={} if args.no_escalation else None)
+    if args.rpm is not None or args.tpm is not None:
+        # Override the published limits of every model the batch calls, e.g. for a paid tier; 0 lifts a limit
+        limiter = get_rate_limiter()
+        for model in routing.models(args.model):
+            default = limiter.limit_for(model) or RateLimit()
+            limiter.limits[model] = RateLimit(
+                default.requests_per_minute if args.rpm is None else args.rpm or None,
+                default.tokens_per_minute if args.tpm is None else args.tpm or None,
+            )
+    agent = ReflectionAgent(model=args.model, convergence=None if args.no_early_stop else ConvergenceConfig(),
+                            metrics=metrics, critics=CRITIC_SYSTEM_PROMPTS if args.critics else None,
+                            routing=routing, hedge=args.hedge)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output != "-" else sys.stdout
+    failures = 0
+    batch_start = time.perf_counter()
+    try:
+        async for result in arun_batch(agent, records, args.concurrency, args.steps, args.optimize,
+                                           args.revision_mode, args.drafts, args.draft_selection, args.timeout):
+            failures += result["error"] is not None
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        metrics.close()
+        if args.prometheus:
+            metrics.write_prometheus(args.prometheus)
+
+    elapsed = time.perf_counter() - batch_start
+    print(f"{len(records)} prompts in {elapsed:.1f}s ({failures} failed)", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through the Reflection Agent.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file of prompts ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file for results ('-' for stdout)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Reflection loops in flight at once")
+    parser.add_argument("-n", "--steps", type=int, default=3, help="Reflection steps per prompt")
+    parser.add_argument("-m", "--model", default="llama-3.3-70b-versatile", help="Model to use (for generation)")
+    parser.add_argument("--reflection-model", help="Model of the reviewer, e.g. llama-3.1-8b-instant")
+    parser.add_argument("--optimization-model", help="Model that optimizes the prompts")
+    parser.add_argument("--no-escalation", action="store_true",
+                        help="Keep the role models even when critiques are malformed or the loop stalls")
+    parser.add_argument("--optimize", action="store_true", help="Optimize each prompt before generating")
+    parser.add_argument("--no-early-stop", action="store_true", help="Only stop when the reviewer answers <OK>")
+    parser.add_argument("--critics", action="store_true", help="Review with several focused critics in parallel")
+    parser.add_argument("--revision-mode", choices=("rewrite", "patch"), default="rewrite",
+                        help="Revise by full rewrites or by edits against the draft")
+    parser.add_argument("--drafts", type=int, default=1, help="First drafts written in parallel per prompt")
+    parser.add_argument("--draft-selection", choices=("heuristic", "rank"), default="heuristic",
+                        help="Pick the best first draft by a local score or by one model call")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Send a duplicate of a request slower than 95%% of recent ones; the first answer wins")
+    parser.add_argument("--timeout", type=float,
+                        help="Seconds a prompt's loop may run; then it stops and keeps the steps it finished")
+    parser.add_argument("--templates", action="store_true", help="Run the built-in template prompts")
+    parser.add_argument("--rpm", type=float, help="Requests per minute allowed for each model (0 for unlimited)")
+    parser.add_argument("--tpm", type=float, help="Tokens per minute allowed for each model (0 for unlimited)")
+    parser.add_argument("--metrics-jsonl", help="Append a latency/token record for every API call to this file")
+    parser.add_argument("--prometheus", help="Write Prometheus metrics for the batch to this file")
+    args = parser.parse_args()
+
+    load_dotenv()
+    return asyncio.run(_amain(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Offline benchmarks and the local mock completions server they run against."""
@@ -0,0 +1,139 @@
+"""
+How fast a stopped or overdue reflection run gives its worker back.
+
+Runs reflection loops against a slow mock server on a one-worker JobQueue, as
+the Streamlit app does, and stops each run at a random moment while its
+requests are in flight. Reports the time from the Stop to the worker being
+free (p50/p95/max) and the steps each stopped run kept. Then runs loops with a
+wall-clock deadline and reports how far past the deadline they returned.
+
+Usage:
+    python benchmarks/bench_cancellation.py --runs 20 --latency 0.5 --timeout 1.2
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from typing import Any, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from run_benchmarks import PROMPTS, MockProcess  # noqa: E402
+from utils.jobs import JobQueue  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def make_agent(mock: MockProcess, args: argparse.Namespace) -> ReflectionAgent:
+    agent = ReflectionAgent(model=args.model, use_cache=False, metrics=MetricsRecorder(),
+                            rate_limiter=RateLimiter(limits={}, default_limit=None), dedupe=False)
+    agent.api_url = mock.url
+    return agent
+
+
+def measure_stops(mock: MockProcess, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Stop every run at a random moment and time how long its worker stays busy afterwards.
+
+    Args:
+        mock (MockProcess): The mock server
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        Dict[str, Any]: Release time percentiles and the steps the stopped runs kept
+    """
+    queue = JobQueue(workers=1, max_queued=1, max_per_owner=None)
+    agent = make_agent(mock, args)
+    rng = random.Random(args.seed)
+    releases, kept = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(args.runs):
+            prompt = f"{PROMPTS[i % len(PROMPTS)]} (run {i})"
+            job = queue.submit(lambda job, prompt=prompt: agent.run(prompt, n_steps=args.steps, sinks=[job],
+                                                                    cancel=job.token))
+            # Somewhere within the first few requests of the run
+            time.sleep(rng.uniform(0.1, 4 * args.latency))
+            stopped = time.perf_counter()
+            job.cancel()
+            while not job.finished:
+                job.wait(len(job.events), timeout=0.01)
+            releases.append(time.perf_counter() - stopped)
+            kept.append(len(job.result[1]) if job.result else 0)
+    queue.shutdown()
+    return {
+        "release_p50": percentile(releases, 0.5),
+        "release_p95": percentile(releases, 0.95),
+        "release_max": max(releases),
+        "kept_steps": sum(kept) / len(kept),
+    }
+
+
+def measure_deadlines(mock: MockProcess, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run loops with a deadline shorter than they need and time how late they return.
+
+    Args:
+        mock (MockProcess): The mock server
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        Dict[str, Any]: Overshoot percentiles past the deadline and the steps the runs kept
+    """
+    agent = make_agent(mock, args)
+    overshoots, kept = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(args.runs):
+            start = time.perf_counter()
+            _, steps_data = agent.run(f"{PROMPTS[i % len(PROMPTS)]} (deadline {i})", n_steps=args.steps,
+                                      timeout=args.timeout)
+            overshoots.append(time.perf_counter() - start - args.timeout)
+            kept.append(len(steps_data))
+    return {
+        "overshoot_p50": percentile(overshoots, 0.5),
+        "overshoot_p95": percentile(overshoots, 0.95),
+        "overshoot_max": max(overshoots),
+        "kept_steps": sum(kept) / len(kept),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure how fast stopped and overdue runs free their worker.")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per scenario")
+    parser.add_argument("--steps", type=int, default=5, help="Reflection steps per run")
+    parser.add_argument("--timeout", type=float, default=1.2, help="Deadline of the deadline scenario, in seconds")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mock")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mock mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=400, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Probability a critique is <OK>")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the mock and the stop times")
+    args = parser.parse_args()
+
+    mock = MockProcess(args)
+    try:
+        print(f"{args.runs} runs of up to {args.steps} steps, mock latency {args.latency:g}s\n")
+        r = measure_stops(mock, args)
+        print(f"Stop -> worker free: p50 {r['release_p50'] * 1000:.1f}ms, p95 {r['release_p95'] * 1000:.1f}ms, "
+              f"max {r['release_max'] * 1000:.1f}ms; {r['kept_steps']:.1f} steps kept per run")
+        r = measure_deadlines(mock, args)
+        print(f"{args.timeout:g}s deadline -> returned late by: p50 {r['overshoot_p50'] * 1000:.1f}ms, "
+              f"p95 {r['overshoot_p95'] * 1000:.1f}ms, max {r['overshoot_max'] * 1000:.1f}ms; "
+              f"{r['kept_steps']:.1f} steps kept per run")
+        print(f"\nmock requests received: {mock.stats()['requests']}")
+    finally:
+        mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Reflect-phase latency of a single reviewer versus parallel focused critics.
+
+Runs the same prompts with the single base reviewer and with the focused
+critics of prompts.CRITIC_SYSTEM_PROMPTS against the mock server (with latency
+jitter, so the critics finish at different times). For every step's reflect
+phase it reports the wall-clock time, the slowest critic and the sum of all
+critic calls: with the critics running concurrently the phase should take
+about as long as the slowest one, not the sum.
+
+Usage:
+    python benchmarks/bench_critics.py --steps 3 --latency 0.3 --jitter 0.1
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from prompts import CRITIC_SYSTEM_PROMPTS  # noqa: E402
+from run_benchmarks import PROMPTS, MockProcess  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+
+
+def run_reviewers(mock: MockProcess, critics: Optional[Dict[str, str]], args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run every prompt and time each step's reflect phase.
+
+    Args:
+        mock (MockProcess): The mock server
+        critics (Optional[Dict[str, str]]): The critics, or None for the single reviewer
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        Dict[str, Any]: Mean reflect-phase wall time, slowest call and summed call time, in seconds
+    """
+    metrics = MetricsRecorder()
+    agent = ReflectionAgent(model=args.model, use_cache=False, metrics=metrics, critics=critics,
+                            rate_limiter=RateLimiter(limits={}, default_limit=None), dedupe=False)
+    agent.api_url = mock.url
+    phases = defaultdict(list)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for run, prompt in enumerate(PROMPTS):
+            metrics.recent.clear()
+            agent.run(prompt, n_steps=args.steps)
+            for call in metrics.recent:
+                if call.kind == "reflection":
+                    phases[(run, call.step)].append(call)
+    walls, slowest, summed = [], [], []
+    for calls in phases.values():
+        walls.append(max(c.timestamp + c.total for c in calls) - min(c.timestamp for c in calls))
+        slowest.append(max(c.total for c in calls))
+        summed.append(sum(c.total for c in calls))
+    return {
+        "reviewers": len(critics or {"reviewer": None}),
+        "phase_wall_s": statistics.fmean(walls),
+        "slowest_call_s": statistics.fmean(slowest),
+        "sum_of_calls_s": statistics.fmean(summed),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare the reflect phase of one reviewer and parallel critics.")
+    parser.add_argument("--steps", type=int, default=3, help="Reflection steps per prompt")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mock")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=800, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Probability a mock critique is <OK>")
+    parser.add_argument("--seed", type=int, default=0, help="Mock random seed")
+    args = parser.parse_args()
+
+    mock = MockProcess(args)
+    try:
+        print(f"{len(PROMPTS)} prompts x {args.steps} steps, mock latency {args.latency:g}s ± {args.jitter:g}s\n")
+        print(f"{'reviewers':<20} {'phase wall s':>13} {'slowest call s':>15} {'sum of calls s':>15}")
+        for name, critics in (("single reviewer", None), ("focused critics", CRITIC_SYSTEM_PROMPTS)):
+            r = run_reviewers(mock, critics, args)
+            label = f"{name} ({r['reviewers']})"
+            print(f"{label:<20} "
+                  f"{r['phase_wall_s']:>13.3f} {r['slowest_call_s']:>15.3f} {r['sum_of_calls_s']:>15.3f}")
+    finally:
+        mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
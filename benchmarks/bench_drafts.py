@@ -0,0 +1,98 @@
+"""
+Rounds and end-to-end latency of a single first draft versus best-of-N drafts.
+
+Runs the same prompts several times against the mock server with a draft
+quality model (--quality-threshold): a first draft holds a random number of
+"For example" sentences, every revision adds one, and the reviewer accepts a
+draft once it holds enough. Picking the best of N concurrent first drafts,
+by the local score or by one ranking call, should start the loop closer to
+acceptance, so runs need fewer rounds and finish sooner although the first
+step sends more requests.
+
+Usage:
+    python benchmarks/bench_drafts.py --drafts 3 --repeats 5 --latency 0.3
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from run_benchmarks import PROMPTS, MockProcess  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+
+
+def run_drafts(mock: MockProcess, n_drafts: int, selection: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run every prompt `args.repeats` times.
+
+    Args:
+        mock (MockProcess): The mock server
+        n_drafts (int): First drafts per run
+        selection (str): How the best draft is chosen ("heuristic" or "rank")
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        Dict[str, Any]: Mean rounds, seconds and requests per run, and the share of runs the reviewer accepted
+    """
+    agent = ReflectionAgent(model=args.model, use_cache=False, metrics=MetricsRecorder(),
+                            rate_limiter=RateLimiter(limits={}, default_limit=None), dedupe=False)
+    agent.api_url = mock.url
+    rounds, seconds = [], []
+    accepted = 0
+    before = mock.stats()["requests"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.repeats):
+            for prompt in PROMPTS:
+                start = time.perf_counter()
+                _, steps = agent.run(prompt, n_steps=args.steps, n_drafts=n_drafts, draft_selection=selection)
+                seconds.append(time.perf_counter() - start)
+                rounds.append(len(steps))
+                accepted += "<OK>" in steps[-1]["stop_reason"]
+    return {
+        "rounds": statistics.fmean(rounds),
+        "seconds": statistics.fmean(seconds),
+        "requests": (mock.stats()["requests"] - before) / len(rounds),
+        "accepted": accepted / len(rounds),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare a single first draft with best-of-N drafts.")
+    parser.add_argument("--drafts", type=int, default=3, help="First drafts per run in the best-of-N scenarios")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per prompt and scenario")
+    parser.add_argument("--steps", type=int, default=10, help="Maximum reflection steps per run")
+    parser.add_argument("--quality-threshold", type=int, default=4, help="Examples a draft needs for <OK>")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mock")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=800, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Unused with a quality threshold")
+    parser.add_argument("--seed", type=int, default=0, help="Mock random seed")
+    args = parser.parse_args()
+
+    mock = MockProcess(args, ["--quality-threshold", str(args.quality_threshold)])
+    try:
+        print(f"{len(PROMPTS)} prompts x {args.repeats} runs, mock latency {args.latency:g}s, "
+              f"<OK> at {args.quality_threshold} examples\n")
+        print(f"{'first draft':<22} {'rounds':>7} {'seconds':>8} {'requests':>9} {'accepted':>9}")
+        for n_drafts, selection in ((1, "heuristic"), (args.drafts, "heuristic"), (args.drafts, "rank")):
+            r = run_drafts(mock, n_drafts, selection, args)
+            label = "single draft" if n_drafts == 1 else f"best of {n_drafts}, {selection}"
+            print(f"{label:<22} {r['rounds']:>7.2f} {r['seconds']:>8.2f} {r['requests']:>9.2f} "
+                  f"{r['accepted']:>9.0%}")
+    finally:
+        mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Tail latency of generate and reflect calls with and without hedged requests.
+
+Starts mock servers whose latency has a long tail (--slow-probability of the
+requests are stragglers that take --slow-latency extra seconds) and sends the
+same mix of generation and reflection calls with hedging off and on. With
+hedging, a call still running after the p95 of recent latencies gets a
+duplicate (on another mock when --endpoints is above 1) and the first answer
+wins. Reports p50/p99/max call latency, hedges fired and won, and the extra
+load as the requests the mocks received per call.
+
+Usage:
+    python benchmarks/bench_hedging.py --calls 400 --slow-probability 0.03 --slow-latency 1.0
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from prompts import BASE_REFLECTION_SYSTEM_PROMPT  # noqa: E402
+from run_benchmarks import MockProcess  # noqa: E402
+from utils.hedging import HedgePolicy  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.providers import Endpoint, ProviderRouter  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def send_calls(agent: ReflectionAgent, label: str, calls: int, concurrency: int) -> None:
+    """Send `calls` distinct requests, alternating generation and reflection, `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            if i % 2:
+                await agent.areflect([{"role": "system", "content": BASE_REFLECTION_SYSTEM_PROMPT},
+                                      {"role": "user", "content": f"{label} draft {i}"}])
+            else:
+                await agent.agenerate([{"role": "system", "content": "You are a writer."},
+                                       {"role": "user", "content": f"{label} request {i}"}])
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+
+
+def run_scenario(mocks: List[MockProcess], policy: Optional[HedgePolicy], args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Warm up the latency windows, then measure `args.calls` calls.
+
+    Args:
+        mocks (List[MockProcess]): The mock servers, one endpoint each
+        policy (Optional[HedgePolicy]): The hedging policy, or None for hedging off
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        Dict[str, Any]: Latency percentiles, hedges fired and won, and upstream requests per call
+    """
+    metrics = MetricsRecorder()
+    router = ProviderRouter([Endpoint(f"mock{i}", mock.url) for i, mock in enumerate(mocks)])
+    agent = ReflectionAgent(model=args.model, use_cache=False, metrics=metrics, provider=router,
+                            rate_limiter=RateLimiter(limits={}, default_limit=None), dedupe=False,
+                            hedge=policy is not None, hedge_policy=policy)
+    label = "hedged" if policy is not None else "plain"
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(send_calls(agent, f"{label} warm-up", args.warmup, args.concurrency))
+        metrics.recent.clear()
+        before = sum(mock.stats()["requests"] for mock in mocks)
+        asyncio.run(send_calls(agent, label, args.calls, args.concurrency))
+    requests = sum(mock.stats()["requests"] for mock in mocks) - before
+    latencies = [c.total for c in metrics.recent]
+    return {
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "max": max(latencies) * 1000,
+        "mean": statistics.fmean(latencies) * 1000,
+        "hedged": sum(c.hedged for c in metrics.recent),
+        "won": sum(c.hedge_won for c in metrics.recent),
+        "requests_per_call": requests / len(latencies),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare tail latency with and without hedged requests.")
+    parser.add_argument("--calls", type=int, default=400, help="Measured calls per scenario")
+    parser.add_argument("--warmup", type=int, default=60, help="Calls that fill the latency windows first")
+    parser.add_argument("--concurrency", type=int, default=8, help="Calls in flight at once")
+    parser.add_argument("--endpoints", type=int, default=1, help="Mock servers to spread requests and hedges over")
+    parser.add_argument("--percentile", type=float, default=0.95, help="Hedge after this percentile of latency")
+    parser.add_argument("--max-extra-load", type=float, default=0.1, help="Duplicates allowed per call")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mocks")
+    parser.add_argument("--latency", type=float, default=0.1, help="Mock mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.03, help="Mock latency jitter in seconds")
+    parser.add_argument("--slow-probability", type=float, default=0.03, help="Share of straggler requests")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Extra seconds a straggler takes")
+    parser.add_argument("--response-chars", type=int, default=400, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.2, help="Probability a critique is <OK>")
+    parser.add_argument("--seed", type=int, default=0, help="Mock random seed")
+    args = parser.parse_args()
+
+    extra = ["--slow-probability", str(args.slow_probability), "--slow-latency", str(args.slow_latency)]
+    mocks = []
+    try:
+        for i in range(args.endpoints):
+            args.seed += i
+            mocks.append(MockProcess(args, extra))
+        print(f"{args.calls} calls, {args.concurrency} at a time, over {args.endpoints} mock(s): "
+              f"{args.latency:g}s +/- {args.jitter:g}s, {args.slow_probability:.0%} stragglers "
+              f"+{args.slow_latency:g}s\n")
+        print(f"{'hedging':<10} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7} {'mean ms':>8} {'hedged':>7} "
+              f"{'won':>5} {'req/call':>9}")
+        policy = HedgePolicy(percentile=args.percentile, max_extra_load=args.max_extra_load)
+        for name, scenario_policy in (("off", None), ("on", policy)):
+            r = run_scenario(mocks, scenario_policy, args)
+            print(f"{name:<10} {r['p50']:>7.1f} {r['p99']:>7.1f} {r['max']:>7.1f} {r['mean']:>8.1f} "
+                  f"{r['hedged']:>7} {r['won']:>5} {r['requests_per_call']:>9.3f}")
+        print("\nhedge delays:", {key: round(delay * 1000, 1) if delay else delay
+                                  for key, delay in policy.stats()["delays"].items()}, "ms")
+    finally:
+        for mock in mocks:
+            mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Microbenchmark: per-request CPU and allocation cost of building a chat completion body.
+
+Compares the previous request path (FixedFirstChatHistory rebuilding lists of
+dicts, copying every message again and JSON-encoding the whole payload, plus a
+second encoding for the cache key) with the current one (slotted messages in
+TokenBudgetChatHistory, a copy-free view and ChatPayload reusing each message's
+cached encoding). Each request appends one new message to a history of about
+--history-kb kilobytes, then builds the body and the cache key.
+
+Usage:
+    python benchmarks/bench_history.py --history-kb 100 --requests 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import BASE_GENERATION_SYSTEM_PROMPT  # noqa: E402
+from utils.cache import completion_key  # noqa: E402
+from utils.completions import FixedFirstChatHistory, TokenBudgetChatHistory, update_chat_history  # noqa: E402
+from utils.payloads import ChatPayload  # noqa: E402
+from utils.tokens import estimate_message_tokens  # noqa: E402
+
+MODEL = "llama-3.3-70b-versatile"
+
+
+def _initial_messages():
+    return [
+        {"role": "system", "content": BASE_GENERATION_SYSTEM_PROMPT},
+        {"role": "user", "content": "Write a detailed guide to sustainable living."},
+    ]
+
+
+def _message_text(i: int, size: int) -> str:
+    line = f"Round {i}: revise the draft and keep every section under review. "
+    return (line * (size // len(line) + 1))[:size]
+
+
+def legacy_request(history: FixedFirstChatHistory) -> bytes:
+    """The request path before slotted messages: copy, copy again, encode everything twice."""
+    messages = history.get_messages()
+    simple_messages = []
+    for msg in messages:
+        if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
+            simple_messages.append({"role": msg["role"], "content": msg["content"]})
+    payload = {"model": MODEL, "messages": simple_messages, "temperature": 0.7, "max_tokens": 1000}
+    completion_key(payload)
+    return json.dumps(payload).encode("utf-8")
+
+
+def current_request(history: TokenBudgetChatHistory) -> bytes:
+    """The current request path: a view over slotted messages and pre-encoded fragments."""
+    payload = ChatPayload(MODEL, history.view(), temperature=0.7, max_tokens=1000)
+    completion_key(payload)
+    return payload.body
+
+
+def _scenario(name: str, history_kb: int, message_kb: int):
+    message_size = message_kb * 1024
+    kept = max(1, history_kb * 1024 // message_size)
+    if name == "before":
+        history = FixedFirstChatHistory(_initial_messages(), total_length=kept + 2)
+        request = legacy_request
+    else:
+        per_message = estimate_message_tokens({"content": _message_text(0, message_size)}, MODEL)
+        budget = sum(estimate_message_tokens(msg, MODEL) for msg in _initial_messages()) + kept * per_message
+        history = TokenBudgetChatHistory(_initial_messages(), model=MODEL, max_tokens=budget)
+        request = current_request
+    # Fill the history to its steady-state size before measuring
+    for i in range(kept):
+        update_chat_history(history, _message_text(i, message_size), "assistant" if i % 2 else "user")
+    return history, request, message_size, kept
+
+
+def measure(name: str, history_kb: int, message_kb: int, requests: int) -> Dict[str, Any]:
+    """
+    Time and trace `requests` append-then-build rounds of one request path.
+
+    Args:
+        name (str): "before" or "after"
+        history_kb (int): Approximate history size kept in steady state
+        message_kb (int): Size of each appended message
+        requests (int): Number of measured requests
+
+    Returns:
+        Dict[str, Any]: Per-request CPU time and allocation figures
+    """
+    history, request, message_size, kept = _scenario(name, history_kb, message_kb)
+    texts = [_message_text(kept + i, message_size) for i in range(requests)]
+
+    def one(i: int) -> bytes:
+        update_chat_history(history, texts[i], "assistant" if i % 2 else "user")
+        return request(history)
+
+    body_size = len(one(0))
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(requests):
+        one(i)
+    cpu = (time.process_time() - cpu_start) / requests
+    wall = (time.perf_counter() - wall_start) / requests
+
+    tracemalloc.start()
+    peak_total = 0
+    for i in range(requests):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        one(i)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - before
+    tracemalloc.stop()
+
+    return {
+        "path": name,
+        "messages": kept + 2,
+        "body_bytes": body_size,
+        "cpu_us": cpu * 1e6,
+        "wall_us": wall * 1e6,
+        "peak_alloc_kb": peak_total / requests / 1024,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure per-request payload building cost before and after.")
+    parser.add_argument("--history-kb", type=int, default=100, help="History size kept in steady state")
+    parser.add_argument("--message-kb", type=int, default=2, help="Size of each appended message")
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests per path")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = [measure(name, args.history_kb, args.message_kb, args.requests) for name in ("before", "after")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{'path':<8} {'messages':>8} {'body KB':>8} {'CPU us/req':>11} {'wall us/req':>12} {'peak alloc KB/req':>18}")
+    for r in results:
+        print(f"{r['path']:<8} {r['messages']:>8} {r['body_bytes'] / 1024:>8.1f} {r['cpu_us']:>11.1f} "
+              f"{r['wall_us']:>12.1f} {r['peak_alloc_kb']:>18.1f}")
+    before, after = results
+    print(f"\nCPU {before['cpu_us'] / after['cpu_us']:.1f}x less, "
+          f"peak allocations {before['peak_alloc_kb'] / max(after['peak_alloc_kb'], 1e-9):.1f}x less per request")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Throughput, queue wait and admission control of the background job queue.
+
+Simulates many users submitting reflection runs against the mock server at
+once through a JobQueue of a given size, as the Streamlit app does, and
+follows each accepted job to the end. For every pool size reports runs
+accepted and rejected, the deepest queue seen, the wait for a worker and the
+end-to-end time per run (p50/p95), and the runs finished per second.
+
+Usage:
+    python benchmarks/bench_jobs.py --users 40 --workers 1 4 8 --max-queued 16
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from run_benchmarks import PROMPTS, MockProcess  # noqa: E402
+from utils.jobs import JobQueue, JobQueueFullError  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def run_load(mock: MockProcess, workers: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Submit one run per user at once and wait for every accepted run.
+
+    Args:
+        mock (MockProcess): The mock server
+        workers (int): Worker threads of the queue
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        Dict[str, Any]: Accepted and rejected runs, the deepest queue, wait and end-to-end percentiles,
+            and runs per second
+    """
+    queue = JobQueue(workers=workers, max_queued=args.max_queued, max_per_owner=1)
+    agent = ReflectionAgent(model=args.model, use_cache=False, metrics=MetricsRecorder(),
+                            rate_limiter=RateLimiter(limits={}, default_limit=None), dedupe=False)
+    agent.api_url = mock.url
+    deepest = 0
+    done = threading.Event()
+
+    def sample_depth() -> None:
+        nonlocal deepest
+        while not done.is_set():
+            deepest = max(deepest, queue.stats()["queued"])
+            time.sleep(0.01)
+
+    sampler = threading.Thread(target=sample_depth, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    jobs, rejected = [], 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user in range(args.users):
+            prompt = f"{PROMPTS[user % len(PROMPTS)]} (user {user})"
+            try:
+                jobs.append(queue.submit(lambda job, prompt=prompt: agent.run(prompt, n_steps=args.steps, sinks=[job]),
+                                         owner=f"user-{user}"))
+            except JobQueueFullError:
+                rejected += 1
+        for job in jobs:
+            while not job.finished:
+                job.wait(len(job.events), timeout=0.5)
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    queue.shutdown()
+    waits = [job.started_at - job.submitted_at for job in jobs]
+    totals = [job.finished_at - job.submitted_at for job in jobs]
+    return {
+        "accepted": len(jobs),
+        "rejected": rejected,
+        "failed": sum(job.status == "failed" for job in jobs),
+        "deepest": deepest,
+        "wait_p50": percentile(waits, 0.5),
+        "wait_p95": percentile(waits, 0.95),
+        "total_p50": percentile(totals, 0.5),
+        "total_p95": percentile(totals, 0.95),
+        "runs_per_second": len(jobs) / elapsed,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the background job queue under a burst of users.")
+    parser.add_argument("--users", type=int, default=40, help="Users submitting a run at the same moment")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="Pool sizes to compare")
+    parser.add_argument("--max-queued", type=int, default=16, help="Runs allowed to wait for a worker")
+    parser.add_argument("--steps", type=int, default=3, help="Reflection steps per run")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mock")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=400, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.3, help="Probability a critique is <OK>")
+    parser.add_argument("--seed", type=int, default=0, help="Mock random seed")
+    args = parser.parse_args()
+
+    mock = MockProcess(args)
+    try:
+        print(f"{args.users} users at once, {args.steps} steps per run, at most {args.max_queued} queued, "
+              f"mock latency {args.latency:g}s\n")
+        print(f"{'workers':>7} {'accepted':>9} {'rejected':>9} {'failed':>7} {'deepest':>8} {'wait p50':>9} "
+              f"{'wait p95':>9} {'run p50':>8} {'run p95':>8} {'runs/s':>7}")
+        for workers in args.workers:
+            r = run_load(mock, workers, args)
+            print(f"{workers:>7} {r['accepted']:>9} {r['rejected']:>9} {r['failed']:>7} {r['deepest']:>8} "
+                  f"{r['wait_p50']:>9.2f} {r['wait_p95']:>9.2f} {r['total_p50']:>8.2f} {r['total_p95']:>8.2f} "
+                  f"{r['runs_per_second']:>7.2f}")
+    finally:
+        mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
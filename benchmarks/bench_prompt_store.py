@@ -0,0 +1,103 @@
+"""
+Optimize-step latency with and without the optimized-prompt store.
+
+Starts from an empty store and completion cache (in a temporary directory),
+optimizes every template once cold, then, with a fresh cache, warms the store
+up as the app does at server start and optimizes the templates again, including copies that only
+differ in whitespace (which the completion cache, keyed on the exact request,
+cannot answer). Reports the optimize_prompt_seconds histogram per source.
+
+Usage:
+    python benchmarks/bench_prompt_store.py --latency 0.3
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from prompts import TEMPLATE_PROMPTS  # noqa: E402
+from run_benchmarks import MockProcess  # noqa: E402
+from utils.cache import CompletionCache  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.prompt_store import OptimizedPromptStore  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+
+
+def _optimize_all(agent: ReflectionAgent, prompts: List[str]) -> List[float]:
+    seconds = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        agent.optimize_prompt(prompt)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def _summary(seconds: List[float]) -> Dict[str, float]:
+    return {"median_ms": statistics.median(seconds) * 1000, "max_ms": max(seconds) * 1000}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the optimize step with and without the prompt store.")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mock")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=800, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Probability a mock critique is <OK>")
+    parser.add_argument("--seed", type=int, default=0, help="Mock random seed")
+    args = parser.parse_args()
+
+    templates = list(TEMPLATE_PROMPTS.values())
+    # Same prompts as typed with stray whitespace: new requests, same normalized prompt
+    retyped = [f"  {prompt.replace(' ', '  ')}\n" for prompt in templates]
+
+    mock = MockProcess(args)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics = MetricsRecorder()
+
+            def agent(with_store: bool) -> ReflectionAgent:
+                a = ReflectionAgent(model=args.model, metrics=metrics,
+                                    cache=CompletionCache(os.path.join(tmp, f"cache-{with_store}.sqlite3")),
+                                    prompt_store=OptimizedPromptStore(os.path.join(tmp, "prompts.sqlite3")),
+                                    rate_limiter=RateLimiter(limits={}, default_limit=None), dedupe=False)
+                if not with_store:
+                    a.prompt_store = None
+                a.api_url = mock.url
+                return a
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                cold = _optimize_all(agent(False), templates)
+                cache_only = _optimize_all(agent(False), retyped)
+                warm_agent = agent(True)
+                start = time.perf_counter()
+                stored = warm_agent.warm_up(templates)
+                warm_up_seconds = time.perf_counter() - start
+                warm = _optimize_all(warm_agent, templates + retyped)
+            requests = mock.stats()["requests"]
+
+        print(f"{len(templates)} templates, mock latency {args.latency * 1000:.0f} ms\n")
+        print(f"{'scenario':<34} {'median ms':>10} {'max ms':>8}")
+        for name, seconds in (("cold (no store, empty cache)", cold),
+                              ("retyped, completion cache only", cache_only),
+                              ("after warm-up, exact + retyped", warm)):
+            s = _summary(seconds)
+            print(f"{name:<34} {s['median_ms']:>10.1f} {s['max_ms']:>8.1f}")
+        print(f"\nwarm-up stored {stored} prompts in {warm_up_seconds:.2f}s; {requests} upstream requests in total\n")
+        print("\n".join(line for line in metrics.prometheus_text().splitlines()
+                        if line.startswith("reflection_agent_optimize_prompt_seconds_") and "_bucket" not in line))
+    finally:
+        mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Latency-based endpoint routing and failover across two local mock servers.
+
+Starts a fast and a slow mock server and routes generation calls over both
+with a ProviderRouter. Three phases:
+- steady: the router should settle on the fast endpoint;
+- outage: the fast endpoint answers 503 for a while, and calls should fail
+  over to the slow one without errors;
+- recovery: once the fast endpoint's cooldown has passed, traffic should
+  return to it.
+The slow endpoint alone is the baseline. Reports per phase the mean call
+latency, calls per endpoint, failovers and errors.
+
+Usage:
+    python benchmarks/bench_providers.py --calls 40 --fast-latency 0.05 --slow-latency 0.25
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from run_benchmarks import MockProcess  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.providers import Endpoint, ProviderRouter  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+from utils.retry import RetryPolicy  # noqa: E402
+
+
+async def run_phase(agent: ReflectionAgent, metrics: MetricsRecorder, phase: str, calls: int,
+                    concurrency: int) -> Dict[str, Any]:
+    """
+    Send `calls` distinct generation requests, `concurrency` at a time.
+
+    Args:
+        agent (ReflectionAgent): The agent, pointed at the router
+        metrics (MetricsRecorder): The agent's metrics
+        phase (str): Name of the phase, to keep its requests apart from the other phases'
+        calls (int): Requests to send
+        concurrency (int): Requests in flight at once
+
+    Returns:
+        Dict[str, Any]: Mean latency, calls per endpoint, failovers and errors
+    """
+    metrics.recent.clear()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            history = [{"role": "system", "content": "You are a writer."},
+                       {"role": "user", "content": f"{phase} request {i}"}]
+            try:
+                await agent.agenerate(history)
+            except Exception:
+                pass
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    records = list(metrics.recent)
+    return {
+        "latency_ms": statistics.fmean(c.total for c in records) * 1000,
+        "endpoints": Counter(c.endpoint for c in records if c.endpoint),
+        "failovers": sum(c.failovers for c in records),
+        "errors": sum(c.error is not None or c.status_code != 200 for c in records),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure latency-based routing and failover over two mock servers.")
+    parser.add_argument("--calls", type=int, default=40, help="Calls per phase")
+    parser.add_argument("--concurrency", type=int, default=4, help="Calls in flight at once")
+    parser.add_argument("--fast-latency", type=float, default=0.05, help="Latency of the fast endpoint")
+    parser.add_argument("--slow-latency", type=float, default=0.25, help="Latency of the slow endpoint")
+    parser.add_argument("--outage", type=float, default=2.0, help="Seconds the fast endpoint answers 503")
+    parser.add_argument("--cooldown", type=float, default=1.0, help="Router cooldown for unhealthy endpoints")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mocks")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=400, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Unused")
+    parser.add_argument("--seed", type=int, default=0, help="Mock random seed")
+    args = parser.parse_args()
+
+    args.latency = args.slow_latency
+    slow = MockProcess(args)
+    args.latency = args.fast_latency
+    fast = MockProcess(args)
+    try:
+        def agent(router: ProviderRouter, metrics: MetricsRecorder) -> ReflectionAgent:
+            return ReflectionAgent(model=args.model, use_cache=False, metrics=metrics, provider=router,
+                                   retry_policy=RetryPolicy(base_delay=0.05, recovery_timeout=args.cooldown),
+                                   rate_limiter=RateLimiter(limits={}, default_limit=None), dedupe=False)
+
+        # The slow endpoint is listed first, so only the measurements can move traffic to the fast one
+        router = ProviderRouter([Endpoint("slow", slow.url), Endpoint("fast", fast.url)],
+                                cooldown=args.cooldown, probe_interval=args.outage)
+        baseline_metrics, routed_metrics = MetricsRecorder(), MetricsRecorder()
+        baseline = agent(ProviderRouter([Endpoint("slow", slow.url)]), baseline_metrics)
+        routed = agent(router, routed_metrics)
+
+        async def phases() -> Dict[str, Dict[str, Any]]:
+            results = {"baseline (slow only)": await run_phase(baseline, baseline_metrics, "baseline",
+                                                               args.calls, args.concurrency)}
+            results["steady"] = await run_phase(routed, routed_metrics, "steady", args.calls, args.concurrency)
+            fast.outage(args.outage)
+            start = time.perf_counter()
+            results["outage"] = await run_phase(routed, routed_metrics, "outage", args.calls, args.concurrency)
+            # Let the outage and the cooldown pass before measuring recovery
+            await asyncio.sleep(max(args.outage - (time.perf_counter() - start), 0) + args.cooldown)
+            results["recovery"] = await run_phase(routed, routed_metrics, "recovery", args.calls, args.concurrency)
+            return results
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = asyncio.run(phases())
+
+        print(f"{args.calls} calls per phase, {args.concurrency} at a time; fast {args.fast_latency:g}s, "
+              f"slow {args.slow_latency:g}s, fast outage {args.outage:g}s\n")
+        print(f"{'phase':<22} {'mean ms':>8} {'fast':>5} {'slow':>5} {'failovers':>10} {'errors':>7}")
+        for name, r in results.items():
+            print(f"{name:<22} {r['latency_ms']:>8.1f} {r['endpoints']['fast']:>5} {r['endpoints']['slow']:>5} "
+                  f"{r['failovers']:>10} {r['errors']:>7}")
+        print("\nrouter state:", {name: {k: round(v, 3) if isinstance(v, float) else v for k, v in s.items() if k != "url"}
+                                  for name, s in router.stats().items()})
+    finally:
+        fast.close()
+        slow.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
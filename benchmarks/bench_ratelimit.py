@@ -0,0 +1,170 @@
+"""
+Stampede benchmark for the client-side rate limiter.
+
+Starts the mock server with an enforced request limit, then has --sessions
+users (each with its own ReflectionAgent, like Streamlit sessions) all start
+runs at the same moment. Without the limiter every session sends at once and
+most requests bounce off the server's 429s; with it, calls queue for their
+slot and go through. Reports how many runs succeeded, how many 429s the
+server sent, the rate-limit queue wait and the spread of session times (how
+fairly the queue served the sessions).
+
+With --processes N the sessions are split over N worker processes that
+share one rate limit state file, as Streamlit and batch workers on one host do.
+
+Usage:
+    python benchmarks/bench_ratelimit.py --sessions 10 --requests-per-minute 600 --burst-seconds 1
+    python benchmarks/bench_ratelimit.py --sessions 12 --processes 3
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from run_benchmarks import PROMPTS, MockProcess  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.providers import Endpoint, ProviderRouter  # noqa: E402
+from utils.ratelimit import FileBackend, RateLimit, RateLimiter  # noqa: E402
+from utils.retry import RetryPolicy  # noqa: E402
+
+
+def _limiter(args: argparse.Namespace, limited: bool, state_path: str = "") -> RateLimiter:
+    if not limited:
+        return RateLimiter(limits={}, default_limit=None)
+    limit = RateLimit(args.requests_per_minute, None, burst_seconds=args.burst_seconds)
+    return RateLimiter(limits={args.model: limit}, backend=FileBackend(state_path) if state_path else None)
+
+
+def run_sessions(url: str, sessions: int, limiter: RateLimiter, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    Start `sessions` users at once, each running --runs-per-session reflection runs.
+
+    Args:
+        url (str): The mock completions URL
+        sessions (int): Concurrent users
+        limiter (RateLimiter): The rate limiter shared by the users
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        List[Dict[str, Any]]: Per session: successful and failed runs, seconds, and rate-limit wait
+    """
+    # One policy for all sessions, like the process-wide default
+    policy = RetryPolicy(seed=args.seed)
+
+    def session(i: int) -> Dict[str, Any]:
+        metrics = MetricsRecorder()
+        agent = ReflectionAgent(model=args.model, use_cache=False, metrics=metrics, retry_policy=policy,
+                                rate_limiter=limiter, dedupe=False,
+                                provider=ProviderRouter([Endpoint("mock", url, rate_limited=True)]))
+        ok = failed = 0
+        start = time.perf_counter()
+        for run in range(args.runs_per_session):
+            try:
+                agent.run(PROMPTS[(i + run) % len(PROMPTS)], n_steps=args.steps)
+                ok += 1
+            except Exception:
+                failed += 1
+        return {
+            "ok": ok,
+            "failed": failed,
+            "seconds": time.perf_counter() - start,
+            "rate_limit_wait": sum(call.rate_limit_wait for call in metrics.recent),
+        }
+
+    # The engine prints every failed call; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(sessions) as pool:
+        return list(pool.map(session, range(sessions)))
+
+
+def run_scenario(mock: MockProcess, limited: bool, args: argparse.Namespace) -> Dict[str, Any]:
+    before = mock.stats()
+    start = time.perf_counter()
+    if args.processes <= 1:
+        results = run_sessions(mock.url, args.sessions, _limiter(args, limited), args)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, "ratelimit.json")
+            command = [sys.executable, os.path.abspath(__file__), "--worker", mock.url,
+                       "--sessions", str(args.sessions // args.processes), "--state-path", state_path,
+                       "--model", args.model, "--steps", str(args.steps),
+                       "--runs-per-session", str(args.runs_per_session),
+                       "--requests-per-minute", str(args.requests_per_minute),
+                       "--burst-seconds", str(args.burst_seconds), "--seed", str(args.seed)]
+            if not limited:
+                command.append("--no-limit")
+            workers = [subprocess.Popen(command, stdout=subprocess.PIPE, text=True) for _ in range(args.processes)]
+            results = [session for worker in workers for session in json.loads(worker.communicate()[0])]
+    elapsed = time.perf_counter() - start
+    after = mock.stats()
+
+    seconds = [r["seconds"] for r in results]
+    waits = [r["rate_limit_wait"] for r in results]
+    return {
+        "runs_ok": sum(r["ok"] for r in results),
+        "runs_failed": sum(r["failed"] for r in results),
+        "elapsed_s": elapsed,
+        "requests": after["requests"] + after["rate_limited"] - before["requests"] - before["rate_limited"],
+        "rate_limited": after["rate_limited"] - before["rate_limited"],
+        "mean_rate_limit_wait_s": statistics.fmean(waits),
+        "session_s": {"min": min(seconds), "median": statistics.median(seconds), "max": max(seconds)},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure a stampede of sessions with and without the rate limiter.")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent users")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes sharing a state file")
+    parser.add_argument("--runs-per-session", type=int, default=2, help="Reflection runs per user")
+    parser.add_argument("--steps", type=int, default=2, help="Reflection steps per run")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mock")
+    parser.add_argument("--requests-per-minute", type=float, default=600, help="Limit enforced by the mock")
+    parser.add_argument("--burst-seconds", type=float, default=1.0, help="Burst the mock's limit allows")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.005, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=800, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Probability a mock critique is <OK>")
+    parser.add_argument("--seed", type=int, default=0, help="Mock and jitter random seed")
+    parser.add_argument("--worker", metavar="URL", help=argparse.SUPPRESS)
+    parser.add_argument("--state-path", help=argparse.SUPPRESS)
+    parser.add_argument("--no-limit", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        limiter = _limiter(args, not args.no_limit, args.state_path)
+        print(json.dumps(run_sessions(args.worker, args.sessions, limiter, args)))
+        return 0
+
+    mock = MockProcess(args, ["--requests-per-minute", str(args.requests_per_minute),
+                              "--burst-seconds", str(args.burst_seconds)])
+    try:
+        print(f"{args.sessions} sessions in {args.processes} process(es) x {args.runs_per_session} runs, "
+              f"server limit {args.requests_per_minute:g} RPM (burst {args.burst_seconds:g}s)\n")
+        print(f"{'limiter':<8} {'runs ok':>8} {'failed':>7} {'requests':>9} {'429s':>6} {'elapsed s':>10} "
+              f"{'wait/session s':>15} {'session s min/med/max':>22}")
+        for limited in (False, True):
+            r = run_scenario(mock, limited, args)
+            spread = "/".join(f"{r['session_s'][key]:.2f}" for key in ("min", "median", "max"))
+            print(f"{'on' if limited else 'off':<8} {r['runs_ok']:>8} {r['runs_failed']:>7} {r['requests']:>9} "
+                  f"{r['rate_limited']:>6} {r['elapsed_s']:>10.2f} {r['mean_rate_limit_wait_s']:>15.2f} "
+                  f"{spread:>22}")
+            # Let the server's bucket refill between scenarios
+            time.sleep(args.burst_seconds)
+    finally:
+        mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Goodput benchmark for the retry policy, against the mock server with injected failures.
+
+Runs the same batch of reflection runs twice, with retries disabled
+(RetryPolicy(max_attempts=1)) and with the default policy, while the mock
+answers a fraction of requests with 429 (Retry-After and x-ratelimit-* headers)
+or 503. Reports the share of runs that succeeded, successful runs per second
+(goodput), requests sent per successful run and retries per error class.
+
+A second scenario takes the endpoint down for --outage seconds and shows the
+circuit breaker failing calls fast instead of spending retries on a dead
+endpoint.
+
+Usage:
+    python benchmarks/bench_retries.py --runs 40 --concurrency 8 --rate-limit-probability 0.2
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from run_benchmarks import PROMPTS, MockProcess  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+from utils.retry import RetryPolicy  # noqa: E402
+
+
+def _policy(name: str, args: argparse.Namespace, **overrides) -> RetryPolicy:
+    if name == "no_retry":
+        return RetryPolicy(max_attempts=1, seed=args.seed, **overrides)
+    return RetryPolicy(base_delay=args.base_delay, seed=args.seed, **overrides)
+
+
+def run_batch(mock: MockProcess, policy: RetryPolicy, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run `args.runs` reflection runs on `args.concurrency` threads and measure what got through.
+
+    Args:
+        mock (MockProcess): The mock server
+        policy (RetryPolicy): The retry policy under test
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        Dict[str, Any]: Success ratio, goodput, requests per successful run, retries and breaker state
+    """
+    agent = ReflectionAgent(model=args.model, use_cache=False, metrics=MetricsRecorder(), retry_policy=policy,
+                            rate_limiter=RateLimiter(limits={}, default_limit=None), dedupe=False)
+    agent.api_url = mock.url
+
+    def one(i: int):
+        start = time.perf_counter()
+        try:
+            agent.run(PROMPTS[i % len(PROMPTS)], n_steps=args.steps)
+            return True, time.perf_counter() - start
+        except Exception:
+            return False, time.perf_counter() - start
+
+    before = mock.stats()
+    start = time.perf_counter()
+    # The engine prints every failed call; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(args.concurrency) as pool:
+        outcomes = list(pool.map(one, range(args.runs)))
+    elapsed = time.perf_counter() - start
+    after = mock.stats()
+
+    succeeded = [seconds for ok, seconds in outcomes if ok]
+    failed = [seconds for ok, seconds in outcomes if not ok]
+    requests = after["requests"] + after["rate_limited"] + after["unavailable"] \
+        - before["requests"] - before["rate_limited"] - before["unavailable"]
+    stats = policy.stats()
+    return {
+        "success_ratio": len(succeeded) / len(outcomes),
+        "goodput_runs_per_s": len(succeeded) / elapsed,
+        "requests_per_success": requests / max(len(succeeded), 1),
+        "success_latency_s": statistics.fmean(succeeded) if succeeded else None,
+        "failure_latency_s": statistics.fmean(failed) if failed else None,
+        "retries": stats["retries"],
+        "exhausted": stats["exhausted"],
+        "breaker_rejections": sum(b["rejected"] for b in stats["breakers"].values()),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure goodput with and without retries under injected failures.")
+    parser.add_argument("--runs", type=int, default=40, help="Reflection runs per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Runs in flight at once")
+    parser.add_argument("--steps", type=int, default=2, help="Reflection steps per run")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mock")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.005, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=800, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Probability a mock critique is <OK>")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.2, help="Probability of a 429")
+    parser.add_argument("--unavailable-probability", type=float, default=0.05, help="Probability of a 503")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Seconds each 429 asks to wait")
+    parser.add_argument("--base-delay", type=float, default=0.05, help="Backoff before the first retry")
+    parser.add_argument("--outage", type=float, default=1.0, help="Outage length for the breaker scenario")
+    parser.add_argument("--seed", type=int, default=0, help="Mock and jitter random seed")
+    args = parser.parse_args()
+
+    mock = MockProcess(args, [
+        "--rate-limit-probability", str(args.rate_limit_probability),
+        "--unavailable-probability", str(args.unavailable_probability),
+        "--retry-after", str(args.retry_after),
+    ])
+    try:
+        print(f"{args.runs} runs x {args.steps} steps, {args.concurrency} concurrent, "
+              f"{args.rate_limit_probability:.0%} 429s, {args.unavailable_probability:.0%} 503s\n")
+        print(f"{'policy':<10} {'success':>8} {'goodput/s':>10} {'req/success':>12} {'retries':>28}")
+        for name in ("no_retry", "default"):
+            r = run_batch(mock, _policy(name, args), args)
+            print(f"{name:<10} {r['success_ratio']:>8.0%} {r['goodput_runs_per_s']:>10.1f} "
+                  f"{r['requests_per_success']:>12.1f} {str(r['retries']):>28}")
+
+        print(f"\nendpoint down for {args.outage:g}s:")
+        print(f"{'breaker':<10} {'success':>8} {'failed run s':>13} {'rejected':>9} {'retries':>28}")
+        for name, threshold in (("off", 10 ** 9), ("on", 5)):
+            policy = _policy("default", args, failure_threshold=threshold, recovery_timeout=args.outage)
+            mock.outage(args.outage)
+            r = run_batch(mock, policy, args)
+            failure_latency = f"{r['failure_latency_s']:.3f}" if r["failure_latency_s"] is not None else "-"
+            print(f"{name:<10} {r['success_ratio']:>8.0%} {failure_latency:>13} {r['breaker_rejections']:>9} "
+                  f"{str(r['retries']):>28}")
+    finally:
+        mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Full-rewrite versus patch-based revisions on the same prompts.
+
+Runs every prompt through the same number of reflection steps twice, once with
+revision_mode="rewrite" and once with revision_mode="patch", against the mock
+server. The mock's response time grows with the completion length
+(--seconds-per-token), and it answers requests for edits with a short JSON
+patch. Reports the completion tokens and latency of the revision steps (step 2
+onwards), the run latency, and how many patches fell back to a full rewrite.
+
+Usage:
+    python benchmarks/bench_revisions.py --steps 4 --seconds-per-token 0.002 --bad-patch-probability 0.1
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from run_benchmarks import PROMPTS, MockProcess  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+
+
+def run_mode(mock: MockProcess, revision_mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run every prompt with one revision mode and summarize the revision steps.
+
+    Args:
+        mock (MockProcess): The mock server
+        revision_mode (str): "rewrite" or "patch"
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        Dict[str, Any]: Completion tokens and seconds per revision step, run seconds and fallbacks
+    """
+    metrics = MetricsRecorder()
+    agent = ReflectionAgent(model=args.model, use_cache=False, metrics=metrics,
+                            rate_limiter=RateLimiter(limits={}, default_limit=None), dedupe=False)
+    agent.api_url = mock.url
+    run_seconds = []
+    fallbacks = revisions = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for prompt in PROMPTS:
+            start = time.perf_counter()
+            _, steps_data = agent.run(prompt, n_steps=args.steps, stream=args.stream, revision_mode=revision_mode)
+            run_seconds.append(time.perf_counter() - start)
+            revisions += len(steps_data) - 1
+            fallbacks += sum(1 for step in steps_data if step.get("patch", {}).get("fallback"))
+
+    # Every generation call of a revision step, fallback rewrites included
+    revision_calls = [call for call in metrics.recent if call.kind == "generation" and call.step > 1]
+    tokens_per_step = sum(call.completion_tokens or 0 for call in revision_calls) / max(revisions, 1)
+    seconds_per_step = sum(call.total for call in revision_calls) / max(revisions, 1)
+    return {
+        "completion_tokens_per_revision": tokens_per_step,
+        "seconds_per_revision": seconds_per_step,
+        "run_seconds": statistics.fmean(run_seconds),
+        "fallbacks": fallbacks,
+        "revisions": revisions,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare full-rewrite and patch-based revisions.")
+    parser.add_argument("--steps", type=int, default=4, help="Reflection steps per prompt")
+    parser.add_argument("--stream", action="store_true", help="Stream the generations and reflections")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mock")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock time to first token in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Mock latency jitter in seconds")
+    parser.add_argument("--seconds-per-token", type=float, default=0.002, help="Mock generation time per token")
+    parser.add_argument("--response-chars", type=int, default=3000, help="Characters per full mock draft")
+    parser.add_argument("--patch-chars", type=int, default=300, help="Replacement characters per mock patch")
+    parser.add_argument("--bad-patch-probability", type=float, default=0.1, help="Probability a patch does not apply")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Probability a mock critique is <OK>")
+    parser.add_argument("--seed", type=int, default=0, help="Mock random seed")
+    args = parser.parse_args()
+
+    mock = MockProcess(args, ["--seconds-per-token", str(args.seconds_per_token),
+                              "--patch-chars", str(args.patch_chars),
+                              "--bad-patch-probability", str(args.bad_patch_probability)])
+    try:
+        print(f"{len(PROMPTS)} prompts x {args.steps} steps, drafts of {args.response_chars} chars, "
+              f"{args.seconds_per_token * 1000:g} ms per token\n")
+        print(f"{'mode':<8} {'tokens/revision':>16} {'s/revision':>11} {'s/run':>7} {'fallbacks':>10}")
+        for mode in ("rewrite", "patch"):
+            r = run_mode(mock, mode, args)
+            print(f"{mode:<8} {r['completion_tokens_per_revision']:>16.0f} {r['seconds_per_revision']:>11.3f} "
+                  f"{r['run_seconds']:>7.2f} {r['fallbacks']:>5}/{r['revisions']:<4}")
+    finally:
+        mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
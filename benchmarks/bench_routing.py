@@ -0,0 +1,115 @@
+"""
+Per-run latency and tokens of a single model versus a per-role model cascade.
+
+Runs the same prompts (with prompt optimization) against the mock server,
+where the small model answers faster than the large one and some of its
+critiques are malformed. The baseline uses the large model for every role;
+the cascade keeps it for generation and routes optimization and reflection
+to the small model, escalating to the large one on a malformed critique or
+a stalled loop. Reports per-run seconds, rounds, tokens and cost, calls per
+model and escalations.
+
+Usage:
+    python benchmarks/bench_routing.py --repeats 3 --large-latency 0.4 --small-latency 0.1
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from run_benchmarks import PROMPTS, MockProcess  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+from utils.routing import ModelRouting  # noqa: E402
+
+
+def run_routing(mock: MockProcess, routing: Optional[ModelRouting], args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run every prompt `args.repeats` times.
+
+    Args:
+        mock (MockProcess): The mock server
+        routing (Optional[ModelRouting]): The cascade, or None for the large model throughout
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        Dict[str, Any]: Mean seconds, rounds, tokens, cost and escalations per run, and calls per model
+    """
+    metrics = MetricsRecorder()
+    agent = ReflectionAgent(model=args.large_model, use_cache=False, metrics=metrics, routing=routing,
+                            rate_limiter=RateLimiter(limits={}, default_limit=None), dedupe=False)
+    agent.api_url = mock.url
+    seconds, rounds, tokens, cost, escalations = [], [], [], [], []
+    calls = Counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.repeats):
+            for prompt in PROMPTS:
+                metrics.recent.clear()
+                start = time.perf_counter()
+                _, steps = agent.run(prompt, n_steps=args.steps, optimize_prompt=True)
+                seconds.append(time.perf_counter() - start)
+                rounds.append(len(steps))
+                escalations.append(sum(len(step.get("escalations", [])) for step in steps))
+                tokens.append(sum((c.prompt_tokens or 0) + (c.completion_tokens or 0) for c in metrics.recent))
+                cost.append(sum(c.cost_usd or 0.0 for c in metrics.recent))
+                calls.update(c.model for c in metrics.recent)
+    runs = len(seconds)
+    return {
+        "seconds": statistics.fmean(seconds),
+        "rounds": statistics.fmean(rounds),
+        "tokens": statistics.fmean(tokens),
+        "cost_usd": statistics.fmean(cost),
+        "escalations": statistics.fmean(escalations),
+        "calls": {model: count / runs for model, count in calls.items()},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare one model for every role with a per-role cascade.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per prompt and scenario")
+    parser.add_argument("--steps", type=int, default=6, help="Maximum reflection steps per run")
+    parser.add_argument("--large-model", default="llama-3.3-70b-versatile", help="Generation (and baseline) model")
+    parser.add_argument("--small-model", default="llama-3.1-8b-instant", help="Reflection and optimization model")
+    parser.add_argument("--large-latency", type=float, default=0.4, help="Mock latency of the large model")
+    parser.add_argument("--small-latency", type=float, default=0.1, help="Mock latency of the small model")
+    parser.add_argument("--malformed", type=float, default=0.2, help="Rate of malformed small-model critiques")
+    parser.add_argument("--quality-threshold", type=int, default=3, help="Examples a draft needs for <OK>")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=800, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Unused with a quality threshold")
+    parser.add_argument("--seed", type=int, default=0, help="Mock random seed")
+    args = parser.parse_args()
+    args.latency = args.large_latency
+
+    mock = MockProcess(args, [
+        "--quality-threshold", str(args.quality_threshold),
+        "--model-latency", f"{args.small_model}={args.small_latency}",
+        "--malformed-critique", f"{args.small_model}={args.malformed}",
+    ])
+    try:
+        print(f"{len(PROMPTS)} prompts x {args.repeats} runs; {args.large_model} {args.large_latency:g}s, "
+              f"{args.small_model} {args.small_latency:g}s with {args.malformed:.0%} malformed critiques\n")
+        print(f"{'routing':<10} {'seconds':>8} {'rounds':>7} {'tokens':>7} {'cost $':>9} {'escal.':>7}  calls per run")
+        cascade = ModelRouting(reflection=args.small_model, optimization=args.small_model,
+                               escalation={args.small_model: args.large_model})
+        for name, routing in (("single", None), ("cascade", cascade)):
+            r = run_routing(mock, routing, args)
+            calls = ", ".join(f"{model} {count:.1f}" for model, count in sorted(r["calls"].items()))
+            print(f"{name:<10} {r['seconds']:>8.2f} {r['rounds']:>7.2f} {r['tokens']:>7.0f} "
+                  f"{r['cost_usd']:>9.6f} {r['escalations']:>7.2f}  {calls}")
+    finally:
+        mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Burst benchmark for single-flight deduplication.
+
+Has --sessions users (each with its own ReflectionAgent, like Streamlit
+sessions) pick the same template at the same moment, with "Optimize prompt"
+on, and run the reflection loop. Compares how many requests reach the mock
+server and how long the burst takes with deduplication off and on.
+
+Usage:
+    python benchmarks/bench_singleflight.py --sessions 10 --steps 2 --stream
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Any, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import ReflectionAgent  # noqa: E402
+from prompts import TEMPLATE_PROMPTS  # noqa: E402
+from run_benchmarks import MockProcess  # noqa: E402
+from utils.metrics import MetricsRecorder  # noqa: E402
+from utils.ratelimit import RateLimiter  # noqa: E402
+from utils.singleflight import SingleFlight  # noqa: E402
+
+
+def run_burst(mock: MockProcess, dedupe: bool, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Start every session at once on the same template and count the upstream requests.
+
+    Args:
+        mock (MockProcess): The mock server
+        dedupe (bool): Share identical in-flight requests
+        args (argparse.Namespace): Benchmark settings
+
+    Returns:
+        Dict[str, Any]: Upstream requests, deduplicated calls and session latencies
+    """
+    prompt = next(iter(TEMPLATE_PROMPTS.values()))
+    single_flight = SingleFlight()
+    metrics = MetricsRecorder()
+    limiter = RateLimiter(limits={}, default_limit=None)
+    start_line = threading.Barrier(args.sessions)
+    seconds = []
+
+    def session() -> None:
+        agent = ReflectionAgent(model=args.model, use_cache=False, metrics=metrics, rate_limiter=limiter,
+                                single_flight=single_flight, dedupe=dedupe)
+        agent.api_url = mock.url
+        start_line.wait()
+        start = time.perf_counter()
+        optimized = agent.optimize_prompt(prompt)
+        agent.run(optimized, n_steps=args.steps, stream=args.stream)
+        seconds.append(time.perf_counter() - start)
+
+    before = mock.stats()
+    threads = [threading.Thread(target=session) for _ in range(args.sessions)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    after = mock.stats()
+    return {
+        "requests": after["requests"] - before["requests"],
+        "deduplicated": single_flight.stats()["deduplicated"],
+        "session_s": {"median": statistics.median(seconds), "max": max(seconds)},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure upstream calls for a burst of identical starts.")
+    parser.add_argument("--sessions", type=int, default=10, help="Users starting at the same moment")
+    parser.add_argument("--steps", type=int, default=2, help="Reflection steps per run")
+    parser.add_argument("--stream", action="store_true", help="Stream the generations and reflections")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mock")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=2000, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Probability a mock critique is <OK>")
+    parser.add_argument("--seed", type=int, default=0, help="Mock random seed")
+    args = parser.parse_args()
+
+    mock = MockProcess(args)
+    try:
+        print(f"{args.sessions} sessions start the same template at once "
+              f"(optimize + {args.steps} steps{', streamed' if args.stream else ''})\n")
+        print(f"{'dedupe':<7} {'upstream requests':>18} {'deduplicated':>13} {'session s p50/max':>18}")
+        for dedupe in (False, True):
+            r = run_burst(mock, dedupe, args)
+            spread = f"{r['session_s']['median']:.2f}/{r['session_s']['max']:.2f}"
+            print(f"{'on' if dedupe else 'off':<7} {r['requests']:>18} {r['deduplicated']:>13} {spread:>18}")
+    finally:
+        mock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
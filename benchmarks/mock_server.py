@@ -0,0 +1,376 @@
+"""
+Local OpenAI-compatible mock of the chat completions endpoint, for offline benchmarks.
+
+Requests whose system prompt belongs to the reviewer get a critique (or "<OK>"
+with the configured probability); every other request gets a generation of the
+configured size. Streaming requests are answered with server-sent events.
+GET /stats returns the request counters and the total simulated service time,
+so a client can tell its own overhead apart from the server's.
+
+Requests for edits (patch revision mode) get a JSON patch that replaces the
+first section, or, with --bad-patch-probability, one that does not apply.
+With --seconds-per-token the response time also grows with the completion's
+length, as a real model's does.
+
+With --quality-threshold N, drafts have a quality: a first draft holds 0 to N
+"For example" sentences at random, every rewrite adds one, and the reviewer
+answers "<OK>" once a draft holds N of them. Requests to rank drafts are
+answered with the number of the draft with the most examples.
+
+Models can differ: --model-latency NAME=SECONDS overrides the latency of one
+model, and --malformed-critique NAME=PROBABILITY makes that model's critiques
+come back as prose without recommendations at the given rate.
+
+Stragglers give the latency a long tail: with --slow-probability P a fraction
+P of the requests take --slow-latency extra seconds, like a request stuck on
+an overloaded replica.
+
+Failures can be injected: a fraction of requests get a 429 with Retry-After and
+x-ratelimit-* headers, or a 503, and GET /outage?seconds=N answers every
+completion request with a 503 for the next N seconds. With --requests-per-minute
+the server enforces a request limit like the provider's and answers 429 once
+it is used up.
+
+Usage:
+    python benchmarks/mock_server.py --port 8765 --latency 0.05 --jitter 0.01 --ok-probability 0.2
+    python benchmarks/mock_server.py --rate-limit-probability 0.2 --unavailable-probability 0.05
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+# The marker of a draft's quality when --quality-threshold is set
+_EXAMPLE = "For example"
+
+
+class MockSettings:
+    """
+    Behaviour of the mock endpoint.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, response_chars: int = 800,
+                 ok_probability: float = 0.0, stream_chunk_chars: int = 16, seed: Optional[int] = 0,
+                 rate_limit_probability: float = 0.0, unavailable_probability: float = 0.0,
+                 retry_after: float = 0.05, requests_per_minute: Optional[float] = None,
+                 burst_seconds: float = 60.0, seconds_per_token: float = 0.0, patch_chars: int = 200,
+                 bad_patch_probability: float = 0.0, quality_threshold: int = 0,
+                 model_latency: Optional[Dict[str, float]] = None,
+                 malformed_critique: Optional[Dict[str, float]] = None, slow_probability: float = 0.0,
+                 slow_latency: float = 1.0):
+        """
+        Args:
+            latency (float): Mean seconds before a response (or its first streamed chunk) is sent
+            jitter (float): Latency varies uniformly by up to this many seconds either way
+            response_chars (int): Length of each generation, in characters
+            ok_probability (float): Probability that a critique is "<OK>"
+            stream_chunk_chars (int): Characters per streamed chunk
+            seed (Optional[int]): Seed for latency and <OK> draws, or None for a random seed
+            rate_limit_probability (float): Probability that a request is answered with a 429
+            unavailable_probability (float): Probability that a request is answered with a 503
+            retry_after (float): Seconds a 429 asks the client to wait
+            requests_per_minute (Optional[float]): Enforced request limit, or None for no limit
+            burst_seconds (float): Seconds of requests the limit lets through at once
+            seconds_per_token (float): Generation time per completion token, on top of `latency`
+            patch_chars (int): Length of the replacement text in a patch reply, in characters
+            bad_patch_probability (float): Probability that a patch reply refers to a section that does not exist
+            quality_threshold (int): Examples a draft needs for the reviewer's <OK>, or 0 to draw <OK> at random
+            model_latency (Optional[Dict[str, float]]): Mean latency of particular models, instead of `latency`
+            malformed_critique (Optional[Dict[str, float]]): Probability, per model, that a critique holds neither
+                <OK> nor recommendations
+            slow_probability (float): Probability that a request is a straggler
+            slow_latency (float): Extra seconds a straggler takes
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.response_chars = response_chars
+        self.ok_probability = ok_probability
+        self.stream_chunk_chars = stream_chunk_chars
+        self.seed = seed
+        self.rate_limit_probability = rate_limit_probability
+        self.unavailable_probability = unavailable_probability
+        self.retry_after = retry_after
+        self.requests_per_minute = requests_per_minute
+        self.burst_seconds = burst_seconds
+        self.seconds_per_token = seconds_per_token
+        self.patch_chars = patch_chars
+        self.bad_patch_probability = bad_patch_probability
+        self.quality_threshold = quality_threshold
+        self.model_latency = model_latency or {}
+        self.malformed_critique = malformed_critique or {}
+        self.slow_probability = slow_probability
+        self.slow_latency = slow_latency
+
+
+class _MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open many connections at once; the default backlog of 5 resets some of them
+    request_queue_size = 1024
+
+    def __init__(self, address: Tuple[str, int], settings: MockSettings):
+        super().__init__(address, _MockHandler)
+        self.settings = settings
+        self.random = random.Random(settings.seed)
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Any] = {
+            "requests": 0,
+            "generation_requests": 0,
+            "reflection_requests": 0,
+            "patch_requests": 0,
+            "ranking_requests": 0,
+            "stream_requests": 0,
+            "service_seconds": 0.0,
+            "rate_limited": 0,
+            "unavailable": 0,
+        }
+        self.outage_until = 0.0
+        self.allowance = (settings.requests_per_minute or 0.0) * settings.burst_seconds / 60.0
+        self.allowance_updated = time.monotonic()
+
+    def draw(self, model: Optional[str] = None) -> Tuple[float, float, float, float]:
+        with self.lock:
+            latency = self.settings.model_latency.get(model, self.settings.latency)
+            delay = latency + self.random.uniform(-self.settings.jitter, self.settings.jitter)
+            if self.settings.slow_probability and self.random.random() < self.settings.slow_probability:
+                delay += self.settings.slow_latency
+            return max(delay, 0.0), self.random.random(), self.random.random(), self.random.random()
+
+    def _over_limit(self) -> Optional[float]:
+        # Seconds until the enforced request limit allows another request, or None if it allows this one
+        settings = self.settings
+        if not settings.requests_per_minute:
+            return None
+        with self.lock:
+            per_second = settings.requests_per_minute / 60.0
+            now = time.monotonic()
+            capacity = per_second * settings.burst_seconds
+            self.allowance = min(self.allowance + (now - self.allowance_updated) * per_second, capacity)
+            self.allowance_updated = now
+            if self.allowance >= 1:
+                self.allowance -= 1
+                return None
+            return (1 - self.allowance) / per_second
+
+    def injected_failure(self, failure_draw: float) -> Optional[Tuple[int, float]]:
+        """The status and Retry-After of an injected failure for this request, or None to answer normally."""
+        settings = self.settings
+        if time.monotonic() < self.outage_until:
+            return 503, 0.0
+        reset = self._over_limit()
+        if reset is not None:
+            return 429, reset
+        if failure_draw < settings.rate_limit_probability:
+            return 429, settings.retry_after
+        if failure_draw < settings.rate_limit_probability + settings.unavailable_probability:
+            return 503, 0.0
+        return None
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Without these, small writes wait for delayed ACKs and add ~40 ms per response
+    disable_nagle_algorithm = True
+    wbufsize = 1 << 16
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def _completion_text(self, messages, model: Optional[str], ok_draw: float, patch_draw: float) -> Tuple[str, str]:
+        settings = self.server.settings
+        system = messages[0]["content"] if messages else ""
+        last = messages[-1]["content"] if messages else ""
+        threshold = settings.quality_threshold
+        if "numbered drafts" in system:
+            drafts = re.split(r"^Draft \d+:$", last, flags=re.MULTILINE)[1:]
+            best = max(range(len(drafts)), key=lambda i: drafts[i].count(_EXAMPLE)) if drafts else 0
+            return "ranking", str(best + 1)
+        if "reviewer" in system.lower():
+            if patch_draw < settings.malformed_critique.get(model, 0.0):
+                return "reflection", "Overall the content reads well, but it could still be improved in places."
+            if (last.count(_EXAMPLE) >= threshold) if threshold else ok_draw < settings.ok_probability:
+                return "reflection", "<OK>"
+            return "reflection", (f"1. Tighten the opening of: {last[:40]}\n"
+                                  f"2. Add a concrete example\n"
+                                  f"3. Shorten the conclusion")
+        filler = "The quick brown fox jumps over the lazy dog. "
+        if "listing your edits" in last:
+            section = 10 ** 6 if patch_draw < settings.bad_patch_probability else 1
+            replacement = f"Revised after {len(messages)} messages. " + filler * (settings.patch_chars // len(filler) + 1)
+            edits = [{"op": "replace", "section": section, "text": replacement[:settings.patch_chars]}]
+            return "patch", json.dumps({"edits": edits})
+        text = f"Draft after {len(messages)} messages. "
+        if threshold:
+            previous = [m["content"] for m in messages if m.get("role") == "assistant"]
+            examples = previous[-1].count(_EXAMPLE) + 1 if previous else int(ok_draw * (threshold + 1))
+            text += f"{_EXAMPLE}, a concrete case. " * examples
+        text += filler * (max(settings.response_chars - len(text), 0) // len(filler) + 1)
+        return "generation", text[:settings.response_chars]
+
+    def do_POST(self) -> None:
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        messages = body.get("messages", [])
+        delay, ok_draw, failure_draw, patch_draw = server.draw(body.get("model"))
+        failure = server.injected_failure(failure_draw)
+        if failure is not None:
+            self._send_failure(*failure)
+            return
+        kind, text = self._completion_text(messages, body.get("model"), ok_draw, patch_draw)
+        # Time to generate the completion, after the time to first token
+        generation_seconds = len(text) // 4 * server.settings.seconds_per_token
+        stream = bool(body.get("stream"))
+        with server.lock:
+            server.counters["requests"] += 1
+            server.counters[f"{kind}_requests"] += 1
+            server.counters["stream_requests"] += stream
+            server.counters["service_seconds"] += delay + generation_seconds
+        time.sleep(delay)
+
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                 "total_tokens": prompt_tokens + len(text) // 4}
+        if not stream:
+            time.sleep(generation_seconds)
+            self._send_json(200, {
+                "id": "mock",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        size = server.settings.stream_chunk_chars
+        for i in range(0, len(text), size):
+            if i:
+                time.sleep(generation_seconds * size / len(text))
+            chunk = {"choices": [{"index": 0, "delta": {"content": text[i:i + size]}, "finish_reason": None}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+        self._write_chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_failure(self, status: int, retry_after: float) -> None:
+        server = self.server
+        with server.lock:
+            server.counters["rate_limited" if status == 429 else "unavailable"] += 1
+        if status == 429:
+            # Groq-style headers: the request limit is exhausted until the reset
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {
+                "Retry-After": f"{retry_after:g}",
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": f"{retry_after:g}s",
+            })
+            return
+        self._send_json(503, {"error": {"message": "Service unavailable", "type": "server_error"}})
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path.rstrip("/")
+        if path == "/stats":
+            with self.server.lock:
+                self._send_json(200, dict(self.server.counters))
+        elif path == "/outage":
+            seconds = float(urllib.parse.parse_qs(url.query).get("seconds", ["0"])[0])
+            with self.server.lock:
+                self.server.outage_until = time.monotonic() + seconds
+            self._send_json(200, {"outage_seconds": seconds})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+def serve(settings: MockSettings, host: str = "127.0.0.1", port: int = 0) -> _MockServer:
+    """
+    Start the mock server on a background thread.
+
+    Args:
+        settings (MockSettings): Behaviour of the endpoint
+        host (str): Interface to bind
+        port (int): Port to bind, or 0 for a free one
+
+    Returns:
+        _MockServer: The running server; its completions URL is http://host:server.server_port/v1/chat/completions
+    """
+    server = _MockServer((host, port), settings)
+    threading.Thread(target=server.serve_forever, name="mock-completions", daemon=True).start()
+    return server
+
+
+def _per_model(values) -> Dict[str, float]:
+    # "NAME=VALUE" arguments to a dictionary
+    return {name: float(value) for name, value in (item.rsplit("=", 1) for item in values)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI-compatible chat completions endpoint.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8765, help="Port to bind (0 for a free one)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=800, help="Characters per generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Probability a critique is <OK>")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="Probability of a 429")
+    parser.add_argument("--unavailable-probability", type=float, default=0.0, help="Probability of a 503")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Seconds a 429 asks the client to wait")
+    parser.add_argument("--requests-per-minute", type=float, help="Enforce a request limit with 429s")
+    parser.add_argument("--burst-seconds", type=float, default=60.0, help="Seconds of requests allowed at once")
+    parser.add_argument("--seconds-per-token", type=float, default=0.0, help="Generation time per completion token")
+    parser.add_argument("--patch-chars", type=int, default=200, help="Replacement text per patch reply")
+    parser.add_argument("--bad-patch-probability", type=float, default=0.0, help="Probability a patch does not apply")
+    parser.add_argument("--quality-threshold", type=int, default=0,
+                        help="Examples a draft needs for <OK> (0 draws <OK> at random)")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="NAME=SECONDS",
+                        help="Mean latency of one model (repeatable)")
+    parser.add_argument("--malformed-critique", action="append", default=[], metavar="NAME=PROBABILITY",
+                        help="Probability a model's critique has no recommendations (repeatable)")
+    parser.add_argument("--slow-probability", type=float, default=0.0, help="Probability a request is a straggler")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Extra seconds a straggler takes")
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency, args.jitter, args.response_chars, args.ok_probability, seed=args.seed,
+                            rate_limit_probability=args.rate_limit_probability,
+                            unavailable_probability=args.unavailable_probability, retry_after=args.retry_after,
+                            requests_per_minute=args.requests_per_minute, burst_seconds=args.burst_seconds,
+                            seconds_per_token=args.seconds_per_token, patch_chars=args.patch_chars,
+                            bad_patch_probability=args.bad_patch_probability,
+                            quality_threshold=args.quality_threshold,
+                            model_latency=_per_model(args.model_latency),
+                            malformed_critique=_per_model(args.malformed_critique),
+                            slow_probability=args.slow_probability, slow_latency=args.slow_latency)
+    server = _MockServer((args.host, args.port), settings)
+    # The first line tells a parent process where to connect
+    print(f"http://{args.host}:{server.server_port}/v1/chat/completions", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+"""
+Offline benchmark suite for the Reflection Agent's own overhead.
+
+Starts the mock completions server (benchmarks/mock_server.py) in a separate
+process, points a ReflectionAgent at it and measures:
+
+- engine import time in a fresh interpreter
+- `run` (plain and streamed) and `optimize_prompt`: end-to-end latency
+  percentiles, requests per run, and engine overhead, i.e. wall time minus
+  the server's simulated service time, per run and per step
+- allocations per run (tracemalloc peak and retained memory)
+- the history/payload hot path (see bench_history.py)
+
+No network access or API key is needed. Results are written as JSON so runs
+from different commits can be compared with --compare.
+
+Usage:
+    python benchmarks/run_benchmarks.py --runs 20 --steps 3 --latency 0.02
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/abc1234.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import bench_history  # noqa: E402
+from engine import ReflectionAgent  # noqa: E402
+from utils.providers import Endpoint, ProviderRouter  # noqa: E402
+from utils.ratelimit import RateLimit, RateLimiter  # noqa: E402
+
+PROMPTS = [
+    "Write a blog post about sustainable living",
+    "Explain how vaccines train the immune system",
+    "Draft a product announcement for a note-taking app",
+    "Summarize the causes of the French Revolution",
+]
+
+
+# Reported but too noisy to flag as regressions
+TAIL_METRICS = (".p90", ".p99", ".max")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values (List[float]): The samples
+        pct (float): The percentile, 0-100
+
+    Returns:
+        float: The sample at that rank
+    """
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean": statistics.fmean(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+class MockProcess:
+    """
+    The mock completions server running in a child process, so its threads do not
+    compete with the engine for the GIL or show up in the engine's allocations.
+    """
+
+    def __init__(self, args: argparse.Namespace, extra_args: Optional[List[str]] = None):
+        command = [
+            sys.executable, os.path.join(BENCH_DIR, "mock_server.py"), "--port", "0",
+            "--latency", str(args.latency), "--jitter", str(args.jitter),
+            "--response-chars", str(args.response_chars), "--ok-probability", str(args.ok_probability),
+            "--seed", str(args.seed),
+        ] + (extra_args or [])
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        self.url = self.process.stdout.readline().strip()
+        if not self.url:
+            raise RuntimeError("mock server failed to start")
+        self.base_url = self.url.split("/v1/")[0]
+
+    def _get(self, path: str) -> Dict[str, Any]:
+        with urllib.request.urlopen(self.base_url + path) as response:
+            return json.loads(response.read())
+
+    def stats(self) -> Dict[str, Any]:
+        return self._get("/stats")
+
+    def outage(self, seconds: float) -> None:
+        """Make the server answer every completion request with a 503 for `seconds`."""
+        self._get(f"/outage?seconds={seconds}")
+
+    def close(self) -> None:
+        self.process.terminate()
+        self.process.wait()
+
+
+def measure_import_time(module: str = "engine", repeats: int = 5) -> Dict[str, float]:
+    """Median and best time to import a module in a fresh interpreter."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    samples = [
+        float(subprocess.check_output([sys.executable, "-c", code], cwd=REPO_DIR, text=True))
+        for _ in range(repeats)
+    ]
+    return {"median": statistics.median(samples), "min": min(samples)}
+
+
+def measure_calls(mock: MockProcess, call: Callable[[int], int], count: int) -> Dict[str, Any]:
+    """
+    Time `count` sequential calls against the mock and split each into service time and engine overhead.
+
+    Args:
+        mock (MockProcess): The mock server
+        call (Callable[[int], int]): Runs call number i and returns how many steps it took
+        count (int): Number of measured calls
+
+    Returns:
+        Dict[str, Any]: Latency, overhead and request-count summaries
+    """
+    latencies, overheads, step_overheads, requests = [], [], [], []
+    for i in range(count):
+        before = mock.stats()
+        start = time.perf_counter()
+        steps = call(i)
+        elapsed = time.perf_counter() - start
+        after = mock.stats()
+        overhead = elapsed - (after["service_seconds"] - before["service_seconds"])
+        latencies.append(elapsed)
+        overheads.append(overhead)
+        step_overheads.append(overhead / max(steps, 1))
+        requests.append(after["requests"] - before["requests"])
+    return {
+        "latency_s": summarize(latencies),
+        "overhead_s": summarize(overheads),
+        "overhead_per_step_s": summarize(step_overheads),
+        "requests_per_call": statistics.fmean(requests),
+    }
+
+
+def measure_allocations(call: Callable[[int], int], count: int) -> Dict[str, float]:
+    """Peak and retained traced memory per call, in KB."""
+    tracemalloc.start()
+    peaks, retained = [], []
+    for i in range(count):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        call(i)
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append((peak - before) / 1024)
+        retained.append((current - before) / 1024)
+    tracemalloc.stop()
+    return {"peak_kb": statistics.fmean(peaks), "retained_kb": statistics.fmean(retained)}
+
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    mock = MockProcess(args)
+    try:
+        # Limits far above the mock's throughput: the limiter's bookkeeping is measured, never its waiting
+        limiter = RateLimiter(limits={}, default_limit=RateLimit(1e9, 1e12))
+        agent = ReflectionAgent(model=args.model, use_cache=False, rate_limiter=limiter,
+                                provider=ProviderRouter([Endpoint("mock", mock.url, rate_limited=True)]))
+
+        def run(i: int, stream: bool = False) -> int:
+            _, steps_data = agent.run(PROMPTS[i % len(PROMPTS)], n_steps=args.steps, stream=stream)
+            return len(steps_data)
+
+        def optimize(i: int) -> int:
+            agent.optimize_prompt(PROMPTS[i % len(PROMPTS)])
+            return 1
+
+        # Warm up connections, imports and caches before measuring
+        run(0)
+        optimize(0)
+
+        results = {
+            "import_engine_s": measure_import_time("engine", args.import_repeats),
+            "run": measure_calls(mock, run, args.runs),
+            "run_stream": measure_calls(mock, lambda i: run(i, stream=True), args.runs),
+            "optimize_prompt": measure_calls(mock, optimize, args.runs),
+            "allocations_per_run": measure_allocations(run, max(args.runs // 4, 3)),
+            "history_payload": {
+                key: value
+                for key, value in bench_history.measure("after", args.history_kb, 2, 200).items()
+                if key in ("cpu_us", "peak_alloc_kb")
+            },
+        }
+        transport = agent.transport.stats()
+        results["connection_reuse_ratio"] = transport["reuse_ratio"]
+        return results
+    finally:
+        mock.close()
+
+
+def _flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Print every metric next to its baseline and return the ones that regressed.
+    Every metric is lower-is-better except the connection reuse ratio. Tail percentiles
+    are shown but not flagged, since a few dozen samples make them noisy.
+
+    Args:
+        baseline (Dict[str, Any]): Results of an earlier run
+        current (Dict[str, Any]): Results of this run
+        threshold (float): Relative change that counts as a regression (0.1 = 10%)
+
+    Returns:
+        List[str]: Names of the regressed metrics
+    """
+    old, new = _flatten(baseline["results"]), _flatten(current["results"])
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('commit')}:")
+    for name, value in new.items():
+        if name not in old:
+            continue
+        change = (value - old[name]) / old[name] if old[name] else 0.0
+        higher_is_better = name == "connection_reuse_ratio"
+        regressed = (-change if higher_is_better else change) > threshold and not name.endswith(TAIL_METRICS)
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<45} {old[name]:>12.6g} -> {value:>12.6g} {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the engine's overhead against a local mock endpoint.")
+    parser.add_argument("--runs", type=int, default=20, help="Measured calls per scenario")
+    parser.add_argument("--steps", type=int, default=3, help="Reflection steps per run")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Model name sent to the mock")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.005, help="Mock latency jitter in seconds")
+    parser.add_argument("--response-chars", type=int, default=2000, help="Characters per mock generation")
+    parser.add_argument("--ok-probability", type=float, default=0.0, help="Probability a mock critique is <OK>")
+    parser.add_argument("--seed", type=int, default=0, help="Mock random seed")
+    parser.add_argument("--history-kb", type=int, default=100, help="History size for the payload benchmark")
+    parser.add_argument("--import-repeats", type=int, default=5, help="Fresh interpreters for the import timing")
+    parser.add_argument("-o", "--output", help="Results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with 1 if any metric regressed")
+    args = parser.parse_args()
+
+    commit = _commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("output", "compare", "threshold", "fail_on_regression")},
+        "results": run_suite(args),
+    }
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    results = report["results"]
+    print(f"engine import: {results['import_engine_s']['median'] * 1000:.1f} ms")
+    for name in ("run", "run_stream", "optimize_prompt"):
+        r = results[name]
+        print(f"{name:<16} p50 {r['latency_s']['p50'] * 1000:8.1f} ms  p99 {r['latency_s']['p99'] * 1000:8.1f} ms  "
+              f"overhead/step p50 {r['overhead_per_step_s']['p50'] * 1000:6.2f} ms  "
+              f"requests/call {r['requests_per_call']:.1f}")
+    allocations = results["allocations_per_run"]
+    print(f"allocations/run: peak {allocations['peak_kb']:.0f} KB, retained {allocations['retained_kb']:.1f} KB")
+    print(f"history payload ({args.history_kb} KB): {results['history_payload']['cpu_us']:.0f} us/request")
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
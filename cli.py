@@ -0,0 +1,89 @@
+"""
+Command-line entry point for running a single prompt through the Reflection Agent.
+
+Usage:
+    python cli.py "Write a blog post about sustainable living" --steps 3 --optimize --stream
+"""
+import argparse
+import json
+import sys
+
+from dotenv import load_dotenv
+
+from engine import ReflectionAgent
+from prompts import CRITIC_SYSTEM_PROMPTS
+from utils.convergence import ConvergenceConfig
+from utils.events import ConsoleSink
+from utils.metrics import MetricsRecorder
+from utils.routing import ModelRouting
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Generate content and iteratively improve it with AI reflection.")
+    parser.add_argument("prompt", help="What you would like the AI to generate ('-' to read from stdin)")
+    parser.add_argument("-n", "--steps", type=int, default=3, help="Maximum number of reflection steps")
+    parser.add_argument("-m", "--model", default="llama-3.3-70b-versatile", help="Model to use (for generation)")
+    parser.add_argument("--reflection-model", help="Model of the reviewer, e.g. llama-3.1-8b-instant")
+    parser.add_argument("--optimization-model", help="Model that optimizes the prompt")
+    parser.add_argument("--no-escalation", action="store_true",
+                        help="Keep the role models even when critiques are malformed or the loop stalls")
+    parser.add_argument("--optimize", action="store_true", help="Optimize the prompt before generating")
+    parser.add_argument("--stream", action="store_true", help="Stream generations and critiques as they are written")
+    parser.add_argument("--quiet", action="store_true", help="Only print the final result")
+    parser.add_argument("--json", action="store_true", help="Print the final result and steps as JSON")
+    parser.add_argument("--no-early-stop", action="store_true", help="Only stop when the reviewer answers <OK>")
+    parser.add_argument("--critics", action="store_true", help="Review with several focused critics in parallel")
+    parser.add_argument("--revision-mode", choices=("rewrite", "patch"), default="rewrite",
+                        help="Revise by full rewrites or by edits against the draft")
+    parser.add_argument("--drafts", type=int, default=1, help="First drafts written in parallel; the best one is revised")
+    parser.add_argument("--draft-selection", choices=("heuristic", "rank"), default="heuristic",
+                        help="Pick the best first draft by a local score or by one model call")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Send a duplicate of a request slower than 95%% of recent ones; the first answer wins")
+    parser.add_argument("--timeout", type=float,
+                        help="Seconds the run may take; then it stops and prints the steps it finished")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API instead of the completion cache")
+    parser.add_argument("--metrics-jsonl", help="Append a latency/token record for every API call to this file")
+    parser.add_argument("--prometheus", help="Write Prometheus metrics for the run to this file")
+    args = parser.parse_args()
+
+    load_dotenv()
+    prompt = sys.stdin.read() if args.prompt == "-" else args.prompt
+    sinks = [] if args.quiet or args.json else [ConsoleSink(show_text=True)]
+    metrics = MetricsRecorder(jsonl_path=args.metrics_jsonl)
+    agent = ReflectionAgent(
+        model=args.model,
+        use_cache=not args.no_cache,
+        sinks=sinks,
+        convergence=None if args.no_early_stop else ConvergenceConfig(),
+        metrics=metrics,
+        critics=CRITIC_SYSTEM_PROMPTS if args.critics else None,
+        routing=ModelRouting(reflection=args.reflection_model, optimization=args.optimization_model,
+                             escalation={} if args.no_escalation else None),
+        hedge=args.hedge,
+    )
+
+    final_output, steps_data = agent.run(
+        user_msg=prompt,
+        n_steps=args.steps,
+        optimize_prompt=args.optimize,
+        stream=args.stream,
+        revision_mode=args.revision_mode,
+        n_drafts=args.drafts,
+        draft_selection=args.draft_selection,
+        timeout=args.timeout,
+    )
+    metrics.close()
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
+
+    if args.json:
+        print(json.dumps({"final_output": final_output, "steps_data": steps_data}, indent=2))
+    else:
+        print("\n\n" + "=" * 30 + " FINAL RESULT " + "=" * 30 + "\n")
+        print(final_output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1074 @@
+"""
+Headless Reflection Agent engine.
+
+This module has no UI dependencies: progress is reported through typed events
+(see utils.events) so the same engine drives the Streamlit app, the CLI, batch
+jobs and tests.
+"""
+import asyncio
+import hashlib
+import json
+from contextlib import nullcontext
+from dataclasses import replace
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from colorama import Fore
+
+from prompts import (
+    BASE_GENERATION_SYSTEM_PROMPT,
+    BASE_REFLECTION_SYSTEM_PROMPT,
+    DRAFT_RANKING_SYSTEM_PROMPT,
+    PATCH_FALLBACK_PROMPT,
+    PATCH_REVISION_PROMPT,
+)
+from utils.cache import CompletionCache, get_completion_cache
+from utils.cancellation import CancellationToken, RunCancelled
+from utils.completions import build_prompt_structure
+from utils.completions import Message
+from utils.completions import TokenBudgetChatHistory
+from utils.completions import update_chat_history
+from utils.convergence import ConvergenceConfig, ConvergenceDetector
+from utils.critics import critic_agrees, merge_critiques
+from utils.drafts import parse_ranking, score_draft
+from utils.events import (
+    CallFinished,
+    Cancelled,
+    Converged,
+    CritiqueDone,
+    GenerationDone,
+    ProgressSink,
+    PromptOptimized,
+    RunFinished,
+    StepStarted,
+    TokenDelta,
+    emit,
+)
+from utils.hedging import HedgePolicy, get_hedge_policy
+from utils.logging import fancy_step_tracker
+from utils.metrics import CallMetrics, MetricsRecorder, get_metrics
+from utils.patches import PatchError, apply_patch, parse_patch, render_sections, strip_section_numbers
+from utils.payloads import ChatPayload
+from utils.prompt_store import OptimizedPromptStore, get_prompt_store, normalize_prompt
+from utils.providers import DEFAULT_API_URL, Endpoint, ProviderRouter, get_provider
+from utils.ratelimit import RateLimiter, get_rate_limiter
+from utils.retry import RetryPolicy, get_retry_policy
+from utils.routing import ModelRouter, ModelRouting, critique_is_malformed
+from utils.singleflight import SingleFlight, get_single_flight
+from utils.transport import RequestStats, Transport, TransportResponse, TransportStatusError, get_transport
+
+
+async def _prepend(first, rest: AsyncIterator) -> AsyncIterator:
+    try:
+        yield first
+        async for item in rest:
+            yield item
+    finally:
+        # Abort the upstream stream if the consumer stops early
+        await rest.aclose()
+
+
+# Encoded once per process and reused by every optimization request
+OPTIMIZATION_SYSTEM_MESSAGE = Message(
+    "system",
+    """You are a prompt optimization expert. Your task is to enhance the user's prompt to make it more detailed, 
+                specific, and optimized for generating high-quality content.
+                
+                Follow these guidelines:
+                1. Maintain the original intent of the prompt
+                2. Add relevant details and specifications
+                3. Improve clarity and structure
+                4. Consider adding formatting suggestions
+                5. Remove any vague or ambiguous language
+                
+                Respond ONLY with the optimized prompt, without explanations or additional text.""",
+)
+OPTIMIZATION_TEMPERATURE = 0.7
+OPTIMIZATION_MAX_TOKENS = 1000
+# Prompt store entries made with other instructions or sampling settings are not reused
+OPTIMIZATION_VARIANT = hashlib.sha256(
+    json.dumps([OPTIMIZATION_SYSTEM_MESSAGE.content, OPTIMIZATION_TEMPERATURE, OPTIMIZATION_MAX_TOKENS]).encode("utf-8")
+).hexdigest()[:16]
+
+# Sampling temperature of each best-of-N first draft. Drafts of one model must differ in their request,
+# or the completion cache and single-flight would hand every draft the same answer
+DRAFT_TEMPERATURES = (0.7, 0.9, 0.5, 1.0, 0.3, 1.1, 0.1, 1.2)
+# The ranking call answers with a draft number and sees at most this many characters of each draft
+RANKING_MAX_TOKENS = 8
+RANKING_DRAFT_CHARS = 2000
+
+class ReflectionAgent:
+    """
+    A class that implements a Reflection Agent, which generates responses and reflects
+    on them using the LLM to iteratively improve the interaction.
+
+    The engine is natively asynchronous (`agenerate`, `areflect`, `aoptimize_prompt`,
+    `arun`) so one event loop can drive many reflection loops at once; the synchronous
+    methods are thin wrappers around the same request building and parsing.
+    """
+
+    def __init__(self, model: str = "llama-3.3-70b-versatile", transport: Optional[Transport] = None,
+                 cache: Optional[CompletionCache] = None, use_cache: bool = True,
+                 sinks: Optional[List[ProgressSink]] = None, convergence: Optional[ConvergenceConfig] = None,
+                 metrics: Optional[MetricsRecorder] = None, retry_policy: Optional[RetryPolicy] = None,
+                 rate_limiter: Optional[RateLimiter] = None, single_flight: Optional[SingleFlight] = None,
+                 dedupe: bool = True, prompt_store: Optional[OptimizedPromptStore] = None,
+                 critics: Optional[Dict[str, str]] = None, routing: Optional[ModelRouting] = None,
+                 provider: Optional[ProviderRouter] = None, hedge: bool = False,
+                 hedge_policy: Optional[HedgePolicy] = None):
+        self.model = model
+        # OpenAI-compatible endpoints (hosted API, local servers) with their URLs and API keys, configured
+        # through the environment and shared by every agent in the process by default
+        self.provider = provider or get_provider()
+        # Pooled keep-alive transport shared by every agent in the process
+        self.transport = transport or get_transport()
+        # Persistent completion cache shared by every agent in the process
+        self.cache = (cache or get_completion_cache()) if use_cache else None
+        # Persistent memo of optimized prompts, keyed by normalized prompt and model
+        self.prompt_store = (prompt_store or get_prompt_store()) if use_cache else None
+        # Progress sinks notified on every run of this agent
+        self.sinks = list(sinks or [])
+        # Early-stopping thresholds; None keeps the reviewer's <OK> as the only stop signal
+        self.convergence = convergence
+        # Model per role (generation, reflection, optimization) and escalation rules; None uses `model` throughout
+        self.routing = routing
+        # System prompt per focused critic (e.g. prompts.CRITIC_SYSTEM_PROMPTS); None uses the single reviewer
+        self.critics = critics
+        # Per-call latency/token records, shared by every agent in the process by default
+        self.metrics = metrics or get_metrics()
+        # Backoff, retry budgets and circuit breakers shared by every agent in the process by default
+        self.retry_policy = retry_policy or get_retry_policy()
+        # Requests/tokens-per-minute queue shared by every agent (and, through a file, every process) by default
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        # Identical requests in flight at the same time share one upstream call
+        self.single_flight = (single_flight or get_single_flight()) if dedupe else None
+        # Slow non-streamed requests get a duplicate, within a budget of extra load; off by default
+        self.hedging = (hedge_policy or get_hedge_policy()) if hedge else None
+
+    def role_model(self, role: str) -> str:
+        """The model the agent's routing assigns to a role ("generation", "reflection" or "optimization")."""
+        return self.routing.model_for(role, self.model) if self.routing is not None else self.model
+
+    @property
+    def api_url(self) -> str:
+        """URL of the first configured endpoint."""
+        return self.provider.endpoints[0].url
+
+    @api_url.setter
+    def api_url(self, url: str) -> None:
+        # Send every request to this one URL, e.g. a local server; only the hosted API is rate limited
+        self.provider = ProviderRouter([Endpoint("default", url, self.provider.endpoints[0].api_key,
+                                                 rate_limited=url == DEFAULT_API_URL)])
+
+    def _record_call(self, call: CallMetrics, sinks: Optional[List[ProgressSink]] = None) -> None:
+        # Every generate, reflect and optimize call ends up here: succeeded, failed or answered from the cache
+        self.metrics.record(call)
+        emit(self.sinks if sinks is None else sinks, CallFinished(call))
+
+    @staticmethod
+    def _retry_hook(call: CallMetrics, verbose: int = 0):
+        def on_retry(error_class: str, delay: float) -> None:
+            call.note_retry(error_class, delay)
+            if verbose > 0:
+                print(f"{call.kind.capitalize()} call failed ({error_class}); retrying in {delay:.2f}s")
+        return on_retry
+
+    @staticmethod
+    def _failover_hook(call: CallMetrics, verbose: int = 0):
+        def on_failover(endpoint: str, error_class: str) -> None:
+            call.note_failover()
+            if verbose > 0:
+                print(f"{call.kind.capitalize()} call failed on {endpoint} ({error_class}); trying the next endpoint")
+        return on_failover
+
+    async def _aopen_stream(self, payload: ChatPayload, call: CallMetrics, tokens: int, endpoint: Endpoint):
+        if endpoint.rate_limited:
+            call.rate_limit_wait += await self.rate_limiter.aacquire(payload.model, tokens)
+        # Wait for the first chunk, so a status error surfaces (and can be retried) before any text is yielded
+        chunks = self.transport.astream(endpoint.url, endpoint.headers(), payload.body_for(endpoint.model_name(payload.model)))
+        try:
+            first = await chunks.__anext__()
+        except TransportStatusError:
+            if endpoint.rate_limited:
+                self.rate_limiter.settle(payload.model, tokens, 0)
+            raise
+        return first, chunks
+
+    @staticmethod
+    def _measure_response(response, call: CallMetrics, verbose: int = 0) -> None:
+        if verbose > 0:
+            print(response.stats)
+        call.apply_stats(response.stats)
+        if response.status_code == 200:
+            call.apply_result(response.json())
+
+    def _settle_tokens(self, payload: ChatPayload, tokens: int, call: CallMetrics) -> None:
+        # Replace the rate limiter's estimate with the usage the provider reported; a shared
+        # response was already settled by the caller that made the request
+        if call.deduplicated or call.endpoint is None or not self.provider.endpoint(call.endpoint).rate_limited:
+            return
+        if call.prompt_tokens is not None and call.completion_tokens is not None:
+            self.rate_limiter.settle(payload.model, tokens, call.prompt_tokens + call.completion_tokens)
+
+    def _flight_key(self, payload: ChatPayload) -> str:
+        return f"{self.provider.key} {payload.cache_key}{' stream' if payload.stream else ''}"
+
+    def _send_completion(self, payload: ChatPayload, call: CallMetrics, tokens: int, verbose: int = 0,
+                         cancel: Optional[CancellationToken] = None) -> Tuple[TransportResponse, Endpoint]:
+        # The upstream request: routed to the best endpoint, rate limited, retried and failed over
+        if self.hedging is not None:
+            # Racing a duplicate needs an event loop; blocking callers borrow the transport's I/O loop
+            return self.transport.run(self._ahedged_completion(payload, call, tokens, verbose), cancel)
+
+        def attempt(endpoint: Endpoint):
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            call.endpoint = endpoint.name
+            if endpoint.rate_limited:
+                call.rate_limit_wait += self.rate_limiter.acquire(payload.model, tokens, cancel)
+            response = self.transport.post(endpoint.url, endpoint.headers(),
+                                           payload.body_for(endpoint.model_name(payload.model)), cancel=cancel)
+            if response.status_code != 200 and endpoint.rate_limited:
+                # A rejected request used no tokens; it still counts as a request
+                self.rate_limiter.settle(payload.model, tokens, 0)
+            return response
+
+        return self.provider.call(payload.model, attempt, self.retry_policy, on_retry=self._retry_hook(call, verbose),
+                                  on_failover=self._failover_hook(call, verbose), cancel=cancel)
+
+    async def _asend_completion(self, payload: ChatPayload, call: CallMetrics, tokens: int,
+                                verbose: int = 0, avoid: Optional[str] = None) -> Tuple[TransportResponse, Endpoint]:
+        async def attempt(endpoint: Endpoint):
+            call.endpoint = endpoint.name
+            if endpoint.rate_limited:
+                call.rate_limit_wait += await self.rate_limiter.aacquire(payload.model, tokens)
+            response = await self.transport.apost(endpoint.url, endpoint.headers(),
+                                                  payload.body_for(endpoint.model_name(payload.model)))
+            if response.status_code != 200 and endpoint.rate_limited:
+                # A rejected request used no tokens; it still counts as a request
+                self.rate_limiter.settle(payload.model, tokens, 0)
+            return response
+
+        return await self.provider.acall(payload.model, attempt, self.retry_policy,
+                                         on_retry=self._retry_hook(call, verbose),
+                                         on_failover=self._failover_hook(call, verbose), avoid=avoid)
+
+    async def _ahedged_completion(self, payload: ChatPayload, call: CallMetrics, tokens: int,
+                                  verbose: int = 0) -> Tuple[TransportResponse, Endpoint]:
+        # A request still running after the hedging delay gets a duplicate, preferably on another endpoint.
+        # Each request fills in a record of its own, so the loser cannot overwrite the winner's endpoint,
+        # waits and retries; the call takes the winner's (the primary's, if both fail)
+        primary, duplicate = replace(call), replace(call)
+
+        def hedge():
+            if verbose > 0:
+                print(f"{call.kind.capitalize()} call is slow on {primary.endpoint}; sending a duplicate request")
+            return self._asend_completion(payload, duplicate, tokens, verbose, avoid=primary.endpoint)
+
+        hedge_won = False
+        try:
+            (response, endpoint), call.hedged, hedge_won = await self.hedging.arace(
+                f"{call.kind} {payload.model}",
+                lambda: self._asend_completion(payload, primary, tokens, verbose),
+                hedge,
+                accept=lambda sent: sent[0].status_code == 200,
+            )
+        finally:
+            call.take_attempt(duplicate if hedge_won else primary)
+            call.hedge_won = hedge_won
+        return response, endpoint
+
+    async def _aupstream_stream(self, payload: ChatPayload, call: CallMetrics, tokens: int, verbose: int = 0):
+        # Only opening the stream is retried or failed over; a stream that fails midway has already yielded text
+        (first, chunks), endpoint = await self.provider.acall(
+            payload.model,
+            lambda endpoint: self._aopen_stream(payload, call, tokens, endpoint),
+            self.retry_policy,
+            on_retry=self._retry_hook(call, verbose),
+            on_failover=self._failover_hook(call, verbose),
+        )
+        call.endpoint = endpoint.name
+        stream = _prepend(first, chunks)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    def _post_completion(self, payload: ChatPayload, call: CallMetrics, verbose: int = 0,
+                         cancel: Optional[CancellationToken] = None):
+        """
+        Send a chat completion payload over the shared transport, retrying 429s, 5xx and
+        connection errors according to the agent's retry policy. Every attempt first waits
+        for a slot from the agent's rate limiter, an identical request already in
+        flight is joined instead of sent again, and with hedging a slow request gets a
+        duplicate.
+
+        Args:
+            payload (ChatPayload): The chat completion request
+            call (CallMetrics): Filled in with the request's timings, token usage and status
+            verbose (int): Verbosity level
+            cancel (Optional[CancellationToken]): Aborts the request when cancelled or past its deadline
+
+        Returns:
+            TransportResponse: The response with its connection-reuse stats
+
+        Raises:
+            RunCancelled: If `cancel` stopped the request
+        """
+        tokens = self.rate_limiter.estimate(payload)
+        if self.single_flight is None:
+            response, endpoint = self._send_completion(payload, call, tokens, verbose, cancel)
+        else:
+            (response, endpoint), call.deduplicated = self.single_flight.do(
+                self._flight_key(payload), lambda: self._send_completion(payload, call, tokens, verbose, cancel),
+                cancel
+            )
+        call.endpoint = endpoint.name
+        self._measure_response(response, call, verbose)
+        self._settle_tokens(payload, tokens, call)
+        return response
+
+    async def _apost_completion(self, payload: ChatPayload, call: CallMetrics, verbose: int = 0):
+        """Async twin of `_post_completion`."""
+        tokens = self.rate_limiter.estimate(payload)
+        send = self._asend_completion if self.hedging is None else self._ahedged_completion
+        if self.single_flight is None:
+            response, endpoint = await send(payload, call, tokens, verbose)
+        else:
+            (response, endpoint), call.deduplicated = await self.single_flight.ado(
+                self._flight_key(payload), lambda: send(payload, call, tokens, verbose)
+            )
+        call.endpoint = endpoint.name
+        self._measure_response(response, call, verbose)
+        self._settle_tokens(payload, tokens, call)
+        return response
+
+    def _open_stream(self, payload: ChatPayload, call: CallMetrics, tokens: int, verbose: int = 0):
+        # The completion's chunks, from its own request or from an identical stream already in flight
+        if self.single_flight is None:
+            return self._aupstream_stream(payload, call, tokens, verbose)
+
+        def joined(shared: bool) -> None:
+            call.deduplicated = shared
+
+        return self.single_flight.astream(
+            self._flight_key(payload), lambda: self._aupstream_stream(payload, call, tokens, verbose), joined
+        )
+
+    def _completion_payload(self, history, verbose: int = 0, model: Optional[str] = None, temperature: float = 0.7,
+                            max_tokens: int = 1000) -> ChatPayload:
+        # History objects (e.g. TokenBudgetChatHistory) hand out their messages without copying;
+        # plain lists of dictionaries are converted once here
+        if hasattr(history, 'view'):
+            messages = history.view()
+        elif hasattr(history, 'get_messages'):
+            messages = history.get_messages()
+        else:
+            messages = history
+
+        payload = ChatPayload(model or self.model, messages, temperature=temperature, max_tokens=max_tokens)
+
+        # Debug
+        if verbose > 0:
+            print(f"API URL: {self.api_url}")
+            print(f"Number of messages: {len(payload.messages)}")
+            print(f"First message role: {payload.messages[0].role if payload.messages else 'No messages'}")
+            print("Payload:", json.dumps(payload.to_dict(), indent=2))
+
+        return payload
+
+    def _completion_output(self, response, verbose: int = 0, log_title: str = "COMPLETION", log_color: str = "") -> str:
+        # Check response
+        if response.status_code != 200:
+            error_message = f"API call failed with status code {response.status_code}: {response.text}"
+            print(error_message)
+            raise Exception(error_message)
+        
+        # Parse response
+        result = response.json()
+        output = result["choices"][0]["message"]["content"]
+        
+        if verbose > 0:
+            print(log_color, f"\n\n{log_title}\n\n", output)
+            
+        return output
+
+    def _cache_get(self, payload: ChatPayload, verbose: int = 0) -> Optional[str]:
+        if self.cache is None:
+            return None
+        output = self.cache.get(payload)
+        if output is not None and verbose > 0:
+            print("Completion cache hit")
+        return output
+
+    def _cache_put(self, payload: ChatPayload, output: str) -> None:
+        if self.cache is not None:
+            self.cache.put(payload, output)
+
+    def _request_completion(self, history, verbose: int = 0, log_title: str = "COMPLETION", log_color: str = "",
+                            kind: str = "generation", step: Optional[int] = None,
+                            sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None,
+                            temperature: float = 0.7, max_tokens: int = 1000,
+                            cancel: Optional[CancellationToken] = None):
+        call = CallMetrics(kind, model or self.model, step)
+        try:
+            payload = self._completion_payload(history, verbose, model, temperature, max_tokens)
+            cached = self._cache_get(payload, verbose)
+            if cached is not None:
+                call.cached = True
+                return cached
+            response = self._post_completion(payload, call, verbose, cancel)
+            output = self._completion_output(response, verbose, log_title, log_color)
+            self._cache_put(payload, output)
+            return output
+        except RunCancelled as e:
+            # Stopping is not a failure: no error message
+            call.finish(e)
+            raise
+        except Exception as e:
+            call.finish(e)
+            print(f"Error in request completion: {str(e)}")
+            raise
+        finally:
+            self._record_call(call.finish(), sinks)
+
+    async def _arequest_completion(self, history, verbose: int = 0, log_title: str = "COMPLETION", log_color: str = "",
+                                   kind: str = "generation", step: Optional[int] = None,
+                                   sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None,
+                                   temperature: float = 0.7, max_tokens: int = 1000):
+        call = CallMetrics(kind, model or self.model, step)
+        try:
+            payload = self._completion_payload(history, verbose, model, temperature, max_tokens)
+            cached = self._cache_get(payload, verbose)
+            if cached is not None:
+                call.cached = True
+                return cached
+            response = await self._apost_completion(payload, call, verbose)
+            output = self._completion_output(response, verbose, log_title, log_color)
+            self._cache_put(payload, output)
+            return output
+        except Exception as e:
+            call.finish(e)
+            print(f"Error in request completion: {str(e)}")
+            raise
+        finally:
+            self._record_call(call.finish(), sinks)
+
+    async def _astream_completion(self, history, verbose: int = 0, log_title: str = "COMPLETION", log_color: str = "",
+                                  kind: str = "generation", step: Optional[int] = None,
+                                  sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None,
+                                  temperature: float = 0.7, max_tokens: int = 1000) -> AsyncIterator[str]:
+        call = CallMetrics(kind, model or self.model, step, streamed=True)
+        try:
+            payload = self._completion_payload(history, verbose, model, temperature, max_tokens)
+            cached = self._cache_get(payload, verbose)
+            if cached is not None:
+                call.cached = True
+                yield cached
+                return
+            payload.stream = True
+            parts = []
+            tokens = self.rate_limiter.estimate(payload)
+            chunks = self._open_stream(payload, call, tokens, verbose)
+            try:
+                async for chunk in chunks:
+                    if isinstance(chunk, RequestStats):
+                        if verbose > 0:
+                            print(chunk)
+                        call.apply_stats(chunk)
+                        continue
+                    # finish_reason and usage arrive on the last chunks
+                    call.apply_result(chunk)
+                    choices = chunk.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            finally:
+                # Stops the upstream stream (or leaves the shared one) if the consumer stops early
+                await chunks.aclose()
+
+            output = "".join(parts)
+            self._settle_tokens(payload, tokens, call)
+            self._cache_put(payload, output)
+            if verbose > 0:
+                print(log_color, f"\n\n{log_title}\n\n", output)
+        except TransportStatusError as e:
+            # Raise, and record, the same error as the non-streaming path
+            call.apply_stats(e.response.stats)
+            try:
+                self._completion_output(e.response, verbose, log_title, log_color)
+            except Exception as error:
+                call.finish(error)
+                print(f"Error in request completion: {str(error)}")
+                raise
+        except Exception as e:
+            call.finish(e)
+            print(f"Error in request completion: {str(e)}")
+            raise
+        finally:
+            self._record_call(call.finish(), sinks)
+
+    def generate(self, generation_history: list, verbose: int = 0, step: Optional[int] = None,
+                 sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None,
+                 temperature: float = 0.7, cancel: Optional[CancellationToken] = None) -> str:
+        return self._request_completion(
+            generation_history, verbose, log_title="GENERATION", log_color=Fore.BLUE,
+            kind="generation", step=step, sinks=sinks, model=model, temperature=temperature, cancel=cancel
+        )
+
+    def reflect(self, reflection_history: list, verbose: int = 0, step: Optional[int] = None,
+                sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None,
+                temperature: float = 0.7, cancel: Optional[CancellationToken] = None) -> str:
+        return self._request_completion(
+            reflection_history, verbose, log_title="REFLECTION", log_color=Fore.GREEN,
+            kind="reflection", step=step, sinks=sinks, model=model, temperature=temperature, cancel=cancel
+        )
+
+    async def agenerate(self, generation_history: list, verbose: int = 0, step: Optional[int] = None,
+                        sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None,
+                        temperature: float = 0.7) -> str:
+        return await self._arequest_completion(
+            generation_history, verbose, log_title="GENERATION", log_color=Fore.BLUE,
+            kind="generation", step=step, sinks=sinks, model=model, temperature=temperature
+        )
+
+    async def areflect(self, reflection_history: list, verbose: int = 0, step: Optional[int] = None,
+                       sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None,
+                       temperature: float = 0.7) -> str:
+        return await self._arequest_completion(
+            reflection_history, verbose, log_title="REFLECTION", log_color=Fore.GREEN,
+            kind="reflection", step=step, sinks=sinks, model=model, temperature=temperature
+        )
+
+    def astream_generate(self, generation_history: list, verbose: int = 0, step: Optional[int] = None,
+                         sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None,
+                         temperature: float = 0.7) -> AsyncIterator[str]:
+        """Yield the generation as text deltas while the model produces it."""
+        return self._astream_completion(
+            generation_history, verbose, log_title="GENERATION", log_color=Fore.BLUE,
+            kind="generation", step=step, sinks=sinks, model=model, temperature=temperature
+        )
+
+    def astream_reflect(self, reflection_history: list, verbose: int = 0, step: Optional[int] = None,
+                        sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None,
+                        temperature: float = 0.7) -> AsyncIterator[str]:
+        """Yield the critique as text deltas while the model produces it."""
+        return self._astream_completion(
+            reflection_history, verbose, log_title="REFLECTION", log_color=Fore.GREEN,
+            kind="reflection", step=step, sinks=sinks, model=model, temperature=temperature
+        )
+
+    @staticmethod
+    async def _collect_stream(deltas: AsyncIterator[str], sinks: List[ProgressSink], step: int, kind: str) -> str:
+        # The joined deltas are exactly the text the non-streaming path would return
+        parts = []
+        async for delta in deltas:
+            parts.append(delta)
+            emit(sinks, TokenDelta(step, kind, delta))
+        return "".join(parts)
+
+    async def _areflect_panel(self, histories: Dict[str, Any], verbose: int, step: int,
+                              sinks: List[ProgressSink], model: Optional[str] = None) -> Dict[str, str]:
+        # The critics review the draft concurrently, so the phase takes as long as the slowest of them
+        tasks = [
+            asyncio.ensure_future(self.areflect(history, verbose=verbose, step=step, sinks=sinks, model=model))
+            for history in histories.values()
+        ]
+        try:
+            critiques = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return dict(zip(histories, critiques))
+
+    async def _agenerate_text(self, generation_history, verbose: int, step: int, sinks: List[ProgressSink],
+                              stream: bool, kind: str = "generation", model: Optional[str] = None) -> str:
+        # One generation call, streamed to the sinks as `kind` deltas when asked
+        if stream:
+            return await self._collect_stream(
+                self.astream_generate(generation_history, verbose=verbose, step=step, sinks=sinks, model=model),
+                sinks, step, kind
+            )
+        return await self.agenerate(generation_history, verbose=verbose, step=step, sinks=sinks, model=model)
+
+    async def _afirst_draft(self, generation_history, user_msg: str, n_drafts: int, models: List[str],
+                            selection: str, verbose: int, step: int,
+                            sinks: List[ProgressSink]) -> Tuple[str, List[Dict[str, Any]]]:
+        # Generate the drafts concurrently, one model and temperature each, and keep the best one.
+        # A failed draft is recorded and skipped; the step only fails when every draft does
+        plan = [(models[i % len(models)], DRAFT_TEMPERATURES[i]) for i in range(n_drafts)]
+        results = await asyncio.gather(*[
+            self.agenerate(generation_history, verbose=verbose, step=step, sinks=sinks,
+                           model=model, temperature=temperature)
+            for model, temperature in plan
+        ], return_exceptions=True)
+
+        drafts: List[Dict[str, Any]] = []
+        for (model, temperature), result in zip(plan, results):
+            if isinstance(result, BaseException):
+                if verbose > 0:
+                    print(f"Draft with {model} at temperature {temperature} failed: {result}")
+                drafts.append({"model": model, "temperature": temperature, "error": str(result)})
+            else:
+                drafts.append({"model": model, "temperature": temperature, "text": result,
+                               "score": round(score_draft(result, user_msg)["score"], 4)})
+        candidates = [i for i, draft in enumerate(drafts) if "text" in draft]
+        if not candidates:
+            raise next(result for result in results if isinstance(result, BaseException))
+
+        chosen = max(candidates, key=lambda i: drafts[i]["score"])
+        if selection == "rank" and len(candidates) > 1:
+            try:
+                chosen = candidates[await self._arank_drafts(
+                    user_msg, [drafts[i]["text"] for i in candidates], verbose, step, sinks
+                )]
+            except Exception as e:
+                # The heuristic pick stands
+                print(f"Draft ranking failed, keeping the best-scored draft: {e}")
+        for i, draft in enumerate(drafts):
+            draft["chosen"] = i == chosen
+        return drafts[chosen]["text"], [
+            {key: value for key, value in draft.items() if key != "text"} for draft in drafts
+        ]
+
+    async def _arank_drafts(self, user_msg: str, drafts: List[str], verbose: int, step: int,
+                            sinks: List[ProgressSink]) -> int:
+        # One short call, at temperature 0, that answers with the number of the best draft
+        numbered = "\n\n".join(
+            f"Draft {i}:\n{draft[:RANKING_DRAFT_CHARS]}" for i, draft in enumerate(drafts, 1)
+        )
+        history = [
+            build_prompt_structure(prompt=DRAFT_RANKING_SYSTEM_PROMPT, role="system"),
+            build_prompt_structure(prompt=f"Request:\n{user_msg}\n\n{numbered}", role="user"),
+        ]
+        reply = await self._arequest_completion(
+            history, verbose, log_title="RANKING", log_color=Fore.YELLOW, kind="ranking", step=step,
+            sinks=sinks, temperature=0.0, max_tokens=RANKING_MAX_TOKENS
+        )
+        return parse_ranking(reply, len(drafts))
+
+    @staticmethod
+    def _patch_request(critique: str, draft: str) -> str:
+        # The critique, the edit instructions and the current draft in numbered sections; the draft is
+        # repeated here so the patch stays applicable after the history trimmed older messages
+        return f"{critique}\n\n{PATCH_REVISION_PROMPT.strip()}\n\nCurrent draft:\n\n{render_sections(draft)}"
+
+    async def _arevise_with_patch(self, generation_history, draft: str, verbose: int, step: int,
+                                  sinks: List[ProgressSink], stream: bool,
+                                  model: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        # Ask for edits against the draft and apply them locally; a reply that does not apply
+        # is followed up with a request for a full rewrite
+        reply = await self._agenerate_text(generation_history, verbose, step, sinks, stream, kind="patch",
+                                           model=model)
+        update_chat_history(generation_history, reply, "assistant")
+        try:
+            edits = parse_patch(reply)
+            return apply_patch(draft, edits), {"edits": edits}
+        except PatchError as e:
+            if verbose > 0:
+                print(f"Patch could not be applied ({e}); falling back to a full rewrite")
+            update_chat_history(generation_history, PATCH_FALLBACK_PROMPT.format(error=e).strip(), "user")
+            generation = strip_section_numbers(
+                await self._agenerate_text(generation_history, verbose, step, sinks, stream, model=model)
+            )
+            update_chat_history(generation_history, generation, "assistant")
+            return generation, {"edits": None, "error": str(e), "fallback": "rewrite"}
+
+    def _optimization_payload(self, user_prompt: str, model: str, verbose: int = 0) -> ChatPayload:
+        # Create an optimization prompt
+        optimization_messages = [
+            OPTIMIZATION_SYSTEM_MESSAGE,
+            Message("user", f"Please optimize this prompt for better results: {user_prompt}"),
+        ]
+        
+        # Send to API for optimization
+        if verbose > 0:
+            print(f"Optimizing prompt: {user_prompt}")
+
+        return ChatPayload(model, optimization_messages, temperature=OPTIMIZATION_TEMPERATURE,
+                           max_tokens=OPTIMIZATION_MAX_TOKENS)
+
+    def _memo_get(self, user_prompt: str, model: str, verbose: int = 0) -> Optional[str]:
+        if self.prompt_store is None:
+            return None
+        optimized_prompt = self.prompt_store.get(user_prompt, model, OPTIMIZATION_VARIANT)
+        if optimized_prompt is not None and verbose > 0:
+            print("Optimized prompt store hit")
+        return optimized_prompt
+
+    def _memo_put(self, user_prompt: str, model: str, optimized_prompt: str) -> None:
+        if self.prompt_store is not None:
+            self.prompt_store.put(user_prompt, model, optimized_prompt, OPTIMIZATION_VARIANT)
+
+    def _optimized_output(self, user_prompt: str, response, verbose: int = 0) -> str:
+        # Check response
+        if response.status_code != 200:
+            print(f"Prompt optimization failed: {response.status_code} - {response.text}")
+            return user_prompt  # Return original prompt if optimization fails
+        
+        # Parse response
+        result = response.json()
+        optimized_prompt = result["choices"][0]["message"]["content"]
+        
+        if verbose > 0:
+            print(f"Original prompt: {user_prompt}")
+            print(f"Optimized prompt: {optimized_prompt}")
+            
+        return optimized_prompt
+
+    def optimize_prompt(self, user_prompt: str, verbose: int = 0,
+                        sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None,
+                        cancel: Optional[CancellationToken] = None) -> str:
+        """
+        Send a user prompt to Groq for optimization before using it in the main application.
+        
+        Args:
+            user_prompt (str): The original user prompt
+            verbose (int): Verbosity level
+            sinks (Optional[List[ProgressSink]]): Receive this call's CallFinished event instead of the agent's sinks
+            model (Optional[str]): Model that optimizes the prompt; defaults to the routing's optimization model
+            cancel (Optional[CancellationToken]): Aborts the request when cancelled or past its deadline
+            
+        Returns:
+            str: The optimized prompt
+
+        Raises:
+            RunCancelled: If `cancel` stopped the request
+        """
+        model = model or self.role_model("optimization")
+        call = CallMetrics("optimization", model)
+        try:
+            memoized = self._memo_get(user_prompt, model, verbose)
+            if memoized is not None:
+                call.cached = call.memoized = True
+                return memoized
+            payload = self._optimization_payload(user_prompt, model, verbose)
+            cached = self._cache_get(payload, verbose)
+            if cached is not None:
+                call.cached = True
+                self._memo_put(user_prompt, model, cached)
+                return cached
+            response = self._post_completion(payload, call, verbose, cancel)
+            optimized_prompt = self._optimized_output(user_prompt, response, verbose)
+            if response.status_code == 200:
+                self._cache_put(payload, optimized_prompt)
+                self._memo_put(user_prompt, model, optimized_prompt)
+            return optimized_prompt
+        except RunCancelled as e:
+            # Unlike a failed optimization, a stopped one does not fall back to the original prompt
+            call.finish(e)
+            raise
+        except Exception as e:
+            call.finish(e)
+            print(f"Error optimizing prompt: {str(e)}")
+            return user_prompt  # Return original prompt if optimization fails
+        finally:
+            self._record_call(call.finish(), sinks)
+
+    async def aoptimize_prompt(self, user_prompt: str, verbose: int = 0,
+                               sinks: Optional[List[ProgressSink]] = None, model: Optional[str] = None) -> str:
+        """
+        Async twin of `optimize_prompt`.
+        
+        Args:
+            user_prompt (str): The original user prompt
+            verbose (int): Verbosity level
+            sinks (Optional[List[ProgressSink]]): Receive this call's CallFinished event instead of the agent's sinks
+            model (Optional[str]): Model that optimizes the prompt; defaults to the routing's optimization model
+            
+        Returns:
+            str: The optimized prompt
+        """
+        model = model or self.role_model("optimization")
+        call = CallMetrics("optimization", model)
+        try:
+            memoized = self._memo_get(user_prompt, model, verbose)
+            if memoized is not None:
+                call.cached = call.memoized = True
+                return memoized
+            payload = self._optimization_payload(user_prompt, model, verbose)
+            cached = self._cache_get(payload, verbose)
+            if cached is not None:
+                call.cached = True
+                self._memo_put(user_prompt, model, cached)
+                return cached
+            response = await self._apost_completion(payload, call, verbose)
+            optimized_prompt = self._optimized_output(user_prompt, response, verbose)
+            if response.status_code == 200:
+                self._cache_put(payload, optimized_prompt)
+                self._memo_put(user_prompt, model, optimized_prompt)
+            return optimized_prompt
+        except Exception as e:
+            call.finish(e)
+            print(f"Error optimizing prompt: {str(e)}")
+            return user_prompt  # Return original prompt if optimization fails
+        finally:
+            self._record_call(call.finish(), sinks)
+
+    async def awarm_up(self, prompts: Iterable[str], verbose: int = 0) -> int:
+        """
+        Optimize the prompts that are not in the prompt store yet, concurrently, so later
+        optimize_prompt calls for them return without a round trip.
+
+        Args:
+            prompts (Iterable[str]): Prompts to optimize, e.g. the templates
+            verbose (int): Verbosity level
+
+        Returns:
+            int: The number of prompts newly stored
+        """
+        if self.prompt_store is None:
+            return 0
+        model = self.role_model("optimization")
+        missing = {}
+        for prompt in prompts:
+            if not self.prompt_store.contains(prompt, model, OPTIMIZATION_VARIANT):
+                missing.setdefault(normalize_prompt(prompt), prompt)
+        # Failed optimizations return the original prompt and are not stored
+        await asyncio.gather(*(self.aoptimize_prompt(prompt, verbose) for prompt in missing.values()))
+        return sum(self.prompt_store.contains(prompt, model, OPTIMIZATION_VARIANT) for prompt in missing.values())
+
+    def warm_up(self, prompts: Iterable[str], verbose: int = 0) -> int:
+        """Synchronous wrapper around `awarm_up`."""
+        return asyncio.run(self.awarm_up(prompts, verbose))
+
+    async def arun(self, user_msg: str, generation_system_prompt: str = "", reflection_system_prompt: str = "", n_steps: int = 10, verbose: int = 0, optimize_prompt: bool = False,
+                   stream: bool = False, sinks: Optional[List[ProgressSink]] = None,
+                   convergence: Optional[ConvergenceConfig] = None, revision_mode: str = "rewrite",
+                   critics: Optional[Dict[str, str]] = None, n_drafts: int = 1,
+                   draft_models: Optional[List[str]] = None, draft_selection: str = "heuristic",
+                   routing: Optional[ModelRouting] = None, cancel: Optional[CancellationToken] = None,
+                   timeout: Optional[float] = None) -> tuple:
+        """
+        Run the generate/reflect loop.
+
+        Args:
+            user_msg (str): The user's request
+            generation_system_prompt (str): Extra instructions prepended to the generation system prompt
+            reflection_system_prompt (str): Extra instructions prepended to the reflection system prompt
+                (to every critic's, with critics)
+            n_steps (int): Maximum number of generate/reflect rounds
+            verbose (int): Verbosity level
+            optimize_prompt (bool): Optimize the user's request before generating
+            stream (bool): Stream generations and critiques token by token
+            sinks (Optional[List[ProgressSink]]): Callables that receive the run's progress events
+                (see utils.events), in addition to the agent's own sinks; every API call is
+                reported as a CallFinished event with its latency and token usage
+            convergence (Optional[ConvergenceConfig]): Stop early once successive rounds converge;
+                defaults to the agent's setting. Without it the loop only stops on <OK> or after n_steps
+            revision_mode (str): "rewrite" has the generator re-emit the whole draft on every step;
+                "patch" asks it for edits against the current draft after the first step (see utils.patches),
+                and falls back to a full rewrite when the edits do not apply
+            critics (Optional[Dict[str, str]]): System prompt per focused critic, e.g.
+                prompts.CRITIC_SYSTEM_PROMPTS; defaults to the agent's setting. The critics review each
+                draft concurrently and their recommendations are merged into one critique (see
+                utils.critics), which is <OK> only when every critic agrees. Without critics a single
+                reviewer uses the base reflection prompt. Critics' replies are not streamed
+            n_drafts (int): Number of first drafts generated concurrently, at different temperatures
+                (see DRAFT_TEMPERATURES); the best one enters the loop. Up to 8. Drafts are not streamed
+            draft_models (Optional[List[str]]): Models the drafts take turns on; defaults to the agent's model
+            draft_selection (str): "heuristic" keeps the draft with the best local score (see
+                utils.drafts.score_draft); "rank" asks the model for the best draft in one short call,
+                falling back to the score if the reply names no draft
+            routing (Optional[ModelRouting]): Model per role and escalation rules (see utils.routing);
+                defaults to the agent's setting. A malformed critique escalates the reviewer to a stronger
+                model and is asked again in the same step; a stalled loop escalates the reviewer, then
+                the generator. Without routing every call uses the agent's model
+            cancel (Optional[CancellationToken]): Stops the run when cancelled, e.g. from another thread:
+                the requests in flight are aborted and the steps finished so far are returned
+            timeout (Optional[float]): Wall-clock budget of the run in seconds, after which it stops the
+                same way
+
+        Returns:
+            tuple: The final generation and the list of per-step data. Each step records its
+                convergence metrics, and the last step records why the loop stopped ("stop_reason").
+                In patch mode, revised steps also record their "patch": the edits, or the error
+                that made the step fall back to a full rewrite. With critics, each step records the
+                individual "critiques" next to the merged "critique". With several drafts, the first step
+                records each draft's model, temperature, score (or error) and whether it was "chosen".
+                Each step records the "models" its generation and reflection used, and the steps that
+                escalated a role record their "escalations". A stopped run returns its latest generation
+                ("" if there was none) and the finished steps, the last one with the cancellation as its
+                stop reason
+
+        Raises:
+            ValueError: If n_steps, revision_mode, n_drafts or draft_selection is invalid
+        """
+        if n_steps < 1:
+            raise ValueError(f"n_steps must be at least 1, got {n_steps}")
+        if revision_mode not in ("rewrite", "patch"):
+            raise ValueError(f"Unknown revision mode: {revision_mode}")
+        if not 1 <= n_drafts <= len(DRAFT_TEMPERATURES):
+            raise ValueError(f"n_drafts must be between 1 and {len(DRAFT_TEMPERATURES)}, got {n_drafts}")
+        if draft_selection not in ("heuristic", "rank"):
+            raise ValueError(f"Unknown draft selection: {draft_selection}")
+        sinks = self.sinks + list(sinks or [])
+        convergence = convergence or self.convergence
+        critics = critics or self.critics
+        # Without a routing every role keeps the agent's model and nothing escalates
+        router = ModelRouter(routing or self.routing or ModelRouting(escalation={}), self.model)
+        detector = ConvergenceDetector(convergence) if convergence is not None else None
+        # Everything below stops at the next await once the token is cancelled or the deadline passes;
+        # the steps finished so far are returned
+        if timeout is not None:
+            cancel = cancel or CancellationToken()
+            cancel.limit(timeout)
+        steps_data = []
+        generation = ""
+        try:
+            with cancel.bind() if cancel is not None else nullcontext():
+                if optimize_prompt:
+                    original_msg = user_msg
+                    user_msg = await self.aoptimize_prompt(user_msg, verbose, sinks=sinks,
+                                                           model=router.models["optimization"])
+                    emit(sinks, PromptOptimized(original_msg, user_msg))
+
+                generation_system_prompt += BASE_GENERATION_SYSTEM_PROMPT
+
+                # Both histories pin their initial messages and trim the rest to the model's token budget
+                generation_history = TokenBudgetChatHistory(
+                    [
+                        build_prompt_structure(prompt=generation_system_prompt, role="system"),
+                        build_prompt_structure(prompt=user_msg, role="user"),
+                    ],
+                    model=router.models["generation"],
+                )
+
+                # One history per critic, each holding that critic's own earlier critiques
+                reviewer_prompts = critics or {"reviewer": BASE_REFLECTION_SYSTEM_PROMPT}
+                reflection_histories = {
+                    name: TokenBudgetChatHistory(
+                        [build_prompt_structure(prompt=reflection_system_prompt + prompt, role="system")],
+                        model=router.models["reflection"],
+                    )
+                    for name, prompt in reviewer_prompts.items()
+                }
+
+                for step in range(n_steps):
+                    if verbose > 0:
+                        fancy_step_tracker(step, n_steps)
+
+                    emit(sinks, StepStarted(step + 1, n_steps))
+                    generation_trims = len(generation_history.trim_log)
+                    reflection_trims = {name: len(history.trim_log) for name, history in reflection_histories.items()}
+                    escalations = len(router.escalations)
+                    models = {"generation": router.models["generation"]}
+
+                    # Generate the response: the first draft in full (the best of several, if asked),
+                    # later ones in full or as a patch
+                    patch = drafts = None
+                    if step == 0 and n_drafts > 1:
+                        generation, drafts = await self._afirst_draft(
+                            generation_history, user_msg, n_drafts, draft_models or [models["generation"]],
+                            draft_selection, verbose, step + 1, sinks
+                        )
+                        update_chat_history(generation_history, generation, "assistant")
+                    elif revision_mode == "patch" and step > 0:
+                        generation, patch = await self._arevise_with_patch(
+                            generation_history, generation, verbose, step + 1, sinks, stream, model=models["generation"]
+                        )
+                    else:
+                        generation = await self._agenerate_text(generation_history, verbose, step + 1, sinks, stream,
+                                                                model=models["generation"])
+                        update_chat_history(generation_history, generation, "assistant")
+                    for history in reflection_histories.values():
+                        update_chat_history(history, generation, "user")
+                    emit(sinks, GenerationDone(step + 1, n_steps, generation))
+
+                    # Reflect and critique the generation
+                    if critics:
+                        critiques = await self._areflect_panel(reflection_histories, verbose, step + 1, sinks,
+                                                               model=router.models["reflection"])
+                    elif stream:
+                        critiques = {"reviewer": await self._collect_stream(
+                            self.astream_reflect(reflection_histories["reviewer"], verbose=verbose, step=step + 1,
+                                                 sinks=sinks, model=router.models["reflection"]),
+                            sinks, step + 1, "critique"
+                        )}
+                    else:
+                        critiques = {"reviewer": await self.areflect(reflection_histories["reviewer"], verbose=verbose,
+                                                                     step=step + 1, sinks=sinks,
+                                                                     model=router.models["reflection"])}
+                    # Ask the reviewers whose critique is malformed again, once, on a stronger model
+                    malformed = [name for name, critique in critiques.items() if critique_is_malformed(critique)]
+                    if malformed and router.escalate("reflection", f"malformed critique from {', '.join(malformed)}",
+                                                     step + 1):
+                        critiques.update(await self._areflect_panel(
+                            {name: reflection_histories[name] for name in malformed}, verbose, step + 1, sinks,
+                            model=router.models["reflection"]
+                        ))
+                    critique = merge_critiques(critiques) if critics else critiques["reviewer"]
+                    models["reflection"] = router.models["reflection"]
+                    emit(sinks, CritiqueDone(step + 1, n_steps, critique))
+
+                    step_data = {
+                        "step": step + 1,
+                        "generation": generation,
+                        "critique": critique,
+                        "models": models
+                    }
+                    if critics:
+                        step_data["critiques"] = critiques
+                    if patch is not None:
+                        step_data["patch"] = patch
+                    if drafts is not None:
+                        step_data["drafts"] = drafts
+                    steps_data.append(step_data)
+
+                    # Expose what the token budget dropped during this step
+                    trimmed = {
+                        "generation": generation_history.trim_log[generation_trims:],
+                        "reflection": [
+                            entry for name, history in reflection_histories.items()
+                            for entry in history.trim_log[reflection_trims[name]:]
+                        ],
+                    }
+                    if trimmed["generation"] or trimmed["reflection"]:
+                        step_data["trimmed"] = trimmed
+
+                    if critic_agrees(critique):
+                        step_data["stop_reason"] = "all critics returned <OK>" if critics else "reviewer returned <OK>"
+                    elif router.check_stall(generation, critique, step + 1) is not None:
+                        # Give the stronger model a fresh start instead of stopping on the stall it is meant to break
+                        if detector is not None:
+                            detector = ConvergenceDetector(convergence)
+                    elif detector is not None:
+                        metrics = detector.update(generation, critique)
+                        step_data["convergence"] = metrics
+                        step_data["stop_reason"] = metrics["stop_reason"]
+
+                    if len(router.escalations) > escalations:
+                        step_data["escalations"] = router.escalations[escalations:]
+
+                    if step_data.get("stop_reason"):
+                        emit(sinks, Converged(step + 1, step_data["stop_reason"]))
+                        break
+
+                    if revision_mode == "patch":
+                        update_chat_history(generation_history, self._patch_request(critique, generation), "user")
+                    else:
+                        update_chat_history(generation_history, critique, "user")
+                    for name, history in reflection_histories.items():
+                        update_chat_history(history, critiques[name], "assistant")
+
+                else:
+                    steps_data[-1]["stop_reason"] = f"reached the {n_steps}-step limit"
+        except RunCancelled as e:
+            if verbose > 0:
+                print(f"Run stopped after {len(steps_data)} steps: {e}")
+            if steps_data:
+                steps_data[-1]["stop_reason"] = str(e)
+            emit(sinks, Cancelled(len(steps_data), str(e)))
+
+        emit(sinks, RunFinished(generation, steps_data))
+        
+        return generation, steps_data
+
+    def run(self, user_msg: str, *args, **kwargs) -> tuple:
+        """
+        Synchronous wrapper around `arun` for callers without an event loop (e.g. the Streamlit script thread).
+        Takes the same arguments as `arun`; sinks are called on the calling thread.
+        """
+        return asyncio.run(self.arun(user_msg, *args, **kwargs))
@@ -1,20 +1,31 @@
 import streamlit as st
-from colorama import Fore
 from dotenv import load_dotenv
 import time
 import os
-import requests
-import json
+import threading
+import uuid
 
-from utils.completions import build_prompt_structure
-from utils.completions import FixedFirstChatHistory
-from utils.completions import update_chat_history
-from utils.logging import fancy_step_tracker
-from prompts import BASE_GENERATION_SYSTEM_PROMPT, BASE_REFLECTION_SYSTEM_PROMPT
+from engine import ReflectionAgent
+from prompts import CRITIC_SYSTEM_PROMPTS, TEMPLATE_PROMPTS
+from utils.cache import get_completion_cache
+from utils.convergence import RECOMMENDATION_PATTERN, ConvergenceConfig
+from utils.events import (Cancelled, CallFinished, CritiqueDone, GenerationDone, PromptOptimized, RunFinished,
+                          StepStarted, TokenDelta)
+from utils.jobs import JobQueueFullError, get_job_queue
+from utils.metrics import run_breakdown
+from utils.prompt_store import get_prompt_store
+from utils.providers import get_provider
+from utils.routing import ModelRouting
 
 # Load environment variables
 load_dotenv()
 
+# Wall-clock limit of one run, in seconds; a run past it stops and keeps the steps it finished
+RUN_TIMEOUT = float(os.getenv("REFLECTION_RUN_TIMEOUT", "600"))
+# Optimize the template prompts in the background when the server starts. Only prompts missing from the
+# prompt store are sent, one call each for the optimization model; set to 0 to skip it, e.g. on a shared quota
+WARM_UP_TEMPLATES = os.getenv("REFLECTION_WARM_UP_TEMPLATES", "1").strip().lower() not in ("0", "false", "no")
+
 # Set page configuration
 st.set_page_config(
     page_title="Reflection Agent",
@@ -322,248 +333,479 @@ def animated_text(text, delay=0):
     </div>
     """, unsafe_allow_html=True)
 
-class ReflectionAgent:
+def escape_html(text):
+    return text.replace("<", "&lt;").replace(">", "&gt;").replace("\n", "<br>")
+
+class StreamlitProgressSink:
     """
-    A class that implements a Reflection Agent, which generates responses and reflects
-    on them using the LLM to iteratively improve the interaction.
+    Drives the progress bar and status line from the engine's progress events.
     """
 
-    def __init__(self, model: str = "llama-3.3-70b-versatile"):
-        # Initialize with API key
-        self.api_key = "Replace with oyur api"
-        if not self.api_key:
-            raise ValueError("API key is not set.")
+    def __init__(self, progress_bar, status_text):
+        self.progress_bar = progress_bar
+        self.status_text = status_text
+        self.stopped = None
+
+    def __call__(self, event) -> None:
+        if isinstance(event, StepStarted):
+            self.progress_bar.progress((event.step - 1) / event.n_steps)
+            self.status_text.text(f"Step {event.step}/{event.n_steps}: Generating content...")
+        elif isinstance(event, GenerationDone):
+            self.status_text.text(f"Step {event.step}/{event.n_steps}: Reflecting on content...")
+        elif isinstance(event, Cancelled):
+            self.stopped = event.reason
+            self.status_text.text(f"Stopped after step {event.step}: {event.reason}")
+        elif isinstance(event, RunFinished) and self.stopped is None:
+            self.progress_bar.progress(1.0)
+            self.status_text.text("Completed!")
+
+# Cached HTML for finished runs, so reruns re-render without recomputing anything
+MAX_STORED_RUNS = 5
+
+def optimized_prompt_html(optimized_prompt):
+    return f"""
+    <div style='background-color:var(--bg-secondary); border-left:4px solid var(--accent-secondary); 
+         padding:15px; border-radius:10px; margin:15px 0; animation: fadeIn 0.8s ease-out;'>
+        <strong>✨ Optimized Prompt:</strong><br>
+        {optimized_prompt.replace("<", "&lt;").replace(">", "&gt;")}
+    </div>
+    """
+
+def timeline_html(steps_data):
+    # First, add a visual timeline to show the progression
+    fragments = ["""
+    <div style='display:flex; justify-content:space-between; margin:20px 0 30px 0;'>
+    """]
+    
+    for i, step_data in enumerate(steps_data):
+        progress_percent = (i+1) / len(steps_data) * 100
+        active_class = "active" if i == len(steps_data)-1 else ""
+        fragments.append(f"""
+        <div style='flex:1; text-align:center;'>
+            <div style='display:inline-block; width:30px; height:30px; border-radius:50%; 
+                background-color:var(--accent-primary); color:var(--text-primary); 
+                text-align:center; line-height:30px; margin-bottom:5px; 
+                box-shadow: 0 0 {10 if active_class else 0}px var(--accent-primary);
+                animation: fadeIn 0.8s ease-out;'>
+                {step_data['step']}
+            </div>
+            <div style='width:100%; height:4px; margin-top:10px; background-color:var(--bg-tertiary);'>
+                <div style='width:{progress_percent}%; height:100%; background-color:var(--accent-primary);'></div>
+            </div>
+        </div>
+        """)
+    
+    fragments.append("</div>")
+    return fragments
+
+def step_card_html(step_data, total_steps, is_last_step):
+    step_number = step_data['step']
+    
+    # Create a card for each step with better visual hierarchy
+    fragments = [f"""
+    <div style='background-color:var(--bg-secondary); border-radius:15px; margin:30px 0; 
+         box-shadow:0 4px 10px var(--shadow); overflow:hidden; animation:fadeIn 0.8s ease-out;'>
+        <div style='background-color:var(--bg-tertiary); padding:15px; display:flex; justify-content:space-between; align-items:center;'>
+            <h3 style='margin:0; color:var(--text-primary);'>Step {step_number} of {total_steps}</h3>
+            <div style='color:var(--accent-primary); font-weight:bold;'>
+                {f"✓ Final" if is_last_step else ""}
+            </div>
+        </div>
+        <div style='padding:20px;'>
+    """]
+    
+    # Generation section
+    fragments.append(f"""
+    <div style='margin-bottom:25px;'>
+        <div style='display:flex; align-items:center; margin-bottom:15px;'>
+            <div style='background-color:var(--accent-primary); width:35px; height:35px; border-radius:50%; 
+                 display:flex; justify-content:center; align-items:center; margin-right:10px;'>
+                <span style='color:var(--text-primary); font-size:18px;'>🎯</span>
+            </div>
+            <h4 style='margin:0; color:var(--text-primary);'>Generation</h4>
+        </div>
+    """)
+    
+    # Safely escape any HTML tags
+    safe_generation = step_data['generation'].replace("<", "&lt;").replace(">", "&gt;")
+    
+    # Format the generation content with line breaks
+    formatted_generation = safe_generation.replace("\n", "<br>")
+    
+    fragments.append(f"""
+        <div style='background-color:rgba(94, 174, 253, 0.1); padding:20px; border-radius:10px; 
+             border-left:4px solid var(--accent-primary); color:var(--text-primary);'>
+            {formatted_generation}
+        </div>
+    </div>
+    """)
+    
+    # Reflection section
+    fragments.append(f"""
+    <div>
+        <div style='display:flex; align-items:center; margin-bottom:15px;'>
+            <div style='background-color:var(--success); width:35px; height:35px; border-radius:50%; 
+                 display:flex; justify-content:center; align-items:center; margin-right:10px;'>
+                <span style='color:var(--text-primary); font-size:18px;'>💭</span>
+            </div>
+            <h4 style='margin:0; color:var(--text-primary);'>Reflection & Changes</h4>
+        </div>
+    """)
+    
+    if "<OK>" in step_data['critique']:
+        fragments.append("""
+        <div style='background-color:rgba(122, 231, 165, 0.1); padding:20px; border-radius:10px; 
+             border-left:4px solid var(--success); color:var(--text-primary);'>
+            ✅ Content is satisfactory! No further improvements needed.
+        </div>
+        """)
+    else:
+        # Analyze the critique to highlight changes
+        # Safely escape any HTML tags in the critique
+        safe_critique = step_data['critique'].replace("<", "&lt;").replace(">", "&gt;")
         
-        self.model = model
-        # Corrected API URL for Groq API based on error message
-        self.api_url = "https://api.groq.com/openai/v1/chat/completions"
+        # Extract specific recommendations and format them nicely
+        matches = RECOMMENDATION_PATTERN.findall(safe_critique)
         
-    def _request_completion(self, history, verbose: int = 0, log_title: str = "COMPLETION", log_color: str = ""):
-        try:
-            # Convert FixedFirstChatHistory to a simple list of dictionaries
-            if isinstance(history, FixedFirstChatHistory):
-                # Extract messages from FixedFirstChatHistory object
-                messages = history.get_messages()
-            else:
-                messages = history
-                
-            # Create a clean list of simple dictionaries
-            simple_messages = []
-            for msg in messages:
-                if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                    simple_messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
-            
-            # Debug
-            if verbose > 0:
-                print(f"API URL: {self.api_url}")
-                print(f"Number of messages: {len(simple_messages)}")
-                print(f"First message role: {simple_messages[0]['role'] if simple_messages else 'No messages'}")
-            
-            # API call with direct dictionaries
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Create payload with proper simple message format
-            payload = {
-                "model": self.model,
-                "messages": simple_messages,
-                "temperature": 0.7,
-                "max_tokens": 1000
-            }
-            
-            # Debug the payload
-            if verbose > 0:
-                print("Payload:", json.dumps(payload, indent=2))
-            
-            # Make the API call
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,  # Use json parameter instead of data for proper serialization
-                timeout=60
-            )
-            
-            # Check response
-            if response.status_code != 200:
-                error_message = f"API call failed with status code {response.status_code}: {response.text}"
-                print(error_message)
-                raise Exception(error_message)
+        # Format the critique content with line breaks
+        formatted_critique = safe_critique.replace("\n", "<br>")
+        
+        # Display the full reflection
+        fragments.append(f"""
+        <div style='background-color:rgba(122, 231, 165, 0.1); padding:20px; border-radius:10px; 
+             border-left:4px solid var(--success); color:var(--text-primary);'>
+            {formatted_critique}
+        </div>
+        """)
+        
+        # If we have recommendations, show them in a more structured format
+        if matches:
+            fragments.append("""
+            <div style='margin-top:20px;'>
+                <h5 style='color:var(--text-primary); margin-bottom:10px;'>Key Improvements Made:</h5>
+                <ul style='color:var(--text-primary); padding-left:20px;'>
+            """)
             
-            # Parse response
-            result = response.json()
-            output = result["choices"][0]["message"]["content"]
+            for rec in matches:
+                fragments.append(f"<li>{rec}</li>")
             
-            if verbose > 0:
-                print(log_color, f"\n\n{log_title}\n\n", output)
-                
-            return output
-        except Exception as e:
-            print(f"Error in request completion: {str(e)}")
-            raise
-
-    def generate(self, generation_history: list, verbose: int = 0) -> str:
-        return self._request_completion(
-            generation_history, verbose, log_title="GENERATION", log_color=Fore.BLUE
-        )
-
-    def reflect(self, reflection_history: list, verbose: int = 0) -> str:
-        return self._request_completion(
-            reflection_history, verbose, log_title="REFLECTION", log_color=Fore.GREEN
-        )
+            fragments.append("</ul></div>")
         
-    def optimize_prompt(self, user_prompt: str, verbose: int = 0) -> str:
-        """
-        Send a user prompt to Groq for optimization before using it in the main application.
+        # Explain why the loop ended here when it wasn't the reviewer's <OK>
+        if step_data.get('stop_reason') and is_last_step:
+            fragments.append(f"""
+            <div style='margin-top:15px; color:var(--warning);'>
+                ⏹ Stopped: {step_data['stop_reason']}
+            </div>
+            """)
         
-        Args:
-            user_prompt (str): The original user prompt
-            verbose (int): Verbosity level
-            
-        Returns:
-            str: The optimized prompt
+    fragments.append("</div></div></div>")
+    return fragments
+
+def final_result_html(final_response):
+    # Safely escape any HTML tags in the final response
+    safe_response = final_response.replace("<", "&lt;").replace(">", "&gt;")
+    return [
+        "<hr>",
         """
-        try:
-            # Create an optimization prompt
-            optimization_messages = [
-                {
-                    "role": "system",
-                    "content": """You are a prompt optimization expert. Your task is to enhance the user's prompt to make it more detailed, 
-                    specific, and optimized for generating high-quality content.
-                    
-                    Follow these guidelines:
-                    1. Maintain the original intent of the prompt
-                    2. Add relevant details and specifications
-                    3. Improve clarity and structure
-                    4. Consider adding formatting suggestions
-                    5. Remove any vague or ambiguous language
-                    
-                    Respond ONLY with the optimized prompt, without explanations or additional text."""
-                },
-                {
-                    "role": "user",
-                    "content": f"Please optimize this prompt for better results: {user_prompt}"
-                }
-            ]
-            
-            # Send to API for optimization
-            if verbose > 0:
-                print(f"Optimizing prompt: {user_prompt}")
-                
-            # Make the API call
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": self.model,
-                "messages": optimization_messages,
-                "temperature": 0.7,
-                "max_tokens": 1000
-            }
-            
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
-            
-            # Check response
-            if response.status_code != 200:
-                print(f"Prompt optimization failed: {response.status_code} - {response.text}")
-                return user_prompt  # Return original prompt if optimization fails
-            
-            # Parse response
-            result = response.json()
-            optimized_prompt = result["choices"][0]["message"]["content"]
-            
-            if verbose > 0:
-                print(f"Original prompt: {user_prompt}")
-                print(f"Optimized prompt: {optimized_prompt}")
-                
-            return optimized_prompt
-            
-        except Exception as e:
-            print(f"Error optimizing prompt: {str(e)}")
-            return user_prompt  # Return original prompt if optimization fails
+        <h2 style='text-align:center; color:var(--text-primary); animation: fadeIn 1s ease-out;'>
+            ✨ Final Result ✨
+        </h2>
+        """,
+        f"""
+        <div style='background-color:var(--bg-secondary); padding:20px; border-radius:10px; border:2px solid var(--accent-primary); 
+             animation: fadeIn 1.5s ease-out; box-shadow: 0 0 15px rgba(77, 166, 255, 0.3);'>
+            {safe_response}
+        </div>
+        """,
+        "<br>",
+    ]
 
-    def run(self, user_msg: str, generation_system_prompt: str = "", reflection_system_prompt: str = "", n_steps: int = 10, verbose: int = 0, optimize_prompt: bool = False) -> tuple:
-        if optimize_prompt:
-            user_msg = self.optimize_prompt(user_msg, verbose)
-            
-        generation_system_prompt += BASE_GENERATION_SYSTEM_PROMPT
-        reflection_system_prompt += BASE_REFLECTION_SYSTEM_PROMPT
-
-        generation_history = FixedFirstChatHistory(
-            [
-                build_prompt_structure(prompt=generation_system_prompt, role="system"),
-                build_prompt_structure(prompt=user_msg, role="user"),
-            ],
-            total_length=3,
-        )
-
-        reflection_history = FixedFirstChatHistory(
-            [build_prompt_structure(prompt=reflection_system_prompt, role="system")],
-            total_length=3,
-        )
-
-        steps_data = []
-        for step in range(n_steps):
-            if verbose > 0:
-                fancy_step_tracker(step, n_steps)
-
-            # Update Streamlit progress
-            progress_value = (step / n_steps)
-            st.session_state.progress_bar.progress(progress_value)
-            st.session_state.status_text.text(f"Step {step+1}/{n_steps}: Generating content...")
-
-            # Generate the response
-            generation = self.generate(generation_history, verbose=verbose)
-            update_chat_history(generation_history, generation, "assistant")
-            update_chat_history(reflection_history, generation, "user")
-
-            # Update Streamlit progress
-            st.session_state.status_text.text(f"Step {step+1}/{n_steps}: Reflecting on content...")
-
-            # Reflect and critique the generation
-            critique = self.reflect(reflection_history, verbose=verbose)
-            
-            steps_data.append({
-                "step": step + 1,
-                "generation": generation,
-                "critique": critique
-            })
+class LiveRunRenderer:
+    """
+    Pushes each step into the page while the loop runs: the timeline grows as
+    steps finish, every step gets its own placeholder that shows the generation
+    as soon as it exists (token by token when streaming), and the placeholder is
+    replaced by the full step card once the critique arrives.
+    Streamed re-renders are throttled so long completions don't flood the websocket.
+    """
+
+    def __init__(self, container, min_interval: float = 0.05):
+        self.min_interval = min_interval
+        with container:
+            self.timeline = st.empty()
+            self.steps_area = st.container()
+        self.slots = {}
+        self.boxes = {}
+        self.generations = {}
+        self.finished_steps = []
+        self.placeholders = {}
+        self.texts = {}
+        self.current = None
+        self.last_render = 0.0
+        # Time of the latest delta; the gap to the next segment's first delta is its time to first token
+        self.last_delta_at = time.perf_counter()
+
+    def __call__(self, event) -> None:
+        if isinstance(event, StepStarted):
+            with self.steps_area:
+                self.slots[event.step] = st.empty()
+            self.boxes[event.step] = self.slots[event.step].container()
+            with self.boxes[event.step]:
+                st.markdown(f"<h3 style='margin-top:30px; color:var(--text-primary);'>Step {event.step} of {event.n_steps}</h3>", unsafe_allow_html=True)
+        elif isinstance(event, TokenDelta):
+            self._on_delta(event)
+        elif isinstance(event, GenerationDone):
+            self.generations[event.step] = event.generation
+            if (event.step, "generation") in self.placeholders:
+                self._render((event.step, "generation"))
+            else:
+                with self.boxes[event.step]:
+                    st.caption("🎯 Generation")
+                    self._text_block(st.empty(), event.generation, "generation")
+        elif isinstance(event, CritiqueDone):
+            step_data = {"step": event.step, "generation": self.generations[event.step], "critique": event.critique}
+            self.finished_steps.append(step_data)
+            self.current = None
+            # Swap the live view for the finished card and extend the timeline
+            with self.slots[event.step].container():
+                for fragment in step_card_html(step_data, event.n_steps, False):
+                    st.markdown(fragment, unsafe_allow_html=True)
+            with self.timeline.container():
+                for fragment in timeline_html(self.finished_steps):
+                    st.markdown(fragment, unsafe_allow_html=True)
+
+    def _on_delta(self, event) -> None:
+        now = time.perf_counter()
+        key = (event.step, event.kind)
+        if key != self.current:
+            if self.current is not None:
+                self._render(self.current)
+            with self.boxes[event.step]:
+                title = {"generation": "🎯 Generation", "patch": "🩹 Edits"}.get(event.kind, "💭 Reflection")
+                st.caption(f"{title} · ⚡ first token in {now - self.last_delta_at:.2f}s")
+                self.placeholders[key] = st.empty()
+            self.texts[key] = ""
+            self.current = key
+            # Show the first token right away
+            self.last_render = 0.0
+
+        self.texts[key] += event.text
+        self.last_delta_at = now
+        if now - self.last_render >= self.min_interval:
+            self._render(key)
+
+    def _render(self, key) -> None:
+        self._text_block(self.placeholders[key], self.texts[key], key[1])
+        self.last_render = time.perf_counter()
+
+    @staticmethod
+    def _text_block(placeholder, text, kind) -> None:
+        border = "var(--accent-primary)" if kind in ("generation", "patch") else "var(--success)"
+        placeholder.markdown(f"""
+        <div style='background-color:var(--bg-secondary); padding:20px; border-radius:10px; 
+             border-left:4px solid {border}; color:var(--text-primary);'>
+            {escape_html(text)}
+        </div>
+        """, unsafe_allow_html=True)
+
+def store_run(user_input, optimized_prompt, final_response, steps_data, calls=None):
+    """
+    Keep a finished run and its rendered HTML in session state so that reruns
+    (e.g. clicking "Copy to Clipboard") re-render it without any API calls.
+    
+    Returns:
+        str: The new run id
+    """
+    run_id = uuid.uuid4().hex[:8]
+    total_steps = len(steps_data)
+    runs = st.session_state.setdefault("runs", {})
+    runs[run_id] = {
+        "id": run_id,
+        "prompt": user_input,
+        "optimized_prompt": optimized_prompt,
+        "final_response": final_response,
+        "steps_data": steps_data,
+        "calls": calls or [],
+        "html": {
+            "optimized_prompt": optimized_prompt_html(optimized_prompt) if optimized_prompt != user_input else None,
+            "timeline": timeline_html(steps_data),
+            "steps": [step_card_html(step_data, total_steps, i == total_steps - 1) for i, step_data in enumerate(steps_data)],
+            "final": final_result_html(final_response),
+        },
+    }
+    # Bound memory per session by dropping the oldest runs
+    while len(runs) > MAX_STORED_RUNS:
+        runs.pop(next(iter(runs)))
+    st.session_state.current_run_id = run_id
+    return run_id
 
-            if "<OK>" in critique:
+def session_owner():
+    """
+    A secret id for this browser session, so one user cannot take every worker and only they can stop
+    their runs. It is kept in the URL next to ?job=, so a refreshed or reconnected tab still owns its runs.
+    """
+    if "owner" not in st.session_state:
+        st.session_state.owner = st.query_params.get("owner") or uuid.uuid4().hex
+    return st.session_state.owner
+
+def forget_job():
+    st.session_state.pop("job_id", None)
+    if "job" in st.query_params:
+        del st.query_params["job"]
+
+def follow_job(job_id, poll_interval=0.5):
+    """
+    Show a background run's progress until it finishes, then keep it like a run made in this session.
+    The events so far are replayed first, so a refreshed tab picks the run up where it is. Only the
+    owner that submitted the run (see session_owner) may stop it; anyone else following the job id
+    gets a read-only view.
+    """
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        forget_job()
+        st.warning("⚠️ That run is no longer available.")
+        return
+
+    stop_area = st.empty()
+    if job.owner != session_owner():
+        stop_area.caption("👀 Following a run started by someone else; only they can stop it.")
+    elif stop_area.button("⏹ Stop", key=f"stop_{job.id}", disabled=job.finished):
+        # Aborts the run's requests on its worker; the steps finished so far are kept
+        job.cancel()
+
+    progress_sink = StreamlitProgressSink(st.progress(0), st.empty())
+    waiting = st.empty()
+    optimized_prompt_container = st.empty()
+    live_area = st.empty()
+    sinks = [progress_sink, LiveRunRenderer(live_area.container())]
+    seen = 0
+    with st.spinner("🧠 Thinking..."):
+        while True:
+            events = job.wait(seen, timeout=poll_interval)
+            for event in events:
+                if isinstance(event, PromptOptimized) and event.optimized != event.original:
+                    optimized_prompt_container.markdown(optimized_prompt_html(event.optimized), unsafe_allow_html=True)
+                for sink in sinks:
+                    sink(event)
+            seen += len(events)
+            if job.finished and seen == len(job.events):
                 break
+            # Touching the page every poll also lets Streamlit interrupt this loop for a rerun
+            if job.token.cancelled:
+                waiting.caption("⏹ Stopping...")
+            elif job.status == "queued":
+                waiting.caption(f"⏳ Waiting for a free worker ({queue.position(job)} runs ahead)")
+            else:
+                waiting.caption(f"⏱ {time.time() - job.started_at:.0f}s")
 
-            update_chat_history(generation_history, critique, "user")
-            update_chat_history(reflection_history, critique, "assistant")
+    stop_area.empty()
+    progress_sink.progress_bar.empty()
+    progress_sink.status_text.empty()
+    waiting.empty()
+    live_area.empty()
+    optimized_prompt_container.empty()
+    forget_job()
+    if job.status == "failed":
+        st.error(f"An error occurred: {job.error}")
+        return
+    result = job.result
+    if job.status == "cancelled":
+        if not result or not result["steps_data"]:
+            st.info(f"⏹ Run stopped ({job.token.reason}) before any step finished.")
+            return
+        st.info(f"⏹ Run stopped ({job.token.reason}) after step {len(result['steps_data'])}.")
 
-        # Final progress update
-        st.session_state.progress_bar.progress(1.0)
-        st.session_state.status_text.text("Completed!")
-        
-        return generation, steps_data
+    optimized_prompt = next((event.optimized for event in job.events if isinstance(event, PromptOptimized)), result["prompt"])
+    calls = [event.metrics.to_dict() for event in job.events if isinstance(event, CallFinished)]
+    store_run(result["prompt"], optimized_prompt, result["final_response"], result["steps_data"], calls)
+
+def render_run(run):
+    """Render a stored run entirely from its cached HTML."""
+    html = run["html"]
+    if html["optimized_prompt"]:
+        st.markdown(html["optimized_prompt"], unsafe_allow_html=True)
+    
+    # Display each step with animations
+    for fragment in html["timeline"]:
+        st.markdown(fragment, unsafe_allow_html=True)
+    for step_fragments in html["steps"]:
+        for fragment in step_fragments:
+            st.markdown(fragment, unsafe_allow_html=True)
+    
+    # Show final response with animation
+    for fragment in html["final"]:
+        st.markdown(fragment, unsafe_allow_html=True)
+    
+    # Copy button for final output
+    if st.button("📋 Copy to Clipboard", key=f"copy_button_{run['id']}"):
+        st.code(run["final_response"])
+        st.success("Content copied! You can now paste it wherever you need.")
+
+def _ms(seconds):
+    return f"{seconds * 1000:.0f}" if seconds is not None else "–"
+
+def markdown_table(headers, rows):
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    lines += ["| " + " | ".join(str(cell) for cell in row) + " |" for row in rows]
+    return "\n".join(lines)
 
-# Template prompts
-TEMPLATE_PROMPTS = {
-    "Algorithm Design": "Design a simple algorithm to find the longest palindrome in a string.",
-    "Essay Outline": "Create an outline for an essay about the impact of artificial intelligence on modern education.",
-    "Marketing Copy": "Write marketing copy for a new fitness app that helps users track their workouts and nutrition.",
-    "Story Idea": "Develop a short story idea about a time traveler who accidentally changes history.",
-    "Product Description": "Write a product description for a smart home device that controls all appliances via voice commands."
-}
+def render_run_metrics(run):
+    """Per-run latency and token breakdown, shown in the sidebar."""
+    calls = run.get("calls")
+    if not calls:
+        return
+    st.markdown("<h3 style='margin-top:30px; color:var(--text-primary);'>📊 Last Run</h3>", unsafe_allow_html=True)
+    breakdown = run_breakdown(calls)
+    total = breakdown.pop("total")
+    st.caption(
+        f"{total['calls']} calls ({total['cached']} cached) · {total['seconds']:.1f}s in API calls "
+        f"({total['rate_limit_wait']:.1f}s rate-limited) · "
+        f"{total['prompt_tokens']} in / {total['completion_tokens']} out tokens · ${total['cost_usd']:.4f}"
+    )
+    st.markdown(markdown_table(
+        ["Kind", "Calls", "Seconds", "Tokens in", "Tokens out"],
+        [[kind, row["calls"], f"{row['seconds']:.2f}", row["prompt_tokens"], row["completion_tokens"]]
+         for kind, row in breakdown.items()],
+    ))
+    with st.expander("Per-call timings (ms)", expanded=False):
+        st.markdown(markdown_table(
+            ["Step", "Kind", "Status", "Rate limit", "Queue", "Connect", "First byte", "Total", "In", "Out", "Finish"],
+            [[call["step"] or "–", call["kind"], call["status"], _ms(call.get("rate_limit_wait")),
+              _ms(call["queue_wait"]), _ms(call["connect_time"]),
+              _ms(call["time_to_first_byte"]), _ms(call["total"]), call["prompt_tokens"] or "–",
+              call["completion_tokens"] or "–", call["finish_reason"] or "–"]
+             for call in calls],
+        ))
+
+MODELS = ["llama-3.3-70b-versatile", "llama-3.1-8b-instant", "mixtral-8x7b-32768", "gemma-7b-it"]
+# Default model of the short structured roles (reflection, prompt optimization)
+FAST_MODEL = "llama-3.1-8b-instant"
+
+@st.cache_resource
+def start_template_warm_up():
+    """
+    Optimize the template prompts with the default optimization model in the background,
+    once per server process.
+    """
+    def warm_up():
+        try:
+            stored = ReflectionAgent(model=FAST_MODEL).warm_up(TEMPLATE_PROMPTS.values())
+            print(f"Template warm-up: {stored} prompts optimized for {FAST_MODEL}")
+        except Exception as e:
+            print(f"Template warm-up failed for {FAST_MODEL}: {str(e)}")
+
+    thread = threading.Thread(target=warm_up, name="template-warm-up", daemon=True)
+    thread.start()
+    return thread
 
 # Streamlit UI
 def main():
     try:
+        if WARM_UP_TEMPLATES:
+            start_template_warm_up()
+
         # Title and description with animation
         animated_title("🧠 Reflection Agent")
         
@@ -573,12 +815,11 @@ def main():
         with st.sidebar:
             st.markdown("<h2 style='text-align:center; color:var(--text-primary);'>⚙️ Settings</h2>", unsafe_allow_html=True)
             
-            # Model selection with animation
-            model = st.selectbox(
-                "Select Model",
-                ["llama-3.3-70b-versatile", "mixtral-8x7b-32768", "gemma-7b-it"],
-                index=0
-            )
+            # Model per role: the large model writes, a fast one reviews and optimizes
+            model = st.selectbox("Generation model", MODELS, index=0, help="Writes and revises the content")
+            reflection_model = st.selectbox("Reflection model", MODELS, index=MODELS.index(FAST_MODEL), help="Reviews each draft")
+            optimization_model = st.selectbox("Optimization model", MODELS, index=MODELS.index(FAST_MODEL), help="Optimizes your prompt")
+            escalate = st.checkbox("Escalate when needed", value=True, help="Switch reflection to the generation model when a critique is malformed or the loop stalls")
             
             # Steps slider with tooltip
             st.markdown("""
@@ -591,6 +832,27 @@ def main():
             # Prompt optimization option
             st.markdown("<h3 style='margin-top:20px; color:var(--text-primary);'>🚀 Advanced Options</h3>", unsafe_allow_html=True)
             optimize_prompt = st.checkbox("Optimize prompt", value=True, help="Let AI enhance your prompt before processing")
+            stream_tokens = st.checkbox("Stream tokens", value=True, help="Show generations and reflections as they are written")
+            patch_revisions = st.checkbox("Revise with edits", value=False, help="After the first draft, ask for targeted edits instead of a full rewrite on every step")
+            focused_critics = st.checkbox("Focused critics", value=False, help="Review each draft with several critics in parallel (clarity, language, structure, impact) instead of one reviewer")
+            n_drafts = st.slider("First drafts", 1, 4, 1, help="Write several first drafts in parallel and continue with the best one")
+            rank_drafts = n_drafts > 1 and st.checkbox("Let the model pick the draft", value=False, help="Pick the best first draft with one short model call instead of a local score")
+            early_stop = st.checkbox("Stop early when converged", value=True, help="End the loop once successive drafts barely change or the reviewer keeps repeating itself")
+            hedge = st.checkbox("Hedge slow requests", value=False, help="Send a duplicate of a request that is slower than 95% of recent ones and keep whichever answers first (not used for streamed text)")
+            use_cache = st.checkbox("Reuse cached completions", value=True, help="Answer repeated requests from the on-disk cache instead of calling the API")
+            if use_cache:
+                cache_stats = get_completion_cache().stats()
+                st.caption(f"Cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · {cache_stats['entries']} entries")
+                store_stats = get_prompt_store().stats()
+                st.caption(f"Optimized prompts: {store_stats['hits']} hits · {store_stats['misses']} misses · {store_stats['entries']} stored")
+            job_stats = get_job_queue().stats()
+            st.caption(f"Runs: {job_stats['running']} running · {job_stats['queued']} queued · {job_stats['workers']} workers")
+            endpoint_stats = get_provider().stats()
+            if len(endpoint_stats) > 1:
+                st.caption("Endpoints: " + " · ".join(
+                    f"{name} {stats['latency'] * 1000:.0f} ms, {stats['error_rate']:.0%} errors" if stats['latency'] is not None else f"{name} unmeasured"
+                    for name, stats in endpoint_stats.items()
+                ))
             
             # Template section
             st.markdown("<h3 style='margin-top:30px; color:var(--text-primary);'>📝 Templates</h3>", unsafe_allow_html=True)
@@ -609,6 +871,9 @@ def main():
                 4. **AI reflects & improves**: Reviews and refines the content
                 5. **Process continues**: Until quality standards are met
                 """)
+            
+            # Filled in once the current run is known
+            run_metrics_area = st.container()
 
         # Main content area with animation effects
         col1, col2 = st.columns([3, 1])
@@ -642,204 +907,57 @@ def main():
                 st.warning("⚠️ Please enter a prompt first!")
                 return
 
-            # Initialize session state for progress tracking
-            st.session_state.progress_bar = st.progress(0)
-            st.session_state.status_text = st.empty()
-            
-            # Create container for steps with animation
-            steps_container = st.container()
-            
+            agent = ReflectionAgent(
+                model=model,
+                routing=ModelRouting(
+                    reflection=reflection_model,
+                    optimization=optimization_model,
+                    escalation={m: model for m in (reflection_model,) if m != model} if escalate else {}
+                ),
+                use_cache=use_cache,
+                convergence=ConvergenceConfig() if early_stop else None,
+                critics=CRITIC_SYSTEM_PROMPTS if focused_critics else None,
+                hedge=hedge
+            )
+
+            def run(job):
+                # Runs on a worker thread; the job collects the progress events for the page to replay
+                final_response, steps_data = agent.run(
+                    user_msg=user_input,
+                    n_steps=n_steps,
+                    verbose=1,
+                    optimize_prompt=optimize_prompt,
+                    stream=stream_tokens,
+                    sinks=[job],
+                    cancel=job.token,
+                    timeout=RUN_TIMEOUT,
+                    revision_mode="patch" if patch_revisions else "rewrite",
+                    n_drafts=n_drafts,
+                    draft_selection="rank" if rank_drafts else "heuristic"
+                )
+                return {"prompt": user_input, "final_response": final_response, "steps_data": steps_data}
+
             try:
-                # Create a placeholder for optimized prompt
-                optimized_prompt_container = st.empty()
-                
-                # Show a loading animation
-                with st.spinner("🧠 Thinking..."):
-                    # Initialize and run the agent
-                    agent = ReflectionAgent(model=model)
-                    
-                    # If prompt optimization is enabled, show it to the user
-                    if optimize_prompt:
-                        with st.spinner("✨ Optimizing your prompt..."):
-                            optimized_prompt = agent.optimize_prompt(user_input, verbose=1)
-                            # Display the optimized prompt if it's different from the original
-                            if optimized_prompt != user_input:
-                                optimized_prompt_container.markdown(f"""
-                                <div style='background-color:var(--bg-secondary); border-left:4px solid var(--accent-secondary); 
-                                     padding:15px; border-radius:10px; margin:15px 0; animation: fadeIn 0.8s ease-out;'>
-                                    <strong>✨ Optimized Prompt:</strong><br>
-                                    {optimized_prompt.replace("<", "&lt;").replace(">", "&gt;")}
-                                </div>
-                                """, unsafe_allow_html=True)
-                    else:
-                        optimized_prompt = user_input
-                    
-                    # Run the agent with the original or optimized prompt
-                    final_response, steps_data = agent.run(
-                        user_msg=optimized_prompt if optimize_prompt else user_input,
-                        n_steps=n_steps,
-                        verbose=1,
-                        optimize_prompt=False  # Don't optimize again
-                    )
-                
-                # Display each step with animations
-                with steps_container:
-                    # First, add a visual timeline to show the progression
-                    st.markdown("""
-                    <div style='display:flex; justify-content:space-between; margin:20px 0 30px 0;'>
-                    """, unsafe_allow_html=True)
-                    
-                    for i, step_data in enumerate(steps_data):
-                        progress_percent = (i+1) / len(steps_data) * 100
-                        active_class = "active" if i == len(steps_data)-1 else ""
-                        st.markdown(f"""
-                        <div style='flex:1; text-align:center;'>
-                            <div style='display:inline-block; width:30px; height:30px; border-radius:50%; 
-                                background-color:var(--accent-primary); color:var(--text-primary); 
-                                text-align:center; line-height:30px; margin-bottom:5px; 
-                                box-shadow: 0 0 {10 if active_class else 0}px var(--accent-primary);
-                                animation: fadeIn 0.8s ease-out;'>
-                                {step_data['step']}
-                            </div>
-                            <div style='width:100%; height:4px; margin-top:10px; background-color:var(--bg-tertiary);'>
-                                <div style='width:{progress_percent}%; height:100%; background-color:var(--accent-primary);'></div>
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
-                    st.markdown("</div>", unsafe_allow_html=True)
-                    
-                    # Display the detailed steps in cards
-                    for i, step_data in enumerate(steps_data):
-                        step_number = step_data['step']
-                        is_last_step = i == len(steps_data)-1
-                        
-                        # Create a card for each step with better visual hierarchy
-                        st.markdown(f"""
-                        <div style='background-color:var(--bg-secondary); border-radius:15px; margin:30px 0; 
-                             box-shadow:0 4px 10px var(--shadow); overflow:hidden; animation:fadeIn 0.8s ease-out;'>
-                            <div style='background-color:var(--bg-tertiary); padding:15px; display:flex; justify-content:space-between; align-items:center;'>
-                                <h3 style='margin:0; color:var(--text-primary);'>Step {step_number} of {len(steps_data)}</h3>
-                                <div style='color:var(--accent-primary); font-weight:bold;'>
-                                    {f"✓ Final" if is_last_step else ""}
-                                </div>
-                            </div>
-                            <div style='padding:20px;'>
-                        """, unsafe_allow_html=True)
-                        
-                        # Generation section
-                        st.markdown(f"""
-                        <div style='margin-bottom:25px;'>
-                            <div style='display:flex; align-items:center; margin-bottom:15px;'>
-                                <div style='background-color:var(--accent-primary); width:35px; height:35px; border-radius:50%; 
-                                     display:flex; justify-content:center; align-items:center; margin-right:10px;'>
-                                    <span style='color:var(--text-primary); font-size:18px;'>🎯</span>
-                                </div>
-                                <h4 style='margin:0; color:var(--text-primary);'>Generation</h4>
-                            </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Safely escape any HTML tags
-                        safe_generation = step_data['generation'].replace("<", "&lt;").replace(">", "&gt;")
-                        
-                        # Format the generation content with line breaks
-                        formatted_generation = safe_generation.replace("\n", "<br>")
-                        
-                        st.markdown(f"""
-                            <div style='background-color:rgba(94, 174, 253, 0.1); padding:20px; border-radius:10px; 
-                                 border-left:4px solid var(--accent-primary); color:var(--text-primary);'>
-                                {formatted_generation}
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Reflection section
-                        st.markdown(f"""
-                        <div>
-                            <div style='display:flex; align-items:center; margin-bottom:15px;'>
-                                <div style='background-color:var(--success); width:35px; height:35px; border-radius:50%; 
-                                     display:flex; justify-content:center; align-items:center; margin-right:10px;'>
-                                    <span style='color:var(--text-primary); font-size:18px;'>💭</span>
-                                </div>
-                                <h4 style='margin:0; color:var(--text-primary);'>Reflection & Changes</h4>
-                            </div>
-                        """, unsafe_allow_html=True)
-                        
-                        if "<OK>" in step_data['critique']:
-                            st.markdown("""
-                            <div style='background-color:rgba(122, 231, 165, 0.1); padding:20px; border-radius:10px; 
-                                 border-left:4px solid var(--success); color:var(--text-primary);'>
-                                ✅ Content is satisfactory! No further improvements needed.
-                            </div>
-                            """, unsafe_allow_html=True)
-                        else:
-                            # Analyze the critique to highlight changes
-                            # Safely escape any HTML tags in the critique
-                            safe_critique = step_data['critique'].replace("<", "&lt;").replace(">", "&gt;")
-                            
-                            # Extract specific recommendations and format them nicely
-                            import re
-                            recommendations = []
-                            numbered_pattern = re.compile(r'(?:\d+\.\s*|\*\s*)([^\n\d\*][^\n]+)')
-                            matches = numbered_pattern.findall(safe_critique)
-                            
-                            # Format the critique content with line breaks
-                            formatted_critique = safe_critique.replace("\n", "<br>")
-                            
-                            # Display the full reflection
-                            st.markdown(f"""
-                            <div style='background-color:rgba(122, 231, 165, 0.1); padding:20px; border-radius:10px; 
-                                 border-left:4px solid var(--success); color:var(--text-primary);'>
-                                {formatted_critique}
-                            </div>
-                            """, unsafe_allow_html=True)
-                            
-                            # If we have recommendations, show them in a more structured format
-                            if matches:
-                                st.markdown("""
-                                <div style='margin-top:20px;'>
-                                    <h5 style='color:var(--text-primary); margin-bottom:10px;'>Key Improvements Made:</h5>
-                                    <ul style='color:var(--text-primary); padding-left:20px;'>
-                                """, unsafe_allow_html=True)
-                                
-                                for rec in matches:
-                                    st.markdown(f"<li>{rec}</li>", unsafe_allow_html=True)
-                                
-                                st.markdown("</ul></div>", unsafe_allow_html=True)
-                            
-                        st.markdown("</div></div></div>", unsafe_allow_html=True)
-                
-                # Clear progress indicators with an animation
-                st.session_state.progress_bar.empty()
-                st.session_state.status_text.empty()
-                
-                # Show final response with animation
-                st.markdown("<hr>", unsafe_allow_html=True)
-                st.markdown("""
-                <h2 style='text-align:center; color:var(--text-primary); animation: fadeIn 1s ease-out;'>
-                    ✨ Final Result ✨
-                </h2>
-                """, unsafe_allow_html=True)
-                
-                # Safely escape any HTML tags in the final response
-                safe_response = final_response.replace("<", "&lt;").replace(">", "&gt;")
-                st.markdown(f"""
-                <div style='background-color:var(--bg-secondary); padding:20px; border-radius:10px; border:2px solid var(--accent-primary); 
-                     animation: fadeIn 1.5s ease-out; box-shadow: 0 0 15px rgba(77, 166, 255, 0.3);'>
-                    {safe_response}
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Copy button for final output
-                st.markdown("<br>", unsafe_allow_html=True)
-                if st.button("📋 Copy to Clipboard", key="copy_button"):
-                    st.code(final_response)
-                    st.success("Content copied! You can now paste it wherever you need.")
-                
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                import traceback
-                st.error(traceback.format_exc())
+                job = get_job_queue().submit(run, owner=session_owner())
+            except JobQueueFullError as e:
+                st.warning(f"⏳ The server is busy: {str(e)}. Please try again in a moment.")
+                return
+            # The job id in the URL lets a refreshed or reconnected tab pick the run up again, and the
+            # owner lets it still stop the run
+            st.session_state.job_id = job.id
+            st.query_params["job"] = job.id
+            st.query_params["owner"] = job.owner
+
+        job_id = st.session_state.get("job_id") or st.query_params.get("job")
+        if job_id:
+            follow_job(job_id)
+    
+        # Re-render the latest finished run from session state on every rerun
+        current_run_id = st.session_state.get("current_run_id")
+        if current_run_id in st.session_state.get("runs", {}):
+            render_run(st.session_state.runs[current_run_id])
+            with run_metrics_area:
+                render_run_metrics(st.session_state.runs[current_run_id])
     
     except Exception as e:
         st.error(f"Application error: {str(e)}")
@@ -71,4 +71,85 @@ Format your response as follows:
 3. Finally, either provide specific improvement suggestions or <OK>
 
 Remember to be constructive and specific in your feedback. Focus on helping improve the content rather than just pointing out flaws.
-""" 
\ No newline at end of file
+"""
+
+# Starting points offered in the UI and used for batch runs
+TEMPLATE_PROMPTS = {
+    "Algorithm Design": "Design a simple algorithm to find the longest palindrome in a string.",
+    "Essay Outline": "Create an outline for an essay about the impact of artificial intelligence on modern education.",
+    "Marketing Copy": "Write marketing copy for a new fitness app that helps users track their workouts and nutrition.",
+    "Story Idea": "Develop a short story idea about a time traveler who accidentally changes history.",
+    "Product Description": "Write a product description for a smart home device that controls all appliances via voice commands."
+}
+
+# Appended to the critique in patch revision mode, followed by the numbered draft
+PATCH_REVISION_PROMPT = """
+Revise the draft to address the critique above by editing it, not by rewriting it.
+The current draft is shown below, split into numbered sections.
+
+Reply ONLY with a JSON object listing your edits, for example:
+{"edits": [
+  {"op": "replace", "section": 2, "text": "The new text of section 2"},
+  {"op": "insert", "after": 3, "text": "A new section after section 3 (after 0 inserts at the start)"},
+  {"op": "delete", "section": 5}
+]}
+
+Section numbers refer to the draft below. Leave out the sections that need no change,
+and do not include the section numbers in the text.
+"""
+
+# Sent when the edits could not be applied
+PATCH_FALLBACK_PROMPT = """
+Those edits could not be applied ({error}). Reply with the complete revised draft instead,
+without section numbers or JSON.
+"""
+
+_CRITIC_SYSTEM_PROMPT = """
+You are an expert content reviewer who checks one thing only: {focus}.
+
+Check:
+{checks}
+
+Ignore every other aspect of the content; other reviewers cover them.
+
+- If the content needs no improvement in this respect, respond with: <OK>
+- Otherwise respond ONLY with a numbered list of at most 5 specific, actionable recommendations,
+  without an introduction or summary
+"""
+
+# Focused critics for multi-critic reflection; together they cover the single reviewer's criteria
+CRITIC_SYSTEM_PROMPTS = {
+    "clarity": _CRITIC_SYSTEM_PROMPT.format(
+        focus="clarity and completeness",
+        checks="""- Is every point easy to understand on first reading?
+- Are terms explained and claims accurate?
+- Is anything the request asked for missing or too thin?""",
+    ),
+    "language": _CRITIC_SYSTEM_PROMPT.format(
+        focus="language",
+        checks="""- Grammar, spelling and punctuation
+- Word choice and sentence length
+- Consistency of style and tone""",
+    ),
+    "structure": _CRITIC_SYSTEM_PROMPT.format(
+        focus="structure",
+        checks="""- A clear introduction and a strong conclusion
+- Logical order of sections and smooth transitions
+- Headings, lists and formatting that fit the content""",
+    ),
+    "impact": _CRITIC_SYSTEM_PROMPT.format(
+        focus="engagement and originality",
+        checks="""- Is the content engaging and memorable?
+- Are there concrete examples, details or data where they would help?
+- Does it avoid clichés and generic statements?""",
+    ),
+}
+
+# Judge for best-of-N first drafts; the request and the numbered drafts follow in the user message
+DRAFT_RANKING_SYSTEM_PROMPT = """
+You are an expert content reviewer. You will see a request and several numbered drafts answering it.
+Pick the draft that best fulfils the request: clear, complete, well structured, with concrete examples
+and details, and that needs the fewest changes to be excellent.
+
+Respond ONLY with the number of the best draft, without explanations or additional text.
+"""
@@ -0,0 +1 @@
+from tests.fixtures import mock, start_mock  # noqa: F401
@@ -0,0 +1,56 @@
+"""
+Fixtures shared by the tests: an in-process mock completions server
+(benchmarks/mock_server.py) and agents that send their requests to it.
+"""
+import pytest
+
+from benchmarks.mock_server import MockSettings, serve
+from engine import ReflectionAgent
+from utils.metrics import MetricsRecorder
+from utils.providers import Endpoint, ProviderRouter
+from utils.ratelimit import RateLimiter
+from utils.retry import RetryPolicy
+from utils.singleflight import SingleFlight
+
+
+def mock_url(server) -> str:
+    return f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+
+@pytest.fixture
+def start_mock():
+    """Start mock servers with the given MockSettings arguments; all are shut down after the test."""
+    servers = []
+
+    def start(**settings):
+        settings.setdefault("latency", 0.01)
+        settings.setdefault("response_chars", 200)
+        server = serve(MockSettings(**settings))
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def mock(start_mock):
+    """A fast mock server whose reviewer never answers <OK>."""
+    return start_mock()
+
+
+def make_agent(*servers, **kwargs) -> ReflectionAgent:
+    """
+    An uncached agent that sends every request to the given mock servers, in order of preference,
+    with metrics, retry, rate-limit and dedupe state of its own so tests do not affect each other.
+    """
+    kwargs.setdefault("use_cache", False)
+    kwargs.setdefault("metrics", MetricsRecorder())
+    kwargs.setdefault("retry_policy", RetryPolicy(base_delay=0.01, seed=0))
+    kwargs.setdefault("rate_limiter", RateLimiter(limits={}, default_limit=None))
+    kwargs.setdefault("single_flight", SingleFlight())
+    if servers:
+        kwargs["provider"] = ProviderRouter([Endpoint(f"mock{i}", mock_url(server)) for i, server in enumerate(servers)])
+    return ReflectionAgent(**kwargs)
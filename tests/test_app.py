@@ -0,0 +1,30 @@
+import pytest
+
+streamlit_testing = pytest.importorskip("streamlit.testing.v1")
+
+
+def show_owner():
+    import streamlit as st
+    from main import session_owner
+    st.text(session_owner())
+    st.text(session_owner())
+
+
+def owners(query_params=None):
+    app = streamlit_testing.AppTest.from_function(show_owner, default_timeout=10)
+    app.query_params.update(query_params or {})
+    app.run()
+    assert not app.exception
+    return [text.value for text in app.text]
+
+
+def test_a_refreshed_tab_keeps_the_owner_in_its_url():
+    # A refresh starts a new session; only the URL carries over
+    assert owners({"job": "abc", "owner": "owner-token"}) == ["owner-token", "owner-token"]
+
+
+def test_a_new_session_gets_a_fresh_owner():
+    first, second = owners(), owners({"job": "abc"})
+    assert first[0] == first[1]
+    assert first[0] != second[0]
+    assert len(first[0]) == 32
@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+from tests.fixtures import make_agent
+
+PROMPT = "Write a short guide to composting"
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_sync_and_async_runs_produce_the_same_steps(mock, stream):
+    agent = make_agent(mock)
+    sync_output, sync_steps = agent.run(PROMPT, n_steps=3, stream=stream)
+    async_output, async_steps = asyncio.run(agent.arun(PROMPT, n_steps=3, stream=stream))
+
+    assert len(sync_steps) == 3
+    assert async_steps == sync_steps
+    assert async_output == sync_output
+
+
+def test_async_runs_share_one_event_loop(mock):
+    agent = make_agent(mock)
+
+    async def main():
+        return await asyncio.gather(*(agent.arun(f"{PROMPT} #{i}", n_steps=2) for i in range(4)))
+
+    results = asyncio.run(main())
+    assert [len(steps) for _, steps in results] == [2] * 4
+    assert len(agent.metrics.recent) == 16
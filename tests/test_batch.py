@@ -0,0 +1,40 @@
+import asyncio
+
+from batch import arun_batch, load_prompts
+from tests.fixtures import make_agent
+
+
+def run_batch(agent, records, **kwargs):
+    async def collect():
+        return [result async for result in arun_batch(agent, records, **kwargs)]
+    return asyncio.run(collect())
+
+
+def test_load_prompts():
+    records = load_prompts(['"Write a haiku"', "", '{"id": "b", "prompt": "Write a limerick", "n_steps": 1}',
+                            '{"text": "no prompt"}', "42"])
+
+    assert records == [{"id": 0, "prompt": "Write a haiku"},
+                       {"id": "b", "prompt": "Write a limerick", "n_steps": 1},
+                       {"id": 2, "text": "no prompt"},
+                       {"id": 3, "prompt": 42}]
+
+
+def test_every_prompt_gets_a_result_with_its_overrides(mock):
+    records = load_prompts(['{"id": "a", "prompt": "Write a haiku"}',
+                            '{"id": "b", "prompt": "Write a limerick", "n_steps": 1}'])
+    results = {result["id"]: result for result in run_batch(make_agent(mock), records, concurrency=2, n_steps=2)}
+
+    assert [len(results[i]["steps_data"]) for i in "ab"] == [2, 1]
+    assert all(result["error"] is None and result["final_output"] for result in results.values())
+    assert all(result["timings"]["elapsed"] > 0 for result in results.values())
+
+
+def test_a_bad_record_fails_on_its_own(mock):
+    records = load_prompts(['"Write a haiku"', '{"text": "no prompt"}', "42", '"Write a limerick"'])
+    results = {result["id"]: result for result in run_batch(make_agent(mock), records, n_steps=1)}
+
+    assert sorted(results) == [0, 1, 2, 3]
+    assert results[1]["error"] == results[2]["error"] == 'the record has no "prompt" string'
+    assert results[1]["prompt"] is None and results[1]["steps_data"] == []
+    assert results[0]["error"] is None and results[3]["error"] is None
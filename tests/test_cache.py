@@ -0,0 +1,60 @@
+import time
+
+from utils.cache import CompletionCache, completion_key
+
+
+def payload(content: str, **fields):
+    return {"model": "llama-3.3-70b-versatile", "messages": [{"role": "user", "content": content}],
+            "temperature": 0.7, "max_tokens": 1000, **fields}
+
+
+def test_key_ignores_fields_that_do_not_change_the_completion():
+    assert completion_key(payload("hi", stream=True)) == completion_key(payload("hi"))
+    assert completion_key(payload("hi", temperature=0.2)) != completion_key(payload("hi"))
+
+
+def test_hit_after_put_and_persisted_across_instances(tmp_path):
+    path = str(tmp_path / "completions.sqlite3")
+    cache = CompletionCache(path)
+    assert cache.get(payload("hi")) is None
+    cache.put(payload("hi"), "hello")
+
+    assert cache.get(payload("hi")) == "hello"
+    assert CompletionCache(path).get(payload("hi")) == "hello"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = CompletionCache(str(tmp_path / "completions.sqlite3"), ttl=0.05)
+    cache.put(payload("hi"), "hello")
+    time.sleep(0.1)
+
+    assert cache.get(payload("hi")) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = CompletionCache(str(tmp_path / "completions.sqlite3"), max_entries=2)
+    cache.put(payload("a"), "A")
+    time.sleep(0.01)
+    cache.put(payload("b"), "B")
+    time.sleep(0.01)
+    assert cache.get(payload("a")) == "A"
+    time.sleep(0.01)
+    cache.put(payload("c"), "C")
+
+    assert cache.get(payload("b")) is None
+    assert cache.get(payload("a")) == "A"
+    assert cache.get(payload("c")) == "C"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_stochastic_requests_can_bypass_the_cache(tmp_path):
+    cache = CompletionCache(str(tmp_path / "completions.sqlite3"), bypass_stochastic=True)
+    cache.put(payload("hi"), "hello")
+    cache.put(payload("hi", temperature=0), "greedy")
+
+    assert cache.get(payload("hi")) is None
+    assert cache.get(payload("hi", temperature=0)) == "greedy"
+    assert cache.stats()["bypassed"] == 1
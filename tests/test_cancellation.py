@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from tests.fixtures import make_agent
+from utils.cancellation import CancellationToken, RunCancelled
+from utils.jobs import JobQueue
+
+PROMPT = "Write a short guide to composting"
+HISTORY = [{"role": "user", "content": "Write a haiku about rain"}]
+
+
+def cancel_after(token: CancellationToken, seconds: float, reason: str = "stopped by the user") -> None:
+    threading.Timer(seconds, token.cancel, (reason,)).start()
+
+
+def test_the_first_reason_wins_and_callbacks_run_once():
+    token, calls = CancellationToken(), []
+    token.add_callback(lambda: calls.append("first"))
+    remove = token.add_callback(lambda: calls.append("removed"))
+    remove()
+
+    token.cancel("stopped by the user")
+    token.cancel("deadline passed")
+    token.add_callback(lambda: calls.append("late"))
+
+    assert token.reason == "stopped by the user"
+    assert calls == ["first", "late"]
+    with pytest.raises(RunCancelled, match="stopped by the user"):
+        token.raise_if_cancelled()
+
+
+def test_a_deadline_cancels_the_token():
+    token = CancellationToken(timeout=60)
+    token.limit(0.05)
+    token.limit(30)
+
+    assert not token.cancelled
+    assert 0 < token.remaining() <= 0.05
+    time.sleep(0.06)
+    assert token.cancelled and token.reason == "deadline passed"
+    assert token.remaining() == 0.0
+
+
+def test_a_bound_task_is_stopped_with_run_cancelled():
+    token = CancellationToken()
+
+    async def main():
+        with token.bind():
+            await asyncio.sleep(5)
+
+    cancel_after(token, 0.05)
+    started = time.perf_counter()
+    with pytest.raises(RunCancelled, match="stopped by the user"):
+        asyncio.run(main())
+    assert time.perf_counter() - started < 0.5
+
+
+def test_a_blocking_request_is_aborted(start_mock):
+    agent = make_agent(start_mock(latency=2.0))
+    token = CancellationToken()
+    cancel_after(token, 0.1)
+
+    started = time.perf_counter()
+    with pytest.raises(RunCancelled):
+        agent.generate(HISTORY, cancel=token)
+    assert time.perf_counter() - started < 0.5
+    assert agent.metrics.recent[-1].error == "RunCancelled"
+
+
+@pytest.mark.parametrize("request_kind", ["generate", "optimize_prompt"])
+def test_a_blocking_retry_backoff_is_stopped(start_mock, request_kind):
+    # Every request is answered with a 429 asking the client to come back in 10s
+    agent = make_agent(start_mock(rate_limit_probability=1.0, retry_after=10))
+    token = CancellationToken()
+    cancel_after(token, 0.1)
+
+    started = time.perf_counter()
+    with pytest.raises(RunCancelled, match="stopped by the user"):
+        if request_kind == "generate":
+            agent.generate(HISTORY, cancel=token)
+        else:
+            agent.optimize_prompt(PROMPT, cancel=token)
+    assert time.perf_counter() - started < 0.5
+    assert agent.retry_policy.breaker(agent.provider.endpoints[0].url).state == "closed"
+
+
+@pytest.mark.parametrize("request_kind", ["agenerate", "aoptimize_prompt"])
+def test_an_async_retry_backoff_is_stopped(start_mock, request_kind):
+    agent = make_agent(start_mock(rate_limit_probability=1.0, retry_after=10))
+    token = CancellationToken()
+
+    async def main():
+        with token.bind():
+            if request_kind == "agenerate":
+                await agent.agenerate(HISTORY)
+            else:
+                await agent.aoptimize_prompt(PROMPT)
+
+    cancel_after(token, 0.1)
+    started = time.perf_counter()
+    with pytest.raises(RunCancelled, match="stopped by the user"):
+        asyncio.run(main())
+    assert time.perf_counter() - started < 0.5
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_a_run_past_its_deadline_stops_retrying(start_mock, stream):
+    agent = make_agent(start_mock(rate_limit_probability=1.0, retry_after=10))
+
+    started = time.perf_counter()
+    output, steps = agent.run(PROMPT, n_steps=3, timeout=0.3, stream=stream)
+    assert time.perf_counter() - started < 0.8
+    assert output == ""
+    assert steps == []
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_a_stopped_run_keeps_the_finished_steps(start_mock, stream):
+    agent = make_agent(start_mock(latency=0.1))
+    token = CancellationToken()
+    cancel_after(token, 0.5)
+
+    started = time.perf_counter()
+    output, steps = agent.run(PROMPT, n_steps=10, cancel=token, stream=stream)
+
+    assert time.perf_counter() - started < 0.8
+    assert 1 <= len(steps) < 10
+    assert steps[-1]["stop_reason"] == "stopped by the user"
+    assert output
+
+
+def test_run_past_its_deadline_keeps_the_finished_steps(start_mock):
+    agent = make_agent(start_mock(latency=0.2))
+    started = time.perf_counter()
+    _, steps = agent.run(PROMPT, n_steps=10, timeout=1.0)
+
+    assert time.perf_counter() - started < 1.3
+    assert 1 <= len(steps) < 10
+    assert steps[-1]["stop_reason"] == "deadline passed"
+
+
+def test_a_stopped_job_frees_its_worker(start_mock):
+    agent = make_agent(start_mock(latency=0.2))
+    queue = JobQueue(workers=1, max_queued=2)
+    running = queue.submit(lambda job: agent.run(PROMPT, n_steps=10, sinks=[job], cancel=job.token))
+    queued = queue.submit(lambda job: agent.run(PROMPT, n_steps=10, sinks=[job], cancel=job.token))
+    time.sleep(0.5)
+
+    queued.cancel()
+    running.cancel()
+    for job in (running, queued):
+        while not job.finished:
+            job.wait(len(job.events), timeout=0.05)
+
+    assert running.status == queued.status == "cancelled"
+    assert running.result[1][-1]["stop_reason"] == "stopped by the user"
+    assert queued.started_at is None
+    queue.shutdown()
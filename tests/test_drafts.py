@@ -0,0 +1,80 @@
+import pytest
+
+from tests.fixtures import make_agent
+from utils.drafts import parse_ranking, score_draft
+
+REQUEST = "Explain how to brew coffee with a French press"
+THIN = "Coffee is nice. You can brew coffee. Coffee is nice"
+RICH = """# How to brew coffee with a French press
+
+1. Heat water to 94 degrees, for example by letting boiled water rest for 30 seconds.
+2. Use 60 grams of coarse ground coffee per litre, such as a medium roast.
+
+Steep for 4 minutes, then press the plunger slowly.
+
+For instance, a shorter steep of 3 minutes gives a lighter cup."""
+
+
+def test_a_specific_structured_complete_draft_scores_higher():
+    rich, thin = score_draft(RICH, REQUEST), score_draft(THIN, REQUEST)
+
+    assert rich["score"] > thin["score"]
+    for name in ("coverage", "specificity", "structure", "complete"):
+        assert rich[name] > thin[name]
+    assert all(0.0 <= value <= 1.0 for value in rich.values())
+    assert rich["coverage"] == 1.0
+
+
+def test_a_cut_off_draft_loses_the_completeness_score():
+    assert score_draft(RICH, REQUEST)["complete"] == 1.0
+    assert score_draft(RICH[:-12], REQUEST)["complete"] == 0.0
+
+
+@pytest.mark.parametrize("reply, index", [("2", 1), ("Draft 3", 2), ("**1** is best.", 0)])
+def test_parse_ranking(reply, index):
+    assert parse_ranking(reply, 3) == index
+
+
+@pytest.mark.parametrize("reply", ["none of them", "4", "0"])
+def test_parse_ranking_rejects_replies_naming_no_draft(reply):
+    with pytest.raises(ValueError):
+        parse_ranking(reply, 3)
+
+
+@pytest.mark.parametrize("selection", ["heuristic", "rank"])
+def test_run_keeps_one_of_several_first_drafts(start_mock, selection):
+    server = start_mock(quality_threshold=4)
+    agent = make_agent(server)
+    _, steps = agent.run(REQUEST, n_steps=1, n_drafts=3, draft_selection=selection)
+
+    drafts = steps[0]["drafts"]
+    assert len(drafts) == 3
+    assert len({draft["temperature"] for draft in drafts}) == 3
+    assert sum(draft["chosen"] for draft in drafts) == 1
+    if selection == "heuristic":
+        assert max(drafts, key=lambda draft: draft["score"])["chosen"]
+    assert server.counters["ranking_requests"] == (selection == "rank")
+
+
+def test_ranking_keeps_the_draft_the_judge_picks(start_mock):
+    # The mock's judge picks the draft with the most examples
+    server = start_mock(quality_threshold=4)
+    agent = make_agent(server)
+    drafts = []
+    generate = agent.agenerate
+
+    async def recording_generate(*args, **kwargs):
+        drafts.append(await generate(*args, **kwargs))
+        return drafts[-1]
+
+    agent.agenerate = recording_generate
+    _, steps = agent.run(REQUEST, n_steps=1, n_drafts=4, draft_selection="rank")
+
+    examples = [draft.count("For example") for draft in drafts]
+    assert len(drafts) == 4 and len(set(examples)) > 1
+    assert steps[0]["generation"].count("For example") == max(examples)
+
+
+def test_n_drafts_is_validated(mock):
+    with pytest.raises(ValueError, match="n_drafts"):
+        make_agent(mock).run(REQUEST, n_drafts=0)
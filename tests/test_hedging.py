@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+
+from tests.fixtures import make_agent
+from utils.hedging import HedgePolicy
+
+MODEL = "llama-3.3-70b-versatile"
+HISTORY = [{"role": "user", "content": "Write a haiku about rain"}]
+
+
+def primed_policy(delay: float = 0.05, **kwargs) -> HedgePolicy:
+    """A policy that hedges generation calls still running after `delay` seconds."""
+    policy = HedgePolicy(min_samples=1, min_delay=delay, **kwargs)
+    policy.observe(f"generation {MODEL}", delay)
+    return policy
+
+
+def test_no_hedging_before_enough_samples():
+    policy = HedgePolicy(percentile=0.5, min_samples=3, min_delay=0.01)
+    for seconds in (0.2, 0.1):
+        policy.observe("generation m", seconds)
+    assert policy.delay("generation m") is None
+
+    policy.observe("generation m", 0.3)
+    assert policy.delay("generation m") == 0.2
+
+
+def test_the_budget_limits_duplicates():
+    policy = HedgePolicy(percentile=0.01, min_samples=1, min_delay=0.01, max_extra_load=0.0, burst=1.0)
+    policy.observe("k", 0.01)
+
+    async def slow(value):
+        await asyncio.sleep(0.05)
+        return value
+
+    async def main():
+        return [await policy.arace("k", lambda: slow("primary"), lambda: slow("hedge")) for _ in range(3)]
+
+    results = asyncio.run(main())
+    assert [hedged for _, hedged, _ in results] == [True, False, False]
+    assert (policy.stats()["hedged"], policy.stats()["denied"]) == (1, 2)
+
+
+@pytest.mark.parametrize("primary_latency, hedge_latency, hedge_wins", [(1.0, 0.01, True), (0.2, 1.0, False)])
+def test_the_call_records_the_request_that_won(start_mock, primary_latency, hedge_latency, hedge_wins):
+    # The first endpoint takes the request; the duplicate goes to the other one
+    slow, other = start_mock(latency=primary_latency), start_mock(latency=hedge_latency)
+    agent = make_agent(slow, other, hedge=True, hedge_policy=primed_policy())
+
+    started = time.perf_counter()
+    assert agent.generate(HISTORY)
+    elapsed = time.perf_counter() - started
+
+    call = agent.metrics.recent[-1]
+    assert call.hedged
+    assert call.hedge_won is hedge_wins
+    assert call.endpoint == ("mock1" if hedge_wins else "mock0")
+    assert call.attempts == 1 and call.failovers == 0
+    assert elapsed < min(primary_latency, 0.05 + hedge_latency) + 0.3
+    assert slow.counters["requests"] + other.counters["requests"] >= 1
+
+
+def test_a_failed_duplicate_does_not_count_against_the_call(start_mock):
+    # The duplicate fails on the second endpoint and fails over back to the first, after the primary answered
+    primary, failing = start_mock(latency=0.2), start_mock(unavailable_probability=1.0)
+    agent = make_agent(primary, failing, hedge=True, hedge_policy=primed_policy())
+    agent.generate(HISTORY)
+
+    call = agent.metrics.recent[-1]
+    assert call.hedged and not call.hedge_won
+    assert (call.endpoint, call.attempts, call.failovers, call.retry_wait) == ("mock0", 1, 0, 0.0)
+    assert failing.counters["unavailable"] == 1
+
+
+def test_a_fast_primary_is_not_hedged(start_mock):
+    fast, other = start_mock(), start_mock()
+    agent = make_agent(fast, other, hedge=True, hedge_policy=primed_policy(delay=0.5))
+    agent.generate(HISTORY)
+
+    call = agent.metrics.recent[-1]
+    assert not call.hedged and call.endpoint == "mock0"
+    assert other.counters["requests"] == 0
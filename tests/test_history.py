@@ -0,0 +1,50 @@
+from utils.completions import TokenBudgetChatHistory
+from utils.tokens import estimate_message_tokens, history_budget
+
+MODEL = "llama-3.3-70b-versatile"
+SYSTEM = {"role": "system", "content": "You are a helpful assistant."}
+USER = {"role": "user", "content": "Write an essay about rivers."}
+
+
+def message(i: int, chars: int = 400):
+    return {"role": "assistant" if i % 2 else "user", "content": f"{i} " + "x" * chars}
+
+
+def test_budget_is_the_context_window_less_the_completion_capped_by_default():
+    assert history_budget(MODEL) == 8192
+    assert history_budget(MODEL, max_budget=None) == 131072 - 1000
+    assert history_budget("gemma-7b-it", completion_tokens=2000) == 8192 - 2000
+
+
+def test_oldest_messages_are_dropped_once_over_budget():
+    history = TokenBudgetChatHistory([SYSTEM, USER], model=MODEL, max_tokens=400)
+    for i in range(10):
+        history.append(message(i))
+
+    messages = history.get_messages()
+    assert messages[:2] == [SYSTEM, USER]
+    assert messages[-1] == message(9)
+    assert history.total_tokens <= 400
+    assert history.total_tokens == sum(estimate_message_tokens(msg, MODEL) for msg in messages)
+    kept = len(messages) - 2
+    assert [msg["content"] for msg in messages[2:]] == [message(i)["content"] for i in range(10 - kept, 10)]
+    assert len(history.trim_log) == 10 - kept
+    assert all(entry["budget"] == 400 for entry in history.trim_log)
+
+
+def test_fixed_messages_and_the_newest_message_are_always_kept():
+    history = TokenBudgetChatHistory([SYSTEM, USER], model=MODEL, max_tokens=50)
+    history.append(message(0, chars=1000))
+    history.append(message(1, chars=1000))
+
+    assert history.get_messages() == [SYSTEM, USER, message(1, chars=1000)]
+    assert history.over_budget
+
+
+def test_under_budget_nothing_is_trimmed():
+    history = TokenBudgetChatHistory([SYSTEM, USER], model=MODEL)
+    for i in range(4):
+        history.append(message(i))
+
+    assert len(history.get_messages()) == 6
+    assert history.trim_log == []
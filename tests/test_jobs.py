@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+from tests.fixtures import make_agent
+from utils.events import RunFinished, StepStarted
+from utils.jobs import JobQueue, JobQueueFullError
+
+
+def blocked(release: threading.Event):
+    def run(job):
+        job("started")
+        release.wait(5)
+        return "result"
+    return run
+
+
+def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def test_submissions_beyond_the_queue_are_rejected(release):
+    queue = JobQueue(workers=1, max_queued=1, max_per_owner=None)
+    running = queue.submit(blocked(release))
+    wait_until(lambda: running.status == "running")
+    queued = queue.submit(blocked(release))
+
+    with pytest.raises(JobQueueFullError):
+        queue.submit(blocked(release))
+    assert queue.position(queued) == 0
+    assert queue.stats()["queued"] == 1 and queue.stats()["rejected"] == 1
+
+    release.set()
+    wait_until(lambda: queued.finished)
+    assert (running.result, queued.result) == ("result", "result")
+    queue.submit(blocked(release))
+    queue.shutdown()
+
+
+def test_each_owner_has_a_share_of_the_queue(release):
+    queue = JobQueue(workers=2, max_queued=10, max_per_owner=2)
+    queue.submit(blocked(release), owner="alice")
+    queue.submit(blocked(release), owner="alice")
+
+    with pytest.raises(JobQueueFullError, match="per user"):
+        queue.submit(blocked(release), owner="alice")
+    queue.submit(blocked(release), owner="bob")
+    queue.submit(blocked(release))
+    release.set()
+    queue.shutdown()
+
+
+def test_queued_jobs_know_their_position(release):
+    queue = JobQueue(workers=1, max_queued=5, max_per_owner=None)
+    jobs = [queue.submit(blocked(release)) for _ in range(3)]
+    wait_until(lambda: jobs[0].status == "running")
+
+    assert [queue.position(job) for job in jobs] == [0, 0, 1]
+    release.set()
+    queue.shutdown()
+
+
+def test_a_follower_can_reconnect_and_replay_the_events(release):
+    queue = JobQueue(workers=1, max_queued=1)
+    job = queue.submit(blocked(release))
+    assert job.wait(0, timeout=5) == ["started"]
+
+    # A refreshed page finds the job by its id and replays everything from the start
+    follower = queue.get(job.id)
+    assert follower is job
+    assert follower.wait(0, timeout=0) == ["started"]
+    assert follower.wait(1, timeout=0.05) == []
+
+    release.set()
+    wait_until(lambda: job.finished)
+    assert queue.get(job.id).status == "done"
+    assert queue.get("unknown") is None
+    queue.shutdown()
+
+
+def test_a_failed_run_records_its_error():
+    queue = JobQueue(workers=1)
+
+    def run(job):
+        raise ValueError("no model")
+
+    job = queue.submit(run)
+    wait_until(lambda: job.finished)
+    assert (job.status, job.error) == ("failed", "ValueError: no model")
+    assert queue.stats()["failed"] == 1
+    assert 'reflection_agent_jobs_finished_total{status="failed"} 1' in queue.prometheus_text()
+    queue.shutdown()
+
+
+def test_finished_jobs_are_forgotten_after_the_retention():
+    queue = JobQueue(workers=1, retention=0.05)
+    job = queue.submit(lambda job: None)
+    wait_until(lambda: job.finished)
+    time.sleep(0.1)
+
+    queue.submit(lambda job: None)
+    assert queue.get(job.id) is None
+    queue.shutdown()
+
+
+def test_a_run_streams_its_progress_into_the_job(mock):
+    agent = make_agent(mock)
+    queue = JobQueue(workers=1)
+    job = queue.submit(lambda job: agent.run("Write a haiku about rain", n_steps=2, sinks=[job]))
+    wait_until(lambda: job.finished)
+
+    assert job.status == "done"
+    _, steps = job.result
+    assert len(steps) == 2
+    assert sum(isinstance(event, StepStarted) for event in job.events) == 2
+    assert isinstance(job.events[-1], RunFinished)
+    queue.shutdown()
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from tests.fixtures import make_agent
+from utils.cache import CompletionCache
+from utils.metrics import MetricsRecorder, run_breakdown
+from utils.retry import RetryPolicy
+
+PROMPT = "Write a short guide to composting"
+HISTORY = [{"role": "user", "content": PROMPT}]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_every_call_is_recorded(mock, stream):
+    agent = make_agent(mock)
+    agent.run(PROMPT, n_steps=2, stream=stream)
+
+    calls = list(agent.metrics.recent)
+    assert [(call.kind, call.step) for call in calls] == [("generation", 1), ("reflection", 1),
+                                                          ("generation", 2), ("reflection", 2)]
+    for call in calls:
+        assert call.status == "200" and call.error is None
+        assert call.streamed == stream
+        assert call.prompt_tokens > 0 and call.completion_tokens > 0
+        assert call.cost_usd > 0
+        assert call.finish_reason == "stop"
+        assert 0 < call.time_to_first_byte <= call.total
+
+
+def test_cached_calls_are_recorded_as_cached(mock, tmp_path):
+    agent = make_agent(mock, use_cache=True, cache=CompletionCache(str(tmp_path / "completions.sqlite3")))
+    agent.run(PROMPT, n_steps=1)
+    agent.run(PROMPT, n_steps=1)
+
+    assert [call.status for call in agent.metrics.recent] == ["200", "200", "cached", "cached"]
+    breakdown = run_breakdown([call.to_dict() for call in agent.metrics.recent])
+    assert breakdown["total"]["calls"] == 4
+    assert breakdown["total"]["cached"] == 2
+
+
+def test_exports_prometheus_text_and_json_lines(mock, tmp_path):
+    path = tmp_path / "calls.jsonl"
+    agent = make_agent(mock, metrics=MetricsRecorder(jsonl_path=str(path)))
+    agent.run(PROMPT, n_steps=1)
+    agent.metrics.close()
+
+    text = agent.metrics.prometheus_text()
+    assert 'reflection_agent_calls_total{kind="generation",model="llama-3.3-70b-versatile",status="200"} 1' in text
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["kind"] for record in records] == ["generation", "reflection"]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_failed_calls_are_recorded_as_errors(mock, stream):
+    agent = make_agent(mock, retry_policy=RetryPolicy(max_attempts=1))
+    mock.outage_until = time.monotonic() + 60
+
+    async def generate():
+        if stream:
+            return "".join([chunk async for chunk in agent.astream_generate(HISTORY)])
+        return await agent.agenerate(HISTORY)
+
+    with pytest.raises(Exception, match="503"):
+        asyncio.run(generate())
+    call = agent.metrics.recent[-1]
+    assert (call.status, call.error, call.streamed) == ("503", "Exception", stream)
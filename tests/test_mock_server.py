@@ -0,0 +1,43 @@
+import json
+import urllib.request
+
+import pytest
+
+from tests.fixtures import make_agent, mock_url
+
+PROMPT = "Write a short guide to composting"
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_run_reaches_the_step_limit_when_the_reviewer_never_answers_ok(mock, stream):
+    agent = make_agent(mock)
+    output, steps = agent.run(PROMPT, n_steps=3, stream=stream)
+
+    assert len(steps) == 3
+    assert steps[-1]["stop_reason"] == "reached the 3-step limit"
+    assert output == steps[-1]["generation"]
+    assert len(output) == 200
+
+
+@pytest.mark.parametrize("n_steps", [0, -1])
+def test_runs_need_at_least_one_step(mock, n_steps):
+    with pytest.raises(ValueError, match="n_steps"):
+        make_agent(mock).run(PROMPT, n_steps=n_steps)
+    assert mock.counters["requests"] == 0
+
+
+def test_run_stops_at_the_reviewers_ok(start_mock):
+    agent = make_agent(start_mock(ok_probability=1.0))
+    _, steps = agent.run(PROMPT, n_steps=5)
+
+    assert len(steps) == 1
+    assert steps[0]["critique"] == "<OK>"
+    assert steps[0]["stop_reason"] == "reviewer returned <OK>"
+
+
+def test_stats_count_the_requests(mock):
+    make_agent(mock).run(PROMPT, n_steps=2)
+
+    with urllib.request.urlopen(mock_url(mock).replace("/v1/chat/completions", "/stats")) as response:
+        stats = json.load(response)
+    assert stats["requests"] == 4
@@ -0,0 +1,75 @@
+import pytest
+
+from tests.fixtures import make_agent
+from utils.patches import PatchError, apply_patch, parse_patch, render_sections, split_sections
+
+DRAFT = "Intro paragraph.\n\nBody paragraph.\n\n```python\nx = 1\n\ny = 2\n```\n\nConclusion."
+
+
+def test_sections_are_paragraphs_with_code_blocks_kept_whole():
+    assert split_sections(DRAFT) == ["Intro paragraph.", "Body paragraph.", "```python\nx = 1\n\ny = 2\n```",
+                                     "Conclusion."]
+    assert render_sections("One.\n\n\n  Two.").splitlines() == ["[1] One.", "", "[2] Two."]
+
+
+def test_edits_refer_to_the_sections_of_the_draft_as_given():
+    revised = apply_patch(DRAFT, [
+        {"op": "delete", "section": 1},
+        {"op": "replace", "section": "2", "text": "[2] Better body."},
+        {"op": "insert", "after": 4, "text": "Postscript."},
+        {"op": "insert", "after": 0, "text": "Title"},
+    ])
+
+    assert split_sections(revised) == ["Title", "Better body.", "```python\nx = 1\n\ny = 2\n```",
+                                       "Conclusion.", "Postscript."]
+
+
+def test_parse_patch_accepts_a_fenced_reply():
+    reply = 'Here are the edits:\n```json\n{"edits": [{"op": "delete", "section": 2}]}\n```'
+    assert parse_patch(reply) == [{"op": "delete", "section": 2}]
+
+
+@pytest.mark.parametrize("reply", [
+    "I rewrote the draft instead.",
+    '{"edits": [{"op": "delete", "section": 1}',
+    '{"changes": []}',
+    '{"edits": ["delete 1"]}',
+])
+def test_unparsable_replies_are_rejected(reply):
+    with pytest.raises(PatchError):
+        parse_patch(reply)
+
+
+@pytest.mark.parametrize("edits", [
+    [{"op": "replace", "section": 5, "text": "Out of range"}],
+    [{"op": "delete", "section": 0}],
+    [{"op": "insert", "after": -1, "text": "Before the start"}],
+    [{"op": "replace", "section": 1, "text": "A"}, {"op": "delete", "section": 1}],
+    [{"op": "replace", "section": 1}],
+    [{"op": "replace", "section": True, "text": "A"}],
+    [{"op": "move", "section": 1}],
+])
+def test_edits_that_do_not_apply_are_rejected(edits):
+    with pytest.raises(PatchError):
+        apply_patch(DRAFT, edits)
+
+
+def test_patch_mode_revises_the_draft_with_edits(mock):
+    agent = make_agent(mock)
+    _, steps = agent.run("Write a short guide to composting", n_steps=3, revision_mode="patch")
+
+    assert "patch" not in steps[0]
+    for previous, step in zip(steps, steps[1:]):
+        edits = step["patch"]["edits"]
+        assert edits[0]["op"] == "replace"
+        assert step["generation"] == apply_patch(previous["generation"], edits)
+
+
+def test_patch_mode_falls_back_to_a_rewrite_when_the_patch_does_not_apply(start_mock):
+    server = start_mock(bad_patch_probability=1.0)
+    agent = make_agent(server)
+    _, steps = agent.run("Write a short guide to composting", n_steps=2, revision_mode="patch")
+
+    assert steps[1]["patch"]["fallback"] == "rewrite"
+    assert "not between" in steps[1]["patch"]["error"]
+    assert steps[1]["generation"].startswith("Draft after")
@@ -0,0 +1,53 @@
+import json
+
+from utils.cache import completion_key
+from utils.completions import Message, TokenBudgetChatHistory
+from utils.payloads import ChatPayload
+
+MODEL = "llama-3.3-70b-versatile"
+MESSAGES = [
+    {"role": "system", "content": "Answer in French."},
+    {"role": "user", "content": "Écris un haïku sur la pluie \"d'automne\" 🌧"},
+    {"role": "assistant", "content": "Line one\nLine two\ttabbed"},
+]
+
+
+def test_cache_key_matches_completion_key_of_the_equivalent_dictionary():
+    payload = ChatPayload(MODEL, MESSAGES, temperature=0.2, max_tokens=512)
+    as_dict = {"model": MODEL, "messages": MESSAGES, "temperature": 0.2, "max_tokens": 512}
+
+    assert payload.cache_key == completion_key(as_dict)
+    assert completion_key(payload) == payload.cache_key
+
+
+def test_cache_key_ignores_streaming_and_tracks_every_key_field():
+    payload = ChatPayload(MODEL, MESSAGES)
+
+    assert ChatPayload(MODEL, MESSAGES, stream=True).cache_key == payload.cache_key
+    assert ChatPayload(MODEL, MESSAGES[:2]).cache_key != payload.cache_key
+    assert ChatPayload(MODEL, MESSAGES, temperature=0.0).cache_key != payload.cache_key
+    assert ChatPayload(MODEL, MESSAGES, max_tokens=10).cache_key != payload.cache_key
+    assert ChatPayload("gemma-7b-it", MESSAGES).cache_key != payload.cache_key
+    assert ChatPayload(MODEL, []).cache_key == completion_key(
+        {"model": MODEL, "messages": [], "temperature": 0.7, "max_tokens": 1000})
+
+
+def test_body_is_the_json_of_the_payload():
+    payload = ChatPayload(MODEL, MESSAGES, stream=True)
+
+    assert json.loads(payload.body) == {"model": MODEL, "messages": MESSAGES, "temperature": 0.7,
+                                        "max_tokens": 1000, "stream": True}
+    assert json.loads(payload.body) == payload.to_dict()
+    assert json.loads(ChatPayload(MODEL, []).body)["messages"] == []
+
+
+def test_payload_from_a_history_view_reuses_the_messages():
+    history = TokenBudgetChatHistory(MESSAGES[:2], model=MODEL)
+    history.append(MESSAGES[2])
+    view = history.view()
+    payload = ChatPayload(MODEL, view)
+
+    assert [msg.to_dict() for msg in payload.messages] == MESSAGES
+    assert all(isinstance(msg, Message) for msg in payload.messages)
+    assert payload.messages[0] is view[0]
+    assert payload.cache_key == ChatPayload(MODEL, MESSAGES).cache_key
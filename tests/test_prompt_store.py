@@ -0,0 +1,85 @@
+import sqlite3
+import time
+
+from tests.fixtures import make_agent
+from utils.cache import CompletionCache
+from utils.prompt_store import OptimizedPromptStore, normalize_prompt, prompt_key
+
+MODEL = "llama-3.1-8b-instant"
+
+
+def store_at(tmp_path, **kwargs) -> OptimizedPromptStore:
+    return OptimizedPromptStore(str(tmp_path / "prompts.sqlite3"), **kwargs)
+
+
+def test_prompts_differing_only_in_whitespace_or_unicode_form_share_a_key():
+    assert normalize_prompt("  Write\ta\n\nhaiku ") == "Write a haiku"
+    assert prompt_key("Write a ｈａｉｋｕ", MODEL) == prompt_key("Write  a haiku", MODEL)
+    assert prompt_key("write a haiku", MODEL) != prompt_key("Write a haiku", MODEL)
+    assert prompt_key("Write a haiku", MODEL, "v2") != prompt_key("Write a haiku", MODEL)
+    assert prompt_key("Write a haiku", "gemma-7b-it") != prompt_key("Write a haiku", MODEL)
+
+
+def test_hit_after_put_and_persisted_across_instances(tmp_path):
+    store = store_at(tmp_path)
+    assert store.get("Write a haiku", MODEL) is None
+    store.put("Write a haiku ", MODEL, "Write a haiku about autumn rain")
+
+    assert store.get("Write  a haiku", MODEL) == "Write a haiku about autumn rain"
+    assert store_at(tmp_path).get("Write a haiku", MODEL) == "Write a haiku about autumn rain"
+    stats = store.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_contains_leaves_the_counters_alone(tmp_path):
+    store = store_at(tmp_path, ttl=0.05)
+    store.put("Write a haiku", MODEL, "optimized")
+
+    assert store.contains("Write a haiku", MODEL)
+    assert not store.contains("Write a limerick", MODEL)
+    assert (store.stats()["hits"], store.stats()["misses"]) == (0, 0)
+    time.sleep(0.1)
+    assert not store.contains("Write a haiku", MODEL)
+    assert store.get("Write a haiku", MODEL) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    store = store_at(tmp_path, max_entries=2)
+    for prompt in ("a", "b"):
+        store.put(prompt, MODEL, prompt.upper())
+        time.sleep(0.01)
+    assert store.get("a", MODEL) == "A"
+    time.sleep(0.01)
+    store.put("c", MODEL, "C")
+
+    assert store.get("b", MODEL) is None
+    assert store.stats()["evictions"] == 1
+    assert store.stats()["entries"] == 2
+
+
+def test_both_stores_keep_their_table_layout(tmp_path):
+    # Files written before the shared store must stay readable
+    store_at(tmp_path)
+    CompletionCache(str(tmp_path / "completions.sqlite3"))
+
+    def columns(path, table):
+        with sqlite3.connect(str(tmp_path / path)) as conn:
+            return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+    assert columns("prompts.sqlite3", "optimized_prompts") == [
+        "key", "model", "prompt", "optimized", "created_at", "last_access"]
+    assert columns("completions.sqlite3", "completions") == ["key", "model", "output", "created_at", "last_access"]
+
+
+def test_warm_up_optimizes_each_missing_prompt_once(mock, tmp_path):
+    agent = make_agent(mock, use_cache=True, cache=CompletionCache(str(tmp_path / "completions.sqlite3")),
+                       prompt_store=store_at(tmp_path))
+    prompts = ["Write a haiku", "Write  a haiku", "Write a limerick"]
+
+    assert agent.warm_up(prompts) == 2
+    assert mock.counters["requests"] == 2
+    assert agent.warm_up(prompts) == 0
+    assert mock.counters["requests"] == 2
+    assert agent.optimize_prompt("Write a limerick")
+    assert mock.counters["requests"] == 2
+    assert agent.prompt_store.stats()["hits"] == 1
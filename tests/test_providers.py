@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from tests.fixtures import make_agent, mock_url
+from utils.providers import Endpoint, ProviderRouter, endpoints_from_env
+
+HISTORY = [{"role": "user", "content": "Write a haiku about rain"}]
+MODEL = "llama-3.3-70b-versatile"
+
+
+def router(**kwargs) -> ProviderRouter:
+    return ProviderRouter([Endpoint("a", "http://a"), Endpoint("b", "http://b"),
+                           Endpoint("c", "http://c", models={"gemma-7b-it": "gemma"})], **kwargs)
+
+
+def names(endpoints):
+    return [endpoint.name for endpoint in endpoints]
+
+
+def test_unmeasured_endpoints_keep_their_order_and_only_serving_ones_are_picked():
+    providers = router()
+
+    assert names(providers.select(MODEL)) == ["a", "b"]
+    assert names(providers.select("gemma-7b-it")) == ["a", "b", "c"]
+    assert providers.endpoint("c").model_name("gemma-7b-it") == "gemma"
+    with pytest.raises(ValueError):
+        ProviderRouter([Endpoint("c", "http://c", models={"gemma-7b-it": "gemma"})]).select(MODEL)
+
+
+def test_the_fastest_endpoint_is_picked():
+    providers = router()
+    providers.record(providers.endpoint("a"), 0.5, failed=False)
+    providers.record(providers.endpoint("b"), 0.1, failed=False)
+
+    assert names(providers.select(MODEL)) == ["b", "a"]
+
+
+def test_failing_endpoints_go_last_until_their_cooldown_ends():
+    providers = router(alpha=1.0, cooldown=0.2)
+    providers.record(providers.endpoint("a"), 0.1, failed=False)
+    providers.record(providers.endpoint("b"), 0.5, failed=False)
+    providers.record(providers.endpoint("a"), 0.1, failed=True)
+
+    assert names(providers.select(MODEL)) == ["b", "a"]
+    time.sleep(0.25)
+    assert names(providers.select(MODEL))[0] == "a"
+
+
+def test_endpoints_from_env(monkeypatch):
+    monkeypatch.setenv("REFLECTION_ENDPOINTS", "groq=https://example.com/v1, local = http://127.0.0.1:8080/v1")
+    monkeypatch.setenv("GROQ_API_KEY", "secret")
+    monkeypatch.setenv("LOCAL_MODELS", f"{MODEL}=llama-3.3,gemma-7b-it")
+    monkeypatch.setenv("LOCAL_RATE_LIMITED", "0")
+    groq, local = endpoints_from_env()
+
+    assert (groq.name, groq.url, groq.api_key, groq.models) == ("groq", "https://example.com/v1", "secret", None)
+    assert groq.headers()["Authorization"] == "Bearer secret"
+    assert (local.name, local.url, local.api_key) == ("local", "http://127.0.0.1:8080/v1", None)
+    assert local.models == {MODEL: "llama-3.3", "gemma-7b-it": "gemma-7b-it"}
+    assert not groq.rate_limited and not local.rate_limited
+
+
+def test_only_the_hosted_api_is_rate_limited_by_default(monkeypatch):
+    monkeypatch.delenv("REFLECTION_ENDPOINTS", raising=False)
+    monkeypatch.delenv("GROQ_API_URL", raising=False)
+    monkeypatch.delenv("GROQ_RATE_LIMITED", raising=False)
+    assert endpoints_from_env()[0].rate_limited
+
+    monkeypatch.setenv("GROQ_API_URL", "http://127.0.0.1:8080/v1/chat/completions")
+    assert not endpoints_from_env()[0].rate_limited
+    monkeypatch.setenv("GROQ_RATE_LIMITED", "1")
+    assert endpoints_from_env()[0].rate_limited
+
+
+def test_fails_over_to_the_next_endpoint(start_mock):
+    down, up = start_mock(), start_mock()
+    down.outage_until = time.monotonic() + 60
+    agent = make_agent(down, up)
+
+    output = agent.generate(HISTORY)
+
+    call = agent.metrics.recent[-1]
+    assert output
+    assert call.endpoint == "mock1"
+    assert call.failovers == 1
+    assert call.attempts == 1
+    assert down.counters["unavailable"] == 1
+    assert up.counters["requests"] == 1
+    assert agent.provider.stats()["mock0"]["failovers"] == 1
+
+
+def test_a_failed_endpoint_is_avoided_afterwards(start_mock):
+    down, up = start_mock(), start_mock()
+    down.outage_until = time.monotonic() + 60
+    # One failure is enough to mark an endpoint unhealthy
+    agent = make_agent(provider=ProviderRouter([Endpoint("mock0", mock_url(down)), Endpoint("mock1", mock_url(up))],
+                                               alpha=1.0))
+
+    for i in range(3):
+        agent.generate(HISTORY + [{"role": "user", "content": str(i)}])
+
+    assert down.counters["unavailable"] == 1
+    assert up.counters["requests"] == 3
+
+
+def test_stays_on_a_healthy_first_endpoint(start_mock):
+    first, second = start_mock(), start_mock()
+    agent = make_agent(first, second)
+
+    agent.generate(HISTORY)
+
+    assert agent.metrics.recent[-1].endpoint == "mock0"
+    assert agent.metrics.recent[-1].failovers == 0
+    assert second.counters["requests"] == 0
+
+
+def test_streams_fail_over_too(start_mock):
+    down, up = start_mock(), start_mock()
+    down.outage_until = time.monotonic() + 60
+    agent = make_agent(down, up)
+
+    _, steps = agent.run("Write a haiku about rain", n_steps=1, stream=True)
+
+    assert steps[0]["generation"]
+    assert all(call.endpoint == "mock1" for call in agent.metrics.recent)
@@ -0,0 +1,158 @@
+import threading
+import time
+
+import pytest
+
+from tests.fixtures import make_agent, mock_url
+from utils.cancellation import CancellationToken, RunCancelled
+from utils.providers import Endpoint, ProviderRouter
+from utils.ratelimit import (DEFAULT_RATE_LIMIT, MODEL_RATE_LIMITS, FileBackend, RateLimit, RateLimiter,
+                             limits_from_env)
+
+MODEL = "llama-3.3-70b-versatile"
+
+
+def limiter(limit: RateLimit, backend=None) -> RateLimiter:
+    return RateLimiter(limits={MODEL: limit}, default_limit=None, backend=backend)
+
+
+def test_requests_beyond_the_burst_wait_for_the_bucket_to_refill():
+    rate_limiter = limiter(RateLimit(requests_per_minute=60, burst_seconds=2))
+
+    assert rate_limiter.reserve(MODEL, 0) == 0
+    assert rate_limiter.reserve(MODEL, 0) == 0
+    assert rate_limiter.reserve(MODEL, 0) == pytest.approx(1.0, abs=0.05)
+    assert rate_limiter.reserve(MODEL, 0) == pytest.approx(2.0, abs=0.05)
+
+
+def test_tokens_are_limited_and_corrected_by_the_reported_usage():
+    rate_limiter = limiter(RateLimit(tokens_per_minute=600))
+
+    assert rate_limiter.reserve(MODEL, 500) == 0
+    assert rate_limiter.reserve(MODEL, 200) == pytest.approx(10.0, abs=0.1)
+    # Both used far less than they reserved
+    rate_limiter.settle(MODEL, 500, 100)
+    rate_limiter.settle(MODEL, 200, 100)
+    assert rate_limiter.reserve(MODEL, 300) == 0
+
+
+def test_cancelled_reservations_are_given_back():
+    rate_limiter = limiter(RateLimit(requests_per_minute=60, burst_seconds=1))
+
+    assert rate_limiter.reserve(MODEL, 0) == 0
+    assert rate_limiter.reserve(MODEL, 0) > 0
+    rate_limiter.cancel(MODEL, 0)
+    rate_limiter.cancel(MODEL, 0)
+    assert rate_limiter.reserve(MODEL, 0) == 0
+
+
+def test_a_cancelled_wait_stops_early_and_gives_the_slot_back():
+    rate_limiter = limiter(RateLimit(requests_per_minute=6, burst_seconds=10))
+    rate_limiter.acquire(MODEL, 0)
+    token = CancellationToken()
+    threading.Timer(0.1, token.cancel, ["stopped by user"]).start()
+
+    started = time.perf_counter()
+    with pytest.raises(RunCancelled, match="stopped by user"):
+        rate_limiter.acquire(MODEL, 0, cancel=token)
+    assert time.perf_counter() - started < 0.5
+    assert rate_limiter.stats()["waiting"] == 0
+    assert rate_limiter.reserve(MODEL, 0) == pytest.approx(10.0, abs=0.5)
+
+
+def test_models_without_a_limit_are_not_queued():
+    rate_limiter = limiter(RateLimit(requests_per_minute=1))
+
+    for _ in range(100):
+        assert rate_limiter.acquire("gemma-7b-it", 1000) == 0
+    assert rate_limiter.stats()["queued"] == 0
+
+
+def test_acquire_waits_for_the_slot():
+    rate_limiter = limiter(RateLimit(requests_per_minute=600, burst_seconds=0.1))
+    rate_limiter.acquire(MODEL, 0)
+
+    started = time.perf_counter()
+    wait = rate_limiter.acquire(MODEL, 0)
+    assert time.perf_counter() - started >= wait == pytest.approx(0.1, abs=0.02)
+    assert rate_limiter.stats()["queued"] == 1
+
+
+def test_file_backend_shares_the_buckets_between_limiters(tmp_path):
+    path = str(tmp_path / "ratelimit.json")
+    limit = RateLimit(requests_per_minute=60, burst_seconds=2)
+    first, second = limiter(limit, FileBackend(path)), limiter(limit, FileBackend(path))
+
+    assert first.reserve(MODEL, 0) == 0
+    assert second.reserve(MODEL, 0) == 0
+    assert first.reserve(MODEL, 0) == pytest.approx(1.0, abs=0.05)
+    assert second.reserve(MODEL, 0) == pytest.approx(2.0, abs=0.05)
+
+
+def test_file_backend_serializes_concurrent_reservations(tmp_path):
+    # Each limiter has its own file descriptor, so only the file lock keeps updates from being lost
+    path = str(tmp_path / "ratelimit.json")
+    limit = RateLimit(requests_per_minute=60, burst_seconds=1)
+    limiters = [limiter(limit, FileBackend(path)) for _ in range(4)]
+    waits = []
+
+    def reserve(rate_limiter: RateLimiter) -> None:
+        for _ in range(25):
+            waits.append(rate_limiter.reserve(MODEL, 0))
+
+    threads = [threading.Thread(target=reserve, args=(rate_limiter,)) for rate_limiter in limiters]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 100 slots a second apart: a lost update would leave the last one closer
+    assert len(waits) == 100
+    assert max(waits) == pytest.approx(99, abs=0.5)
+
+
+def test_file_backend_recovers_from_a_corrupt_file(tmp_path):
+    path = tmp_path / "ratelimit.json"
+    path.write_text("{not json")
+
+    assert limiter(RateLimit(requests_per_minute=60), FileBackend(str(path))).reserve(MODEL, 0) == 0
+
+
+def test_limits_from_env(monkeypatch):
+    monkeypatch.delenv("REFLECTION_RATE_LIMITS", raising=False)
+    assert limits_from_env() == ({}, None)
+
+    monkeypatch.setenv("REFLECTION_RATE_LIMITS", f"free, {MODEL}=1000/300000, *=60/")
+    limits, default_limit = limits_from_env()
+    assert set(limits) == set(MODEL_RATE_LIMITS)
+    assert (limits[MODEL].requests_per_minute, limits[MODEL].tokens_per_minute) == (1000, 300000)
+    assert limits["gemma-7b-it"] is MODEL_RATE_LIMITS["gemma-7b-it"]
+    assert (default_limit.requests_per_minute, default_limit.tokens_per_minute) == (60, None)
+
+    monkeypatch.setenv("REFLECTION_RATE_LIMITS", "free")
+    assert limits_from_env()[1] is DEFAULT_RATE_LIMIT
+
+
+@pytest.mark.parametrize("entry", ["fast", f"{MODEL}=30", "=30/1000"])
+def test_limits_from_env_rejects_malformed_entries(monkeypatch, entry):
+    monkeypatch.setenv("REFLECTION_RATE_LIMITS", entry)
+    with pytest.raises(ValueError):
+        limits_from_env()
+
+
+def test_agent_calls_to_a_rate_limited_endpoint_wait_for_the_limiter(mock):
+    agent = make_agent(provider=ProviderRouter([Endpoint("mock", mock_url(mock), rate_limited=True)]),
+                       rate_limiter=limiter(RateLimit(requests_per_minute=600, burst_seconds=0.1)))
+    agent.run("Write a haiku about rain", n_steps=2)
+
+    calls = list(agent.metrics.recent)
+    assert len(calls) == 4
+    assert sum(call.rate_limit_wait for call in calls) >= 0.2
+    assert agent.rate_limiter.stats()["calls"] == 4
+
+
+def test_other_endpoints_are_not_limited(mock):
+    agent = make_agent(mock, rate_limiter=limiter(RateLimit(requests_per_minute=1)))
+    agent.run("Write a haiku about rain", n_steps=2)
+
+    assert agent.rate_limiter.stats()["calls"] == 0
@@ -0,0 +1,135 @@
+import time
+
+import pytest
+
+from tests.fixtures import make_agent, mock_url
+from utils.cancellation import RunCancelled
+from utils.retry import CircuitOpenError, RetryPolicy, parse_duration, server_delay
+
+HISTORY = [{"role": "user", "content": "Write a haiku about rain"}]
+
+
+class Response:
+    def __init__(self, status_code: int, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def attempts(*responses):
+    """An attempt function that returns the given responses in turn, and the list of calls made."""
+    calls = []
+
+    def attempt():
+        calls.append(time.perf_counter())
+        return responses[len(calls) - 1]
+
+    return attempt, calls
+
+
+def test_parse_duration():
+    assert parse_duration("1m30.5s") == 90.5
+    assert parse_duration("250ms") == 0.25
+    assert parse_duration("7") == 7.0
+    assert parse_duration(str(time.time() + 30)) == pytest.approx(30, abs=1)
+    assert parse_duration("soon") is None
+    assert parse_duration(None) is None
+
+
+def test_server_delay_waits_for_the_exhausted_limit():
+    assert server_delay({"retry-after": "2"}) == 2.0
+    assert server_delay({"x-ratelimit-reset-requests": "2s", "x-ratelimit-remaining-requests": "5",
+                         "x-ratelimit-reset-tokens": "7.5s", "x-ratelimit-remaining-tokens": "0"}) == 7.5
+    assert server_delay({"x-ratelimit-reset-requests": "2s", "x-ratelimit-reset-tokens": "7.5s"}) == 2.0
+    assert server_delay({}) is None
+
+
+def test_retry_after_is_honoured():
+    attempt, calls = attempts(Response(429, {"retry-after": "0.3"}), Response(200))
+    retries = []
+    policy = RetryPolicy(base_delay=0.01, seed=0)
+
+    assert policy.call(attempt, on_retry=lambda error_class, delay: retries.append((error_class, delay))).status_code == 200
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.3
+    assert retries[0][0] == "rate_limit" and 0.3 <= retries[0][1] <= 0.31
+    assert policy.stats()["retries"] == {"rate_limit": 1}
+
+
+def test_retry_after_beyond_the_limit_gives_up():
+    attempt, calls = attempts(Response(429, {"retry-after": "120"}), Response(200))
+    policy = RetryPolicy(base_delay=0.01, max_retry_after=60.0, seed=0)
+
+    assert policy.call(attempt).status_code == 429
+    assert len(calls) == 1
+    assert policy.stats()["exhausted"] == 1
+
+
+def test_client_errors_are_not_retried():
+    attempt, calls = attempts(Response(400), Response(200))
+
+    assert RetryPolicy(base_delay=0.01, seed=0).call(attempt).status_code == 400
+    assert len(calls) == 1
+
+
+def test_retries_stop_at_the_class_limit():
+    attempt, calls = attempts(*[Response(503)] * 10)
+
+    assert RetryPolicy(base_delay=0.001, class_limits={"server_error": 2}, seed=0).call(attempt).status_code == 503
+    assert len(calls) == 3
+
+
+def test_agent_retries_through_a_short_outage(mock):
+    agent = make_agent(mock, retry_policy=RetryPolicy(base_delay=0.1, seed=0))
+    mock.outage_until = time.monotonic() + 0.05
+
+    assert agent.generate(HISTORY)
+    call = agent.metrics.recent[-1]
+    assert call.status == "200"
+    assert call.attempts > 1
+    assert call.retry_wait > 0
+    assert mock.counters["unavailable"] == call.attempts - 1
+
+
+def test_breaker_opens_on_failures_and_closes_after_a_successful_probe(mock):
+    policy = RetryPolicy(max_attempts=1, failure_threshold=2, recovery_timeout=0.3, seed=0)
+    agent = make_agent(mock, retry_policy=policy)
+    breaker = lambda: policy.stats()["breakers"][mock_url(mock)]  # noqa: E731
+    mock.outage_until = time.monotonic() + 60
+
+    for i in range(2):
+        with pytest.raises(Exception, match="503"):
+            agent.generate(HISTORY + [{"role": "user", "content": f"attempt {i}"}])
+    assert breaker()["state"] == "open"
+
+    # Fails fast without reaching the server
+    requests = mock.counters["requests"]
+    with pytest.raises(CircuitOpenError):
+        agent.generate(HISTORY + [{"role": "user", "content": "while open"}])
+    assert mock.counters["requests"] == requests
+    assert breaker()["rejected"] == 1
+
+    mock.outage_until = 0.0
+    time.sleep(0.35)
+    agent.generate(HISTORY + [{"role": "user", "content": "probe"}])
+    assert breaker() == {"state": "closed", "failures": 0, "rejected": 1}
+    assert mock.counters["requests"] == requests + 1
+
+
+def test_a_cancelled_probe_leaves_the_circuit_open():
+    policy = RetryPolicy(max_attempts=1, failure_threshold=1, recovery_timeout=0.05, seed=0)
+
+    def fail(error):
+        def attempt():
+            raise error
+        return attempt
+
+    with pytest.raises(ConnectionError):
+        policy.call(fail(ConnectionError("refused")), key="api")
+    time.sleep(0.06)
+    with pytest.raises(RunCancelled):
+        policy.call(fail(RunCancelled("stopped by the user")), key="api")
+    assert policy.breaker("api").state == "half_open"
+
+    # The next call probes at once instead of waiting for the cancelled probe to time out
+    assert policy.call(lambda: Response(200), key="api").status_code == 200
+    assert policy.breaker("api").state == "closed"
@@ -0,0 +1,85 @@
+import pytest
+
+from tests.fixtures import make_agent
+from utils.routing import ModelRouter, ModelRouting, critique_is_malformed
+
+SMALL, LARGE = "llama-3.1-8b-instant", "llama-3.3-70b-versatile"
+CRITIQUE = "1. Add a concrete example\n2. Shorten the conclusion"
+
+
+@pytest.mark.parametrize("critique, malformed", [
+    ("<OK>", False),
+    (CRITIQUE, False),
+    ("* Cut the second paragraph", False),
+    ("Overall this reads well, but it could be improved.", True),
+    ("", True),
+])
+def test_critique_is_malformed(critique, malformed):
+    assert critique_is_malformed(critique) == malformed
+
+
+def test_unset_roles_use_the_agents_model():
+    routing = ModelRouting(reflection=SMALL)
+
+    assert routing.model_for("reflection", LARGE) == SMALL
+    assert routing.model_for("generation", LARGE) == LARGE
+    with pytest.raises(ValueError):
+        routing.model_for("judging", LARGE)
+
+
+def test_models_lists_every_role_and_escalation_once():
+    routing = ModelRouting(reflection=SMALL, optimization="gemma-7b-it")
+
+    assert routing.models(LARGE) == [LARGE, SMALL, "gemma-7b-it"]
+    assert ModelRouting(reflection=SMALL, escalation={}).models(LARGE) == [LARGE, SMALL]
+    assert ModelRouting(escalation={"a": "b", "b": "a"}).models("a") == ["a", "b"]
+
+
+def test_escalation_follows_the_ladder_up_to_the_cap():
+    routing = ModelRouting(escalation={"a": "b", "b": "c", "c": "d"}, max_escalations=2)
+    router = ModelRouter(routing, "a")
+
+    assert router.escalate("reflection", "test", 1)["to"] == "b"
+    assert router.escalate("reflection", "test", 2) == {"step": 2, "role": "reflection", "from": "b", "to": "c",
+                                                        "reason": "test"}
+    assert router.escalate("reflection", "test", 3) is None
+    assert router.models == {"generation": "a", "reflection": "c", "optimization": "a"}
+
+
+def test_the_strongest_model_is_not_escalated():
+    router = ModelRouter(ModelRouting(), LARGE)
+    assert router.escalate("generation", "test", 1) is None
+
+
+def test_a_stall_escalates_the_reviewer_then_the_generator():
+    router = ModelRouter(ModelRouting(generation=SMALL, reflection=SMALL, max_escalations=5), LARGE)
+    draft = "The same draft, round after round, without any change at all."
+
+    escalations = [router.check_stall(draft, CRITIQUE, step) for step in range(1, 8)]
+    escalations = [escalation for escalation in escalations if escalation is not None]
+
+    assert [(escalation["role"], escalation["to"]) for escalation in escalations] == [("reflection", LARGE),
+                                                                                       ("generation", LARGE)]
+    assert all(escalation["reason"].startswith("loop stalled") for escalation in escalations)
+
+
+def test_escalation_can_be_disabled():
+    router = ModelRouter(ModelRouting(reflection=SMALL, escalation={}), LARGE)
+    draft = "The same draft, round after round."
+
+    assert all(router.check_stall(draft, CRITIQUE, step) is None for step in range(1, 6))
+    assert router.escalate("reflection", "test", 1) is None
+
+
+def test_malformed_critiques_are_asked_again_on_a_stronger_model(start_mock):
+    server = start_mock(malformed_critique={SMALL: 1.0})
+    agent = make_agent(server, model=LARGE, routing=ModelRouting(reflection=SMALL))
+    _, steps = agent.run("Write a short guide to composting", n_steps=2)
+
+    first = steps[0]
+    assert first["escalations"] == [{"step": 1, "role": "reflection", "from": SMALL, "to": LARGE,
+                                     "reason": "malformed critique from reviewer"}]
+    assert not critique_is_malformed(first["critique"])
+    assert first["models"]["reflection"] == LARGE
+    assert "escalations" not in steps[1]
+    assert server.counters["reflection_requests"] == 3
@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tests.fixtures import make_agent
+from utils.cancellation import CancellationToken, RunCancelled
+from utils.singleflight import SingleFlight
+
+HISTORY = [{"role": "user", "content": "Write a haiku about rain"}]
+
+
+def start_after(pool: ThreadPoolExecutor, fn, *args, **kwargs):
+    # Give the previous submission time to become the flight's leader
+    future = pool.submit(fn, *args, **kwargs)
+    time.sleep(0.1)
+    return future
+
+
+def slow_call(result, calls, seconds: float = 0.3):
+    def call():
+        calls.append(threading.get_ident())
+        time.sleep(seconds)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return call
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    flight, calls = SingleFlight(), []
+    with ThreadPoolExecutor(3) as pool:
+        results = [start_after(pool, flight.do, "key", slow_call("result", calls)) for _ in range(3)]
+        results = [future.result() for future in results]
+
+    assert len(calls) == 1
+    assert sorted(results) == [("result", False), ("result", True), ("result", True)]
+    assert flight.stats() == {"calls": 1, "deduplicated": 2, "restarted": 0, "in_flight": 0}
+
+
+def test_errors_are_shared_and_the_next_call_starts_over():
+    flight, calls = SingleFlight(), []
+    with ThreadPoolExecutor(2) as pool:
+        results = [start_after(pool, flight.do, "key", slow_call(ValueError("boom"), calls)) for _ in range(2)]
+        for future in results:
+            with pytest.raises(ValueError, match="boom"):
+                future.result()
+
+    assert flight.do("key", slow_call("result", calls, 0)) == ("result", False)
+    assert len(calls) == 2
+
+
+def test_a_cancelled_async_waiter_leaves_the_call_running_for_the_others():
+    flight, calls = SingleFlight(), []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.3)
+        return "result"
+
+    async def main():
+        first = asyncio.create_task(flight.ado("key", call))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(flight.ado("key", call))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == ("result", True)
+    assert len(calls) == 1
+
+
+def test_an_abandoned_async_call_is_cancelled():
+    flight, finished = SingleFlight(), []
+
+    async def call():
+        await asyncio.sleep(0.3)
+        finished.append(1)
+
+    async def main():
+        waiter = asyncio.create_task(flight.ado("key", call))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        await asyncio.sleep(0.4)
+
+    asyncio.run(main())
+    assert finished == []
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_late_stream_subscribers_get_every_chunk():
+    flight = SingleFlight()
+
+    async def stream():
+        for chunk in "abcde":
+            yield chunk
+            await asyncio.sleep(0.05)
+
+    async def collect(delay: float):
+        await asyncio.sleep(delay)
+        return "".join([chunk async for chunk in flight.astream("key", stream)])
+
+    async def main():
+        return await asyncio.gather(collect(0), collect(0.12))
+
+    assert asyncio.run(main()) == ["abcde", "abcde"]
+    assert flight.stats()["deduplicated"] == 1
+
+
+def test_identical_concurrent_requests_share_one_upstream_request(start_mock):
+    server = start_mock(latency=0.3)
+    agent = make_agent(server)
+
+    with ThreadPoolExecutor(3) as pool:
+        outputs = [start_after(pool, agent.generate, HISTORY) for _ in range(3)]
+        outputs = [future.result() for future in outputs]
+
+    assert len(set(outputs)) == 1
+    assert server.counters["requests"] == 1
+    assert sorted(call.deduplicated for call in agent.metrics.recent) == [False, True, True]
+
+
+def test_a_cancelled_leader_does_not_cancel_its_followers(start_mock):
+    server = start_mock(latency=0.5)
+    agent = make_agent(server)
+    token = CancellationToken()
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = start_after(pool, agent.generate, HISTORY, cancel=token)
+        follower = start_after(pool, agent.generate, HISTORY)
+        token.cancel("stopped by user")
+        with pytest.raises(RunCancelled, match="stopped by user"):
+            leader.result(timeout=1)
+        output = follower.result(timeout=5)
+
+    assert output
+    assert agent.single_flight.stats()["restarted"] == 1
+    assert agent.metrics.recent[-1].error is None
+    assert agent.metrics.recent[-1].deduplicated is False
+
+
+def test_a_cancelled_follower_stops_waiting_and_leaves_the_leader_running(start_mock):
+    server = start_mock(latency=0.5)
+    agent = make_agent(server)
+    token = CancellationToken()
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = start_after(pool, agent.generate, HISTORY)
+        follower = start_after(pool, agent.generate, HISTORY, cancel=token)
+        stopped = time.perf_counter()
+        token.cancel("stopped by user")
+        with pytest.raises(RunCancelled, match="stopped by user"):
+            follower.result(timeout=1)
+        assert time.perf_counter() - stopped < 0.2
+        assert not leader.done()
+        assert leader.result(timeout=5)
+
+    assert server.counters["requests"] == 1
+    assert agent.single_flight.stats()["restarted"] == 0
+
+
+def test_a_follower_past_its_deadline_stops_waiting(start_mock):
+    server = start_mock(latency=0.5)
+    agent = make_agent(server)
+
+    with ThreadPoolExecutor(1) as pool:
+        leader = start_after(pool, agent.generate, HISTORY)
+        with pytest.raises(RunCancelled, match="deadline passed"):
+            agent.generate(HISTORY, cancel=CancellationToken(timeout=0.1))
+        assert not leader.done()
+        assert leader.result(timeout=5)
+
+    assert server.counters["requests"] == 1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_identical_concurrent_async_requests_share_one_upstream_request(start_mock, stream):
+    server = start_mock(latency=0.3)
+    agent = make_agent(server)
+
+    async def main():
+        if stream:
+            async def collect():
+                return "".join([chunk async for chunk in agent.astream_generate(HISTORY)])
+            return await asyncio.gather(*(collect() for _ in range(3)))
+        return await asyncio.gather(*(agent.agenerate(HISTORY) for _ in range(3)))
+
+    outputs = asyncio.run(main())
+    assert len(set(outputs)) == 1
+    assert server.counters["requests"] == 1
+
+
+def test_dedupe_can_be_turned_off(start_mock):
+    server = start_mock(latency=0.2)
+    agent = make_agent(server, dedupe=False)
+
+    with ThreadPoolExecutor(2) as pool:
+        list(pool.map(lambda _: agent.generate(HISTORY), range(2)))
+
+    assert server.counters["requests"] == 2
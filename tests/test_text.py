@@ -0,0 +1,35 @@
+import pytest
+
+from utils.convergence import ConvergenceConfig, ConvergenceDetector
+from utils.critics import merge_critiques
+from utils.text import find_overlapping, word_overlap, words
+
+
+def test_words_are_lowercase_and_unicode_aware():
+    assert words("Don't over-brew: 95°C, Café!") == ["don", "t", "over", "brew", "95", "c", "café"]
+    assert words("  ") == []
+
+
+def test_word_overlap_is_the_jaccard_similarity():
+    assert word_overlap({"add", "an", "example"}, {"add", "one", "example"}) == pytest.approx(0.5)
+    assert word_overlap(set(), set()) == 0.0
+
+
+def test_find_overlapping_returns_the_first_match():
+    seen = [{"shorten", "the", "intro"}, {"add", "an", "example"}, {"add", "an", "example", "here"}]
+
+    assert find_overlapping({"add", "an", "example"}, seen, 0.6) == 1
+    assert find_overlapping({"cite", "sources"}, seen, 0.6) is None
+    assert find_overlapping(set(), [set()], 0.0) is None
+
+
+def test_critics_and_convergence_agree_on_what_repeats():
+    # The same overlap decides both whether critics' recommendations merge and whether the reviewer repeats itself
+    first, repeat = "Add a concrete example for each step", "Add a concrete example to each step"
+    merged = merge_critiques({"clarity": f"1. {first}", "depth": f"1. {repeat}"})
+    detector = ConvergenceDetector(ConvergenceConfig(similarity_threshold=None, max_diff_ratio=None))
+    detector.update("draft one", f"1. {first}")
+
+    assert merged.splitlines()[1:] == [f"1. [clarity, depth] {first}"]
+    assert detector.update("draft two", f"1. {repeat}")["recurring"] == 1.0
+
@@ -2,14 +2,87 @@ from .completions import (
     build_prompt_structure,
     completions_create,
     FixedFirstChatHistory,
+    Message,
+    MessagesView,
+    TokenBudgetChatHistory,
     update_chat_history
 )
+from .payloads import ChatPayload
+from .tokens import estimate_cost, estimate_message_tokens, estimate_tokens, history_budget
+from .cancellation import CancellationToken, RunCancelled
+from .cache import CompletionCache, completion_key, get_completion_cache
+from .convergence import ConvergenceConfig, ConvergenceDetector, extract_recommendations
+from .critics import critic_agrees, merge_critiques
+from .drafts import parse_ranking, score_draft
+from .events import ConsoleSink, ProgressSink, emit
+from .hedging import HedgePolicy, get_hedge_policy
+from .jobs import Job, JobQueue, JobQueueFullError, get_job_queue
 from .logging import fancy_step_tracker
+from .metrics import CallMetrics, MetricsRecorder, get_metrics
+from .prompt_store import OptimizedPromptStore, get_prompt_store, normalize_prompt
+from .providers import Endpoint, ProviderRouter, get_provider
+from .ratelimit import RateLimit, RateLimiter, get_rate_limiter
+from .singleflight import SingleFlight, get_single_flight
+from .retry import CircuitOpenError, RetryPolicy, get_retry_policy
+from .routing import ModelRouter, ModelRouting, critique_is_malformed
+from .transport import Transport, TransportConfig, get_transport
 
 __all__ = [
     'build_prompt_structure',
     'completions_create',
     'FixedFirstChatHistory',
+    'Message',
+    'MessagesView',
+    'TokenBudgetChatHistory',
+    'ChatPayload',
+    'estimate_cost',
+    'estimate_message_tokens',
+    'estimate_tokens',
+    'history_budget',
     'update_chat_history',
-    'fancy_step_tracker'
+    'CompletionCache',
+    'completion_key',
+    'get_completion_cache',
+    'CancellationToken',
+    'RunCancelled',
+    'ConvergenceConfig',
+    'ConvergenceDetector',
+    'extract_recommendations',
+    'critic_agrees',
+    'merge_critiques',
+    'parse_ranking',
+    'score_draft',
+    'ConsoleSink',
+    'ProgressSink',
+    'emit',
+    'HedgePolicy',
+    'get_hedge_policy',
+    'Job',
+    'JobQueue',
+    'JobQueueFullError',
+    'get_job_queue',
+    'fancy_step_tracker',
+    'CallMetrics',
+    'MetricsRecorder',
+    'get_metrics',
+    'OptimizedPromptStore',
+    'get_prompt_store',
+    'normalize_prompt',
+    'Endpoint',
+    'ProviderRouter',
+    'get_provider',
+    'RateLimit',
+    'RateLimiter',
+    'get_rate_limiter',
+    'SingleFlight',
+    'get_single_flight',
+    'CircuitOpenError',
+    'RetryPolicy',
+    'get_retry_policy',
+    'ModelRouter',
+    'ModelRouting',
+    'critique_is_malformed',
+    'Transport',
+    'TransportConfig',
+    'get_transport'
 ] 
\ No newline at end of file
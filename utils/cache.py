@@ -0,0 +1,122 @@
+"""
+Persistent on-disk cache of chat completions.
+
+Entries are keyed by a SHA-256 of the canonical JSON of (model, messages,
+temperature, max_tokens), so the same request maps to the same key in every
+process, and the SQLite file (in WAL mode, see utils.sqlite_store) can be
+shared by several workers on one host.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from .sqlite_store import SQLiteLRUStore
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "completions.sqlite3")
+
+# Only these payload fields determine the completion; anything else (e.g. "stream") is ignored
+KEY_FIELDS = ("model", "messages", "temperature", "max_tokens")
+
+
+def completion_key(payload: Dict[str, Any]) -> str:
+    """
+    Build a process-independent cache key for a chat completion payload.
+
+    Args:
+        payload (Dict[str, Any]): The chat completion request body, or a ChatPayload
+            (utils.payloads), which hashes its pre-encoded fragments instead
+
+    Returns:
+        str: A hex SHA-256 digest of the canonical key fields
+    """
+    if hasattr(payload, "cache_key"):
+        return payload.cache_key
+    canonical = json.dumps(
+        {field: payload.get(field) for field in KEY_FIELDS},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CompletionCache(SQLiteLRUStore):
+    """
+    A SQLite-backed completion cache with LRU eviction, TTL and hit/miss counters.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 10000, ttl: Optional[float] = 7 * 24 * 3600,
+                 bypass_stochastic: bool = False):
+        """
+        Args:
+            path (str): SQLite database file
+            max_entries (int): Size cap; least recently used entries are evicted beyond it
+            ttl (Optional[float]): Seconds an entry stays valid, or None to never expire
+            bypass_stochastic (bool): Skip the cache for requests with temperature > 0,
+                for callers that want a fresh sample every time
+        """
+        super().__init__(path, "completions", "output", ("model",), max_entries=max_entries, ttl=ttl)
+        self.bypass_stochastic = bypass_stochastic
+        self.bypassed = 0
+
+    def _bypass(self, payload: Dict[str, Any]) -> bool:
+        return self.bypass_stochastic and payload.get("temperature", 0) > 0
+
+    def get(self, payload: Dict[str, Any]) -> Optional[str]:
+        """
+        Look up the cached completion for a payload.
+
+        Args:
+            payload (Dict[str, Any]): The chat completion request body
+
+        Returns:
+            Optional[str]: The cached output, or None on a miss
+        """
+        if self._bypass(payload):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        return self._get(completion_key(payload))
+
+    def put(self, payload: Dict[str, Any], output: str) -> None:
+        """
+        Store a completion, evicting the least recently used entries beyond the size cap.
+
+        Args:
+            payload (Dict[str, Any]): The chat completion request body
+            output (str): The completion text
+        """
+        if self._bypass(payload):
+            return
+        self._put(completion_key(payload), output, model=payload.get("model"))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters for this process and the current number of entries.
+
+        Returns:
+            Dict[str, Any]: Counters (including requests that bypassed the cache) and entry count
+        """
+        stats = super().stats()
+        stats["bypassed"] = self.bypassed
+        return stats
+
+
+_shared_cache: Optional[CompletionCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_completion_cache() -> CompletionCache:
+    """
+    Get the process-wide completion cache, stored at $REFLECTION_CACHE_PATH or .cache/completions.sqlite3.
+
+    Returns:
+        CompletionCache: The shared cache
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = CompletionCache(os.getenv("REFLECTION_CACHE_PATH", DEFAULT_CACHE_PATH))
+        return _shared_cache
@@ -0,0 +1,175 @@
+"""
+Cancellation tokens and deadlines for reflection runs.
+
+A token is cancelled explicitly (e.g. by a Stop button on another thread) or
+once its deadline passes. Async code binds the token to its task: cancelling
+the token cancels the task, which aborts the HTTP requests it is waiting on
+(see utils.transport), and the CancelledError is turned into RunCancelled so
+the caller can tell it apart from a cancellation of its own. Blocking code
+passes the token down to Transport.post, which stops waiting and aborts the
+request the same way, and waits (for a rate limit slot, a retry's backoff,
+or an identical request in flight) on the token instead of sleeping blindly.
+"""
+import asyncio
+import concurrent.futures
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+
+class RunCancelled(Exception):
+    """A run or request was stopped by its cancellation token; the message is the reason."""
+
+
+class CancellationToken:
+    """
+    Signals that a run should stop, explicitly or once a deadline passes. Safe to share across threads.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Args:
+            timeout (Optional[float]): Seconds from now after which the token counts as cancelled, or None
+        """
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.reason: Optional[str] = None
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """
+        Cancel the token and notify everything bound to it. Later calls are ignored.
+
+        Args:
+            reason (str): Why, reported as the run's stop reason
+        """
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def limit(self, timeout: float) -> None:
+        """Move the deadline to at most `timeout` seconds from now."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self.deadline = deadline if self.deadline is None else min(self.deadline, deadline)
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline passed")
+        return self.reason is not None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline (0 once cancelled), or None without a deadline."""
+        if self.cancelled:
+            return 0.0
+        return max(self.deadline - time.monotonic(), 0.0) if self.deadline is not None else None
+
+    def raise_if_cancelled(self) -> None:
+        """
+        Raises:
+            RunCancelled: If the token is cancelled or its deadline passed
+        """
+        if self.cancelled:
+            raise RunCancelled(self.reason)
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Block for `seconds`, waking early once the token is cancelled or its deadline passes.
+
+        Raises:
+            RunCancelled: If the token is cancelled by the end of the wait
+        """
+        woken = threading.Event()
+        remove = self.add_callback(woken.set)
+        try:
+            remaining = self.remaining()
+            woken.wait(seconds if remaining is None else min(seconds, remaining))
+        finally:
+            remove()
+        self.raise_if_cancelled()
+
+    def wait(self, future: concurrent.futures.Future) -> Any:
+        """
+        Block until `future` is done, without cancelling it when the token fires (others may wait for it too).
+
+        Returns:
+            Any: The future's result
+
+        Raises:
+            RunCancelled: If the token is cancelled first
+        """
+        woken = threading.Event()
+        remove = self.add_callback(woken.set)
+        future.add_done_callback(lambda _: woken.set())
+        try:
+            while not future.done():
+                self.raise_if_cancelled()
+                woken.wait(self.remaining())
+        finally:
+            remove()
+        return future.result()
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Call `callback` once when the token is cancelled (at once, if it already is). It runs on the
+        cancelling thread and must not block.
+
+        Args:
+            callback (Callable[[], None]): The callback
+
+        Returns:
+            Callable[[], None]: Removes the callback again
+        """
+        with self._lock:
+            registered = self.reason is None
+            if registered:
+                self._callbacks.append(callback)
+        if not registered:
+            callback()
+
+        def remove() -> None:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+        return remove
+
+    @contextmanager
+    def bind(self) -> Iterator[None]:
+        """
+        Cancel the current asyncio task when the token is cancelled or its deadline passes.
+
+        Raises:
+            RunCancelled: In place of the task's CancelledError, if the token caused it
+        """
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        active = True
+
+        def interrupt() -> None:
+            # Runs on the loop, so it cannot cancel the task after the block has been left
+            if active:
+                task.cancel()
+
+        remove = self.add_callback(lambda: loop.call_soon_threadsafe(interrupt))
+        remaining = self.remaining()
+        timer = loop.call_later(remaining, self.cancel, "deadline passed") if remaining is not None else None
+        try:
+            yield
+        except asyncio.CancelledError:
+            if self.reason is None:
+                raise
+            # The cancellation was ours: the task may go on (e.g. to report the partial run)
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+            raise RunCancelled(self.reason) from None
+        finally:
+            active = False
+            remove()
+            if timer is not None:
+                timer.cancel()
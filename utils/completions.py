@@ -1,7 +1,13 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Union
 from collections import deque
+from collections.abc import Sequence as SequenceABC
+from itertools import chain, islice
 import json
 
+from .ratelimit import RateLimiter, get_rate_limiter
+from .retry import RetryPolicy, get_retry_policy
+from .tokens import estimate_message_tokens, history_budget
+
 def build_prompt_structure(prompt: str, role: str) -> Dict[str, str]:
     """
     Builds a structured prompt for the LLM.
@@ -18,54 +24,93 @@ def build_prompt_structure(prompt: str, role: str) -> Dict[str, str]:
         "content": prompt
     }
 
-def completions_create(client: Any, history: List[Dict[str, str]], model: str) -> str:
+def completions_create(client: Any, history: List[Dict[str, str]], model: str,
+                       retry_policy: Optional[RetryPolicy] = None, rate_limiter: Optional[RateLimiter] = None,
+                       provider: Any = None) -> str:
     """
     Creates a completion using the provided client and history.
+    Rate limits, server errors and connection errors are retried with backoff
+    (see utils.retry) instead of resending the identical request right away,
+    and every attempt waits for a slot from the rate limiter (see utils.ratelimit).
     
     Args:
-        client: The LLM client (e.g., Groq client)
+        client: The LLM client (e.g., Groq client), or None to send the request through the
+            provider router (see utils.providers) like the agent does
         history (List[Dict[str, str]]): The conversation history
         model (str): The model to use for completion
+        retry_policy (Optional[RetryPolicy]): The retry policy; defaults to the process-wide one
+        rate_limiter (Optional[RateLimiter]): The rate limiter; defaults to the process-wide one
+        provider (Optional[ProviderRouter]): The endpoints when client is None; defaults to the process-wide router
         
     Returns:
         str: The generated response
     """
-    try:
-        # Handle FixedFirstChatHistory objects
-        if hasattr(history, 'get_messages'):
-            messages = history.get_messages()
-        else:
-            messages = history
-            
-        # Updated for Groq 0.4.0 compatibility
-        response = client.chat.completions.create(
+    # Handle FixedFirstChatHistory objects
+    if hasattr(history, 'get_messages'):
+        messages = history.get_messages()
+    else:
+        messages = history
+
+    if client is None:
+        return _provider_completion(messages, model, retry_policy or get_retry_policy(),
+                                    rate_limiter or get_rate_limiter(), provider)
+
+    # The policy owns retries, so turn off the SDK's own immediate ones where supported
+    if hasattr(client, 'with_options'):
+        client = client.with_options(max_retries=0)
+    policy = retry_policy or get_retry_policy()
+    limiter = rate_limiter or get_rate_limiter()
+    tokens = sum(estimate_message_tokens(msg, model) for msg in messages) + 1000
+
+    def attempt():
+        limiter.acquire(model, tokens)
+        return client.chat.completions.create(
             messages=messages,
             model=model,
             temperature=0.7,
             max_tokens=1000,
-            # Remove any parameters that might cause issues
         )
+
+    try:
+        response = policy.call(attempt, key=str(getattr(client, 'base_url', 'sdk')))
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            limiter.settle(model, tokens, usage.prompt_tokens + usage.completion_tokens)
         return response.choices[0].message.content
     except Exception as e:
         print(f"Error in completions_create: {str(e)}")
-        # Try alternative approach if the first fails
-        try:
-            # Some versions might use different parameter formats
-            if hasattr(history, 'get_messages'):
-                messages = history.get_messages()
-            else:
-                messages = history
-                
-            response = client.chat.completions.create(
-                messages=messages,
-                model=model,
-                temperature=0.7,
-                max_tokens=1000
-            )
-            return response.choices[0].message.content
-        except Exception as nested_e:
-            print(f"Alternative approach also failed: {str(nested_e)}")
-            raise
+        raise
+
+def _provider_completion(messages, model: str, policy: RetryPolicy, limiter: RateLimiter, provider: Any) -> str:
+    # Imported here: utils.payloads builds on this module's Message
+    from .payloads import ChatPayload
+    from .providers import get_provider
+    from .transport import get_transport
+
+    payload = ChatPayload(model, messages, temperature=0.7, max_tokens=1000)
+    transport = get_transport()
+    tokens = limiter.estimate(payload)
+
+    def attempt(endpoint):
+        if endpoint.rate_limited:
+            limiter.acquire(model, tokens)
+        response = transport.post(endpoint.url, endpoint.headers(), payload.body_for(endpoint.model_name(model)))
+        if response.status_code != 200 and endpoint.rate_limited:
+            limiter.settle(model, tokens, 0)
+        return response
+
+    try:
+        response, endpoint = (provider or get_provider()).call(model, attempt, policy)
+        if response.status_code != 200:
+            raise Exception(f"API call failed with status code {response.status_code}: {response.text}")
+        result = response.json()
+        usage = result.get("usage")
+        if usage and endpoint.rate_limited:
+            limiter.settle(model, tokens, usage["prompt_tokens"] + usage["completion_tokens"])
+        return result["choices"][0]["message"]["content"]
+    except Exception as e:
+        print(f"Error in completions_create: {str(e)}")
+        raise
 
 class FixedFirstChatHistory:
     """
@@ -123,12 +168,207 @@ class FixedFirstChatHistory:
         """Make the object JSON serializable"""
         return self.get_messages()
 
+class Message:
+    """
+    A chat message. Slotted so long histories stay compact, and its JSON encoding is
+    computed once and reused by every request that sends it. Treat it as immutable.
+    Supports dict-style access (message["role"]) for code written against plain dicts.
+    """
+
+    __slots__ = ("role", "content", "_encoded")
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+        self._encoded: Optional[bytes] = None
+
+    @classmethod
+    def from_dict(cls, message: Union["Message", Dict[str, str]]) -> "Message":
+        """
+        Convert a {"role", "content"} dictionary to a Message; Messages are returned as is.
+
+        Args:
+            message (Union[Message, Dict[str, str]]): The message to convert
+
+        Returns:
+            Message: The message
+        """
+        if isinstance(message, Message):
+            return message
+        return cls(message["role"], message["content"])
+
+    @property
+    def encoded(self) -> bytes:
+        """The message as compact UTF-8 JSON with sorted keys, encoded on first use."""
+        if self._encoded is None:
+            self._encoded = json.dumps(
+                {"content": self.content, "role": self.role},
+                separators=(",", ":"),
+                ensure_ascii=False,
+            ).encode("utf-8")
+        return self._encoded
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+    def __getitem__(self, key: str) -> str:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def __repr__(self):
+        return f"Message(role={self.role!r}, content={len(self.content)} chars)"
+
+class MessagesView(SequenceABC):
+    """
+    A read-only view of a history's messages: the fixed messages followed by the kept
+    recent ones. Nothing is copied; the view reflects later appends to the history.
+    """
+
+    __slots__ = ("_fixed", "_window")
+
+    def __init__(self, fixed: Sequence[Message], window: Sequence[Message]):
+        self._fixed = fixed
+        self._window = window
+
+    def __len__(self) -> int:
+        return len(self._fixed) + len(self._window)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(islice(self, *index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        if index < len(self._fixed):
+            return self._fixed[index]
+        return self._window[index - len(self._fixed)]
+
+    def __iter__(self) -> Iterator[Message]:
+        return chain(self._fixed, self._window)
+
+    def __repr__(self):
+        return f"MessagesView({len(self)} messages)"
+
+class TokenBudgetChatHistory:
+    """
+    A chat history that trims by estimated prompt tokens instead of message count.
+    The fixed (initial) messages are always kept; the oldest other messages are dropped
+    once the estimated prompt size exceeds the model's budget. Token counts are computed
+    once per message, so appends and reads stay O(1) amortized.
+
+    Messages are stored as slotted `Message` objects in a deque used as a ring buffer
+    (dropping the oldest message is O(1)), and `view()` hands them out without copying.
+    """
+
+    def __init__(self, initial_messages: List[Dict[str, str]], model: Optional[str] = None,
+                 max_tokens: Optional[int] = None, completion_tokens: int = 1000):
+        """
+        Initialize the chat history.
+
+        Args:
+            initial_messages (List[Dict[str, str]]): Messages that are always sent (e.g. system prompt and user request)
+            model (Optional[str]): The model the history is sent to, used for the budget and token estimates
+            max_tokens (Optional[int]): Prompt-token budget; defaults to the model's budget from utils.tokens
+            completion_tokens (int): Tokens reserved for the completion when deriving the default budget
+        """
+        self.model = model
+        self.max_tokens = max_tokens if max_tokens is not None else history_budget(model, completion_tokens)
+        self.fixed_messages = tuple(Message.from_dict(msg) for msg in initial_messages)
+        self.fixed_tokens = sum(estimate_message_tokens(msg, model) for msg in self.fixed_messages)
+        self.window: deque = deque()  # kept Messages, oldest first
+        self._window_token_counts: deque = deque()  # estimated tokens of each kept message
+        self.window_tokens = 0
+        self.trim_log: List[Dict[str, Any]] = []
+        self._view = MessagesView(self.fixed_messages, self.window)
+        self._messages_cache: Optional[List[Dict[str, str]]] = None
+
+    @property
+    def total_tokens(self) -> int:
+        """Estimated prompt tokens of the messages currently kept."""
+        return self.fixed_tokens + self.window_tokens
+
+    @property
+    def over_budget(self) -> bool:
+        """True when the fixed messages plus the newest message alone exceed the budget."""
+        return self.total_tokens > self.max_tokens
+
+    def append(self, message: Union[Message, Dict[str, str]]) -> None:
+        """
+        Append a message, then drop the oldest non-fixed messages until the history fits the budget.
+        The newest message is always kept, even if it alone exceeds the budget.
+
+        Args:
+            message (Union[Message, Dict[str, str]]): The message to append
+        """
+        message = Message.from_dict(message)
+        tokens = estimate_message_tokens(message, self.model)
+        self.window.append(message)
+        self._window_token_counts.append(tokens)
+        self.window_tokens += tokens
+        self._messages_cache = None
+
+        while len(self.window) > 1 and self.total_tokens > self.max_tokens:
+            dropped = self.window.popleft()
+            dropped_tokens = self._window_token_counts.popleft()
+            self.window_tokens -= dropped_tokens
+            self.trim_log.append({
+                "role": dropped.role,
+                "tokens": dropped_tokens,
+                "total_tokens": self.total_tokens,
+                "budget": self.max_tokens,
+            })
+
+    def view(self) -> MessagesView:
+        """
+        Get a read-only, copy-free view of the current messages.
+
+        Returns:
+            MessagesView: The fixed messages followed by the kept recent messages
+        """
+        return self._view
+
+    def get_messages(self) -> List[Dict[str, str]]:
+        """
+        Get the current chat history as simple dictionaries, e.g. for SDK clients.
+        The list is cached until the next append and must be treated as read-only.
+
+        Returns:
+            List[Dict[str, str]]: The fixed messages followed by the kept recent messages
+        """
+        if self._messages_cache is None:
+            self._messages_cache = [msg.to_dict() for msg in self._view]
+        return self._messages_cache
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        return self.get_messages()
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+    def __str__(self):
+        """String representation for debugging"""
+        return (f"TokenBudgetChatHistory(msgs={len(self._view)}, fixed={len(self.fixed_messages)}, "
+                f"tokens={self.total_tokens}/{self.max_tokens}, trimmed={len(self.trim_log)})")
+
+    def __iter__(self):
+        """Make iterable for compatibility"""
+        return iter(self.get_messages())
+
+    def toJSON(self):
+        """Make the object JSON serializable"""
+        return self.get_messages()
+
 def update_chat_history(history: FixedFirstChatHistory, content: str, role: str) -> None:
     """
     Updates the chat history with a new message.
     
     Args:
-        history (FixedFirstChatHistory): The chat history to update
+        history (FixedFirstChatHistory): The chat history to update (or any history with `append`)
         content (str): The content of the new message
         role (str): The role of the message (system, user, or assistant)
     """
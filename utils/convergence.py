@@ -0,0 +1,132 @@
+"""
+Convergence detection for the reflection loop.
+
+The reviewer only ends a run by answering <OK>, but in practice the generator
+often returns nearly the same text round after round while the reviewer keeps
+repeating the same recommendations. These checks compare successive
+generations and critiques so the loop can stop once further rounds are
+unlikely to change anything.
+"""
+import difflib
+import re
+from typing import Any, Dict, List, Optional
+
+from .text import find_overlapping, words
+
+# Numbered ("1. ...") or bulleted ("* ...") recommendation lines in a critique
+RECOMMENDATION_PATTERN = re.compile(r'(?:\d+\.\s*|\*\s*)([^\n\d\*][^\n]+)')
+
+
+def extract_recommendations(critique: str) -> List[str]:
+    """
+    Extract the numbered or bulleted recommendations from a critique.
+
+    Args:
+        critique (str): The reviewer's critique
+
+    Returns:
+        List[str]: The recommendation texts, in order
+    """
+    return [match.strip() for match in RECOMMENDATION_PATTERN.findall(critique)]
+
+
+class ConvergenceConfig:
+    """
+    Thresholds for stopping the loop early. Set any threshold to None to disable that check.
+    """
+
+    def __init__(self, similarity_threshold: Optional[float] = 0.97, max_diff_ratio: Optional[float] = 0.02,
+                 recurring_threshold: Optional[float] = 0.75, recurring_patience: int = 2,
+                 recommendation_overlap: float = 0.6):
+        """
+        Args:
+            similarity_threshold (Optional[float]): Stop when a generation is at least this similar
+                (word-level ratio, 0-1) to the previous one
+            max_diff_ratio (Optional[float]): Stop when the words inserted, deleted or replaced since the
+                previous generation are at most this fraction of its length
+            recurring_threshold (Optional[float]): Fraction of a critique's recommendations already made
+                in earlier critiques that counts as the reviewer repeating itself
+            recurring_patience (int): Consecutive repeating critiques needed before stopping
+            recommendation_overlap (float): Word overlap (Jaccard, 0-1) at which two recommendations
+                count as the same
+        """
+        self.similarity_threshold = similarity_threshold
+        self.max_diff_ratio = max_diff_ratio
+        self.recurring_threshold = recurring_threshold
+        self.recurring_patience = recurring_patience
+        self.recommendation_overlap = recommendation_overlap
+
+
+class ConvergenceDetector:
+    """
+    Tracks successive generations and critiques of one run and decides when it has converged.
+    """
+
+    def __init__(self, config: Optional[ConvergenceConfig] = None):
+        self.config = config or ConvergenceConfig()
+        self._previous_words: Optional[List[str]] = None
+        self._seen_recommendations: List[set] = []
+        self._recurring_streak = 0
+
+    def _recurring_ratio(self, recommendations: List[str]) -> float:
+        if not recommendations:
+            return 0.0
+        repeated = sum(
+            find_overlapping(set(words(recommendation)), self._seen_recommendations,
+                             self.config.recommendation_overlap) is not None
+            for recommendation in recommendations
+        )
+        return repeated / len(recommendations)
+
+    def update(self, generation: str, critique: str) -> Dict[str, Any]:
+        """
+        Record one round and check every configured threshold.
+
+        Args:
+            generation (str): This round's generation
+            critique (str): This round's critique
+
+        Returns:
+            Dict[str, Any]: The round's metrics (similarity, diff_words, diff_ratio, recurring) and "stop_reason",
+                which is None unless the loop should stop
+        """
+        config = self.config
+        generation_words = words(generation)
+        similarity = None
+        diff_words = None
+        diff_ratio = None
+        if self._previous_words is not None:
+            matcher = difflib.SequenceMatcher(None, self._previous_words, generation_words, autojunk=False)
+            similarity = matcher.ratio()
+            diff_words = sum(
+                max(i2 - i1, j2 - j1)
+                for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+                if tag != "equal"
+            )
+            diff_ratio = diff_words / max(len(generation_words), 1)
+        self._previous_words = generation_words
+
+        recommendations = extract_recommendations(critique)
+        recurring = self._recurring_ratio(recommendations)
+        self._seen_recommendations.extend(set(words(r)) for r in recommendations)
+        if config.recurring_threshold is not None and recommendations and recurring >= config.recurring_threshold:
+            self._recurring_streak += 1
+        else:
+            self._recurring_streak = 0
+
+        stop_reason = None
+        if similarity is not None and config.similarity_threshold is not None and similarity >= config.similarity_threshold:
+            stop_reason = f"generation similarity {similarity:.2f} >= {config.similarity_threshold:.2f}"
+        elif diff_ratio is not None and config.max_diff_ratio is not None and diff_ratio <= config.max_diff_ratio:
+            stop_reason = f"generation changed only {diff_words} words ({diff_ratio:.1%} <= {config.max_diff_ratio:.1%})"
+        elif config.recurring_threshold is not None and self._recurring_streak >= config.recurring_patience:
+            stop_reason = (f"reviewer repeated {recurring:.0%} of its recommendations "
+                           f"for {self._recurring_streak} rounds")
+
+        return {
+            "similarity": similarity,
+            "diff_words": diff_words,
+            "diff_ratio": diff_ratio,
+            "recurring": recurring,
+            "stop_reason": stop_reason,
+        }
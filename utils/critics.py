@@ -0,0 +1,58 @@
+"""
+Merging the critiques of several focused critics into one review.
+
+With multi-critic reflection every critic checks one criterion (see
+prompts.CRITIC_SYSTEM_PROMPTS) and the critics run concurrently. Their
+recommendations are merged locally, without another model call, into one
+numbered list labelled by critic, with near-duplicates folded together. The
+merged review is "<OK>" only when every critic answered <OK>.
+"""
+from typing import Dict, List, Set, Tuple
+
+from .convergence import extract_recommendations
+from .text import find_overlapping, words
+
+
+def critic_agrees(critique: str) -> bool:
+    """Whether a critique accepts the content, i.e. contains <OK> as the loop checks for."""
+    return "<OK>" in critique
+
+
+def merge_critiques(critiques: Dict[str, str], overlap: float = 0.6) -> str:
+    """
+    Merge the critics' critiques into one numbered recommendation list.
+
+    Args:
+        critiques (Dict[str, str]): Critique per critic name, in the order to list them
+        overlap (float): Word overlap (Jaccard, 0-1) at which two recommendations count as the same
+
+    Returns:
+        str: "<OK>" if every critic agrees; otherwise the satisfied critics and the numbered
+            recommendations of the others, each labelled with the critics that made it
+    """
+    if all(critic_agrees(critique) for critique in critiques.values()):
+        return "<OK>"
+
+    # (text, words, critic names) of each distinct recommendation
+    merged: List[Tuple[str, Set[str], List[str]]] = []
+    for name, critique in critiques.items():
+        if critic_agrees(critique):
+            continue
+        recommendations = extract_recommendations(critique) or [" ".join(critique.split())]
+        for recommendation in filter(None, recommendations):
+            recommendation_words = set(words(recommendation))
+            match = find_overlapping(recommendation_words, (seen for _, seen, _ in merged), overlap)
+            if match is None:
+                merged.append((recommendation, recommendation_words, [name]))
+            elif name not in merged[match][2]:
+                merged[match][2].append(name)
+
+    lines = []
+    satisfied = [name for name, critique in critiques.items() if critic_agrees(critique)]
+    if satisfied:
+        # Never repeat the <OK> marker here: the loop would take it for an accepted draft
+        lines.append(f"No changes needed for: {', '.join(satisfied)}.")
+        lines.append("")
+    lines.append("Recommendations:")
+    lines.extend(f"{i}. [{', '.join(names)}] {text}" for i, (text, _, names) in enumerate(merged, 1))
+    return "\n".join(lines)
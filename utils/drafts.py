@@ -0,0 +1,76 @@
+"""
+Cheap scoring of competing first drafts for best-of-N generation.
+
+The scores are local text heuristics, computed in microseconds, that track
+what the reviewer asks for most often: covering the request, concrete
+examples and details, a visible structure, varied wording and a draft that
+was not cut off. They only need to rank drafts of the same request, not to
+grade them absolutely.
+"""
+import re
+from typing import Dict
+
+from .text import words
+
+# Phrases and tokens that mark concrete content: examples, figures, named steps
+_SPECIFIC_PATTERN = re.compile(r"\b(?:for example|for instance|e\.g\.|such as|example|\d+(?:[.,]\d+)?%?)", re.IGNORECASE)
+# Markdown headings, bullets and numbered items
+_STRUCTURE_PATTERN = re.compile(r"^\s*(?:#{1,6}\s|[-*•]\s|\d+[.)]\s)", re.MULTILINE)
+_STOPWORDS = frozenset("""
+a about an and are as at be but by can create design develop explain for from how in into is it its
+make of on or please that the their this to up use using we what when which who why will with write you your
+""".split())
+
+# Weight of each component in the overall score
+SCORE_WEIGHTS = {"coverage": 0.35, "specificity": 0.25, "structure": 0.2, "diversity": 0.1, "complete": 0.1}
+
+
+def score_draft(draft: str, request: str) -> Dict[str, float]:
+    """
+    Score a draft for a request.
+
+    Args:
+        draft (str): The draft
+        request (str): The user's request it answers
+
+    Returns:
+        Dict[str, float]: Each component (coverage, specificity, structure, diversity, complete), 0-1,
+            and their weighted "score"
+    """
+    draft_words = words(draft)
+    keywords = {word for word in words(request) if len(word) > 2 and word not in _STOPWORDS}
+    present = set(draft_words)
+    paragraphs = [block for block in re.split(r"\n\s*\n", draft.strip()) if block.strip()]
+    # Type/token ratio over a fixed window, so long drafts are not penalized for their length
+    window = draft_words[:400]
+
+    components = {
+        "coverage": len(keywords & present) / len(keywords) if keywords else 1.0,
+        "specificity": min(len(_SPECIFIC_PATTERN.findall(draft)) / 5, 1.0),
+        "structure": min(len(paragraphs) / 4, 1.0) * 0.5 + (0.5 if _STRUCTURE_PATTERN.search(draft) else 0.0),
+        "diversity": len(set(window)) / len(window) if window else 0.0,
+        # A draft cut off by max_tokens rarely ends on a sentence or block boundary
+        "complete": 1.0 if draft.rstrip().endswith((".", "!", "?", ")", "`", "*", '"')) else 0.0,
+    }
+    components["score"] = sum(SCORE_WEIGHTS[name] * value for name, value in components.items())
+    return components
+
+
+def parse_ranking(reply: str, n_drafts: int) -> int:
+    """
+    Read the chosen draft from a ranking reply ("2", "Draft 2", ...).
+
+    Args:
+        reply (str): The judge's reply
+        n_drafts (int): How many drafts were ranked
+
+    Returns:
+        int: The 0-based index of the chosen draft
+
+    Raises:
+        ValueError: If the reply names no draft in range
+    """
+    match = re.search(r"\d+", reply)
+    if match is None or not 1 <= int(match.group()) <= n_drafts:
+        raise ValueError(f"No draft number between 1 and {n_drafts} in the ranking reply: {reply!r}")
+    return int(match.group()) - 1
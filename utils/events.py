@@ -0,0 +1,120 @@
+"""
+Typed progress events emitted by the reflection engine.
+
+A sink is any callable that accepts an event. The engine never talks to a UI
+directly; the Streamlit app, the CLI and tests each plug in their own sinks.
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List
+
+from colorama import Fore, Style
+
+from .logging import fancy_step_tracker
+from .metrics import CallMetrics
+
+
+@dataclass(frozen=True)
+class PromptOptimized:
+    original: str
+    optimized: str
+
+
+@dataclass(frozen=True)
+class StepStarted:
+    step: int
+    n_steps: int
+
+
+@dataclass(frozen=True)
+class TokenDelta:
+    step: int
+    kind: str  # "generation", "patch" (edits in patch revision mode) or "critique"
+    text: str
+
+
+@dataclass(frozen=True)
+class GenerationDone:
+    step: int
+    n_steps: int
+    generation: str
+
+
+@dataclass(frozen=True)
+class CritiqueDone:
+    step: int
+    n_steps: int
+    critique: str
+
+
+@dataclass(frozen=True)
+class Converged:
+    step: int
+    reason: str
+
+
+@dataclass(frozen=True)
+class Cancelled:
+    step: int  # last finished step, 0 if none
+    reason: str
+
+
+@dataclass(frozen=True)
+class CallFinished:
+    metrics: CallMetrics
+
+
+@dataclass(frozen=True)
+class RunFinished:
+    final_output: str
+    steps_data: List[Dict[str, Any]]
+
+
+ProgressSink = Callable[[Any], None]
+
+
+def emit(sinks: Iterable[ProgressSink], event: Any) -> None:
+    """
+    Deliver an event to every sink in order.
+
+    Args:
+        sinks (Iterable[ProgressSink]): The sinks to notify
+        event: The event to deliver
+    """
+    for sink in sinks:
+        sink(event)
+
+
+class ConsoleSink:
+    """
+    Prints progress to the terminal, for the CLI and other headless runs.
+    """
+
+    def __init__(self, show_text: bool = False):
+        """
+        Args:
+            show_text (bool): Also print each generation and critique
+        """
+        self.show_text = show_text
+        self._streaming = None
+
+    def __call__(self, event: Any) -> None:
+        if isinstance(event, PromptOptimized):
+            print(f"{Fore.MAGENTA}Optimized prompt:{Style.RESET_ALL} {event.optimized}")
+        elif isinstance(event, StepStarted):
+            fancy_step_tracker(event.step - 1, event.n_steps)
+        elif isinstance(event, TokenDelta) and self.show_text:
+            if self._streaming != (event.step, event.kind):
+                self._streaming = (event.step, event.kind)
+                color = Fore.BLUE if event.kind == "generation" else Fore.GREEN
+                print(color, f"\n\n{event.kind.upper()}\n\n", Style.RESET_ALL)
+            print(event.text, end="", flush=True)
+        elif isinstance(event, GenerationDone) and self.show_text:
+            if self._streaming is None:
+                print(Fore.BLUE, f"\n\nGENERATION\n\n", event.generation, Style.RESET_ALL)
+        elif isinstance(event, CritiqueDone) and self.show_text:
+            if self._streaming is None:
+                print(Fore.GREEN, f"\n\nREFLECTION\n\n", event.critique, Style.RESET_ALL)
+        elif isinstance(event, Converged):
+            print(f"{Fore.CYAN}Converged at step {event.step}: {event.reason}{Style.RESET_ALL}")
+        elif isinstance(event, Cancelled):
+            print(f"{Fore.YELLOW}Stopped after step {event.step}: {event.reason}{Style.RESET_ALL}")
@@ -0,0 +1,189 @@
+"""
+Hedged requests: a duplicate for a call that is slower than usual.
+
+Most completions answer within a narrow band, but a few get stuck behind a
+slow replica or a congested queue. A hedging policy keeps a window of recent
+latencies per kind of call and model; when a request has not answered within
+a high percentile of them (p95 by default), a duplicate goes out, preferably
+to another endpoint. The first acceptable response wins and the other request
+is cancelled. A token bucket caps the extra load: every call deposits
+`max_extra_load` tokens and every hedge spends one, so in steady state at most
+that fraction of calls is sent twice.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .retry import RetryBudget
+
+
+def _consume(task: asyncio.Task) -> None:
+    # Retrieve the outcome of a losing request, so a late error is not reported as never retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+class HedgePolicy:
+    """
+    Decides when a slow call gets a duplicate request, and races the two.
+    """
+
+    def __init__(self, percentile: float = 0.95, min_samples: int = 20, window: int = 200,
+                 min_delay: float = 0.05, max_extra_load: float = 0.1, burst: float = 5.0):
+        """
+        Args:
+            percentile (float): Share of recent calls (0-1) that answered before a duplicate is sent
+            min_samples (int): Calls of a kind and model measured before their requests are hedged
+            window (int): Recent latencies kept per kind and model
+            min_delay (float): Lower bound of the hedging delay, in seconds
+            max_extra_load (float): Duplicates allowed per call in steady state
+            burst (float): Duplicates available at once, and the budget's capacity
+        """
+        if not 0 < percentile < 1:
+            raise ValueError("percentile must be between 0 and 1")
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self.budget = RetryBudget(ratio=max_extra_load, reserve=burst)
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.won = 0
+        self.denied = 0
+
+    def observe(self, key: str, seconds: float) -> None:
+        """
+        Add a call's latency to the window of its kind and model.
+
+        Args:
+            key (str): The kind of call and model, e.g. "generation llama-3.3-70b-versatile"
+            seconds (float): Time until the response was available
+        """
+        with self._lock:
+            if key not in self._latencies:
+                self._latencies[key] = deque(maxlen=self.window)
+            self._latencies[key].append(seconds)
+
+    def delay(self, key: str) -> Optional[float]:
+        """
+        Get the time after which a call gets a duplicate.
+
+        Args:
+            key (str): The kind of call and model
+
+        Returns:
+            Optional[float]: The configured percentile of recent latencies (at least `min_delay`), or None
+                while fewer than `min_samples` calls were measured
+        """
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        # Nearest-rank percentile
+        return max(samples[math.ceil(self.percentile * len(samples)) - 1], self.min_delay)
+
+    async def arace(self, key: str, primary: Callable[[], Awaitable[Any]], hedge: Callable[[], Awaitable[Any]],
+                    accept: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool, bool]:
+        """
+        Run a request, and a duplicate if it is still running after the hedging delay.
+
+        Args:
+            key (str): The kind of call and model
+            primary (Callable[[], Awaitable[Any]]): Sends the request
+            hedge (Callable[[], Awaitable[Any]]): Sends the duplicate (e.g. to another endpoint)
+            accept (Optional[Callable[[Any], bool]]): Whether a response may win the race; one that is not
+                accepted (e.g. an error status) only counts once the other request has failed too
+
+        Returns:
+            Tuple[Any, bool, bool]: The winning response, whether a duplicate was sent, and whether it won
+
+        Raises:
+            Exception: The primary request's error, if both requests fail
+        """
+        started = time.perf_counter()
+        self.budget.deposit()
+        with self._lock:
+            self.calls += 1
+        first = asyncio.ensure_future(primary())
+        tasks = [first]
+        try:
+            delay = self.delay(key)
+            if delay is not None:
+                await asyncio.wait(tasks, timeout=delay)
+            if delay is None or first.done() or not self._admit():
+                result = await first
+                self.observe(key, time.perf_counter() - started)
+                return result, False, False
+
+            tasks.append(asyncio.ensure_future(hedge()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # The primary wins a tie
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is None and (accept is None or accept(task.result())):
+                        self.observe(key, time.perf_counter() - started)
+                        won = task is not first
+                        if won:
+                            with self._lock:
+                                self.won += 1
+                        return task.result(), True, won
+            # Neither was acceptable: answer as the primary alone would have
+            return first.result(), True, False
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                task.add_done_callback(_consume)
+
+    def _admit(self) -> bool:
+        admitted = self.budget.withdraw()
+        with self._lock:
+            if admitted:
+                self.hedged += 1
+            else:
+                self.denied += 1
+        return admitted
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the hedging counters and the current delay of every kind of call and model.
+
+        Returns:
+            Dict[str, Any]: Calls, hedged calls, hedges that won, hedges the budget denied, the extra
+                load (hedged / calls) and the delay per key
+        """
+        with self._lock:
+            keys = list(self._latencies)
+            calls, hedged, won, denied = self.calls, self.hedged, self.won, self.denied
+        return {
+            "calls": calls,
+            "hedged": hedged,
+            "won": won,
+            "denied": denied,
+            "extra_load": hedged / calls if calls else 0.0,
+            "delays": {key: self.delay(key) for key in keys},
+        }
+
+
+_shared_policy: Optional[HedgePolicy] = None
+_shared_lock = threading.Lock()
+
+
+def get_hedge_policy() -> HedgePolicy:
+    """
+    Get the process-wide hedging policy, so every agent learns from the same latencies and shares one budget.
+
+    Returns:
+        HedgePolicy: The shared policy
+    """
+    global _shared_policy
+    with _shared_lock:
+        if _shared_policy is None:
+            _shared_policy = HedgePolicy()
+        return _shared_policy
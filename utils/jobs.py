@@ -0,0 +1,287 @@
+"""
+Background job queue for reflection runs.
+
+A front end submits a run and gets a job id back at once; a bounded pool of
+worker threads runs the jobs. A job is itself a progress sink: it keeps every
+event of its run, so any number of followers (the tab that submitted it, or
+the same tab after a browser refresh) can replay the events so far and wait
+for the rest. Jobs live in the server process, not in a browser session.
+
+Admission control bounds what one server takes on: at most `max_queued` jobs
+wait for a worker, and each owner (e.g. a browser session) has at most
+`max_per_owner` jobs queued or running. A rejected submission raises
+JobQueueFullError, so the front end can ask the user to try again later.
+
+Every job carries a cancellation token for its run. Cancelling a queued job
+means it never starts; cancelling a running one aborts its in-flight requests,
+and the run's partial result is kept with the status "cancelled".
+
+The pool is sized through the environment:
+
+    REFLECTION_JOB_WORKERS=4   # runs executed at once
+    REFLECTION_JOB_QUEUE=16    # runs waiting for a worker
+"""
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .cancellation import CancellationToken
+from .metrics import METRIC_PREFIX
+
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+
+class JobQueueFullError(RuntimeError):
+    """The queue, or the owner's share of it, is full."""
+
+
+class Job:
+    """
+    One submitted run: its status, its progress events so far and, once finished, its result or error.
+    """
+
+    def __init__(self, owner: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.owner = owner
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.events: List[Any] = []
+        self.token = CancellationToken()
+        self._changed = threading.Condition()
+
+    def __call__(self, event: Any) -> None:
+        # A job is the progress sink of its own run
+        with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def cancel(self, reason: str = "stopped by the user") -> None:
+        """
+        Stop the job: it will not start if still queued, and its run is aborted if running.
+
+        Args:
+            reason (str): Why, reported as the run's stop reason
+        """
+        self.token.cancel(reason)
+        with self._changed:
+            self._changed.notify_all()
+
+    def _set_status(self, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        with self._changed:
+            self.status = status
+            if status == "running":
+                self.started_at = time.time()
+            elif status in FINISHED_STATUSES:
+                self.finished_at = time.time()
+                self.result = result
+                self.error = error
+            self._changed.notify_all()
+
+    def wait(self, index: int, timeout: Optional[float] = None) -> List[Any]:
+        """
+        Wait for events after the first `index` ones.
+
+        Args:
+            index (int): Number of events the caller has already seen
+            timeout (Optional[float]): Seconds to wait at most
+
+        Returns:
+            List[Any]: The new events; empty if the timeout passed, or the job finished, without any
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > index or self.finished, timeout)
+            return self.events[index:]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The job's status and timings, without its events or result."""
+        return {
+            "id": self.id,
+            "owner": self.owner,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "events": len(self.events),
+            "error": self.error,
+            "stop_reason": self.token.reason,
+        }
+
+
+class JobQueue:
+    """
+    Runs submitted jobs on a bounded pool of worker threads, with admission control.
+    """
+
+    def __init__(self, workers: int = 4, max_queued: int = 16, max_per_owner: Optional[int] = 2,
+                 retention: float = 3600.0):
+        """
+        Args:
+            workers (int): Jobs run at once
+            max_queued (int): Jobs that may wait for a worker; further submissions are rejected
+            max_per_owner (Optional[int]): Jobs one owner may have queued or running, or None for no limit
+            retention (float): Seconds a finished job stays available to its followers
+        """
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_owner = max_per_owner
+        self.retention = retention
+        # Each job runs its own event loop on its worker thread
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reflection-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.finished: Counter = Counter()
+        self.started = 0
+        self.queue_wait = 0.0
+
+    def submit(self, run: Callable[[Job], Any], owner: Optional[str] = None) -> Job:
+        """
+        Queue a run.
+
+        Args:
+            run (Callable[[Job], Any]): Executes the run on a worker thread, with the job as its progress
+                sink and `job.token` as its cancellation token, and returns its result
+            owner (Optional[str]): Who submitted it, for the per-owner limit
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            JobQueueFullError: If the queue, or the owner's share of it, is full
+        """
+        with self._lock:
+            self._prune()
+            active = [job for job in self._jobs.values() if not job.finished]
+            if sum(job.status == "queued" for job in active) >= self.max_queued:
+                self.rejected += 1
+                raise JobQueueFullError(f"{self.max_queued} runs are already waiting")
+            if (owner is not None and self.max_per_owner is not None
+                    and sum(job.owner == owner for job in active) >= self.max_per_owner):
+                self.rejected += 1
+                raise JobQueueFullError(f"Only {self.max_per_owner} runs per user at a time")
+            job = Job(owner)
+            self._jobs[job.id] = job
+            self.submitted += 1
+        self._executor.submit(self._execute, job, run)
+        return job
+
+    def _execute(self, job: Job, run: Callable[[Job], Any]) -> None:
+        if job.token.cancelled:
+            # Stopped while it waited: free the worker at once
+            job._set_status("cancelled")
+        else:
+            job._set_status("running")
+            with self._lock:
+                self.started += 1
+                self.queue_wait += job.started_at - job.submitted_at
+            try:
+                result = run(job)
+            except Exception as e:
+                print(f"Job {job.id} failed: {str(e)}")
+                job._set_status("failed", error=f"{type(e).__name__}: {e}")
+            else:
+                job._set_status("cancelled" if job.token.cancelled else "done", result=result)
+        with self._lock:
+            self.finished[job.status] += 1
+
+    def _prune(self) -> None:
+        # Forget finished jobs nobody came back for; the caller holds the lock
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """The job with this id, or None if it is unknown or was pruned."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """Number of queued jobs submitted before this one (0 once it runs)."""
+        with self._lock:
+            if job.status != "queued":
+                return 0
+            return sum(other.status == "queued" and other.submitted_at < job.submitted_at
+                       for other in self._jobs.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the queue depth and the job counters.
+
+        Returns:
+            Dict[str, Any]: Workers, queued and running jobs, and jobs submitted, rejected, done, failed and
+                cancelled since the queue was created, with the mean wait for a worker
+        """
+        with self._lock:
+            statuses = Counter(job.status for job in self._jobs.values())
+            return {
+                "workers": self.workers,
+                "queued": statuses["queued"],
+                "running": statuses["running"],
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "done": self.finished["done"],
+                "failed": self.finished["failed"],
+                "cancelled": self.finished["cancelled"],
+                "mean_queue_wait": self.queue_wait / self.started if self.started else 0.0,
+            }
+
+    def prometheus_text(self) -> str:
+        """
+        Render the queue depth and job counters in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition, ending with a newline
+        """
+        stats = self.stats()
+        lines = []
+        for name, kind, help_text, value in (
+            ("jobs_queued", "gauge", "Runs waiting for a worker", stats["queued"]),
+            ("jobs_running", "gauge", "Runs being executed", stats["running"]),
+            ("job_workers", "gauge", "Worker threads of the job queue", stats["workers"]),
+            ("jobs_submitted_total", "counter", "Runs accepted by the job queue", stats["submitted"]),
+            ("jobs_rejected_total", "counter", "Runs turned away by admission control", stats["rejected"]),
+        ):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            lines.append(f"{METRIC_PREFIX}_{name} {value}")
+        lines.append(f"# HELP {METRIC_PREFIX}_jobs_finished_total Finished runs by outcome")
+        lines.append(f"# TYPE {METRIC_PREFIX}_jobs_finished_total counter")
+        for status in FINISHED_STATUSES:
+            lines.append(f'{METRIC_PREFIX}_jobs_finished_total{{status="{status}"}} {stats[status]}')
+        return "\n".join(lines) + "\n"
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+_shared_queue: Optional[JobQueue] = None
+_shared_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Get the process-wide job queue, sized by $REFLECTION_JOB_WORKERS and $REFLECTION_JOB_QUEUE.
+
+    Returns:
+        JobQueue: The shared queue
+    """
+    global _shared_queue
+    with _shared_lock:
+        if _shared_queue is None:
+            _shared_queue = JobQueue(workers=int(os.getenv("REFLECTION_JOB_WORKERS", "4")),
+                                     max_queued=int(os.getenv("REFLECTION_JOB_QUEUE", "16")))
+        return _shared_queue
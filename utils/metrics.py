@@ -0,0 +1,377 @@
+"""
+Per-call instrumentation for generate, reflect and optimize calls.
+
+Every completion call produces a CallMetrics record: where its time went
+(rate-limiter and connection-pool queue wait, connect, time to first byte/token, total), what the provider
+billed (prompt/completion tokens, cost) and how it ended (status,
+finish_reason). The process-wide recorder aggregates them into Prometheus
+text exposition format and can append every record to a JSON lines file.
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .tokens import estimate_cost
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = "reflection_agent"
+
+
+# Filled in by each request a call sends, rather than by the call as a whole
+_ATTEMPT_FIELDS = ("endpoint", "rate_limit_wait", "attempts", "retry_wait", "failovers")
+
+
+@dataclass
+class CallMetrics:
+    kind: str  # "generation", "reflection", "optimization" or "ranking" (choosing among first drafts)
+    model: str
+    step: Optional[int] = None
+    status_code: int = 0
+    cached: bool = False
+    # An optimization answered from the optimized-prompt store (also counts as cached)
+    memoized: bool = False
+    # Answered by an identical request that was already in flight
+    deduplicated: bool = False
+    streamed: bool = False
+    error: Optional[str] = None
+    reused_connection: Optional[bool] = None
+    # Time the client-side rate limiter held the call back, over all attempts
+    rate_limit_wait: float = 0.0
+    queue_wait: Optional[float] = None
+    connect_time: Optional[float] = None
+    time_to_first_byte: Optional[float] = None
+    time_to_first_token: Optional[float] = None
+    total: float = 0.0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    finish_reason: Optional[str] = None
+    # Time the provider reports the request spent in its own queue, when it does
+    provider_queue_time: Optional[float] = None
+    cost_usd: Optional[float] = None
+    attempts: int = 1
+    # Seconds spent backing off between attempts
+    retry_wait: float = 0.0
+    # The endpoint that answered (see utils.providers), and how many failed before it
+    endpoint: Optional[str] = None
+    failovers: int = 0
+    # A duplicate request was sent after the hedging delay (see utils.hedging), and whether it answered first
+    hedged: bool = False
+    hedge_won: bool = False
+    timestamp: float = field(default_factory=time.time)
+    started_at: float = field(default_factory=time.perf_counter, repr=False)
+
+    @property
+    def status(self) -> str:
+        """Status label: "memoized", "cached", the HTTP status code, or "error" when no response arrived."""
+        if self.memoized:
+            return "memoized"
+        if self.cached:
+            return "cached"
+        if not self.status_code:
+            return "error"
+        return str(self.status_code)
+
+    @property
+    def source(self) -> str:
+        """Where the output came from: "store", "cache" or "api"."""
+        if self.memoized:
+            return "store"
+        return "cache" if self.cached else "api"
+
+    def apply_stats(self, stats) -> None:
+        """
+        Copy the transport's timings for this call.
+
+        Args:
+            stats (RequestStats): The request's connection stats
+        """
+        self.status_code = stats.status_code
+        self.reused_connection = stats.reused_connection
+        self.queue_wait = stats.queue_wait
+        self.connect_time = stats.connect_time
+        self.time_to_first_byte = stats.time_to_first_byte
+        self.time_to_first_token = stats.time_to_first_token
+        # Includes earlier attempts and backoff when the call was retried
+        self.total = time.perf_counter() - self.started_at
+
+    def apply_result(self, result: Dict[str, Any]) -> None:
+        """
+        Copy the usage block and finish_reason from a completion response or final stream chunk.
+
+        Args:
+            result (Dict[str, Any]): The decoded response body or chunk
+        """
+        choices = result.get("choices") or []
+        if choices and choices[0].get("finish_reason"):
+            self.finish_reason = choices[0]["finish_reason"]
+        # Groq reports streamed usage under "x_groq"
+        usage = result.get("usage") or (result.get("x_groq") or {}).get("usage")
+        if usage:
+            self.prompt_tokens = usage.get("prompt_tokens")
+            self.completion_tokens = usage.get("completion_tokens")
+            self.provider_queue_time = usage.get("queue_time")
+            self.cost_usd = estimate_cost(self.model, self.prompt_tokens or 0, self.completion_tokens or 0)
+
+    def note_retry(self, error_class: str, delay: float) -> None:
+        """Retry-policy hook: count another attempt and its backoff."""
+        self.attempts += 1
+        self.retry_wait += delay
+
+    def note_failover(self) -> None:
+        """Provider-router hook: an endpoint failed and the request moved to the next one."""
+        self.failovers += 1
+
+    def take_attempt(self, attempt: "CallMetrics") -> None:
+        """
+        Take the endpoint, rate-limit wait, retries and failovers of the request that answered, from the
+        record it filled in on its own (e.g. the winner of a hedged race).
+        """
+        for name in _ATTEMPT_FIELDS:
+            setattr(self, name, getattr(attempt, name))
+
+    def finish(self, error: Optional[BaseException] = None) -> "CallMetrics":
+        """Close a call that has no transport stats (cache hit or failed request)."""
+        if error is not None:
+            self.error = type(error).__name__
+        if not self.total:
+            self.total = time.perf_counter() - self.started_at
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = asdict(self)
+        record.pop("started_at")
+        record["status"] = self.status
+        return record
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[Tuple[str, str], ...], value: float) -> None:
+        # Per series: one count per bucket, then +Inf count and sum
+        series = self.series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self, name: str) -> List[str]:
+        lines = []
+        for labels, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {series[-2]}")
+            lines.append(f"{name}_sum{_labels(labels)} {series[-1]}")
+            lines.append(f"{name}_count{_labels(labels)} {series[-2]}")
+        return lines
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return f"{{{pairs}}}" if pairs else ""
+
+
+# (attribute, metric name, help text) of every latency histogram
+_HISTOGRAMS = (
+    ("total", "call_duration_seconds", "Total latency of a completion call"),
+    ("rate_limit_wait", "rate_limit_wait_seconds", "Time held back by the client-side rate limiter"),
+    ("queue_wait", "queue_wait_seconds", "Time waiting for the I/O loop and a pooled connection"),
+    ("connect_time", "connect_seconds", "TCP/TLS handshake time of calls that opened a connection"),
+    ("time_to_first_byte", "time_to_first_byte_seconds", "Time until the response headers arrived"),
+    ("time_to_first_token", "time_to_first_token_seconds", "Time until the first streamed token arrived"),
+)
+
+
+class MetricsRecorder:
+    """
+    Thread-safe aggregate of CallMetrics records, exportable as Prometheus text and JSON lines.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, max_recent: int = 1000):
+        """
+        Args:
+            jsonl_path (Optional[str]): Append every record to this JSON lines file
+            max_recent (int): Number of recent records kept in memory
+        """
+        self.jsonl_path = jsonl_path
+        self.recent: deque = deque(maxlen=max_recent)
+        self._lock = threading.Lock()
+        self._jsonl = None
+        self._calls: Counter = Counter()
+        self._tokens: Counter = Counter()
+        self._cost: Counter = Counter()
+        self._finish_reasons: Counter = Counter()
+        self._retries: Counter = Counter()
+        self._deduplicated: Counter = Counter()
+        self._endpoints: Counter = Counter()
+        self._failovers: Counter = Counter()
+        self._hedges: Counter = Counter()
+        self._hedges_won: Counter = Counter()
+        self._histograms = {attribute: _Histogram() for attribute, _, _ in _HISTOGRAMS}
+        # Unlike the histograms above, includes store and cache hits
+        self._optimize = _Histogram()
+
+    def record(self, call: CallMetrics) -> None:
+        """
+        Add one call to the aggregates (and the JSON lines file, if configured).
+
+        Args:
+            call (CallMetrics): The finished call
+        """
+        labels = (("kind", call.kind), ("model", call.model))
+        with self._lock:
+            self.recent.append(call)
+            self._calls[labels + (("status", call.status),)] += 1
+            if call.attempts > 1:
+                self._retries[labels] += call.attempts - 1
+            if call.deduplicated:
+                self._deduplicated[labels] += 1
+            if call.endpoint is not None and not call.deduplicated:
+                self._endpoints[(("endpoint", call.endpoint), ("status", call.status))] += 1
+            if call.failovers:
+                self._failovers[labels] += call.failovers
+            if call.hedged:
+                self._hedges[labels] += 1
+            if call.hedge_won:
+                self._hedges_won[labels] += 1
+            # A shared response was billed once, to the call that made the request
+            billed = not call.deduplicated
+            if billed and call.prompt_tokens is not None:
+                self._tokens[labels + (("type", "prompt"),)] += call.prompt_tokens
+            if billed and call.completion_tokens is not None:
+                self._tokens[labels + (("type", "completion"),)] += call.completion_tokens
+            if billed and call.cost_usd is not None:
+                self._cost[(("model", call.model),)] += call.cost_usd
+            if call.finish_reason is not None:
+                self._finish_reasons[(("kind", call.kind), ("reason", call.finish_reason))] += 1
+            if call.kind == "optimization":
+                self._optimize.observe((("model", call.model), ("source", call.source)), call.total)
+            if not call.cached:
+                for attribute, histogram in self._histograms.items():
+                    value = getattr(call, attribute)
+                    if value is not None:
+                        histogram.observe(labels, value)
+            if self.jsonl_path:
+                if self._jsonl is None:
+                    directory = os.path.dirname(self.jsonl_path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self._jsonl = open(self.jsonl_path, "a", encoding="utf-8")
+                self._jsonl.write(json.dumps(call.to_dict()) + "\n")
+                self._jsonl.flush()
+
+    def prometheus_text(self) -> str:
+        """
+        Render the aggregates in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition, ending with a newline
+        """
+        lines = []
+
+        def counter(name: str, help_text: str, values: Counter) -> None:
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{METRIC_PREFIX}_{name}{_labels(labels)} {value}")
+
+        with self._lock:
+            counter("calls_total", "Completion calls by kind, model and status", self._calls)
+            counter("tokens_total", "Tokens billed by kind, model and type", self._tokens)
+            counter("cost_usd_total", "Estimated spend in USD by model", self._cost)
+            counter("finish_reasons_total", "Completion finish reasons by kind", self._finish_reasons)
+            counter("retries_total", "Retried attempts by kind and model", self._retries)
+            counter("deduplicated_total", "Calls answered by an identical call already in flight",
+                    self._deduplicated)
+            counter("endpoint_calls_total", "Upstream calls by the endpoint that answered and status", self._endpoints)
+            counter("failovers_total", "Endpoints left for the next one after a failure, by kind and model",
+                    self._failovers)
+            counter("hedges_total", "Duplicate requests sent for slow calls, by kind and model", self._hedges)
+            counter("hedges_won_total", "Hedged calls the duplicate answered first, by kind and model",
+                    self._hedges_won)
+            for attribute, name, help_text in _HISTOGRAMS:
+                lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} histogram")
+                lines.extend(self._histograms[attribute].render(f"{METRIC_PREFIX}_{name}"))
+            name = f"{METRIC_PREFIX}_optimize_prompt_seconds"
+            lines.append(f"# HELP {name} Latency of the optimize step by where the prompt came from (store, cache, api)")
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(self._optimize.render(name))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the Prometheus exposition to a file (e.g. for node_exporter's textfile collector)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def to_jsonl(self) -> str:
+        """The recent records as JSON lines."""
+        with self._lock:
+            return "".join(json.dumps(call.to_dict()) + "\n" for call in self.recent)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+
+
+def run_breakdown(calls: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Sum a run's call records per kind, for a compact latency/token summary.
+
+    Args:
+        calls (List[Dict[str, Any]]): CallMetrics records as dictionaries
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Per kind and for "total": calls, cached calls, seconds, rate-limit wait,
+            tokens and cost
+    """
+    breakdown: Dict[str, Dict[str, Any]] = {}
+    for call in calls:
+        for key in (call["kind"], "total"):
+            row = breakdown.setdefault(key, {
+                "calls": 0, "cached": 0, "seconds": 0.0, "rate_limit_wait": 0.0, "prompt_tokens": 0,
+                "completion_tokens": 0, "cost_usd": 0.0,
+            })
+            row["calls"] += 1
+            row["cached"] += call["cached"]
+            row["seconds"] += call["total"]
+            row["rate_limit_wait"] += call.get("rate_limit_wait", 0.0)
+            row["prompt_tokens"] += call["prompt_tokens"] or 0
+            row["completion_tokens"] += call["completion_tokens"] or 0
+            row["cost_usd"] += call["cost_usd"] or 0.0
+    return breakdown
+
+
+_shared_metrics: Optional[MetricsRecorder] = None
+_shared_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRecorder:
+    """
+    Get the process-wide metrics recorder; records are also appended to $REFLECTION_METRICS_JSONL if set.
+
+    Returns:
+        MetricsRecorder: The shared recorder
+    """
+    global _shared_metrics
+    with _shared_lock:
+        if _shared_metrics is None:
+            _shared_metrics = MetricsRecorder(os.getenv("REFLECTION_METRICS_JSONL") or None)
+        return _shared_metrics
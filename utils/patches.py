@@ -0,0 +1,144 @@
+"""
+Structured edits for patch-based revisions.
+
+Instead of re-emitting the whole draft on every step, the generator can answer
+a critique with a short list of edits against the draft's numbered sections
+(paragraphs, with fenced code blocks kept whole). The edits are applied
+locally; a reply that cannot be parsed or applied raises PatchError so the
+caller can fall back to a full rewrite.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+_SECTION_BREAK = re.compile(r"\n[ \t]*\n\s*")
+# A "[3] " marker at the start of a section, copied from the numbered draft
+_SECTION_MARKER = re.compile(r"(\A\s*|\n[ \t]*\n\s*)\[\d+\][ \t]*")
+
+
+class PatchError(ValueError):
+    """A patch reply that could not be parsed or applied."""
+    pass
+
+
+def split_sections(text: str) -> List[str]:
+    """
+    Split a draft into sections: paragraphs separated by blank lines, keeping fenced code blocks whole.
+
+    Args:
+        text (str): The draft
+
+    Returns:
+        List[str]: The non-empty sections, in order
+    """
+    sections: List[str] = []
+    in_fence = False
+    for block in _SECTION_BREAK.split(text.strip()):
+        if in_fence:
+            sections[-1] += "\n\n" + block
+        elif block:
+            sections.append(block)
+        if block.count("```") % 2:
+            in_fence = not in_fence
+    return sections
+
+
+def render_sections(text: str) -> str:
+    """
+    Render a draft with "[n] " before each section, as the patch request shows it to the generator.
+
+    Args:
+        text (str): The draft
+
+    Returns:
+        str: The numbered draft
+    """
+    return "\n\n".join(f"[{i}] {section}" for i, section in enumerate(split_sections(text), 1))
+
+
+def strip_section_numbers(text: str) -> str:
+    """Remove "[n] " markers the generator copied from the numbered draft into its text."""
+    return _SECTION_MARKER.sub(lambda match: match.group(1), text).strip()
+
+
+def parse_patch(reply: str) -> List[Dict[str, Any]]:
+    """
+    Extract the edits from a patch reply: a JSON object {"edits": [...]}, possibly inside a code fence.
+
+    Args:
+        reply (str): The generator's reply
+
+    Returns:
+        List[Dict[str, Any]]: The edits
+
+    Raises:
+        PatchError: If the reply holds no such object
+    """
+    start, end = reply.find("{"), reply.rfind("}")
+    if start == -1 or end < start:
+        raise PatchError("the reply has no JSON object")
+    try:
+        patch = json.loads(reply[start:end + 1])
+    except ValueError as e:
+        raise PatchError(f"the reply is not valid JSON: {e}")
+    edits = patch.get("edits") if isinstance(patch, dict) else None
+    if not isinstance(edits, list) or not all(isinstance(edit, dict) for edit in edits):
+        raise PatchError('the reply has no "edits" list of objects')
+    return edits
+
+
+def _section_number(edit: Dict[str, Any], field: str, low: int, high: int) -> int:
+    number = edit.get(field)
+    if isinstance(number, str) and number.strip().isdigit():
+        number = int(number)
+    if isinstance(number, bool) or not isinstance(number, int):
+        raise PatchError(f'{edit.get("op")} needs an integer "{field}"')
+    if not low <= number <= high:
+        raise PatchError(f'{edit.get("op")} {field} {number} is not between {low} and {high}')
+    return number
+
+
+def _edit_text(edit: Dict[str, Any]) -> str:
+    text = edit.get("text")
+    if not isinstance(text, str):
+        raise PatchError(f'{edit.get("op")} needs a "text" string')
+    return strip_section_numbers(text)
+
+
+def apply_patch(draft: str, edits: List[Dict[str, Any]]) -> str:
+    """
+    Apply edits to a draft. Section numbers refer to the draft as given, whatever the order of the edits:
+    {"op": "replace", "section": n, "text": ...}, {"op": "delete", "section": n} and
+    {"op": "insert", "after": n, "text": ...} (after 0 inserts at the start).
+
+    Args:
+        draft (str): The current draft
+        edits (List[Dict[str, Any]]): The edits, e.g. from parse_patch
+
+    Returns:
+        str: The revised draft
+
+    Raises:
+        PatchError: If an edit is malformed, out of range or conflicts with another
+    """
+    sections = split_sections(draft)
+    replaced: Dict[int, Optional[str]] = {}
+    inserted: Dict[int, List[str]] = {}
+    for edit in edits:
+        op = edit.get("op")
+        if op in ("replace", "delete"):
+            number = _section_number(edit, "section", 1, len(sections))
+            if number in replaced:
+                raise PatchError(f"section {number} is edited more than once")
+            replaced[number] = _edit_text(edit) if op == "replace" else None
+        elif op == "insert":
+            number = _section_number(edit, "after", 0, len(sections))
+            inserted.setdefault(number, []).append(_edit_text(edit))
+        else:
+            raise PatchError(f"unknown edit op {op!r}")
+
+    revised = list(inserted.get(0, []))
+    for number, section in enumerate(sections, 1):
+        revised.append(replaced[number] if number in replaced else section)
+        revised.extend(inserted.get(number, []))
+    return "\n\n".join(section for section in revised if section)
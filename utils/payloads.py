@@ -0,0 +1,111 @@
+"""
+Chat completion request bodies assembled from pre-encoded message fragments.
+
+Every message caches its own JSON encoding (see utils.completions.Message), so
+building a request only encodes messages that have not been sent before; the
+long system prompts and earlier turns are reused byte for byte. The body uses
+the same canonical layout as utils.cache.completion_key, so the cache key is a
+hash over the same fragments rather than a second full encoding.
+"""
+import hashlib
+import json
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+from .completions import Message
+
+
+def _encode(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+class ChatPayload:
+    """
+    A chat completion request body. Supports `get(field)` like a payload dictionary,
+    so the completion cache accepts it in place of one.
+    """
+
+    __slots__ = ("model", "messages", "temperature", "max_tokens", "stream", "_cache_key")
+
+    def __init__(self, model: str, messages: Iterable[Union[Message, Dict[str, str]]],
+                 temperature: float = 0.7, max_tokens: int = 1000, stream: bool = False):
+        """
+        Args:
+            model (str): The model to call
+            messages (Iterable[Union[Message, Dict[str, str]]]): The chat messages, e.g. a history's `view()`;
+                the sequence is snapshotted, the messages themselves are not copied
+            temperature (float): Sampling temperature
+            max_tokens (int): Maximum completion tokens
+            stream (bool): Ask the server to stream the completion
+        """
+        self.model = model
+        self.messages: Tuple[Message, ...] = tuple(Message.from_dict(msg) for msg in messages)
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.stream = stream
+        self._cache_key: Optional[str] = None
+
+    def get(self, field: str, default: Any = None) -> Any:
+        if field == "messages":
+            return [msg.to_dict() for msg in self.messages]
+        if field in ("model", "temperature", "max_tokens"):
+            return getattr(self, field)
+        if field == "stream" and self.stream:
+            return True
+        return default
+
+    def _head(self) -> bytes:
+        return b'{"max_tokens":' + _encode(self.max_tokens) + b',"messages":['
+
+    def _tail(self, stream: bool, model: Optional[str] = None) -> bytes:
+        return (b'],"model":' + _encode(model or self.model)
+                + (b',"stream":true' if stream else b"")
+                + b',"temperature":' + _encode(self.temperature) + b"}")
+
+    @property
+    def body(self) -> bytes:
+        """The UTF-8 JSON request body."""
+        return self.body_for(self.model)
+
+    def body_for(self, model: str) -> bytes:
+        """
+        The UTF-8 JSON request body, naming `model` instead, for a backend that serves the model under another name.
+
+        Args:
+            model (str): The model name the backend expects
+
+        Returns:
+            bytes: The request body
+        """
+        # One join over all fragments, so the body is the only large allocation
+        parts = [self._head()]
+        for msg in self.messages:
+            parts.append(msg.encoded)
+            parts.append(b",")
+        tail = self._tail(self.stream, model)
+        if self.messages:
+            parts[-1] = tail
+        else:
+            parts.append(tail)
+        return b"".join(parts)
+
+    @property
+    def cache_key(self) -> str:
+        """The completion cache key, equal to `completion_key` of the equivalent dictionary."""
+        if self._cache_key is None:
+            digest = hashlib.sha256(self._head())
+            for i, msg in enumerate(self.messages):
+                if i:
+                    digest.update(b",")
+                digest.update(msg.encoded)
+            digest.update(self._tail(False))
+            self._cache_key = digest.hexdigest()
+        return self._cache_key
+
+    def to_dict(self) -> Dict[str, Any]:
+        payload = {field: self.get(field) for field in ("model", "messages", "temperature", "max_tokens")}
+        if self.stream:
+            payload["stream"] = True
+        return payload
+
+    def __repr__(self):
+        return f"ChatPayload(model={self.model!r}, messages={len(self.messages)}, stream={self.stream})"
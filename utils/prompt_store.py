@@ -0,0 +1,116 @@
+"""
+Persistent store of optimized prompts.
+
+Optimizing a prompt is a full round trip before generation can start, and
+the same prompts (the templates above all) are optimized over and over. The
+store remembers one optimization per (model, normalized prompt, optimizer
+instructions), so prompts that differ only in whitespace or Unicode form share
+an entry, and survives restarts in a SQLite file shared by every process on
+the host (see utils.sqlite_store).
+"""
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from typing import Optional
+
+from .sqlite_store import SQLiteLRUStore
+
+DEFAULT_PROMPT_STORE_PATH = os.path.join(".cache", "optimized_prompts.sqlite3")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a prompt for lookup: Unicode NFKC, with runs of whitespace collapsed
+    to one space and the ends trimmed. Case is kept, since it can change the meaning.
+
+    Args:
+        prompt (str): The user's prompt
+
+    Returns:
+        str: The normalized prompt
+    """
+    return " ".join(unicodedata.normalize("NFKC", prompt).split())
+
+
+def prompt_key(prompt: str, model: str, variant: str = "") -> str:
+    """
+    Build a process-independent key for an optimized prompt.
+
+    Args:
+        prompt (str): The user's prompt, normalized or not
+        model (str): The model that optimizes it
+        variant (str): Fingerprint of the optimization instructions
+
+    Returns:
+        str: A hex SHA-256 digest
+    """
+    canonical = json.dumps([model, variant, normalize_prompt(prompt)], separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class OptimizedPromptStore(SQLiteLRUStore):
+    """
+    A SQLite-backed memo of optimize_prompt results with LRU eviction and hit/miss counters.
+    """
+
+    def __init__(self, path: str = DEFAULT_PROMPT_STORE_PATH, max_entries: int = 1000,
+                 ttl: Optional[float] = 30 * 24 * 3600):
+        """
+        Args:
+            path (str): SQLite database file
+            max_entries (int): Size cap; least recently used entries are evicted beyond it
+            ttl (Optional[float]): Seconds an entry stays valid, or None to never expire
+        """
+        super().__init__(path, "optimized_prompts", "optimized", ("model", "prompt"), max_entries=max_entries,
+                         ttl=ttl)
+
+    def get(self, prompt: str, model: str, variant: str = "") -> Optional[str]:
+        """
+        Look up the optimization of a prompt.
+
+        Args:
+            prompt (str): The user's prompt
+            model (str): The model that optimizes it
+            variant (str): Fingerprint of the optimization instructions
+
+        Returns:
+            Optional[str]: The optimized prompt, or None on a miss
+        """
+        return self._get(prompt_key(prompt, model, variant))
+
+    def put(self, prompt: str, model: str, optimized: str, variant: str = "") -> None:
+        """
+        Store the optimization of a prompt, evicting the least recently used entries beyond the size cap.
+
+        Args:
+            prompt (str): The user's prompt
+            model (str): The model that optimized it
+            optimized (str): The optimized prompt
+            variant (str): Fingerprint of the optimization instructions
+        """
+        self._put(prompt_key(prompt, model, variant), optimized, model=model, prompt=normalize_prompt(prompt))
+
+    def contains(self, prompt: str, model: str, variant: str = "") -> bool:
+        """Whether a live entry exists, without touching the counters or the LRU order."""
+        return self._contains(prompt_key(prompt, model, variant))
+
+
+_shared_store: Optional[OptimizedPromptStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_prompt_store() -> OptimizedPromptStore:
+    """
+    Get the process-wide optimized-prompt store, stored at $REFLECTION_PROMPT_STORE_PATH
+    or .cache/optimized_prompts.sqlite3.
+
+    Returns:
+        OptimizedPromptStore: The shared store
+    """
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = OptimizedPromptStore(os.getenv("REFLECTION_PROMPT_STORE_PATH", DEFAULT_PROMPT_STORE_PATH))
+        return _shared_store
@@ -0,0 +1,331 @@
+"""
+OpenAI-compatible completion endpoints and the router that picks one per request.
+
+Any number of backends that speak the chat completions API (the hosted
+provider, a local llama.cpp or vLLM server, ...) can serve the same models.
+The router keeps a moving average of every endpoint's latency and error rate,
+sends each request to the fastest healthy endpoint that serves its model and,
+when an endpoint fails with a retryable error or has its circuit open, fails
+over to the next one at once instead of backing off. Only the last candidate
+is retried with the full retry policy.
+
+Endpoints are configured through the environment:
+
+    REFLECTION_ENDPOINTS=groq=https://api.groq.com/openai/v1/chat/completions,local=http://127.0.0.1:8080/v1/chat/completions
+    GROQ_API_KEY=...                                # <NAME>_API_KEY, optional for local servers
+    LOCAL_MODELS=llama-3.3-70b-versatile=llama-3.3  # <NAME>_MODELS: models served (and their name there)
+    GROQ_RATE_LIMITED=1                             # <NAME>_RATE_LIMITED: count against the rate limits
+                                                    # (default: only endpoints at the hosted API do)
+
+Without REFLECTION_ENDPOINTS a single "groq" endpoint is used, at $GROQ_API_URL or the hosted API.
+"""
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .cancellation import CancellationToken
+from .retry import CircuitOpenError, RetryPolicy, classify_error, classify_status
+
+DEFAULT_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+
+class Endpoint:
+    """
+    One OpenAI-compatible chat completions backend.
+    """
+
+    def __init__(self, name: str, url: str, api_key: Optional[str] = None,
+                 models: Optional[Dict[str, str]] = None, rate_limited: bool = False):
+        """
+        Args:
+            name (str): Short name, used in metrics and logs
+            url (str): The chat completions URL
+            api_key (Optional[str]): Bearer token, or None for servers without authentication
+            models (Optional[Dict[str, str]]): The models served, each mapped to the name the backend
+                knows it by; None serves every model under its own name
+            rate_limited (bool): Whether requests count against the configured rate limits (see
+                utils.ratelimit); local servers and paid accounts usually do not
+        """
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.models = models
+        self.rate_limited = rate_limited
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def model_name(self, model: str) -> str:
+        """The name this backend knows a model by."""
+        return self.models.get(model, model) if self.models is not None else model
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def __repr__(self):
+        return f"Endpoint(name={self.name!r}, url={self.url!r})"
+
+
+class EndpointHealth:
+    """
+    Moving latency and error rate of one endpoint.
+    """
+
+    def __init__(self):
+        # Exponentially weighted moving averages; latency stays None until a request succeeds
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.last_used = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.failovers = 0
+
+
+class ProviderRouter:
+    """
+    Sends each request to the fastest healthy endpoint that serves its model, failing over on errors.
+    """
+
+    def __init__(self, endpoints: List[Endpoint], alpha: float = 0.2, max_error_rate: float = 0.5,
+                 cooldown: float = 30.0, probe_interval: float = 60.0):
+        """
+        Args:
+            endpoints (List[Endpoint]): The backends, in order of preference while none has been measured
+            alpha (float): Weight of the newest sample in the moving averages
+            max_error_rate (float): Error rate above which an endpoint is only used when no healthy one is left
+            cooldown (float): Seconds after which an unhealthy endpoint is tried again
+            probe_interval (float): Seconds after which an endpoint that was not picked gets a request again,
+                so a backend that became faster is noticed
+        """
+        if not endpoints:
+            raise ValueError("A provider router needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.probe_interval = probe_interval
+        self._health = {endpoint.name: EndpointHealth() for endpoint in self.endpoints}
+        self._lock = threading.Lock()
+
+    @property
+    def key(self) -> str:
+        """Identifies the set of endpoints, e.g. to keep requests to different backends apart."""
+        return " ".join(endpoint.url for endpoint in self.endpoints)
+
+    def endpoint(self, name: str) -> Endpoint:
+        return next(endpoint for endpoint in self.endpoints if endpoint.name == name)
+
+    def select(self, model: str, avoid: Optional[str] = None) -> List[Endpoint]:
+        """
+        Order the endpoints that serve a model for one request: healthy ones by moving latency, unmeasured
+        or long-unused ones first (they get a probe), then unhealthy ones by error rate.
+
+        Args:
+            model (str): The requested model
+            avoid (Optional[str]): Name of an endpoint to try last, e.g. the one a hedged request is waiting on
+
+        Returns:
+            List[Endpoint]: The candidates, best first
+
+        Raises:
+            ValueError: If no endpoint serves the model
+        """
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.serves(model)]
+        if not candidates:
+            raise ValueError(f"No endpoint serves model {model}")
+        now = time.monotonic()
+        with self._lock:
+            def rank(position: int) -> Tuple[bool, int, float, int]:
+                health = self._health[candidates[position].name]
+                avoided = candidates[position].name == avoid
+                idle = now - health.last_used
+                if health.error_rate > self.max_error_rate and idle < self.cooldown:
+                    return avoided, 1, health.error_rate, position
+                probe = health.latency is None or idle >= self.probe_interval
+                return avoided, 0, 0.0 if probe else health.latency, position
+
+            order = sorted(range(len(candidates)), key=rank)
+            # Stamp the pick now, so concurrent requests do not all probe the same endpoint
+            self._health[candidates[order[0]].name].last_used = now
+        return [candidates[i] for i in order]
+
+    def record(self, endpoint: Endpoint, seconds: float, failed: bool) -> None:
+        """
+        Add one request's outcome to an endpoint's moving averages.
+
+        Args:
+            endpoint (Endpoint): The endpoint
+            seconds (float): Time until the response (or the first streamed chunk)
+            failed (bool): Whether it failed with a retryable error; failures leave the latency alone,
+                since a quick error would make a broken endpoint look fast
+        """
+        with self._lock:
+            health = self._health[endpoint.name]
+            health.requests += 1
+            health.last_used = time.monotonic()
+            health.error_rate += self.alpha * (float(failed) - health.error_rate)
+            if failed:
+                health.failures += 1
+            elif health.latency is None:
+                health.latency = seconds
+            else:
+                health.latency += self.alpha * (seconds - health.latency)
+
+    def _failed_over(self, endpoint: Endpoint, reason: str,
+                     on_failover: Optional[Callable[[str, str], None]]) -> None:
+        with self._lock:
+            self._health[endpoint.name].failovers += 1
+        if on_failover is not None:
+            on_failover(endpoint.name, reason)
+
+    def _outcome(self, endpoint: Endpoint, started: float, result: Any = None,
+                 error: Optional[BaseException] = None) -> Optional[str]:
+        # Record the attempt and return its retryable error class, if any (None for a circuit that was open)
+        if isinstance(error, CircuitOpenError):
+            return "circuit_open"
+        if error is not None:
+            failure_class = classify_error(error)
+        else:
+            # An opened stream (or an SDK result) has no status; it only arrives on success
+            failure_class = classify_status(getattr(result, "status_code", 200))
+        # An error of our own (not a failed request) says nothing about the endpoint
+        if error is None or failure_class is not None:
+            self.record(endpoint, time.perf_counter() - started, failure_class is not None)
+        return failure_class
+
+    def call(self, model: str, attempt: Callable[[Endpoint], Any], retry_policy: RetryPolicy,
+             on_retry: Optional[Callable[[str, float], None]] = None,
+             on_failover: Optional[Callable[[str, str], None]] = None,
+             avoid: Optional[str] = None, cancel: Optional[CancellationToken] = None) -> Tuple[Any, Endpoint]:
+        """
+        Run a blocking request on the best endpoint, failing over to the next on a retryable error.
+
+        Args:
+            model (str): The requested model
+            attempt (Callable[[Endpoint], Any]): Sends the request to an endpoint and returns the response
+            retry_policy (RetryPolicy): Circuit breakers (one per endpoint URL) and the retries of the last candidate
+            on_retry (Optional[Callable[[str, float], None]]): Called with the error class and delay before each retry
+            on_failover (Optional[Callable[[str, str], None]]): Called with the endpoint left and the error class
+            avoid (Optional[str]): Name of an endpoint to try last (see `select`)
+            cancel (Optional[CancellationToken]): Stops the retries' backoff once cancelled or past its deadline
+
+        Returns:
+            Tuple[Any, Endpoint]: The response and the endpoint that gave it
+
+        Raises:
+            ValueError: If no endpoint serves the model
+        """
+        candidates = self.select(model, avoid)
+        for i, endpoint in enumerate(candidates):
+            last = i == len(candidates) - 1
+            started = time.perf_counter()
+            try:
+                result = retry_policy.call(lambda: attempt(endpoint), key=endpoint.url, on_retry=on_retry,
+                                           max_attempts=None if last else 1, cancel=cancel)
+            except Exception as e:
+                failure_class = self._outcome(endpoint, started, error=e)
+                if last or failure_class is None:
+                    raise
+            else:
+                failure_class = self._outcome(endpoint, started, result=result)
+                if last or failure_class is None:
+                    return result, endpoint
+            self._failed_over(endpoint, failure_class, on_failover)
+
+    async def acall(self, model: str, attempt: Callable[[Endpoint], Awaitable[Any]], retry_policy: RetryPolicy,
+                    on_retry: Optional[Callable[[str, float], None]] = None,
+                    on_failover: Optional[Callable[[str, str], None]] = None,
+                    avoid: Optional[str] = None) -> Tuple[Any, Endpoint]:
+        """Async twin of `call`: `attempt` returns an awaitable."""
+        candidates = self.select(model, avoid)
+        for i, endpoint in enumerate(candidates):
+            last = i == len(candidates) - 1
+            started = time.perf_counter()
+            try:
+                result = await retry_policy.acall(lambda: attempt(endpoint), key=endpoint.url, on_retry=on_retry,
+                                                  max_attempts=None if last else 1)
+            except Exception as e:
+                failure_class = self._outcome(endpoint, started, error=e)
+                if last or failure_class is None:
+                    raise
+            else:
+                failure_class = self._outcome(endpoint, started, result=result)
+                if last or failure_class is None:
+                    return result, endpoint
+            self._failed_over(endpoint, failure_class, on_failover)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the moving latency and error rate, and the counters, of every endpoint.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Per endpoint name: url, latency, error_rate, requests, failures, failovers
+        """
+        with self._lock:
+            return {
+                endpoint.name: {
+                    "url": endpoint.url,
+                    "latency": self._health[endpoint.name].latency,
+                    "error_rate": self._health[endpoint.name].error_rate,
+                    "requests": self._health[endpoint.name].requests,
+                    "failures": self._health[endpoint.name].failures,
+                    "failovers": self._health[endpoint.name].failovers,
+                }
+                for endpoint in self.endpoints
+            }
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return default if value is None else value.strip().lower() not in ("0", "false", "no", "")
+
+
+def endpoints_from_env() -> List[Endpoint]:
+    """
+    Build the endpoints described by the environment (see the module docstring).
+
+    Returns:
+        List[Endpoint]: The configured endpoints, or the default "groq" one
+    """
+    spec = os.getenv("REFLECTION_ENDPOINTS", "").strip()
+    if not spec:
+        url = os.getenv("GROQ_API_URL", DEFAULT_API_URL)
+        return [Endpoint("groq", url, os.getenv("GROQ_API_KEY"),
+                         rate_limited=_env_flag("GROQ_RATE_LIMITED", url == DEFAULT_API_URL))]
+    endpoints = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, url = item.partition("=")
+        prefix = name.strip().upper().replace("-", "_")
+        models = os.getenv(f"{prefix}_MODELS")
+        endpoints.append(Endpoint(
+            name.strip(), url.strip(), os.getenv(f"{prefix}_API_KEY"),
+            models={
+                served.strip(): (alias.strip() or served.strip())
+                for served, _, alias in (entry.partition("=") for entry in models.split(","))
+                if served.strip()
+            } if models else None,
+            rate_limited=_env_flag(f"{prefix}_RATE_LIMITED", url.strip() == DEFAULT_API_URL),
+        ))
+    return endpoints
+
+
+_shared_provider: Optional[ProviderRouter] = None
+_shared_lock = threading.Lock()
+
+
+def get_provider() -> ProviderRouter:
+    """
+    Get the process-wide provider router over the endpoints configured in the environment.
+
+    Returns:
+        ProviderRouter: The shared router
+    """
+    global _shared_provider
+    with _shared_lock:
+        if _shared_provider is None:
+            _shared_provider = ProviderRouter(endpoints_from_env())
+        return _shared_provider
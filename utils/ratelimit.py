@@ -0,0 +1,403 @@
+"""
+Client-side rate limiting of completion calls, per model, in requests and tokens per minute.
+
+Every call reserves a slot before it is sent: its request and estimated
+tokens are taken from two token buckets, which may go into debt, and the
+caller waits until the buckets have refilled enough to cover it. Slots are
+handed out in arrival order, so concurrent sessions queue behind each other
+fairly instead of all being sent at once and bouncing off the provider's 429s.
+Once the response reports the actual usage, the estimate is corrected.
+
+The bucket state lives in a backend: in memory for one process, or in a small
+JSON file guarded by an exclusive lock, so Streamlit sessions, the CLI and
+batch workers on one host share the same budget.
+
+Limits are opt-in. The process-wide limiter enforces none unless the
+environment sets them, as "model=requests/tokens" per minute (either side may
+be left empty for unlimited; "*" is every other model):
+
+    REFLECTION_RATE_LIMITS=free                                      # the published free-tier limits
+    REFLECTION_RATE_LIMITS=free,llama-3.3-70b-versatile=1000/300000  # ... with one model on a paid tier
+    REFLECTION_RATE_LIMITS=*=60/                                     # 60 requests per minute for every model
+
+Only endpoints marked rate limited count against them (see utils.providers).
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cancellation import CancellationToken
+from .tokens import estimate_message_tokens
+
+# Next to the code rather than the working directory, so every process on the host finds the same file
+DEFAULT_RATE_LIMIT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       ".cache", "ratelimit.json")
+
+
+class RateLimit:
+    """
+    Requests and tokens a model may use per minute; None leaves that dimension unlimited.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 burst_seconds: float = 60.0):
+        """
+        Args:
+            requests_per_minute (Optional[float]): Requests allowed per minute
+            tokens_per_minute (Optional[float]): Prompt plus completion tokens allowed per minute
+            burst_seconds (float): Seconds of traffic that may be sent at once; lower it for
+                providers that reject bursts within the minute
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_seconds = burst_seconds
+
+    def buckets(self) -> Tuple[Optional[Tuple[float, float]], Optional[Tuple[float, float]]]:
+        """(capacity, refill per second) of the request and token buckets; None where unlimited."""
+        return tuple(
+            (per_minute * self.burst_seconds / 60.0, per_minute / 60.0) if per_minute else None
+            for per_minute in (self.requests_per_minute, self.tokens_per_minute)
+        )
+
+    def __repr__(self):
+        return (f"RateLimit(requests_per_minute={self.requests_per_minute}, "
+                f"tokens_per_minute={self.tokens_per_minute}, burst_seconds={self.burst_seconds})")
+
+
+# The provider's published free-tier limits of each supported model
+MODEL_RATE_LIMITS = {
+    "llama-3.3-70b-versatile": RateLimit(30, 12000),
+    "llama-3.1-8b-instant": RateLimit(30, 6000),
+    "mixtral-8x7b-32768": RateLimit(30, 5000),
+    "gemma-7b-it": RateLimit(30, 15000),
+}
+DEFAULT_RATE_LIMIT = RateLimit(30, 6000)
+
+
+def limits_from_env() -> Tuple[Dict[str, RateLimit], Optional[RateLimit]]:
+    """
+    Read the limits set by $REFLECTION_RATE_LIMITS (see the module docstring).
+
+    Returns:
+        Tuple[Dict[str, RateLimit], Optional[RateLimit]]: The limit per model, and the limit of every
+            other model (None for unlimited); both empty when the variable is unset
+
+    Raises:
+        ValueError: If an entry is not "free" or "model=requests/tokens"
+    """
+    limits: Dict[str, RateLimit] = {}
+    default_limit: Optional[RateLimit] = None
+    for entry in filter(None, (part.strip() for part in os.getenv("REFLECTION_RATE_LIMITS", "").split(","))):
+        if entry == "free":
+            limits.update(MODEL_RATE_LIMITS)
+            default_limit = DEFAULT_RATE_LIMIT
+            continue
+        model, separator, spec = entry.partition("=")
+        requests, slash, tokens = spec.partition("/")
+        if not separator or not slash or not model.strip():
+            raise ValueError(f"Invalid rate limit {entry!r}; expected model=requests/tokens")
+        limit = RateLimit(float(requests) if requests.strip() else None, float(tokens) if tokens.strip() else None)
+        if model.strip() == "*":
+            default_limit = limit
+        else:
+            limits[model.strip()] = limit
+    return limits, default_limit
+
+
+def _adjust_state(state: Optional[List[float]], limit: RateLimit, amounts: Tuple[float, float],
+                  now: float) -> List[float]:
+    # state is [requests available, tokens available, last update as a wall-clock timestamp];
+    # levels go negative while calls are queued
+    if not state:
+        state = [bucket[0] if bucket else 0.0 for bucket in limit.buckets()] + [now]
+    state = list(state)
+    elapsed = max(now - state[2], 0.0)
+    for i, (bucket, amount) in enumerate(zip(limit.buckets(), amounts)):
+        if bucket:
+            capacity, per_second = bucket
+            # A single request larger than the whole bucket waits for a full bucket, not forever
+            state[i] = min(min(state[i] + elapsed * per_second, capacity) - min(amount, capacity), capacity)
+    state[2] = now
+    return state
+
+
+class MemoryBackend:
+    """
+    Bucket state shared by the threads of one process.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def update(self, key: str, change: Callable[[Optional[List[float]]], List[float]]) -> List[float]:
+        """
+        Atomically replace a bucket state.
+
+        Args:
+            key (str): The bucket, i.e. the model name
+            change (Callable): Gets the current state (None if there is none yet) and returns the new one
+
+        Returns:
+            List[float]: The new state
+        """
+        with self._lock:
+            state = change(self._states.get(key))
+            self._states[key] = state
+            return state
+
+
+class FileBackend:
+    """
+    Bucket state in a JSON file under an exclusive lock, shared by every process on the host.
+    """
+
+    def __init__(self, path: str = DEFAULT_RATE_LIMIT_PATH):
+        """
+        Args:
+            path (str): The state file; created if missing
+
+        Raises:
+            ImportError: On platforms without fcntl (Windows)
+        """
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # flock only excludes other processes; threads of this process share the descriptor
+        self._lock = threading.Lock()
+        self._file = open(path, "a+", encoding="utf-8")
+
+    def update(self, key: str, change: Callable[[Optional[List[float]]], List[float]]) -> List[float]:
+        """
+        Atomically replace a bucket state.
+
+        Args:
+            key (str): The bucket, i.e. the model name
+            change (Callable): Gets the current state (None if there is none yet) and returns the new one
+
+        Returns:
+            List[float]: The new state
+        """
+        with self._lock:
+            self._fcntl.flock(self._file, self._fcntl.LOCK_EX)
+            try:
+                self._file.seek(0)
+                try:
+                    states = json.loads(self._file.read() or "{}")
+                except ValueError:
+                    # A torn or foreign file; start from full buckets
+                    states = {}
+                state = change(states.get(key))
+                states[key] = state
+                self._file.seek(0)
+                self._file.truncate()
+                self._file.write(json.dumps(states))
+                self._file.flush()
+                return state
+            finally:
+                self._fcntl.flock(self._file, self._fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class RateLimiter:
+    """
+    Queues completion calls so each model stays within its requests and tokens per minute.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, RateLimit]] = None,
+                 default_limit: Optional[RateLimit] = DEFAULT_RATE_LIMIT, backend=None):
+        """
+        Args:
+            limits (Optional[Dict[str, RateLimit]]): Limit per model (default: MODEL_RATE_LIMITS)
+            default_limit (Optional[RateLimit]): Limit of models not in `limits`, or None to leave them unlimited
+            backend (Optional[Union[MemoryBackend, FileBackend]]): Where the bucket state lives (default: in memory)
+        """
+        self.limits = dict(MODEL_RATE_LIMITS if limits is None else limits)
+        self.default_limit = default_limit
+        self.backend = backend or MemoryBackend()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.queued = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def limit_for(self, model: str) -> Optional[RateLimit]:
+        """The limit of a model, or None if it is not limited."""
+        return self.limits.get(model, self.default_limit)
+
+    @staticmethod
+    def estimate(payload) -> int:
+        """
+        Estimate the tokens a request counts against the limit: its prompt plus max_tokens.
+
+        Args:
+            payload (ChatPayload): The request
+
+        Returns:
+            int: The estimated tokens
+        """
+        return sum(estimate_message_tokens(msg, payload.model) for msg in payload.messages) + payload.max_tokens
+
+    def _adjust(self, model: str, requests: float, tokens: float) -> Optional[List[float]]:
+        # Take (or, with negative amounts, give back) capacity; returns the new state
+        limit = self.limit_for(model)
+        if limit is None:
+            return None
+
+        return self.backend.update(model, lambda state: _adjust_state(state, limit, (requests, tokens), time.time()))
+
+    def reserve(self, model: str, tokens: int) -> float:
+        """
+        Reserve the next slot for a request without waiting for it.
+
+        Args:
+            model (str): The model the request goes to
+            tokens (int): Estimated tokens of the request
+
+        Returns:
+            float: Seconds until the slot starts (0 if the request can be sent now)
+        """
+        state = self._adjust(model, 1, tokens)
+        if state is None:
+            return 0.0
+        wait = 0.0
+        for bucket, level in zip(self.limit_for(model).buckets(), state):
+            if bucket and level < 0:
+                wait = max(wait, -level / bucket[1])
+        return wait
+
+    def cancel(self, model: str, tokens: int) -> None:
+        """Give back a reservation that will not be used, e.g. because its caller was cancelled."""
+        self._adjust(model, -1, -tokens)
+
+    def settle(self, model: str, reserved_tokens: int, used_tokens: int) -> None:
+        """
+        Correct a reservation once the response reports the tokens it actually used.
+
+        Args:
+            model (str): The model the request went to
+            reserved_tokens (int): Tokens reserved for the request
+            used_tokens (int): Prompt plus completion tokens the provider reported
+        """
+        if used_tokens != reserved_tokens:
+            self._adjust(model, 0, used_tokens - reserved_tokens)
+
+    def _record(self, wait: float) -> None:
+        with self._lock:
+            self.calls += 1
+            if wait > 0:
+                self.queued += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+    def _enter(self, model: str, tokens: int) -> float:
+        wait = self.reserve(model, tokens)
+        self._record(wait)
+        if wait > 0:
+            with self._lock:
+                self.waiting += 1
+        return wait
+
+    def _leave(self) -> None:
+        with self._lock:
+            self.waiting -= 1
+
+    def acquire(self, model: str, tokens: int, cancel: Optional[CancellationToken] = None) -> float:
+        """
+        Wait for a slot to send a request.
+
+        Args:
+            model (str): The model the request goes to
+            tokens (int): Estimated tokens of the request
+            cancel (Optional[CancellationToken]): Stop waiting, and give the slot back, once it is cancelled
+                or its deadline passes
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            RunCancelled: If `cancel` stopped the wait
+        """
+        wait = self._enter(model, tokens)
+        if wait <= 0:
+            return 0.0
+        try:
+            if cancel is None:
+                time.sleep(wait)
+            else:
+                cancel.sleep(wait)
+        except BaseException:
+            self.cancel(model, tokens)
+            raise
+        finally:
+            self._leave()
+        return wait
+
+    async def aacquire(self, model: str, tokens: int) -> float:
+        """Async twin of `acquire`: waiting does not block the event loop."""
+        wait = self._enter(model, tokens)
+        if wait <= 0:
+            return 0.0
+        try:
+            await asyncio.sleep(wait)
+        except BaseException:
+            self.cancel(model, tokens)
+            raise
+        finally:
+            self._leave()
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get this process's queueing counters.
+
+        Returns:
+            Dict[str, Any]: Calls, calls that had to wait, calls waiting now, and total/mean/max wait
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "queued": self.queued,
+                "waiting": self.waiting,
+                "total_wait": self.total_wait,
+                "mean_wait": self.total_wait / self.queued if self.queued else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+
+_shared_limiter: Optional[RateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Get the process-wide rate limiter, with the limits of $REFLECTION_RATE_LIMITS (none by default).
+    Its state is shared with other processes through $REFLECTION_RATE_LIMIT_PATH (default
+    .cache/ratelimit.json in the repository); set it to "" to keep it in memory.
+
+    Returns:
+        RateLimiter: The shared limiter
+    """
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            path = os.getenv("REFLECTION_RATE_LIMIT_PATH", DEFAULT_RATE_LIMIT_PATH)
+            backend = None
+            if path:
+                try:
+                    backend = FileBackend(path)
+                except (ImportError, OSError) as e:
+                    print(f"Rate limit state not shared between processes ({e}); keeping it in memory")
+            limits, default_limit = limits_from_env()
+            _shared_limiter = RateLimiter(limits=limits, default_limit=default_limit, backend=backend)
+        return _shared_limiter
@@ -0,0 +1,460 @@
+"""
+Retry policy for completion calls: exponential backoff with jitter, server
+hints (Retry-After and the x-ratelimit-reset-* headers), per-error-class
+retry limits and budgets, and a circuit breaker per endpoint.
+
+429s and 5xx are routine under load, so a failed call is retried instead of
+failing the whole run. The budgets cap retries to a fraction of the traffic,
+so retries cannot turn a provider slowdown into a retry storm, and the
+circuit breaker fails fast while an endpoint keeps failing.
+"""
+import asyncio
+import email.utils
+import random
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+from .cancellation import CancellationToken, RunCancelled
+
+RATE_LIMIT = "rate_limit"
+SERVER_ERROR = "server_error"
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+
+RETRYABLE_STATUS = {
+    429: RATE_LIMIT,
+    500: SERVER_ERROR,
+    502: SERVER_ERROR,
+    503: SERVER_ERROR,
+    504: SERVER_ERROR,
+}
+
+# Failures that suggest the endpoint is unhealthy; 429 means it is up but throttling us
+BREAKER_CLASSES = (SERVER_ERROR, TIMEOUT, CONNECTION)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an endpoint whose circuit breaker is open.
+    """
+
+    def __init__(self, key: str, retry_in: float):
+        super().__init__(f"Circuit open for {key}: too many consecutive failures, retrying in {retry_in:.1f}s")
+        self.key = key
+        self.retry_in = retry_in
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a reset header value into seconds from now.
+
+    Accepts Go-style durations ("1m30.5s", "250ms"), plain seconds, epoch
+    timestamps and HTTP dates.
+
+    Args:
+        value (Optional[str]): The header value
+
+    Returns:
+        Optional[float]: Seconds to wait, or None if the value is missing or unparsable
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+        # Large values are absolute epoch timestamps
+        return max(seconds - time.time(), 0.0) if seconds > 1e9 else max(seconds, 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def server_delay(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Get the wait the server asked for, from Retry-After or the rate-limit reset headers.
+
+    Args:
+        headers (Mapping[str, str]): Response headers with lower-cased names
+
+    Returns:
+        Optional[float]: Seconds to wait, or None if the server gave no hint
+    """
+    retry_after = parse_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    resets = {}
+    for limit in ("requests", "tokens"):
+        reset = parse_duration(headers.get(f"x-ratelimit-reset-{limit}"))
+        if reset is not None:
+            resets[limit] = (reset, headers.get(f"x-ratelimit-remaining-{limit}"))
+    if not resets:
+        return None
+    # Wait for the limit that is actually exhausted; if none says so, for the soonest reset
+    exhausted = [reset for reset, remaining in resets.values() if remaining is not None and remaining.strip() == "0"]
+    return max(exhausted) if exhausted else min(reset for reset, _ in resets.values())
+
+
+def classify_status(status_code: int) -> Optional[str]:
+    """Error class of an HTTP status, or None if it should not be retried."""
+    return RETRYABLE_STATUS.get(status_code)
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """
+    Error class of an exception raised by the transport or an SDK client, or None if it should not be retried.
+
+    Args:
+        error (BaseException): The exception
+
+    Returns:
+        Optional[str]: One of the error classes, or None
+    """
+    response = getattr(error, "response", None)
+    status_code = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status_code:
+        return classify_status(status_code)
+    timeouts: Tuple[type, ...] = (TimeoutError, asyncio.TimeoutError)
+    connection_errors: Tuple[type, ...] = (ConnectionError,)
+    try:
+        import httpx
+        timeouts += (httpx.TimeoutException,)
+        connection_errors += (httpx.TransportError,)
+    except ImportError:
+        pass
+    try:
+        import groq
+        timeouts += (groq.APITimeoutError,)
+        connection_errors += (groq.APIConnectionError,)
+    except (ImportError, AttributeError):
+        # Not installed, or a release that does not export these
+        pass
+    if isinstance(error, timeouts):
+        return TIMEOUT
+    if isinstance(error, connection_errors):
+        return CONNECTION
+    return None
+
+
+def _failure_headers(result: Any = None, error: Optional[BaseException] = None) -> Mapping[str, str]:
+    source = getattr(error, "response", None) if error is not None else result
+    headers = getattr(source, "headers", None)
+    return headers if headers is not None else {}
+
+
+class RetryBudget:
+    """
+    A token bucket that limits retries to a fraction of calls: every call deposits
+    `ratio` tokens (up to `reserve`) and every retry spends one.
+    """
+
+    def __init__(self, ratio: float = 0.2, reserve: float = 20.0):
+        """
+        Args:
+            ratio (float): Retries allowed per call in steady state
+            reserve (float): Retries available in a burst, and the bucket's capacity
+        """
+        self.ratio = ratio
+        self.reserve = reserve
+        self.tokens = reserve
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.tokens = min(self.tokens + self.ratio, self.reserve)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Opens after consecutive endpoint failures and fails fast until a probe call succeeds.
+    """
+
+    def __init__(self, key: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        """
+        Args:
+            key (str): The endpoint this breaker guards, for error messages
+            failure_threshold (int): Consecutive failures that open the circuit
+            recovery_timeout (float): Seconds the circuit stays open before one probe call is let through
+        """
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a probe already in flight
+        """
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            retry_in = self.opened_at + self.recovery_timeout - now
+            if self.state == "open" and retry_in <= 0:
+                self.state = "half_open"
+            # A probe that never reported back (e.g. it was cancelled) is replaced after recovery_timeout
+            if self.state == "half_open" and (self._probe_started is None
+                                              or now - self._probe_started > self.recovery_timeout):
+                self._probe_started = now
+                return
+            self.rejected += 1
+            raise CircuitOpenError(self.key, max(retry_in, 0.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._probe_started = None
+
+    def record_cancelled(self) -> None:
+        # A call stopped by its caller says nothing about the endpoint; only let the next call probe in its place
+        with self._lock:
+            self._probe_started = None
+
+
+class RetryPolicy:
+    """
+    Decides whether and when to retry a failed call, for both blocking and async callers.
+
+    An attempt either returns a response object with `status_code` and `headers`
+    (retried on 429/5xx) or raises (retried on timeouts, connection errors and
+    exceptions carrying a retryable status). When the retries run out, the last
+    response is returned or the last exception re-raised, so callers handle the
+    failure exactly as they would without retries.
+    """
+
+    def __init__(self, max_attempts: int = 6, base_delay: float = 0.5, max_delay: float = 20.0,
+                 multiplier: float = 2.0, max_retry_after: float = 60.0,
+                 class_limits: Optional[Dict[str, int]] = None, budgets: Optional[Dict[str, RetryBudget]] = None,
+                 failure_threshold: int = 5, recovery_timeout: float = 30.0, seed: Optional[int] = None):
+        """
+        Args:
+            max_attempts (int): Attempts per call, including the first
+            base_delay (float): Backoff before the first retry, in seconds
+            max_delay (float): Upper bound of the exponential backoff
+            multiplier (float): Backoff growth per retry
+            max_retry_after (float): Give up instead of waiting when the server asks for a longer wait
+            class_limits (Optional[Dict[str, int]]): Retries per call for each error class
+            budgets (Optional[Dict[str, RetryBudget]]): Process-wide retry budget for each error class
+            failure_threshold (int): Consecutive endpoint failures that open its circuit breaker
+            recovery_timeout (float): Seconds an open circuit waits before a probe call
+            seed (Optional[int]): Seed for the jitter, for reproducible tests
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.max_retry_after = max_retry_after
+        self.class_limits = class_limits or {RATE_LIMIT: 5, SERVER_ERROR: 3, TIMEOUT: 2, CONNECTION: 3}
+        self.budgets = budgets or {
+            # Rate-limit retries wait for the server's reset, so they may be more frequent
+            RATE_LIMIT: RetryBudget(ratio=0.5),
+            SERVER_ERROR: RetryBudget(),
+            TIMEOUT: RetryBudget(),
+            CONNECTION: RetryBudget(),
+        }
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._random = random.Random(seed)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.retries: Dict[str, int] = {}
+        self.exhausted = 0
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        """The circuit breaker of an endpoint, created on first use."""
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(key, self.failure_threshold, self.recovery_timeout)
+            return self._breakers[key]
+
+    def _start(self, key: str) -> CircuitBreaker:
+        for budget in self.budgets.values():
+            budget.deposit()
+        return self.breaker(key)
+
+    def _assess(self, breaker: CircuitBreaker, result: Any = None, error: Optional[BaseException] = None) -> Optional[str]:
+        # The error class of a failed attempt (None on success or a non-retryable failure); feeds the breaker
+        if isinstance(error, RunCancelled):
+            breaker.record_cancelled()
+            return None
+        if error is not None:
+            failure_class = classify_error(error)
+        else:
+            # SDK results have no status; they only arrive on success
+            failure_class = classify_status(getattr(result, "status_code", 200))
+        if failure_class in BREAKER_CLASSES:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return failure_class
+
+    def _delay(self, failure_class: str, headers: Mapping[str, str], attempt: int, max_attempts: int,
+               class_retries: Dict[str, int]) -> Optional[float]:
+        # Seconds to wait before the next attempt, or None to give up
+        if attempt >= max_attempts or class_retries.get(failure_class, 0) >= self.class_limits.get(failure_class, 0):
+            return None
+        hint = server_delay(headers)
+        if hint is not None and hint > self.max_retry_after:
+            return None
+        budget = self.budgets.get(failure_class)
+        if budget is not None and not budget.withdraw():
+            return None
+        class_retries[failure_class] = class_retries.get(failure_class, 0) + 1
+        with self._lock:
+            self.retries[failure_class] = self.retries.get(failure_class, 0) + 1
+        if hint is not None:
+            # Spread out the clients that were all told to come back at the same moment
+            return hint + self._random.uniform(0, self.base_delay)
+        # Full jitter: uniform over the exponential backoff window
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1)))
+
+    def _give_up(self) -> None:
+        with self._lock:
+            self.exhausted += 1
+
+    def call(self, attempt: Callable[[], Any], key: str = "default",
+             on_retry: Optional[Callable[[str, float], None]] = None, max_attempts: Optional[int] = None,
+             cancel: Optional[CancellationToken] = None) -> Any:
+        """
+        Run a blocking attempt with retries.
+
+        Args:
+            attempt (Callable[[], Any]): Makes one attempt and returns the response
+            key (str): The endpoint, selecting the circuit breaker
+            on_retry (Optional[Callable[[str, float], None]]): Called with the error class and delay before each retry
+            max_attempts (Optional[int]): Attempts for this call, if fewer than the policy's (1 to fail fast,
+                e.g. when another endpoint can take the request)
+            cancel (Optional[CancellationToken]): Stop waiting for the next attempt once it is cancelled
+                or its deadline passes
+
+        Returns:
+            Any: The first successful or non-retryable response, or the last one once retries run out
+
+        Raises:
+            CircuitOpenError: If the endpoint's circuit is open
+            RunCancelled: If `cancel` stopped the backoff
+        """
+        breaker = self._start(key)
+        class_retries: Dict[str, int] = {}
+        max_attempts = min(max_attempts or self.max_attempts, self.max_attempts)
+        for attempt_number in range(1, max_attempts + 1):
+            breaker.before_call()
+            try:
+                result = attempt()
+            except Exception as e:
+                failure_class = self._assess(breaker, error=e)
+                delay = self._delay(failure_class, _failure_headers(error=e), attempt_number, max_attempts,
+                                    class_retries) if failure_class else None
+                if delay is None:
+                    if failure_class:
+                        self._give_up()
+                    raise
+            else:
+                failure_class = self._assess(breaker, result=result)
+                delay = self._delay(failure_class, _failure_headers(result), attempt_number, max_attempts,
+                                    class_retries) if failure_class else None
+                if delay is None:
+                    if failure_class:
+                        self._give_up()
+                    return result
+            if on_retry is not None:
+                on_retry(failure_class, delay)
+            if cancel is None:
+                time.sleep(delay)
+            else:
+                cancel.sleep(delay)
+
+    async def acall(self, attempt: Callable[[], Awaitable[Any]], key: str = "default",
+                    on_retry: Optional[Callable[[str, float], None]] = None, max_attempts: Optional[int] = None) -> Any:
+        """Async twin of `call`: `attempt` returns an awaitable and backoff does not block the event loop."""
+        breaker = self._start(key)
+        class_retries: Dict[str, int] = {}
+        max_attempts = min(max_attempts or self.max_attempts, self.max_attempts)
+        for attempt_number in range(1, max_attempts + 1):
+            breaker.before_call()
+            try:
+                result = await attempt()
+            except Exception as e:
+                failure_class = self._assess(breaker, error=e)
+                delay = self._delay(failure_class, _failure_headers(error=e), attempt_number, max_attempts,
+                                    class_retries) if failure_class else None
+                if delay is None:
+                    if failure_class:
+                        self._give_up()
+                    raise
+            else:
+                failure_class = self._assess(breaker, result=result)
+                delay = self._delay(failure_class, _failure_headers(result), attempt_number, max_attempts,
+                                    class_retries) if failure_class else None
+                if delay is None:
+                    if failure_class:
+                        self._give_up()
+                    return result
+            if on_retry is not None:
+                on_retry(failure_class, delay)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get retry counters and the state of every circuit breaker.
+
+        Returns:
+            Dict[str, Any]: Retries per error class, calls that ran out of retries, and breaker states
+        """
+        with self._lock:
+            breakers = list(self._breakers.values())
+            return {
+                "retries": dict(self.retries),
+                "exhausted": self.exhausted,
+                "breakers": {b.key: {"state": b.state, "failures": b.failures, "rejected": b.rejected} for b in breakers},
+            }
+
+
+_shared_policy: Optional[RetryPolicy] = None
+_shared_lock = threading.Lock()
+
+
+def get_retry_policy() -> RetryPolicy:
+    """
+    Get the process-wide retry policy, so budgets and circuit breakers see all traffic.
+
+    Returns:
+        RetryPolicy: The shared policy
+    """
+    global _shared_policy
+    with _shared_lock:
+        if _shared_policy is None:
+            _shared_policy = RetryPolicy()
+        return _shared_policy
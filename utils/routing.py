@@ -0,0 +1,158 @@
+"""
+Per-role model routing for the reflection loop.
+
+Prompt optimization and reflection are short, structured tasks that a small
+fast model handles well; generation benefits from the large model. A routing
+assigns a model to each role, and escalates a role to a stronger model during
+a run when its cheap model falls short: when a critique is malformed (neither
+<OK> nor a list of recommendations) or when the loop stalls (drafts stop
+changing, or the reviewer keeps repeating itself, without an <OK>).
+"""
+from typing import Any, Dict, List, Optional
+
+from .convergence import ConvergenceConfig, ConvergenceDetector, extract_recommendations
+from .critics import critic_agrees
+
+ROLES = ("generation", "reflection", "optimization")
+
+# The next stronger model of each supported model
+DEFAULT_ESCALATION = {
+    "llama-3.1-8b-instant": "llama-3.3-70b-versatile",
+    "gemma-7b-it": "llama-3.3-70b-versatile",
+    "mixtral-8x7b-32768": "llama-3.3-70b-versatile",
+}
+
+
+def critique_is_malformed(critique: str) -> bool:
+    """Whether a critique neither accepts the content (<OK>) nor makes a numbered or bulleted recommendation."""
+    return not critic_agrees(critique) and not extract_recommendations(critique)
+
+
+class ModelRouting:
+    """
+    The model of each role and the escalation rules. A role left as None uses the agent's model.
+    """
+
+    def __init__(self, generation: Optional[str] = None, reflection: Optional[str] = None,
+                 optimization: Optional[str] = None, escalation: Optional[Dict[str, str]] = None,
+                 stall_similarity: Optional[float] = 0.9, stall_patience: int = 2, max_escalations: int = 2):
+        """
+        Args:
+            generation (Optional[str]): Model that writes and revises the drafts
+            reflection (Optional[str]): Model of the reviewer (or of every critic)
+            optimization (Optional[str]): Model that optimizes the user's prompt
+            escalation (Optional[Dict[str, str]]): The next stronger model of each model; defaults to
+                DEFAULT_ESCALATION, and {} disables escalation
+            stall_similarity (Optional[float]): A draft at least this similar (word-level ratio, 0-1) to the
+                previous one, without an <OK>, counts as a stalled round; None to ignore similarity
+            stall_patience (int): Consecutive rounds of the reviewer repeating its recommendations that
+                count as a stall
+            max_escalations (int): Escalations allowed per run, across roles
+        """
+        self.generation = generation
+        self.reflection = reflection
+        self.optimization = optimization
+        self.escalation = DEFAULT_ESCALATION if escalation is None else escalation
+        self.stall_similarity = stall_similarity
+        self.stall_patience = stall_patience
+        self.max_escalations = max_escalations
+
+    def model_for(self, role: str, default: str) -> str:
+        """
+        Get the model of a role.
+
+        Args:
+            role (str): One of ROLES
+            default (str): The agent's model
+
+        Returns:
+            str: The role's model, or `default` if the routing leaves it unset
+        """
+        if role not in ROLES:
+            raise ValueError(f"Unknown role: {role}")
+        return getattr(self, role) or default
+
+    def models(self, default: str) -> List[str]:
+        """
+        Get every model a run may call: the model of each role and the models they escalate to.
+
+        Args:
+            default (str): The agent's model
+
+        Returns:
+            List[str]: The models, each once
+        """
+        models: List[str] = []
+        for role in ROLES:
+            model = self.model_for(role, default)
+            while model is not None and model not in models:
+                models.append(model)
+                model = self.escalation.get(model)
+        return models
+
+
+class ModelRouter:
+    """
+    The current model of each role during one run, with the escalations made so far.
+    """
+
+    def __init__(self, routing: ModelRouting, default_model: str):
+        self.routing = routing
+        self.models = {role: routing.model_for(role, default_model) for role in ROLES}
+        self.escalations: List[Dict[str, Any]] = []
+        self._stall = self._stall_detector()
+
+    def _stall_detector(self) -> ConvergenceDetector:
+        # The convergence checks at looser thresholds: a stall is the loop converging without an <OK>
+        return ConvergenceDetector(ConvergenceConfig(
+            similarity_threshold=self.routing.stall_similarity, max_diff_ratio=None,
+            recurring_patience=self.routing.stall_patience,
+        ))
+
+    def escalate(self, role: str, reason: str, step: int) -> Optional[Dict[str, Any]]:
+        """
+        Move a role to the next stronger model.
+
+        Args:
+            role (str): One of ROLES
+            reason (str): Why, for the run's record
+            step (int): The step the escalation happens in
+
+        Returns:
+            Optional[Dict[str, Any]]: The escalation (step, role, from, to, reason), or None if the role's
+                model has no stronger model or the run used up its escalations
+        """
+        current = self.models[role]
+        stronger = self.routing.escalation.get(current)
+        if stronger is None or stronger == current or len(self.escalations) >= self.routing.max_escalations:
+            return None
+        self.models[role] = stronger
+        escalation = {"step": step, "role": role, "from": current, "to": stronger, "reason": reason}
+        self.escalations.append(escalation)
+        # Judge the stronger model's rounds on their own
+        self._stall = self._stall_detector()
+        return escalation
+
+    def check_stall(self, generation: str, critique: str, step: int) -> Optional[Dict[str, Any]]:
+        """
+        Record a round that did not end with <OK>, and escalate if the loop stalls: the reviewer first,
+        since a weak reviewer repeating itself is the likelier cause, then the generator.
+
+        Args:
+            generation (str): This round's generation
+            critique (str): This round's critique
+            step (int): This round's step
+
+        Returns:
+            Optional[Dict[str, Any]]: The escalation, or None
+        """
+        if not self.routing.escalation:
+            return None
+        stop_reason = self._stall.update(generation, critique)["stop_reason"]
+        if stop_reason is None:
+            return None
+        for role in ("reflection", "generation"):
+            escalation = self.escalate(role, f"loop stalled: {stop_reason}", step)
+            if escalation is not None:
+                return escalation
+        return None
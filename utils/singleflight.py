@@ -0,0 +1,331 @@
+"""
+Single-flight deduplication of identical in-flight completion requests.
+
+When several sessions send the same request at the same moment (the same
+template with "Optimize prompt" on, say), only the first one goes upstream;
+the others wait for it and get the same response. Streamed responses are
+fanned out chunk by chunk, replaying what was already received to late joiners.
+
+Callers may run on different threads and event loops (every Streamlit session
+has its own), so results are handed over through thread-safe futures. A
+waiter that is cancelled only stops waiting: the shared call keeps running
+for the others, and is cancelled only once nobody waits for it. If the shared
+call itself is cancelled, e.g. because the event loop running it shut down,
+or its blocking caller was stopped by its own cancellation token, the
+remaining waiters start over and one of them sends the request again.
+"""
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .cancellation import CancellationToken, RunCancelled
+
+
+def _cancelling() -> bool:
+    # Whether the current task itself is being cancelled (Python 3.11+; assume not before)
+    task = asyncio.current_task()
+    return bool(task is not None and getattr(task, "cancelling", lambda: 0)())
+
+
+class _Abandoned(Exception):
+    # The shared stream was cancelled before it finished
+    pass
+
+
+class _Flight:
+    # One upstream call and the callers waiting for it
+    def __init__(self):
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.waiters = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def abandon(self) -> None:
+        # Cancel the upstream call, from any thread
+        if self.task is not None and not self.done():
+            self.loop.call_soon_threadsafe(self.task.cancel)
+
+
+class _StreamFlight(_Flight):
+    # One upstream stream; its items are kept so late subscribers can catch up
+    def __init__(self):
+        super().__init__()
+        self.items: List[Any] = []
+        self.subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _wake(subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]) -> None:
+        for loop, wakeup in subscribers:
+            try:
+                loop.call_soon_threadsafe(wakeup.put_nowait, None)
+            except RuntimeError:
+                # The subscriber already saw the end of the stream and its event loop has closed
+                pass
+
+    def publish(self, item: Any) -> None:
+        with self.lock:
+            self.items.append(item)
+            subscribers = list(self.subscribers)
+        self._wake(subscribers)
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        with self.lock:
+            if isinstance(error, asyncio.CancelledError):
+                self.future.cancel()
+            elif error is not None:
+                self.future.set_exception(error)
+            else:
+                self.future.set_result(None)
+            subscribers = list(self.subscribers)
+        self._wake(subscribers)
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        wakeup: asyncio.Queue = asyncio.Queue()
+        entry = (asyncio.get_running_loop(), wakeup)
+        with self.lock:
+            self.subscribers.append(entry)
+        index = 0
+        try:
+            while True:
+                with self.lock:
+                    batch = self.items[index:]
+                    finished = self.future.done()
+                index += len(batch)
+                for item in batch:
+                    yield item
+                if not batch:
+                    if finished:
+                        if self.future.cancelled():
+                            raise _Abandoned()
+                        # Raises the upstream error, if any
+                        self.future.result()
+                        return
+                    await wakeup.get()
+        finally:
+            with self.lock:
+                self.subscribers.remove(entry)
+
+
+class SingleFlight:
+    """
+    Shares one upstream call between concurrent callers with the same key.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.deduplicated = 0
+        self.restarted = 0
+
+    def _join(self, key: str, flight_type: type = _Flight) -> Tuple[_Flight, bool]:
+        # The flight for key and whether the caller leads it (i.e. must make the upstream call)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = flight_type()
+                self.calls += 1
+            else:
+                self.deduplicated += 1
+            flight.waiters += 1
+            return flight, leader
+
+    def _leave(self, flight: _Flight) -> None:
+        with self._lock:
+            flight.waiters -= 1
+            abandoned = flight.waiters == 0
+        if abandoned:
+            flight.abandon()
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        # Later callers start a new flight; called before the result is published
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _restart(self) -> None:
+        with self._lock:
+            self.restarted += 1
+
+    def do(self, key: str, call: Callable[[], Any],
+           cancel: Optional[CancellationToken] = None) -> Tuple[Any, bool]:
+        """
+        Run a blocking call, or wait for the identical one already in flight.
+
+        Args:
+            key (str): Identifies identical calls
+            call (Callable[[], Any]): Makes the upstream call
+            cancel (Optional[CancellationToken]): Stop waiting for another caller's call once it is
+                cancelled or its deadline passes; the call goes on for the others
+
+        Returns:
+            Tuple[Any, bool]: The result, and whether it was shared from another caller's call
+
+        Raises:
+            RunCancelled: If `cancel` stopped the wait, or the caller's own call
+        """
+        while True:
+            flight, leader = self._join(key)
+            try:
+                if leader:
+                    try:
+                        result = call()
+                    except RunCancelled:
+                        # Only this caller was stopped (its Stop or deadline): the waiters start over
+                        self._forget(key, flight)
+                        flight.future.cancel()
+                        raise
+                    except Exception as e:
+                        self._forget(key, flight)
+                        flight.future.set_exception(e)
+                        raise
+                    except BaseException:
+                        # e.g. KeyboardInterrupt: the waiters start over
+                        self._forget(key, flight)
+                        flight.future.cancel()
+                        raise
+                    self._forget(key, flight)
+                    flight.future.set_result(result)
+                    return result, False
+                try:
+                    return (flight.future.result() if cancel is None else cancel.wait(flight.future)), True
+                except concurrent.futures.CancelledError:
+                    self._restart()
+            finally:
+                self._leave(flight)
+
+    async def _run(self, key: str, flight: _Flight, call: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            self._forget(key, flight)
+            flight.future.cancel()
+            raise
+        except BaseException as e:
+            self._forget(key, flight)
+            flight.future.set_exception(e)
+        else:
+            self._forget(key, flight)
+            flight.future.set_result(result)
+
+    async def ado(self, key: str, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Async twin of `do`. The upstream call runs as its own task, so cancelling
+        the caller that started it does not cancel it for the others.
+
+        Args:
+            key (str): Identifies identical calls
+            call (Callable[[], Awaitable[Any]]): Makes the upstream call
+
+        Returns:
+            Tuple[Any, bool]: The result, and whether it was shared from another caller's call
+        """
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                flight.loop = asyncio.get_running_loop()
+                flight.task = flight.loop.create_task(self._run(key, flight, call))
+            try:
+                return await asyncio.shield(asyncio.wrap_future(flight.future)), not leader
+            except asyncio.CancelledError:
+                if not flight.future.cancelled() or _cancelling():
+                    raise
+                self._restart()
+            finally:
+                self._leave(flight)
+
+    async def _pump(self, key: str, flight: _StreamFlight, open_stream: Callable[[], AsyncIterator[Any]]) -> None:
+        stream = open_stream()
+        try:
+            try:
+                async for item in stream:
+                    flight.publish(item)
+            finally:
+                # Closes the upstream connection when the stream is abandoned
+                await stream.aclose()
+        except BaseException as e:
+            self._forget(key, flight)
+            flight.close(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            self._forget(key, flight)
+            flight.close()
+
+    async def astream(self, key: str, open_stream: Callable[[], AsyncIterator[Any]],
+                      joined: Optional[Callable[[bool], None]] = None) -> AsyncIterator[Any]:
+        """
+        Iterate a stream, or subscribe to the identical one already in flight.
+
+        Args:
+            key (str): Identifies identical streams
+            open_stream (Callable[[], AsyncIterator[Any]]): Opens the upstream stream
+            joined (Optional[Callable[[bool], None]]): Called with whether the stream is shared from another caller
+
+        Yields:
+            Any: Every item of the stream, from the first one
+
+        Raises:
+            RuntimeError: If the shared stream was cancelled after this caller had received part of it
+        """
+        received = False
+        while True:
+            flight, leader = self._join(key, _StreamFlight)
+            if leader:
+                flight.loop = asyncio.get_running_loop()
+                flight.task = flight.loop.create_task(self._pump(key, flight, open_stream))
+            if joined is not None:
+                joined(not leader)
+            subscription = flight.subscribe()
+            try:
+                async for item in subscription:
+                    received = True
+                    yield item
+                return
+            except _Abandoned:
+                if received:
+                    raise RuntimeError("The shared completion stream was cancelled")
+                self._restart()
+            finally:
+                await subscription.aclose()
+                self._leave(flight)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get deduplication counters.
+
+        Returns:
+            Dict[str, int]: Upstream calls, deduplicated requests, requests restarted
+                after a cancelled shared call, and calls in flight
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "deduplicated": self.deduplicated,
+                "restarted": self.restarted,
+                "in_flight": len(self._flights),
+            }
+
+
+_shared_single_flight: Optional[SingleFlight] = None
+_shared_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    Get the process-wide single-flight group, so identical requests from different sessions share one call.
+
+    Returns:
+        SingleFlight: The shared group
+    """
+    global _shared_single_flight
+    with _shared_lock:
+        if _shared_single_flight is None:
+            _shared_single_flight = SingleFlight()
+        return _shared_single_flight
@@ -0,0 +1,127 @@
+"""
+A string store in one SQLite table, shared by the completion cache and the
+optimized-prompt store.
+
+The file is opened in WAL mode, so several processes on one host can share
+it. Entries expire after a TTL, and the least recently used ones are evicted
+beyond a size cap. Callers build their own keys and may store extra columns
+next to each value, e.g. the model, for inspection.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+
+class SQLiteLRUStore:
+    """
+    A SQLite-backed key/value table with LRU eviction, TTL and hit/miss counters. Safe to share across threads.
+    """
+
+    def __init__(self, path: str, table: str, value_column: str, extra_columns: Sequence[str] = (),
+                 max_entries: int = 10000, ttl: Optional[float] = None):
+        """
+        Args:
+            path (str): SQLite database file
+            table (str): Table of the entries, created if missing
+            value_column (str): Column holding the stored text
+            extra_columns (Sequence[str]): Text columns stored next to the value, e.g. "model"
+            max_entries (int): Size cap; least recently used entries are evicted beyond it
+            ttl (Optional[float]): Seconds an entry stays valid, or None to never expire
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._table = table
+        self._value_column = value_column
+        self._extra_columns = tuple(extra_columns)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY,"
+            + "".join(f" {column} TEXT," for column in self._extra_columns)
+            + f" {value_column} TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _get(self, key: str) -> Optional[str]:
+        # A live entry's value, counted as a hit and moved to the front of the LRU order; expired entries are dropped
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self._value_column}, created_at FROM {self._table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self._expired(row[1], now):
+                self._conn.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self._table} SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def _put(self, key: str, value: str, **extra: Any) -> None:
+        # Store a value with its extra columns, evicting the least recently used entries beyond the size cap
+        columns = ("key",) + self._extra_columns + (self._value_column, "created_at", "last_access")
+        now = time.time()
+        values = (key,) + tuple(extra.get(column) for column in self._extra_columns) + (value, now, now)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                values,
+            )
+            overflow = self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    f"DELETE FROM {self._table} WHERE key IN "
+                    f"(SELECT key FROM {self._table} ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+
+    def _contains(self, key: str) -> bool:
+        # Whether a live entry exists, without touching the counters or the LRU order
+        with self._lock:
+            row = self._conn.execute(f"SELECT created_at FROM {self._table} WHERE key = ?", (key,)).fetchone()
+        return row is not None and not self._expired(row[0], time.time())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self._table}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters for this process and the current number of entries.
+
+        Returns:
+            Dict[str, Any]: Counters and entry count
+        """
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
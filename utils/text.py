@@ -0,0 +1,48 @@
+"""
+Word-level text comparison shared by convergence detection, critique merging
+and draft scoring: one tokenizer, and the word overlap that decides when two
+recommendations say the same thing.
+"""
+import re
+from typing import Iterable, List, Optional, Set
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def words(text: str) -> List[str]:
+    """
+    Split text into lowercase words, in order.
+
+    Args:
+        text (str): The text
+
+    Returns:
+        List[str]: Its words; punctuation and whitespace are dropped
+    """
+    return _WORD_PATTERN.findall(text.lower())
+
+
+def word_overlap(first: Set[str], second: Set[str]) -> float:
+    """
+    Jaccard similarity of two word sets: shared words over all words, 0-1 (0 if both are empty).
+    """
+    union = first | second
+    return len(first & second) / len(union) if union else 0.0
+
+
+def find_overlapping(candidate: Set[str], seen: Iterable[Set[str]], threshold: float) -> Optional[int]:
+    """
+    Find the first word set that overlaps a candidate by at least `threshold`.
+
+    Args:
+        candidate (Set[str]): Words of the new text
+        seen (Iterable[Set[str]]): Words of the texts to compare with, in order
+        threshold (float): Word overlap (Jaccard, 0-1) at which two texts count as the same
+
+    Returns:
+        Optional[int]: Index of the first match in `seen`, or None
+    """
+    for i, words_seen in enumerate(seen):
+        if (candidate or words_seen) and word_overlap(candidate, words_seen) >= threshold:
+            return i
+    return None
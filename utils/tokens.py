@@ -0,0 +1,110 @@
+"""
+Cheap token estimates per model, used to budget chat histories and requests
+without shipping a tokenizer for every model.
+"""
+import math
+from typing import Dict, Optional
+
+# Context window of each supported model, in tokens
+MODEL_CONTEXT_WINDOWS = {
+    "llama-3.3-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072,
+    "mixtral-8x7b-32768": 32768,
+    "gemma-7b-it": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Average characters per token for each model family's tokenizer on English prose
+CHARS_PER_TOKEN = {
+    "llama": 4.0,
+    "mixtral": 3.5,
+    "gemma": 4.0,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+# Role markers and separators the chat template adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# USD per million (prompt, completion) tokens, from the provider's published price list
+MODEL_PRICES_PER_MILLION = {
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "mixtral-8x7b-32768": (0.24, 0.24),
+    "gemma-7b-it": (0.07, 0.07),
+}
+
+# Prompt tokens allowed per request by default, so long critiques cannot blow up latency
+DEFAULT_HISTORY_BUDGET = 8192
+
+
+def _chars_per_token(model: Optional[str]) -> float:
+    if model:
+        for family, ratio in CHARS_PER_TOKEN.items():
+            if model.startswith(family):
+                return ratio
+    return DEFAULT_CHARS_PER_TOKEN
+
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Estimate how many tokens a model's tokenizer produces for a text.
+
+    Args:
+        text (str): The text to measure
+        model (Optional[str]): The model whose tokenizer to approximate
+
+    Returns:
+        int: The estimated token count, rounded up
+    """
+    return math.ceil(len(text) / _chars_per_token(model))
+
+
+def estimate_message_tokens(message: Dict[str, str], model: Optional[str] = None) -> int:
+    """
+    Estimate the prompt tokens a chat message costs, including the chat template overhead.
+
+    Args:
+        message (Dict[str, str]): A message with "role" and "content"
+        model (Optional[str]): The model whose tokenizer to approximate
+
+    Returns:
+        int: The estimated token count
+    """
+    return estimate_tokens(message["content"], model) + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_budget(model: Optional[str], completion_tokens: int = 1000,
+                   max_budget: Optional[int] = DEFAULT_HISTORY_BUDGET) -> int:
+    """
+    Get the prompt-token budget for a model's chat history.
+
+    Args:
+        model (Optional[str]): The model the history is sent to
+        completion_tokens (int): Tokens reserved for the completion (the request's max_tokens)
+        max_budget (Optional[int]): Upper bound below the context window, or None for the full window
+
+    Returns:
+        int: The number of prompt tokens the history may use
+    """
+    budget = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW) - completion_tokens
+    if max_budget is not None:
+        budget = min(budget, max_budget)
+    return budget
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """
+    Estimate what a call costs from its token usage.
+
+    Args:
+        model (Optional[str]): The model that served the call
+        prompt_tokens (int): Prompt tokens billed
+        completion_tokens (int): Completion tokens billed
+
+    Returns:
+        Optional[float]: The cost in USD, or None for models without a known price
+    """
+    prices = MODEL_PRICES_PER_MILLION.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
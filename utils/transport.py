@@ -0,0 +1,396 @@
+"""
+Pooled, keep-alive HTTP transport shared by every completion request.
+
+All generate, reflect and optimize calls go through one process-wide
+client so that TCP/TLS handshakes are paid once per connection instead of
+once per request. The client lives on a dedicated I/O event loop thread, so
+synchronous callers and any number of caller event loops share one pool.
+"""
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Coroutine, Dict, Optional, Union
+
+from .cancellation import CancellationToken, RunCancelled
+
+
+class TransportConfig:
+    """
+    Connection pool and timeout settings for the transport.
+    """
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 http2: bool = False, keepalive_expiry: float = 30.0):
+        """
+        Args:
+            pool_size (int): Maximum number of pooled keep-alive connections
+            connect_timeout (float): Seconds allowed to establish a connection
+            read_timeout (float): Seconds allowed between bytes of the response
+            http2 (bool): Negotiate HTTP/2 when the `h2` package is installed
+            keepalive_expiry (float): Seconds an idle connection is kept open
+        """
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2
+        self.keepalive_expiry = keepalive_expiry
+
+    def __repr__(self):
+        return (f"TransportConfig(pool_size={self.pool_size}, connect_timeout={self.connect_timeout}, "
+                f"read_timeout={self.read_timeout}, http2={self.http2})")
+
+
+class RequestStats:
+    """
+    Connection details and phase timings recorded for a single request.
+    All timings are seconds since the caller submitted the request, except `connect_time`.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.status_code = 0
+        self.reused_connection = True
+        self.http_version = ""
+        self.submitted_at = time.perf_counter()
+        self.elapsed = 0.0
+        # Waiting for the I/O loop and a free pooled connection
+        self.queue_wait: Optional[float] = None
+        # TCP (and TLS) handshake; None when a pooled connection was reused
+        self.connect_time: Optional[float] = None
+        # Until the response headers arrived
+        self.time_to_first_byte: Optional[float] = None
+        # Only set for streamed requests
+        self.time_to_first_token: Optional[float] = None
+        self._marks: Dict[str, float] = {}
+
+    async def on_trace(self, event: str, info: Dict[str, Any]) -> None:
+        """httpcore trace hook: timestamps each phase; a TCP connect means no idle connection was reused."""
+        if event == "connection.connect_tcp.started":
+            self.reused_connection = False
+        self._marks.setdefault(event, time.perf_counter())
+
+    def _mark(self, *events: str) -> Optional[float]:
+        for event in events:
+            if event in self._marks:
+                return self._marks[event]
+        return None
+
+    def finish(self) -> None:
+        """Derive the phase timings once the response (or stream) is complete."""
+        self.elapsed = time.perf_counter() - self.submitted_at
+        connect_started = self._mark("connection.connect_tcp.started")
+        sent = self._mark("http11.send_request_headers.started", "http2.send_request_headers.started")
+        queue_end = connect_started or sent
+        if queue_end is not None:
+            self.queue_wait = queue_end - self.submitted_at
+        if connect_started is not None:
+            connected = self._mark("connection.start_tls.complete", "connection.connect_tcp.complete")
+            if connected is not None:
+                self.connect_time = connected - connect_started
+        headers = self._mark("http11.receive_response_headers.complete", "http2.receive_response_headers.complete")
+        if headers is not None:
+            self.time_to_first_byte = headers - self.submitted_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "status_code": self.status_code,
+            "reused_connection": self.reused_connection,
+            "http_version": self.http_version,
+            "elapsed": self.elapsed,
+            "queue_wait": self.queue_wait,
+            "connect_time": self.connect_time,
+            "time_to_first_byte": self.time_to_first_byte,
+            "time_to_first_token": self.time_to_first_token,
+        }
+
+    def __str__(self):
+        reuse = "reused" if self.reused_connection else "new"
+        ttfb = f", first byte {self.time_to_first_byte * 1000:.1f} ms" if self.time_to_first_byte is not None else ""
+        ttft = f", first token {self.time_to_first_token * 1000:.1f} ms" if self.time_to_first_token is not None else ""
+        return f"RequestStats({self.http_version} {self.status_code}, {reuse} connection, {self.elapsed * 1000:.1f} ms{ttfb}{ttft})"
+
+
+class TransportResponse:
+    """
+    The status, headers, body and connection stats of a completed request.
+    """
+
+    def __init__(self, status_code: int, text: str, stats: RequestStats, headers: Optional[Dict[str, str]] = None):
+        self.status_code = status_code
+        self.text = text
+        self.stats = stats
+        # Lower-cased header names
+        self.headers = headers or {}
+        self._json: Any = None
+
+    def json(self) -> Any:
+        # Parsed once; the engine reads the content and the usage block from the same result
+        if self._json is None:
+            self._json = json.loads(self.text)
+        return self._json
+
+
+class TransportStatusError(Exception):
+    """
+    Raised by `Transport.astream` when the server answers with a non-200 status.
+    """
+
+    def __init__(self, response: TransportResponse):
+        super().__init__(f"HTTP {response.status_code}: {response.text}")
+        self.response = response
+
+
+def _headers(response) -> Dict[str, str]:
+    return {name.lower(): value for name, value in response.headers.items()}
+
+
+def _body(payload: Union[Dict[str, Any], bytes]) -> Dict[str, Any]:
+    # Pre-encoded bodies (see utils.payloads) are sent as is instead of being encoded again
+    if isinstance(payload, (bytes, bytearray)):
+        return {"content": payload}
+    return {"json": payload}
+
+
+class Transport:
+    """
+    A process-wide pooled HTTP client with keep-alive and connection-reuse counters.
+    """
+
+    def __init__(self, config: Optional[TransportConfig] = None):
+        # httpx dominates import time, so headless callers only pay for it once a transport is created
+        import httpx
+
+        self.config = config or TransportConfig()
+        http2 = self.config.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("HTTP/2 requested but the 'h2' package is not installed; falling back to HTTP/1.1")
+                http2 = False
+
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=self.config.pool_size,
+                max_keepalive_connections=self.config.pool_size,
+                keepalive_expiry=self.config.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                self.config.read_timeout,
+                connect=self.config.connect_timeout,
+            ),
+        )
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._reused = 0
+
+        # The pool is bound to this loop; every request is executed on it
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="transport-io", daemon=True)
+        self._thread.start()
+
+    async def _send(self, url: str, headers: Dict[str, str], payload: Union[Dict[str, Any], bytes],
+                    stats: RequestStats) -> TransportResponse:
+        response = await self._client.post(url, headers=headers, **_body(payload), extensions={"trace": stats.on_trace})
+        stats.finish()
+        stats.status_code = response.status_code
+        stats.http_version = response.http_version
+        self._record(stats)
+        return TransportResponse(response.status_code, response.text, stats, _headers(response))
+
+    async def _on_io_loop(self, coro):
+        """Await a coroutine on the I/O loop from whichever loop the caller runs on."""
+        if asyncio.get_running_loop() is self._loop:
+            return await coro
+        # Cancelling the caller's task cancels the request on the I/O loop as well
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    async def apost(self, url: str, headers: Dict[str, str], payload: Union[Dict[str, Any], bytes]) -> TransportResponse:
+        """
+        POST a JSON payload over a pooled connection without blocking the caller's event loop.
+
+        Args:
+            url (str): The endpoint URL
+            headers (Dict[str, str]): Request headers
+            payload (Union[Dict[str, Any], bytes]): The JSON body, or an already encoded one
+
+        Returns:
+            TransportResponse: The response together with its connection stats
+        """
+        return await self._on_io_loop(self._send(url, headers, payload, RequestStats(url)))
+
+    async def _stream(self, url: str, headers: Dict[str, str], payload: Union[Dict[str, Any], bytes],
+                      stats: RequestStats, emit) -> None:
+        try:
+            async with self._client.stream("POST", url, headers=headers, **_body(payload),
+                                           extensions={"trace": stats.on_trace}) as response:
+                stats.status_code = response.status_code
+                stats.http_version = response.http_version
+                if response.status_code != 200:
+                    await response.aread()
+                    stats.finish()
+                    self._record(stats)
+                    emit(TransportStatusError(
+                        TransportResponse(response.status_code, response.text, stats, _headers(response))
+                    ))
+                    return
+                async for line in response.aiter_lines():
+                    # Server-sent events: only "data:" lines carry chunks. The body is read to the
+                    # end even after "[DONE]" so the connection can go back to the pool.
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        continue
+                    if stats.time_to_first_token is None:
+                        stats.time_to_first_token = time.perf_counter() - stats.submitted_at
+                    emit(json.loads(data))
+            stats.finish()
+            self._record(stats)
+            emit(stats)
+        except Exception as e:
+            emit(e)
+
+    async def astream(self, url: str, headers: Dict[str, str], payload: Union[Dict[str, Any], bytes]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        POST a JSON payload and yield the decoded server-sent event chunks as they arrive.
+
+        Args:
+            url (str): The endpoint URL
+            headers (Dict[str, str]): Request headers
+            payload (Union[Dict[str, Any], bytes]): The JSON body (or an encoded one), normally with "stream": True
+
+        Yields:
+            Dict[str, Any]: Each decoded chunk; the last item is the request's RequestStats
+
+        Raises:
+            TransportStatusError: If the server answers with a non-200 status
+        """
+        caller_loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def emit(item) -> None:
+            caller_loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        stats = RequestStats(url)
+        future = asyncio.run_coroutine_threadsafe(self._stream(url, headers, payload, stats, emit), self._loop)
+        try:
+            while True:
+                item = await queue.get()
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+                if isinstance(item, RequestStats):
+                    return
+        finally:
+            # Abort the upstream request if the consumer stops early
+            future.cancel()
+
+    def post(self, url: str, headers: Dict[str, str], payload: Union[Dict[str, Any], bytes],
+             cancel: Optional[CancellationToken] = None) -> TransportResponse:
+        """
+        POST a JSON payload over a pooled connection, blocking until the response arrives.
+
+        Args:
+            url (str): The endpoint URL
+            headers (Dict[str, str]): Request headers
+            payload (Union[Dict[str, Any], bytes]): The JSON body, or an already encoded one
+            cancel (Optional[CancellationToken]): Stop waiting, and abort the request, once it is cancelled
+                or its deadline passes
+
+        Returns:
+            TransportResponse: The response together with its connection stats
+
+        Raises:
+            RunCancelled: If `cancel` stopped the request
+        """
+        return self.run(self._send(url, headers, payload, RequestStats(url)), cancel)
+
+    def run(self, coro: Coroutine[Any, Any, Any], cancel: Optional[CancellationToken] = None) -> Any:
+        """
+        Run a coroutine on the I/O loop, blocking until it finishes. Blocking callers use it for
+        work that needs an event loop (e.g. racing hedged requests) without starting one per call.
+
+        Args:
+            coro (Coroutine[Any, Any, Any]): The coroutine, e.g. one awaiting `apost`
+            cancel (Optional[CancellationToken]): Stop waiting, and cancel the coroutine, once it is
+                cancelled or its deadline passes
+
+        Returns:
+            Any: The coroutine's result
+
+        Raises:
+            RunCancelled: If `cancel` stopped the coroutine
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        if cancel is None:
+            return future.result()
+        # Cancelling the future cancels the coroutine, and so its requests, on the I/O loop
+        remove = cancel.add_callback(future.cancel)
+        try:
+            return future.result(timeout=cancel.remaining())
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            cancel.cancel("deadline passed")
+            raise RunCancelled(cancel.reason) from None
+        except concurrent.futures.CancelledError:
+            if not cancel.cancelled:
+                raise
+            raise RunCancelled(cancel.reason) from None
+        finally:
+            remove()
+
+    def _record(self, stats: RequestStats) -> None:
+        with self._lock:
+            self._requests += 1
+            if stats.reused_connection:
+                self._reused += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get aggregate connection-reuse counters since the transport was created.
+
+        Returns:
+            Dict[str, Any]: Request, new-connection and reused-connection counts
+        """
+        with self._lock:
+            requests, reused = self._requests, self._reused
+        return {
+            "requests": requests,
+            "new_connections": requests - reused,
+            "reused_connections": reused,
+            "reuse_ratio": reused / requests if requests else 0.0,
+        }
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_shared_transport: Optional[Transport] = None
+_shared_lock = threading.Lock()
+
+
+def get_transport(config: Optional[TransportConfig] = None) -> Transport:
+    """
+    Get the process-wide transport, creating it on first use.
+
+    Args:
+        config (Optional[TransportConfig]): Settings used if the transport does not exist yet
+
+    Returns:
+        Transport: The shared transport
+    """
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = Transport(config)
+        elif config is not None and vars(config) != vars(_shared_transport.config):
+            print(f"Transport already initialised with {_shared_transport.config}; ignoring {config}")
+        return _shared_transport